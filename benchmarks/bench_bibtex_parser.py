@@ -0,0 +1,63 @@
+'''
+Benchmark of the parser of single bibtex entries used by pdf2bib for the methods application/x-bibtex and text/bibliography; style=bibtex 
+of dx.doi.org (bibtex_makers.parse_bibtex_entry), against bibtexparser.loads(text).entries[0].
+
+It reports the time needed to parse each entry in the format returned by dx.doi.org (see bench_pipeline.make_xbibtex), and the time needed to import 
+bibtexparser (in a new python process), which is no longer paid when all entries are handled by the fast parser. The equivalence of the two parsers
+(including the edge cases of the bibtex syntax: tabs, nested braces, concatenations via #, macros, parentheses as delimiters...) is checked by 
+tests/test_bibtex_makers.py.
+
+Usage:
+    python benchmarks/bench_bibtex_parser.py [--entries 1000] [--runs 5] [--seed 0]
+'''
+import argparse
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import bibtexparser
+import pdf2bib.bibtex_makers as bibtex_makers
+from bench_pipeline import make_paper, make_xbibtex
+
+def time_per_entry(function, texts, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        times.append((time.perf_counter() - start) / len(texts))
+    return min(times)
+
+def import_time(statement, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the parser of single bibtex entries against bibtexparser.")
+    parser.add_argument("--entries", type=int, default=1000, help="Number of entries in the corpus.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs of each timing.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING) #bibtexparser logs a warning for each non-standard entry
+
+    rng = random.Random(args.seed)
+    texts = [make_xbibtex(make_paper(i, rng)) for i in range(args.entries)]
+
+    bibtexparser_time = time_per_entry(lambda text: bibtexparser.loads(text).entries[0], texts[:200], args.runs)
+    fast_time = time_per_entry(bibtex_makers.parse_bibtex_entry, texts, args.runs)
+    print(f"bibtexparser.loads  : {1e6 * bibtexparser_time:10.1f} us per entry")
+    print(f"parse_bibtex_entry  : {1e6 * fast_time:10.1f} us per entry ({bibtexparser_time / fast_time:.0f}x faster)")
+    baseline = import_time("pass", args.runs)
+    print(f"import bibtexparser : {1000 * (import_time('import bibtexparser', args.runs) - baseline):10.1f} ms (no longer needed for the entries above)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+Benchmark of the single-file latency of the command line of pdf2bib, with and without the daemon (pdf2bib --serve).
+
+Each command-line run (pdf2bib file.pdf -nocache -nostore) is done in a new python process, as it happens for each right-click from the context menu.
+In all processes (the daemon and the command lines run without it) the function pdf2doi.pdf2doi is replaced by a stand-in which waits for --latency
+seconds (the time of a typical online lookup) and returns a fixed citeproc+json record, so that no internet connection is needed.
+The daemon stores its port in a temporary cache directory (via the environment variable XDG_CACHE_HOME), so it does not interfere with a running daemon.
+
+Usage:
+    python benchmarks/bench_daemon.py [--runs 10] [--latency 0.2]
+'''
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+STUB = '''
+import json, os, sys, time
+import pdf2doi
+import pdf2bib
+def stub_pdf2doi(filename):
+    time.sleep({latency})
+    citeproc = {{'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {{'date-parts': [[2020, 5]]}},
+                'author': [{{'given': 'Jane', 'family': 'Doe'}}]}}
+    return {{'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(citeproc), 'path': filename, 'method': 'stub'}}
+pdf2doi.pdf2doi = stub_pdf2doi
+pdf2bib.config.set('separator', os.path.sep)
+'''
+DAEMON_SCRIPT = STUB + '''
+import pdf2bib.daemon
+pdf2bib.daemon.serve(port=0)
+'''
+CLIENT_SCRIPT = STUB + '''
+import pdf2bib.main
+sys.argv = ['pdf2bib'] + sys.argv[1:]
+pdf2bib.main.main()
+'''
+
+
+def run(command, env):
+    start = time.perf_counter()
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0 or not '@article' in completed.stdout:
+        raise RuntimeError(f"The command {command} failed:\n{completed.stdout}\n{completed.stderr}")
+    return elapsed
+
+def measure(name, command, env, runs):
+    run(command, env) #The first run is discarded, so that all files are in the OS cache
+    times = [run(command, env) for _ in range(runs)]
+    print(f"{name:16s}: median {1000 * statistics.median(times):8.1f} ms, min {1000 * min(times):8.1f} ms, max {1000 * max(times):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the single-file latency of pdf2bib with and without the daemon.")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs of each command (the median is reported).")
+    parser.add_argument("--latency", type=float, default=0.2, help="Time (in seconds) spent by the stand-in of pdf2doi for each file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'paper.pdf')
+        open(filename, 'wb').close()
+        env = dict(os.environ, XDG_CACHE_HOME=os.path.join(folder, 'cache'))
+        options = [filename, '-nocache', '-nostore']
+        print(f"Lookup latency: {1000 * args.latency:.1f} ms")
+        measure('without daemon', [sys.executable, '-c', CLIENT_SCRIPT.format(latency=args.latency)] + options + ['-nodaemon'], env, args.runs)
+
+        daemon = subprocess.Popen([sys.executable, '-c', DAEMON_SCRIPT.format(latency=args.latency)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+        try:
+            daemon_file = os.path.join(folder, 'cache', 'pdf2bib', 'daemon.json')
+            while not os.path.exists(daemon_file):
+                if daemon.poll() is not None:
+                    raise RuntimeError("The daemon could not be started.")
+                time.sleep(0.05)
+            measure('with daemon', [sys.executable, '-m', 'pdf2bib.main'] + options + ['-daemon'], env, args.runs)
+        finally:
+            daemon.send_signal(signal.SIGINT)
+            daemon.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+Benchmark of the deadlines of pdf2bib (arguments timeout and batch_timeout of pdf2bib.pdf2bib, see deadlines.py) on a folder containing a few pathological files.
+
+The folder of synthetic pdf files and the local stand-in for dx.doi.org and export.arxiv.org are the same as in bench_two_phase.py. A few files (--hanging) have
+an identifier whose lookup hangs for --hang seconds, and a few other files (--stuck) take --hang seconds to be analyzed (pdf2doi.pdf2doi is wrapped by a
+function which sleeps first, as with a pathological text layer). The folder is processed without deadlines, with a deadline for each file (--timeout) and
+with a deadline for the whole folder (--batch_timeout). For each run, the script reports the total time, and the numbers of bibtex entries and of cancelled files.
+With the deadline of each file, all the other files must get their bibtex entry.
+
+Usage:
+    python benchmarks/bench_deadlines.py [--files 40] [--hanging 2] [--stuck 2] [--hang 20] [--timeout 2] [--batch_timeout 3] [--workers 4] [--executor thread]
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import unquote
+
+import pdf2doi
+import pdf2bib
+import pdf2bib.deadlines as deadlines
+from bench_two_phase import StandInHandler, start_standin_server, make_corpus
+
+
+class HangingHandler(StandInHandler):
+    hang = 20
+    hanging = set() #identifiers whose lookup hangs
+
+    def do_GET(self):
+        identifier = unquote(self.path.split('id:')[1]) if self.path.startswith('/api/query') else unquote(self.path[1:])
+        if identifier in self.hanging:
+            time.sleep(self.hang)
+        super().do_GET()
+
+def make_stuck_pdf2doi(stuck_files, hang):
+    original = pdf2doi.pdf2doi
+    def stuck_pdf2doi(filename, *args, **kwargs):
+        if os.path.basename(filename) in stuck_files:
+            time.sleep(hang)
+        return original(filename, *args, **kwargs)
+    return stuck_pdf2doi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the deadlines of pdf2bib on a folder with hanging lookups and slow files.")
+    parser.add_argument("--files", type=int, default=40, help="Number of pdf files in the folder.")
+    parser.add_argument("--hanging", type=int, default=2, help="Number of files whose lookup hangs.")
+    parser.add_argument("--stuck", type=int, default=2, help="Number of files whose analysis hangs.")
+    parser.add_argument("--hang", type=float, default=20, help="Duration (in seconds) of the hanging lookups and analyses.")
+    parser.add_argument("--timeout", type=float, default=2, help="Deadline of each file (in seconds).")
+    parser.add_argument("--batch_timeout", type=float, default=3, help="Deadline of the whole folder (in seconds).")
+    parser.add_argument("--workers", type=int, default=4, help="Number of workers.")
+    parser.add_argument("--executor", choices=['thread', 'process'], default='thread', help="Pool used to process the files.")
+    parser.add_argument("--skip_baseline", action="store_true", help="Do not process the folder without deadlines (which takes at least --hang seconds).")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2bib.config.set('save_identifier_metadata', False)
+    pdf2bib.config.set('ratelimit_dxdoiorg_per_minute', 60000) #The queries go through the limiters (whose timeouts follow the deadlines), without being paced
+    pdf2bib.config.set('ratelimit_exportarxivorg_per_minute', 60000)
+    pdf2doi.config.set('websearch', False)
+    HangingHandler.latency = 0.02
+    HangingHandler.hang = args.hang
+    server = start_standin_server()
+    server.RequestHandlerClass = HangingHandler
+
+    with tempfile.TemporaryDirectory() as folder:
+        identifiers = make_corpus(folder, args.files, 1)
+        names = sorted(f for f in os.listdir(folder))
+        hanging = names[1:1 + args.hanging]
+        stuck = names[1 + args.hanging:1 + args.hanging + args.stuck]
+        HangingHandler.hanging = {identifiers[names.index(name)] for name in hanging}
+        pdf2doi.pdf2doi = make_stuck_pdf2doi(set(stuck), args.hang)
+        slow = {os.path.join(folder, name) for name in hanging + stuck}
+        print(f"{args.files} files ({args.hanging} with a hanging lookup, {args.stuck} with a hanging analysis), hang {args.hang:.0f} s, {args.workers} workers ({args.executor} pool)")
+
+        runs = {'no deadline': {}, f'timeout {args.timeout:g} s': {'timeout': args.timeout},
+                f'batch_timeout {args.batch_timeout:g} s': {'batch_timeout': args.batch_timeout}}
+        failed = False
+        for name, kwargs in runs.items():
+            if args.skip_baseline and not kwargs:
+                continue
+            start = time.perf_counter()
+            results = pdf2bib.pdf2bib(folder, workers=args.workers, executor=args.executor, **kwargs)
+            elapsed = time.perf_counter() - start
+            found = sum(bool(result['bibtex']) for result in results)
+            cancelled = [result['path'] for result in results if result.get('status') == deadlines.TIMEOUT_STATUS]
+            print(f"{name:20s}: {elapsed:7.2f} s, {found:4d}/{len(results)} bibtex entries, {len(cancelled):4d} cancelled files")
+            if 'timeout' in kwargs:
+                failed |= (set(cancelled) != slow or found != args.files - len(slow))
+    sys.stdout.flush()
+    os._exit(1 if failed else 0) #The threads which are still stuck in the analysis of the slow files are not waited for
+
+
+if __name__ == '__main__':
+    sys.exit(main())
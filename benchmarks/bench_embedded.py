@@ -0,0 +1,61 @@
+'''
+Benchmark of the bibtex entries embedded in the metadata of the pdf files (config.get('embed_metadata'), see embedded.py).
+
+The folder of synthetic pdf files and the local stand-in for dx.doi.org and export.arxiv.org are the same as in bench_two_phase.py. The folder is processed
+a first time with embed_metadata enabled (so that the bibtex entries are found online and stored in the files), and then a second time as it would be on
+another computer, i.e. with both caches of pdf2bib disabled. For each run, the script reports the total time and the number of requests received by the
+stand-in server, and it checks that the bibtex entries of the second run are the same as those of the first one.
+
+Usage:
+    python benchmarks/bench_embedded.py [--files 100] [--latency 0.05] [--workers 8]
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pdf2doi
+import pdf2bib
+from bench_two_phase import StandInHandler, start_standin_server, make_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pdf2bib on a folder whose bibtex entries are embedded in the pdf files.")
+    parser.add_argument("--files", type=int, default=100, help="Number of pdf files in the folder.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency (in seconds) of each answer of the stand-in server.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of workers.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2bib.config.set('save_identifier_metadata', False)
+    pdf2bib.config.set('ratelimit_enabled', False) #The requests would be paced with the limits of dx.doi.org and export.arxiv.org
+    pdf2doi.config.set('websearch', False)
+    StandInHandler.latency = args.latency
+    start_standin_server()
+
+    with tempfile.TemporaryDirectory() as folder:
+        make_corpus(folder, args.files, 1)
+        size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+        runs = {'first run (embed)': {'embed_metadata': True}, 'second run': {}, 'second run (not read)': {'read_embedded_metadata': False}}
+        reference = None
+        for name, settings in runs.items():
+            StandInHandler.requests_count = 0
+            start = time.perf_counter()
+            results = pdf2bib.pdf2bib(folder, workers=args.workers, settings=settings)
+            elapsed = time.perf_counter() - start
+            bibtex = [result['bibtex'] for result in results]
+            reference = reference or bibtex
+            print(f"{name:22s}: {elapsed:7.3f} s, {StandInHandler.requests_count:5d} requests, {sum(map(bool, bibtex)):5d}/{len(results)} bibtex entries, "
+                  f"same entries as the first run: {bibtex == reference}")
+            if bibtex != reference:
+                sys.exit(1)
+        growth = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)) / size - 1
+        print(f"Size of the pdf files: +{100 * growth:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
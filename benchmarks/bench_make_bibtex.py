@@ -0,0 +1,63 @@
+'''
+Benchmark of the function bibtex_makers.make_bibtex_many, compared to calling bibtex_makers.make_bibtex for each entry.
+The metadata dictionaries are synthetic, with the same format as the ones returned by parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg.
+Before timing, the script checks that the two functions return exactly the same strings.
+
+Usage:
+    python benchmarks/bench_make_bibtex.py [--entries 200000] [--repeat 3]
+'''
+import argparse
+import random
+import time
+
+from pdf2bib.bibtex_makers import make_bibtex, make_bibtex_many, _normalize_bibtex_id
+
+FAMILY_NAMES = ['Doe', 'Smith', 'Müller', 'García-López', "O'Brien", 'Nguyễn', '{\\"{o}}rsted', 'van der Berg']
+GIVEN_NAMES = ['Jane', 'John', 'Zoë', 'José', 'A. B.', '']
+TITLE_WORDS = ['Quantum', 'Light-matter', 'On', 'Nonlinear', 'Ultrafast', 'Électron', 'Topological:', 'A']
+
+
+def make_metadata(i, rng):
+    authors = [{'given': rng.choice(GIVEN_NAMES), 'family': rng.choice(FAMILY_NAMES)} for _ in range(rng.randint(1, 8))]
+    title = " ".join(rng.choice(TITLE_WORDS) for _ in range(6))
+    if i % 3 == 2:
+        #Same format as the output of parse_bib_from_exportarxivorg
+        return {'title': title, 'published': '2021-03-04T18:00:00Z', 'eprint': f'arXiv:2103.{i:05d}', 'ejournal': 'arXiv', 'ENTRYTYPE': 'article',
+                'url': f'http://arxiv.org/abs/2103.{i:05d}v1', 'doi': None, 'year': '2021', 'month': '03', 'day': '04',
+                'author': " and ".join(a['given'] + " " + a['family'] for a in authors)}
+    #Same format as the output of parse_bib_from_dxdoiorg (with the method application/citeproc+json)
+    return {'title': title, 'volume': str(i % 100), 'issue': str(i % 12), 'page': f'{i}-{i + 10}', 'publisher': 'Stub Publishing',
+            'url': f'http://dx.doi.org/10.1000%2Fstub.{i}', 'doi': f'10.1000/stub.{i}', 'journal': 'Journal of Stubs',
+            'year': 2000 + i % 23, 'month': 1 + i % 12, 'author': authors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batch bibtex renderer.")
+    parser.add_argument("--entries", type=int, default=200000, help="Number of metadata dictionaries.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions (the best time is reported).")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    metadata_list = [make_metadata(i, rng) for i in range(args.entries)]
+
+    for expected, obtained in zip(map(make_bibtex, metadata_list), make_bibtex_many(metadata_list)):
+        if expected != obtained:
+            raise AssertionError(f"make_bibtex_many returned a different entry:\n{obtained}\ninstead of\n{expected}")
+    print(f"make_bibtex and make_bibtex_many returned identical entries for {args.entries} dictionaries.")
+
+    timings = {}
+    for name, function in [('make_bibtex', lambda: [make_bibtex(metadata) for metadata in metadata_list]),
+                           ('make_bibtex_many', lambda: list(make_bibtex_many(metadata_list)))]:
+        elapsed = []
+        for _ in range(args.repeat):
+            _normalize_bibtex_id.cache_clear() #Each run starts without memoized IDs
+            start = time.perf_counter()
+            function()
+            elapsed.append(time.perf_counter() - start)
+        timings[name] = min(elapsed)
+        print(f"{name:16s}: {timings[name]:7.3f} s, {args.entries/timings[name]:10.0f} entries/s")
+    print(f"Speedup: {timings['make_bibtex']/timings['make_bibtex_many']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+Benchmark of the records of large collaborations (thousands of authors), from the parsing of the data returned by export.arxiv.org and dx.doi.org
+to the bibtex entry.
+
+The records are synthetic: an arXiv entry (in the format returned by pdf2doi when querying export.arxiv.org) and a citeproc+json document (as returned by
+dx.doi.org, where each author also has the keys 'sequence' and 'affiliation'), both with --authors authors. The script reports
+    - the time taken by parse_bib_from_exportarxivorg, compared to the previous version of its author parsing (which split each name twice),
+    - the time taken by make_bibtex and make_bibtex_many and the size of the bibtex entries, with all authors and with config.get('max_authors') = --max_authors,
+    - the memory taken by the metadata of --records records, as returned by the parsers and as stored in the compact results (see compact.py).
+Before timing, the script checks that the new parsing returns the same authors as the previous one, and that the compact metadata gives the same bibtex entries.
+
+Usage:
+    python benchmarks/bench_mega_authors.py [--authors 5000] [--max_authors 10] [--records 100] [--repeat 5]
+'''
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import pdf2bib
+from pdf2bib.bibtex_makers import make_bibtex, make_bibtex_many, parse_bib_from_dxdoiorg, parse_bib_from_exportarxivorg
+from pdf2bib.compact import compact_metadata
+
+FAMILY_NAMES = ['Doe', 'Smith', 'Müller', 'García-López', "O'Brien", 'Nguyễn', 'van der Berg', 'Rossi', 'Tanaka', 'Kowalski']
+GIVEN_NAMES = ['Jane', 'John', 'Zoë', 'José', 'A. B.', 'Maria Luisa', 'K.']
+
+
+def make_arxiv_items(i, authors, rng):
+    names = [f"{rng.choice(GIVEN_NAMES)} {rng.choice(FAMILY_NAMES)}{rng.randrange(1000)}" for _ in range(authors)]
+    return {'title': 'Observation of a new particle in the search for the Standard Model Higgs boson', 'link': f'http://arxiv.org/abs/1207.{i:05d}v2',
+            'published': '2012-07-31T17:54:33Z', 'arxiv_doi': f'10.1016/j.physletb.2012.{i:02d}', 'authors': [{'name': name} for name in names]}
+
+def make_citeproc_text(i, authors, rng):
+    return json.dumps({'title': 'Observation of a new boson at a mass of 125 GeV with the CMS experiment at the LHC', 'volume': '716', 'issue': '1',
+                       'page': '30-61', 'publisher': 'Elsevier BV', 'URL': f'http://dx.doi.org/10.1016/j.physletb.2012.{i:02d}', 'DOI': f'10.1016/j.physletb.2012.{i:02d}',
+                       'container-title': 'Physics Letters B', 'issued': {'date-parts': [[2012, 9]]},
+                       'author': [{'given': rng.choice(GIVEN_NAMES), 'family': f"{rng.choice(FAMILY_NAMES)}{rng.randrange(1000)}", 'sequence': 'additional',
+                                   'affiliation': [{'name': 'CERN, Geneva, Switzerland'}]} for _ in range(authors)]})
+
+def previous_arxiv_authors(items):
+    #Parsing of the authors done by parse_bib_from_exportarxivorg before the names were split only once
+    return [{'given': " ".join(author['name'].split(" ")[0:-1]), 'family': author['name'].split(" ")[-1]} for author in items['authors']]
+
+def best_time(function, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+def allocated_size(function):
+    tracemalloc.start()
+    value = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pdf2bib on records with thousands of authors.")
+    parser.add_argument("--authors", type=int, default=5000, help="Number of authors of each record.")
+    parser.add_argument("--max_authors", type=int, default=10, help="Value of config.get('max_authors') used for the truncated entries.")
+    parser.add_argument("--records", type=int, default=100, help="Number of records whose metadata is kept in memory.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of repetitions (the best time is reported).")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    rng = random.Random(0)
+    arxiv_items = make_arxiv_items(0, args.authors, rng)
+    citeproc_text = make_citeproc_text(0, args.authors, rng)
+    records = {'arXiv': parse_bib_from_exportarxivorg(arxiv_items), 'citeproc': parse_bib_from_dxdoiorg(citeproc_text, 'application/citeproc+json')}
+
+    failed = records['arXiv']['author'] != previous_arxiv_authors(arxiv_items)
+    for metadata in records.values():
+        compact = compact_metadata(metadata)
+        failed |= (make_bibtex(compact) != make_bibtex(metadata) or list(make_bibtex_many([compact])) != [make_bibtex(metadata)])
+        with pdf2bib.config.settings(max_authors=args.max_authors):
+            failed |= (make_bibtex(compact) != make_bibtex(metadata) or list(make_bibtex_many([compact])) != [make_bibtex(metadata)])
+    print(f"{args.authors} authors per record, same authors and bibtex entries as before and with the compact metadata: {not failed}")
+    if failed:
+        sys.exit(1)
+
+    print("Parsing of the authors of the arXiv record:")
+    previous = best_time(lambda: previous_arxiv_authors(arxiv_items), args.repeat)
+    new = best_time(lambda: parse_bib_from_exportarxivorg(arxiv_items), args.repeat)
+    print(f"    split twice (previous)        : {1000 * previous:8.2f} ms")
+    print(f"    parse_bib_from_exportarxivorg : {1000 * new:8.2f} ms ({previous / new:.2f}x)")
+    print(f"    parse_bib_from_dxdoiorg       : {1000 * best_time(lambda: parse_bib_from_dxdoiorg(citeproc_text, 'application/citeproc+json'), args.repeat):8.2f} ms (citeproc record)")
+
+    print("Generation of the bibtex entries:")
+    for name, metadata in records.items():
+        for max_authors in (0, args.max_authors):
+            with pdf2bib.config.settings(max_authors=max_authors):
+                size = len(make_bibtex(metadata).encode('utf-8'))
+                single = best_time(lambda: make_bibtex(metadata), args.repeat)
+                many = best_time(lambda: list(make_bibtex_many([metadata] * 10)), args.repeat) / 10
+            label = f"{name}, max_authors={max_authors}"
+            print(f"    {label:25s}: make_bibtex {1000 * single:7.3f} ms, make_bibtex_many {1000 * many:7.3f} ms, {size:8d} bytes")
+
+    print(f"Memory taken by the metadata of {args.records} records:")
+    for name, metadata in records.items():
+        texts = [make_citeproc_text(i, args.authors, rng) for i in range(args.records)] if name == 'citeproc' else None
+        items = [make_arxiv_items(i, args.authors, rng) for i in range(args.records)] if name == 'arXiv' else None
+        parse = (lambda: [parse_bib_from_dxdoiorg(text, 'application/citeproc+json') for text in texts]) if texts else (lambda: [parse_bib_from_exportarxivorg(i) for i in items])
+        plain, plain_size = allocated_size(parse)
+        _, compact_size = allocated_size(lambda: [compact_metadata(metadata) for metadata in plain])
+        del plain
+        print(f"    {name:8s}: as parsed {plain_size / 2**20:8.1f} MiB, compact {compact_size / 2**20:8.1f} MiB ({plain_size / compact_size:.1f}x smaller)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+'''
+Benchmark of the deduplication and key disambiguation of pdf2bib (see merge.py) when a batch of new entries is merged into a large .bib file.
+
+For each size N, a .bib file with N synthetic entries (generated by make_bibtex_many, so that many keys collide, and merged via MergeEngine so that
+they are all distinct) is created. Then a batch of --batch entries is merged into it: one third of them are duplicates of existing entries (found
+by DOI, by arXiv ID or, for the entries without DOI, by title) and the others are new works, most of which have keys already in use. The script
+reports, for each index ('memory', and 'sqlite' both when the index must be built and when it is reused), the time needed to load the index and
+the time needed to resolve each new entry, which does not depend on N. The index is reused when a second batch is merged into the file
+produced by the first one. It also checks that all duplicates are found and that all keys are distinct.
+
+Usage:
+    python benchmarks/bench_merge.py [--sizes 10000 100000] [--batch 1000] [--seed 0]
+'''
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import pdf2bib
+import pdf2bib.merge as merge
+import pdf2bib.writers as writers
+from pdf2bib.bibtex_makers import make_bibtex_many
+from bench_pipeline import make_paper
+
+
+def make_metadata(paper, with_doi=True):
+    metadata = {'title': paper['title'], 'author': [{'given': given, 'family': family} for given, family in paper['authors']],
+                'journal': 'Journal of Stubs', 'volume': paper['volume'], 'page': paper['page'], 'year': paper['year'], 'month': paper['month']}
+    if paper['year'] % 5 == 0:
+        number = int(paper['doi'].rsplit('.', 1)[1]) #The arXiv IDs of make_paper repeat every 100000 papers
+        metadata['eprint'] = f"arXiv:{2100 + number // 100000}.{number % 100000:05d}v1"
+    if with_doi:
+        metadata['doi'] = paper['doi']
+    return metadata
+
+def make_batch(papers, size, batch, offset, rng):
+    #One third of the batch are duplicates of existing entries (a third of them without DOI, so that they are found by title), the others are new works
+    entries, duplicates = [], 0
+    for i in range(batch):
+        if i % 3 == 0:
+            paper = papers[rng.randrange(size)]
+            entries.append(make_metadata(paper, with_doi=(i % 9 != 0)))
+            duplicates += 1
+        else:
+            entries.append(make_metadata(make_paper(size + offset + i, rng)))
+    return list(make_bibtex_many(entries)), duplicates
+
+def measure(filename, entries, index):
+    start = time.perf_counter()
+    engine = merge.MergeEngine(filename, index=index)
+    writer = writers.BibtexWriter(filename, mode='merge')
+    loaded = time.perf_counter()
+    for bibtex in entries:
+        bibtex = engine.resolve(bibtex)
+        if bibtex:
+            writer.write(bibtex)
+    resolved = time.perf_counter()
+    writer.close()
+    engine.close()
+    return loaded - start, (resolved - loaded) / len(entries), engine
+
+def check_keys(filename):
+    with open(filename, encoding='utf-8') as file:
+        keys = [key for key, _ in writers.iter_bibtex_entries(file) if key]
+    assert len(keys) == len(set(keys)), "Some keys are used more than once"
+    return len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the deduplication of the entries merged into a large .bib file.")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000], help="Numbers of entries of the existing .bib file.")
+    parser.add_argument("--batch", type=int, default=1000, help="Number of entries merged into the .bib file.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+    pdf2bib.config.set('verbose', False)
+
+    with tempfile.TemporaryDirectory() as folder:
+        for size in args.sizes:
+            rng = random.Random(args.seed)
+            papers = [make_paper(i, rng) for i in range(size)]
+            base = os.path.join(folder, f"base{size}.bib")
+            start = time.perf_counter()
+            engine = merge.merge_bibtex_entries(base, make_bibtex_many(make_metadata(paper) for paper in papers), index='memory')
+            print(f"N = {size}: .bib file created in {time.perf_counter() - start:.1f} s ({engine.numb_renamed} keys disambiguated)")
+            batches = [make_batch(papers, size, args.batch, offset, rng) for offset in (0, args.batch)]
+
+            #The second batch is merged into the file (and with the index) left by the first batch with the sqlite index
+            filename = os.path.join(folder, f"refs{size}.bib")
+            for index, name, (batch, duplicates) in [('memory', 'memory', batches[0]), ('sqlite', 'sqlite (build)', batches[0]),
+                                                     ('sqlite', 'sqlite (reuse)', batches[1])]:
+                if name != 'sqlite (reuse)':
+                    shutil.copy(base, filename)
+                    if os.path.exists(filename + merge.INDEX_SUFFIX):
+                        os.remove(filename + merge.INDEX_SUFFIX)
+                load_time, resolve_time, engine = measure(filename, batch, index)
+                assert engine.numb_duplicates == duplicates, f"{engine.numb_duplicates} duplicates were found instead of {duplicates}"
+                numb_entries = check_keys(filename)
+                print(f"    {name:15s}: index loaded in {load_time:7.2f} s, {1e6 * resolve_time:8.1f} us per merged entry "
+                      f"({engine.numb_duplicates} duplicates, {engine.numb_renamed} keys disambiguated, {numb_entries} entries in the file)")
+
+
+if __name__ == '__main__':
+    main()
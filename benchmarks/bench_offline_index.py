@@ -0,0 +1,117 @@
+'''
+Benchmark (and equivalence check) of the offline index of pdf2bib (see offline.py).
+
+Two synthetic snapshots are generated: --records Crossref works in the format of the Crossref REST API (one per line, compressed with gzip, with the
+bulky fields such as references and abstracts which are found in the real snapshots), and a quarter as many papers in the format of the arXiv metadata snapshot.
+The script reports the time needed to import them and the size of the index, and then the time needed by each lookup (offline.lookup) of a DOI
+or an arXiv ID which is in the index, or which is not. For a sample of the identifiers, it also checks that the bibtex entry generated from the
+data in the index is the same as the one generated from the data returned by dx.doi.org and export.arxiv.org (see bench_pipeline.py).
+
+Usage:
+    python benchmarks/bench_offline_index.py [--records 100000] [--lookups 20000] [--seed 0]
+'''
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import pdf2bib
+import pdf2bib.offline as offline
+from pdf2bib.bibtex_makers import parse_bib_from_dxdoiorg, parse_bib_from_exportarxivorg, make_bibtex
+from bench_pipeline import make_paper, make_citeproc_json, make_arxiv_entry
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def make_crossref_work(paper):
+    #Same data of make_citeproc_json, in the format of the Crossref REST API
+    work = json.loads(make_citeproc_json(paper))
+    work.update({'title': [work['title']], 'container-title': [work['container-title']], 'short-container-title': ['J. Stubs'],
+                 'abstract': '<jats:p>An abstract.</jats:p>' * 40, 'reference-count': 30,
+                 'reference': [{'key': f"ref{k}", 'DOI': f"10.1000/stub.{k}", 'unstructured': 'A reference. ' * 5} for k in range(30)]})
+    for author in work['author']:
+        author['affiliation'] = [{'name': 'Department of Stubs, University of Stubs'}]
+    return work
+
+def make_arxiv_item(paper):
+    #Same data of make_arxiv_entry, in the format of the arXiv metadata snapshot
+    weekday = WEEKDAYS[time.strptime(f"{paper['year']}-{paper['month']}-04", "%Y-%m-%d").tm_wday]
+    item = {'id': paper['arxiv_id'], 'submitter': 'Jane Doe', 'title': paper['title'], 'abstract': 'An abstract. ' * 50,
+            'authors': ", ".join(f"{given} {family}" for given, family in paper['authors']),
+            'authors_parsed': [[family, given, ''] for given, family in paper['authors']],
+            'versions': [{'version': 'v1', 'created': f"{weekday}, 04 {MONTH_NAMES[paper['month'] - 1]} {paper['year']} 18:00:00 GMT"}],
+            'doi': paper['doi'] if paper['year'] % 2 else None, 'update_date': f"{paper['year']}-{paper['month']:02d}-04"}
+    return item
+
+def write_jsonl(filename, items):
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'wt', encoding='utf-8') as file:
+        for item in items:
+            file.write(json.dumps(item) + '\n')
+
+def time_lookups(identifiers):
+    times = []
+    for identifier_type, identifier, method in identifiers:
+        start = time.perf_counter()
+        offline.lookup(identifier_type, identifier, method)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return statistics.median(times), times[int(0.99 * (len(times) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the offline index of pdf2bib.")
+    parser.add_argument("--records", type=int, default=100000, help="Number of Crossref works in the snapshot (the arXiv snapshot contains a quarter as many papers).")
+    parser.add_argument("--lookups", type=int, default=20000, help="Number of lookups of each kind.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+    args = parser.parse_args()
+    pdf2bib.config.set('verbose', False)
+
+    rng = random.Random(args.seed)
+    papers = [make_paper(i, rng) for i in range(args.records)]
+    arxiv_papers = papers[:min(len(papers) // 4, 100000)] #The arXiv IDs of make_paper repeat every 100000 papers
+    method = offline.CITEPROC_METHOD
+
+    with tempfile.TemporaryDirectory() as folder:
+        crossref_snapshot = os.path.join(folder, 'crossref-works.jsonl.gz')
+        arxiv_snapshot = os.path.join(folder, 'arxiv-metadata-snapshot.json')
+        write_jsonl(crossref_snapshot, (make_crossref_work(paper) for paper in papers))
+        write_jsonl(arxiv_snapshot, (make_arxiv_item(paper) for paper in arxiv_papers))
+        snapshots_size = os.path.getsize(crossref_snapshot) + os.path.getsize(arxiv_snapshot)
+
+        pdf2bib.config.set('offline_index', os.path.join(folder, 'index.sqlite'))
+        start = time.perf_counter()
+        counts = offline.import_snapshots([crossref_snapshot, arxiv_snapshot])
+        elapsed = time.perf_counter() - start
+        numb_records = sum(counts.values())
+        print(f"Import: {numb_records} records ({counts}) in {elapsed:.1f} s ({1e6 * elapsed / numb_records:.0f} us per record), "
+              f"index of {os.path.getsize(offline.offline_index_path()) / 2**20:.1f} MB (snapshots: {snapshots_size / 2**20:.1f} MB)")
+
+        hits_doi = [('DOI', rng.choice(papers)['doi'], method) for _ in range(args.lookups)]
+        hits_arxiv = [('arxiv ID', rng.choice(arxiv_papers)['arxiv_id'], '') for _ in range(args.lookups)]
+        misses = [('DOI', f"10.9999/missing.{i}", method) for i in range(args.lookups)]
+        offline.lookup(*hits_doi[0]) #The index is opened
+        for name, identifiers in [('DOI (found)', hits_doi), ('arXiv ID (found)', hits_arxiv), ('DOI (not found)', misses)]:
+            median, p99 = time_lookups(identifiers)
+            print(f"{name:17s}: median {1e6 * median:7.1f} us, p99 {1e6 * p99:7.1f} us per lookup")
+
+        mismatches = 0
+        for paper in rng.sample(papers, min(1000, len(papers))):
+            expected = make_bibtex(parse_bib_from_dxdoiorg(make_citeproc_json(paper), method))
+            mismatches += make_bibtex(parse_bib_from_dxdoiorg(offline.lookup('DOI', paper['doi'], method), method)) != expected
+        for paper in rng.sample(arxiv_papers, min(1000, len(arxiv_papers))):
+            expected = make_bibtex(parse_bib_from_exportarxivorg(make_arxiv_entry(paper)))
+            mismatches += make_bibtex(parse_bib_from_exportarxivorg(offline.lookup('arxiv ID', paper['arxiv_id']))) != expected
+        print(f"Equivalence with the data returned online: {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+Offline benchmark suite for the whole pdf2bib pipeline. No internet connection nor real pdf files are needed.
+
+The function pdf2doi.pdf2doi is replaced by a deterministic stand-in (see StubPdf2doi) which waits for a configurable time (simulating the network lookup)
+and then returns, for each file, either a citeproc+json record, an x-bibtex record (depending on pdf2doi.config.get('method_dxdoiorg')) or an arXiv record,
+or no identifier at all (with probability error_rate). The same synthetic records are used to benchmark the single stages of the pipeline:
+    parse_dxdoiorg_citeproc   : bibtex_makers.parse_bib_from_dxdoiorg with the method application/citeproc+json
+    parse_dxdoiorg_xbibtex    : bibtex_makers.parse_bib_from_dxdoiorg with the method application/x-bibtex
+    parse_exportarxivorg      : bibtex_makers.parse_bib_from_exportarxivorg
+    make_bibtex               : bibtex_makers.make_bibtex
+    save_bibtex_entries       : main.save_bibtex_entries (writing a .bib file)
+    pdf2bib[N]                : pdf2bib.pdf2bib on a folder with N (empty) pdf files
+For each benchmark the script reports the throughput, the percentiles of the latency of each item (i.e. of each call, written entry or processed file) and
+the peak memory allocated (measured with tracemalloc in a separate run, so that it does not affect the timings). The persistent caches of pdf2bib are disabled.
+The results are printed (or saved) as JSON, so that different releases can be compared.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--entries 10000] [--entries_xbibtex 1000] [--sizes 10 100 1000 10000] [--latency 0.005] [--error_rate 0.05]
+                                        [--workers 8] [--seed 0] [--output results.json]
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pdf2doi
+import pdf2bib
+import pdf2bib.bibtex_makers as bibtex_makers
+import pdf2bib.main as main_module
+
+FAMILY_NAMES = ['Doe', 'Smith', 'Müller', 'García', "O'Brien", 'Nguyễn', 'Rossi', 'van der Berg']
+GIVEN_NAMES = ['Jane', 'John', 'Zoë', 'José', 'A. B.', 'Maria']
+TITLE_WORDS = ['Quantum', 'Light-matter', 'interaction', 'in', 'Nonlinear', 'Ultrafast', 'optical', 'metasurfaces', 'Topological', 'photonics']
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def make_paper(i, rng):
+    #Returns the "true" data of the i-th synthetic paper, from which the records returned by the different websites are generated
+    return {'doi': f"10.1000/stub.{i}", 'arxiv_id': f"2103.{i % 100000:05d}", 'title': " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(4, 12))),
+            'authors': [(rng.choice(GIVEN_NAMES), rng.choice(FAMILY_NAMES)) for _ in range(rng.randint(1, 10))],
+            'year': rng.randint(1990, 2024), 'month': rng.randint(1, 12), 'volume': str(rng.randint(1, 200)), 'page': f"{i}-{i + 12}"}
+
+def make_citeproc_json(paper):
+    #Same format as the text returned by dx.doi.org with the method application/citeproc+json
+    return json.dumps({'type': 'journal-article', 'title': paper['title'], 'DOI': paper['doi'], 'URL': 'http://dx.doi.org/' + paper['doi'],
+                       'container-title': 'Journal of Stubs', 'publisher': 'Stub Publishing', 'volume': paper['volume'], 'issue': '2',
+                       'page': paper['page'], 'issued': {'date-parts': [[paper['year'], paper['month']]]},
+                       'author': [{'given': given, 'family': family, 'sequence': 'additional', 'affiliation': []} for given, family in paper['authors']]})
+
+def make_xbibtex(paper):
+    #Same format as the text returned by dx.doi.org with the method application/x-bibtex
+    authors = " and ".join(f"{family}, {given}" for given, family in paper['authors'])
+    return (f" @article{{{paper['authors'][0][1].replace(' ', '_')}_{paper['year']}, title={{{paper['title']}}}, volume={{{paper['volume']}}}, "
+            f"ISSN={{1234-5678}}, url={{http://dx.doi.org/{paper['doi']}}}, DOI={{{paper['doi']}}}, number={{2}}, journal={{Journal of Stubs}}, "
+            f"publisher={{Stub Publishing}}, author={{{authors}}}, year={{{paper['year']}}}, month={MONTHS[paper['month'] - 1]}, pages={{{paper['page']}}} }}\n")
+
+def make_arxiv_entry(paper):
+    #Same format as the dictionary obtained by pdf2doi by parsing (with feedparser) the response of export.arxiv.org
+    authors = [{'name': f"{given} {family}"} for given, family in paper['authors']]
+    return {'id': f"http://arxiv.org/abs/{paper['arxiv_id']}v1", 'title': paper['title'], 'summary': 'An abstract. ' * 50,
+            'link': f"http://arxiv.org/abs/{paper['arxiv_id']}v1", 'published': f"{paper['year']}-{paper['month']:02d}-04T18:00:00Z",
+            'arxiv_doi': paper['doi'] if paper['year'] % 2 else None, 'authors': authors, 'author': authors[-1]['name']}
+
+
+class StubPdf2doi():
+    '''
+    Deterministic stand-in of pdf2doi.pdf2doi. The result for each file depends only on its name and on seed: with probability error_rate no identifier is found,
+    otherwise a DOI record (in the format of pdf2doi.config.get('method_dxdoiorg')) is returned for 2/3 of the files, and an arXiv record for the others.
+    '''
+    def __init__(self, latency=0.005, error_rate=0.05, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+
+    def __call__(self, filename):
+        name = os.path.basename(filename)
+        rng = random.Random(f"{self.seed}|{name}")
+        if self.latency:
+            time.sleep(self.latency)
+        result = {'identifier': None, 'identifier_type': None, 'validation_info': None, 'path': filename, 'method': None}
+        if rng.random() < self.error_rate:
+            return result
+        i = int(''.join(c for c in name if c.isdigit()) or 0)
+        paper = make_paper(i, rng)
+        if i % 3 == 2:
+            result.update({'identifier': paper['arxiv_id'], 'identifier_type': 'arxiv ID', 'validation_info': make_arxiv_entry(paper), 'method': 'stub'})
+        elif pdf2doi.config.get('method_dxdoiorg') == 'application/citeproc+json':
+            result.update({'identifier': paper['doi'], 'identifier_type': 'DOI', 'validation_info': make_citeproc_json(paper), 'method': 'stub'})
+        else:
+            result.update({'identifier': paper['doi'], 'identifier_type': 'DOI', 'validation_info': make_xbibtex(paper), 'method': 'stub'})
+        return result
+
+
+def percentile(sorted_values, q):
+    #Nearest-rank percentile of a sorted list
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))]
+
+def summarize(name, size, elapsed, latencies, peak):
+    latencies = sorted(latencies)
+    latency_ms = None
+    if latencies:
+        latency_ms = {f"p{q}": round(1000 * percentile(latencies, q), 4) for q in (50, 90, 99)}
+        latency_ms['max'] = round(1000 * latencies[-1], 4)
+    return {'benchmark': name, 'size': size, 'elapsed_s': round(elapsed, 6), 'throughput_per_s': round(size / elapsed, 2) if elapsed else None,
+            'latency_ms': latency_ms, 'peak_memory_mb': round(peak / 1e6, 3)}
+
+def run_benchmark(name, size, run):
+    '''
+    Calls run(record) twice: the first time to measure the elapsed time, the second time (with tracemalloc enabled) to measure the peak memory.
+    The function run must call record() once for each item (call, entry, file...) which is completed, so that the latency of each item can be computed.
+    '''
+    latencies = []
+    last = [time.perf_counter()]
+    def record(latency=None):
+        now = time.perf_counter()
+        latencies.append(now - last[0] if latency is None else latency)
+        last[0] = now
+    start = last[0] = time.perf_counter()
+    run(record)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    run(lambda latency=None: None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = summarize(name, size, elapsed, latencies, peak)
+    print(f"{name:28s}: {elapsed:8.3f} s, {result['throughput_per_s']:10.1f} items/s, peak memory {result['peak_memory_mb']:8.2f} MB", file=sys.stderr)
+    return result
+
+def per_item(function, items):
+    def run(record):
+        for item in items:
+            function(item)
+            record()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for pdf2bib.")
+    parser.add_argument("--entries", type=int, default=10000, help="Number of synthetic records used for the benchmarks of the single stages.")
+    parser.add_argument("--entries_xbibtex", type=int, default=1000,
+                        help="Number of synthetic x-bibtex records (parsing them with bibtexparser is much slower than the other stages).")
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10, 100, 1000, 10000], help="Numbers of pdf files for the end-to-end benchmarks.")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latency (in seconds) of each call of the stubbed pdf2doi.")
+    parser.add_argument("--error_rate", type=float, default=0.05, help="Fraction of files for which the stubbed pdf2doi finds no identifier.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of workers used by pdf2bib in the end-to-end benchmarks.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpora.")
+    parser.add_argument("--output", help="File where the JSON report is saved. If not specified, it is printed.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2doi.pdf2doi = StubPdf2doi(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+
+    rng = random.Random(args.seed)
+    papers = [make_paper(i, rng) for i in range(args.entries)]
+    citeproc_corpus = [make_citeproc_json(paper) for paper in papers]
+    xbibtex_corpus = [make_xbibtex(paper) for paper in papers[:args.entries_xbibtex]]
+    arxiv_corpus = [make_arxiv_entry(paper) for paper in papers]
+    metadata_corpus = [bibtex_makers.parse_bib_from_dxdoiorg(text, 'application/citeproc+json') for text in citeproc_corpus]
+
+    results = []
+    results.append(run_benchmark('parse_dxdoiorg_citeproc', args.entries,
+                                 per_item(lambda text: bibtex_makers.parse_bib_from_dxdoiorg(text, 'application/citeproc+json'), citeproc_corpus)))
+    results.append(run_benchmark('parse_dxdoiorg_xbibtex', len(xbibtex_corpus),
+                                 per_item(lambda text: bibtex_makers.parse_bib_from_dxdoiorg(text, 'application/x-bibtex'), xbibtex_corpus)))
+    results.append(run_benchmark('parse_exportarxivorg', args.entries, per_item(bibtex_makers.parse_bib_from_exportarxivorg, arxiv_corpus)))
+    results.append(run_benchmark('make_bibtex', args.entries, per_item(bibtex_makers.make_bibtex, metadata_corpus)))
+
+    with tempfile.TemporaryDirectory() as folder:
+        entries = [{'bibtex': bibtex_makers.make_bibtex(metadata), 'path': os.path.join(folder, f"paper{i:05d}.pdf")}
+                   for i, metadata in enumerate(metadata_corpus)]
+        def save(record):
+            def timed_entries():
+                for entry in entries:
+                    yield entry
+                    record()
+            with contextlib.redirect_stdout(io.StringIO()): #save_bibtex_entries prints a message when done
+                main_module.save_bibtex_entries('references.bib', timed_entries())
+        results.append(run_benchmark('save_bibtex_entries', args.entries, save))
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(size):
+                open(os.path.join(folder, f"paper{i:05d}.pdf"), 'wb').close()
+            def end_to_end(record):
+                #The latency of each file is measured from the start to the end of pdf2bib_singlefile (in the thread where it runs)
+                pdf2bib_singlefile = main_module.pdf2bib_singlefile
+                def timed_pdf2bib_singlefile(filename):
+                    start = time.perf_counter()
+                    try:
+                        return pdf2bib_singlefile(filename)
+                    finally:
+                        record(time.perf_counter() - start)
+                main_module.pdf2bib_singlefile = timed_pdf2bib_singlefile
+                try:
+                    pdf2bib.pdf2bib(folder, workers=args.workers)
+                finally:
+                    main_module.pdf2bib_singlefile = pdf2bib_singlefile
+            results.append(run_benchmark(f'pdf2bib[{size}]', size, end_to_end))
+
+    try:
+        from importlib.metadata import version
+        pdf2bib_version = version('pdf2bib')
+    except Exception:
+        pdf2bib_version = None
+    report = {'pdf2bib_version': pdf2bib_version, 'python_version': platform.python_version(), 'platform': platform.platform(),
+              'parameters': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+Benchmark of the process-pool mode of pdf2bib (pdf2bib.pdf2bib(target, workers=N, executor='process')) on a CPU-bound workload.
+
+A folder of synthetic pdf files (each with a few pages of dense text, and no identifier) is generated with pymupdf, which is installed together with pdf2doi.
+Online searches and validations of pdf2doi are disabled, so no internet connection is needed and all the time is spent by pdf2doi analyzing the pdf files.
+The settings are passed to the worker processes by pdf2bib itself, so the benchmark works with any start method of the processes (fork, spawn, forkserver).
+Since the analysis is CPU-bound, the 'thread' executor does not scale with the number of workers, while the 'process' executor should scale almost linearly
+up to the number of cores.
+
+Usage:
+    python benchmarks/bench_processes.py [--files 16] [--pages 1] [--workers 1 2 4 8]
+'''
+import argparse
+import os
+import tempfile
+import time
+
+import pdf2doi
+import pdf2bib
+
+LINE = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et dolore magna aliqua. " * 3
+
+
+def make_pdf(filename, pages):
+    import pymupdf
+    document = pymupdf.open()
+    for _ in range(pages):
+        page = document.new_page()
+        page.insert_text((40, 40), "\n".join([LINE] * 40), fontsize=6)
+    document.save(filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the thread and process executors of pdf2bib on CPU-bound pdf files.")
+    parser.add_argument("--files", type=int, default=16, help="Number of pdf files in the folder.")
+    parser.add_argument("--pages", type=int, default=1, help="Number of pages of each pdf file.")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8], help="Values of workers to benchmark.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2bib.config.set('save_identifier_metadata', False)
+    pdf2doi.config.set('websearch', False)
+    pdf2doi.config.set('webvalidation', False)
+
+    print(f"Number of cores: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(args.files):
+            make_pdf(os.path.join(folder, f"paper{i:05d}.pdf"), args.pages)
+
+        reference = None
+        for executor in ['thread', 'process']:
+            for workers in args.workers:
+                start = time.perf_counter()
+                results = pdf2bib.pdf2bib(folder, workers=workers, executor=executor)
+                elapsed = time.perf_counter() - start
+                if reference is None:
+                    reference = elapsed
+                identifiers = [result['identifier'] for result in results]
+                print(f"executor = {executor:7s}, workers = {workers:3d}: {elapsed:8.3f} s, {args.files/elapsed:6.2f} files/s, "
+                      f"speedup {reference/elapsed:5.2f}x, identifiers found: {sum(identifier is not None for identifier in identifiers)}")
+
+
+if __name__ == '__main__':
+    main()
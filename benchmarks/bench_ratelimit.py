@@ -0,0 +1,119 @@
+'''
+Benchmark of the per-host rate limiting of pdf2bib (see ratelimit.py) against the unpaced queries done by pdf2doi.
+
+A local stand-in server answers after a fixed latency (--latency), but it accepts at most --server_rate requests per second: the requests beyond this
+rate are answered with the status 429 and the header Retry-After, as done by dx.doi.org and export.arxiv.org when they throttle a client.
+A batch of --requests queries is then sent by --threads threads
+    - 'unpaced': each query is retried immediately (at most 10 times, as done by pdf2doi.finders.validate_doi_web) until it succeeds,
+    - 'adaptive': each query is sent via ratelimit.get, with no limit on the rate (only the adaptive limit on the concurrency, and the backoff),
+    - 'paced': each query is sent via ratelimit.get, with a limit of --limit requests per minute (by default, 90% of the rate accepted by the server).
+For each approach the script reports the time needed, the number of queries which succeeded, the number of requests received by the server
+and how many of them were throttled, and the final limits of the host.
+
+Usage:
+    python benchmarks/bench_ratelimit.py [--requests 500] [--threads 32] [--server_rate 100] [--latency 0.05] [--limit 0]
+'''
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+import pdf2bib
+import pdf2bib.ratelimit as ratelimit
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+    rate = 100
+    tokens = 0.0
+    last = 0.0
+    received = 0
+    throttled = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            now = time.monotonic()
+            cls = ThrottlingHandler
+            cls.tokens = min(cls.rate / 10, cls.tokens + (now - cls.last) * cls.rate) #Bursts of at most 0.1 s worth of requests
+            cls.last = now
+            cls.received += 1
+            accepted = cls.tokens >= 1
+            if accepted:
+                cls.tokens -= 1
+            else:
+                cls.throttled += 1
+        time.sleep(self.latency)
+        body = b'{"title": "A stand-in paper"}' if accepted else b'Too Many Requests'
+        self.send_response(200 if accepted else 429)
+        if not accepted:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def unpaced_get(url, attempts=10):
+    for _ in range(attempts):
+        try:
+            response = requests.get(url, timeout=ratelimit.REQUEST_TIMEOUT)
+        except requests.RequestException:
+            continue
+        if not ratelimit.is_throttled(response.status_code, response.text):
+            return response
+    return None
+
+def paced_get(url):
+    try:
+        response = ratelimit.get(url)
+    except requests.RequestException:
+        return None
+    return None if ratelimit.is_throttled(response.status_code, response.text) else response
+
+def run(get, url, numb_requests, threads):
+    ThrottlingHandler.received, ThrottlingHandler.throttled = 0, 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        responses = list(executor.map(get, [f"{url}{i}" for i in range(numb_requests)]))
+    return time.perf_counter() - start, sum(response is not None for response in responses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the per-host rate limiting of pdf2bib against unpaced queries.")
+    parser.add_argument("--requests", type=int, default=500, help="Number of queries of the batch.")
+    parser.add_argument("--threads", type=int, default=32, help="Number of threads sending the queries.")
+    parser.add_argument("--server_rate", type=int, default=100, help="Number of requests per second accepted by the stand-in server.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency (in seconds) of each answer of the stand-in server.")
+    parser.add_argument("--limit", type=int, default=0, help="Requests per minute of the 'paced' approach (default: 90%% of the rate of the server).")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('ratelimit_max_concurrency', args.threads)
+    ThrottlingHandler.latency, ThrottlingHandler.rate = args.latency, args.server_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    limit = args.limit or int(0.9 * 60 * args.server_rate)
+
+    print(f"{args.requests} queries, {args.threads} threads, server accepting {args.server_rate} requests/s with latency {1000 * args.latency:.0f} ms")
+    for name, per_minute in [('unpaced', None), ('adaptive', None), ('paced', limit)]:
+        ratelimit.set_host_limit('127.0.0.1', per_minute=per_minute)
+        time.sleep(1) #The bucket of the server is refilled
+        elapsed, succeeded = run(unpaced_get if name == 'unpaced' else paced_get, url, args.requests, args.threads)
+        print(f"{name:9s}: {elapsed:7.2f} s, {succeeded:5d}/{args.requests} succeeded, {ThrottlingHandler.received:6d} requests received by the server "
+              f"({ThrottlingHandler.throttled} throttled)")
+        if name != 'unpaced':
+            stats = ratelimit.get_limiter('127.0.0.1').stats()
+            print(f"           final limits: concurrency {stats['concurrency']}"
+                  + (f", {stats['per_minute']:.0f} requests per minute" if stats['per_minute'] else ""))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Benchmark of the memory taken by the results of pdf2bib, when they are stored as dictionaries (default) or as compact records (pdf2bib.compact.Result,
+used when pdf2bib.config.get('compact_results') is True) with each of the modes of config.get('compact_validation_info').
+
+For each synthetic paper, a citeproc+json record similar to those returned by dx.doi.org (including the list of references, license and links, which
+make up most of its size) or an arXiv record is generated, and it is turned into a result exactly as done by pdf2bib_singlefile. The memory retained
+by the list of all results is measured with tracemalloc. No internet connection is needed.
+
+Usage:
+    python benchmarks/bench_results_memory.py [--files 5000] [--references 40]
+'''
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+import pdf2bib
+import pdf2bib.compact as compact
+from pdf2bib.main import _add_bibtex_to_result
+from bench_pipeline import make_paper, make_citeproc_json, make_arxiv_entry
+
+
+def make_crossref_record(paper, references, rng):
+    #Adds to the citeproc+json record the fields which are normally returned by dx.doi.org but not used by pdf2bib
+    record = json.loads(make_citeproc_json(paper))
+    record.update({'indexed': {'date-parts': [[2024, 1, 1]], 'date-time': '2024-01-01T00:00:00Z', 'timestamp': 1704067200000},
+                   'reference-count': references, 'source': 'Crossref', 'is-referenced-by-count': rng.randint(0, 500),
+                   'license': [{'start': {'date-parts': [[paper['year'], 1, 1]]}, 'content-version': 'vor', 'delay-in-days': 0,
+                                'URL': 'https://link.aps.org/licenses/aps-default-license'}],
+                   'link': [{'URL': f"http://link.aps.org/article/{paper['doi']}", 'content-type': 'unspecified', 'intended-application': 'similarity-checking'}],
+                   'reference': [{'key': f"{paper['doi']}_ref{j}", 'doi-asserted-by': 'publisher', 'DOI': f"10.{1000 + j}/ref.{rng.randint(0, 10**6)}",
+                                  'unstructured': f"A. Author and B. Author, Some Journal {rng.randint(1, 100)}, {rng.randint(1, 9999)} ({rng.randint(1950, 2024)})."}
+                                 for j in range(references)]})
+    return json.dumps(record)
+
+def make_results(files, references, mode):
+    rng = random.Random(0)
+    results = []
+    for i in range(files):
+        paper = make_paper(i, rng)
+        if i % 3 == 2:
+            result = {'identifier': paper['arxiv_id'], 'identifier_type': 'arxiv ID', 'validation_info': make_arxiv_entry(paper),
+                      'path': f"/papers/paper{i:06d}.pdf", 'method': 'document_text'}
+        else:
+            result = {'identifier': paper['doi'], 'identifier_type': 'DOI', 'validation_info': make_crossref_record(paper, references, rng),
+                      'path': f"/papers/paper{i:06d}.pdf", 'method': 'document_infos'}
+        _add_bibtex_to_result(result)
+        result['timings'] = {'cache': 0.001, 'extraction': 0.01, 'lookup': 0.2, 'parse': 0.001, 'render': 0.0005, 'total': 0.22}
+        results.append(compact.Result(result, validation_info=mode) if mode else result)
+    return results
+
+def measure(files, references, mode):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    results = make_results(files, references, mode)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    bibtex = [result['bibtex'] for result in results]
+    return memory, elapsed, bibtex
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the memory taken by the results of pdf2bib.")
+    parser.add_argument("--files", type=int, default=5000, help="Number of results.")
+    parser.add_argument("--references", type=int, default=40, help="Number of references in each citeproc+json record.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    reference = None
+    for mode in [None] + compact.VALIDATION_INFO_MODES:
+        memory, elapsed, bibtex = measure(args.files, args.references, mode)
+        if reference is None:
+            reference = (memory, bibtex)
+        assert bibtex == reference[1], "The compact results contain different bibtex entries"
+        name = 'dict' if mode is None else f"Result ({mode})"
+        print(f"{name:20s}: {memory / 2**20:9.1f} MiB ({memory / args.files / 1024:6.2f} KiB per result, {reference[0] / memory:5.2f}x less than dict), "
+              f"built in {elapsed:6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
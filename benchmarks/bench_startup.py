@@ -0,0 +1,81 @@
+'''
+Benchmark of the cold start-up time of pdf2bib. Each command is run several times in a new python process, and the median wall time is reported for
+    import          : python -c "import pdf2bib"
+    help            : python -m pdf2bib.main --help
+    singlefile      : a full command-line run (pdf2bib file.pdf) on an empty pdf file. The function pdf2doi.pdf2doi is replaced by a stand-in
+                      which returns a fixed citeproc+json record, so that no internet connection is needed, but pdf2doi is still imported.
+With --importtime, the modules which take the longest to import (measured via python -X importtime) are also listed for each command.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 10] [--importtime]
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SINGLEFILE_SCRIPT = '''
+import json, os, sys
+import pdf2doi
+import pdf2bib
+import pdf2bib.main
+def stub_pdf2doi(filename):
+    citeproc = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]},
+                'author': [{'given': 'Jane', 'family': 'Doe'}]}
+    return {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(citeproc), 'path': filename, 'method': 'stub'}
+pdf2doi.pdf2doi = stub_pdf2doi
+pdf2bib.config.set('separator', os.path.sep)
+sys.argv = ['pdf2bib', sys.argv[1], '-nocache', '-nostore']
+pdf2bib.main.main()
+'''
+
+
+def run(command, importtime=False):
+    #Runs command in a new process, and returns the wall time (and the output of -X importtime, if importtime is True)
+    if importtime:
+        command = [command[0], '-X', 'importtime'] + command[1:]
+    start = time.perf_counter()
+    completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"The command {command} failed:\n{completed.stderr}")
+    return elapsed, completed.stderr
+
+def slowest_imports(importtime_output, number=10):
+    #Parses the output of python -X importtime, and returns the number top-level imports with the largest cumulative time
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if len(name) - len(name.lstrip()) <= 3: #only the modules imported directly by the command (or by site)
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:number]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the start-up time of pdf2bib.")
+    parser.add_argument("--runs", type=int, default=10, help="Number of runs of each command (the median is reported).")
+    parser.add_argument("--importtime", action="store_true", help="Also list the slowest imports of each command.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'paper.pdf')
+        open(filename, 'wb').close()
+        commands = {'import': [sys.executable, '-c', 'import pdf2bib'],
+                    'help': [sys.executable, '-m', 'pdf2bib.main', '--help'],
+                    'singlefile': [sys.executable, '-c', SINGLEFILE_SCRIPT, filename]}
+        for name, command in commands.items():
+            run(command) #The first run is discarded, so that all files are in the OS cache
+            times = [run(command)[0] for _ in range(args.runs)]
+            print(f"{name:12s}: median {1000 * statistics.median(times):8.1f} ms, min {1000 * min(times):8.1f} ms, max {1000 * max(times):8.1f} ms")
+            if args.importtime:
+                for cumulative, module in slowest_imports(run(command, importtime=True)[1]):
+                    print(f"{'':14s}{cumulative / 1000:8.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+'''
+Benchmark of the two-phase pipeline of pdf2bib (pdf2bib.pipeline.pdf2bib_pipeline) against the standard per-file processing (pdf2bib.pdf2bib).
+
+A folder of synthetic pdf files is generated with pymupdf (which is installed together with pdf2doi). The identifier of each file (a DOI or an arXiv ID) is
+stored in its metadata, and each identifier is shared by several files (--copies), as it happens in folders containing different versions of the same papers.
+The queries of pdf2doi to dx.doi.org and export.arxiv.org are redirected to a local stand-in server, which answers after a fixed latency (--latency), counts
+the requests it receives, and (optionally) drops the first connection for a fraction of the identifiers (--failures), to simulate an unreliable network.
+Both the persistent cache and the identifier cache of pdf2bib are disabled, so that the number of requests reflects the work done by each approach.
+The rate limiting of pdf2bib is disabled as well (see bench_ratelimit.py).
+
+Usage:
+    python benchmarks/bench_two_phase.py [--files 200] [--copies 4] [--latency 0.05] [--failures 0.0] [--workers 8] [--concurrency 16]
+'''
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+
+import feedparser
+import requests
+import pdf2doi
+import pdf2bib
+import pdf2bib.pipeline as pipeline
+
+ARXIV_FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom">
+<entry><id>http://arxiv.org/abs/{id}v1</id><published>2019-10-23T10:00:00Z</published><title>A stand-in arXiv paper {id}</title>
+<author><name>Alice B. Carter</name></author><author><name>Dan Evans</name></author>
+<link href="http://arxiv.org/abs/{id}v1" rel="alternate" type="text/html"/></entry></feed>'''
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.05
+    failing = set() #identifiers whose first request is dropped
+    requests_count = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/api/query'):
+            identifier = unquote(self.path.split('id:')[1])
+        else:
+            identifier = unquote(self.path[1:])
+        with self.lock:
+            StandInHandler.requests_count += 1
+            drop = identifier in self.failing
+            self.failing.discard(identifier)
+        time.sleep(self.latency)
+        if drop:
+            self.close_connection = True
+            self.connection.close()
+            return
+        if self.path.startswith('/api/query'):
+            body, content_type = ARXIV_FEED.format(id=identifier).encode(), 'application/atom+xml'
+        else:
+            body = json.dumps({'title': f'A stand-in paper {identifier}', 'DOI': identifier, 'container-title': 'Journal of Stand-ins', 'volume': '1',
+                               'issued': {'date-parts': [[2020, 5]]}, 'author': [{'given': 'Jane', 'family': 'Doe'}]}).encode()
+            content_type = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_standin_server():
+    '''
+    Starts the stand-in server in a background thread, and redirects to it the queries done by pdf2doi (via requests and feedparser).
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/'
+    requests_get, feedparser_parse = requests.get, feedparser.parse
+    requests.get = lambda address, *args, **kwargs: requests_get(address.replace('https://dx.doi.org/', url).replace('http://export.arxiv.org/', url), *args, **kwargs)
+    feedparser.parse = lambda address, *args, **kwargs: feedparser_parse(address.replace('http://export.arxiv.org/', url), *args, **kwargs)
+    return server
+
+def make_corpus(folder, files, copies):
+    #Each identifier is stored in the metadata of copies files. One identifier out of five is an arXiv ID.
+    import pymupdf
+    identifiers = []
+    for i in range(files):
+        number = i // copies
+        identifier = f'{1900 + number % 100:04d}.{10000 + number:05d}' if number % 5 == 4 else f'10.1000/standin.{number}'
+        document = pymupdf.open()
+        document.new_page().insert_text((40, 40), "A paper without identifiers in the text", fontsize=8)
+        document.set_metadata({'subject': f'arXiv:{identifier}' if number % 5 == 4 else f'doi:{identifier}'})
+        document.save(os.path.join(folder, f"paper{i:05d}.pdf"))
+        identifiers.append(identifier)
+    return identifiers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the two-phase pipeline of pdf2bib against the per-file processing.")
+    parser.add_argument("--files", type=int, default=200, help="Number of pdf files in the folder.")
+    parser.add_argument("--copies", type=int, default=4, help="Number of files sharing the same identifier.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency (in seconds) of each answer of the stand-in server.")
+    parser.add_argument("--failures", type=float, default=0.0, help="Fraction of identifiers whose first request is dropped by the stand-in server.")
+    parser.add_argument("--workers", type=int, default=8, help="Number of workers of both approaches.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent validations of the two-phase pipeline.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False)
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2bib.config.set('save_identifier_metadata', False)
+    pdf2bib.config.set('ratelimit_enabled', False) #The requests would be paced with the limits of dx.doi.org and export.arxiv.org
+    pdf2doi.config.set('websearch', False)
+    StandInHandler.latency = args.latency
+    start_standin_server()
+
+    with tempfile.TemporaryDirectory() as folder:
+        identifiers = make_corpus(folder, args.files, args.copies)
+        unique = sorted(set(identifiers))
+        print(f"{args.files} files, {len(unique)} unique identifiers, latency {1000 * args.latency:.0f} ms, failures {100 * args.failures:.0f}%")
+        runs = {'per-file': lambda: pdf2bib.pdf2bib(folder, workers=args.workers),
+                'two-phase': lambda: pipeline.pdf2bib_pipeline(folder, workers=args.workers, concurrency=args.concurrency)}
+        for name, run in runs.items():
+            StandInHandler.requests_count = 0
+            StandInHandler.failing = set(random.Random(0).sample(unique, int(args.failures * len(unique))))
+            start = time.perf_counter()
+            results = run()
+            elapsed = time.perf_counter() - start
+            found = sum(bool(result['bibtex']) for result in results)
+            print(f"{name:10s}: {elapsed:8.3f} s, {StandInHandler.requests_count:6d} requests, {found:6d}/{len(results)} bibtex entries")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+'''
+Benchmark of the concurrent processing of a folder (pdf2bib.pdf2bib(target, workers=N)).
+
+The function pdf2doi.pdf2doi is replaced by a stand-in which waits for a fixed time (simulating the network lookup) and then returns
+a valid citeproc+json record, so that the benchmark does not require any internet connection nor real pdf files.
+
+Usage:
+    python benchmarks/bench_workers.py [--files 100] [--latency 0.2] [--workers 1 4 8 16]
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import pdf2doi
+import pdf2bib
+
+
+def make_stub_pdf2doi(latency):
+    def stub_pdf2doi(filename):
+        time.sleep(latency)
+        doi = "10.1000/" + os.path.basename(filename)[:-4]
+        citeproc = {'title': 'A stub paper', 'DOI': doi, 'URL': 'http://dx.doi.org/' + doi, 'container-title': 'Journal of Stubs',
+                    'publisher': 'Stub Publishing', 'volume': '1', 'issue': '2', 'page': '3-4', 'issued': {'date-parts': [[2020, 5]]},
+                    'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Smith'}]}
+        return {'identifier': doi, 'identifier_type': 'DOI', 'validation_info': json.dumps(citeproc), 'path': filename, 'method': 'stub'}
+    return stub_pdf2doi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pdf2bib on a folder with a stubbed resolver of fixed latency.")
+    parser.add_argument("--files", type=int, default=100, help="Number of (empty) pdf files in the folder.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Latency (in seconds) of each stubbed lookup.")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 4, 8, 16], help="Values of workers to benchmark.")
+    args = parser.parse_args()
+
+    pdf2bib.config.set('verbose', False)
+    pdf2bib.config.set('separator', os.path.sep)
+    pdf2bib.config.set('cache_enabled', False) #All (empty) pdf files have the same content, so they would be found in the cache
+    pdf2bib.config.set('identifier_cache_enabled', False)
+    pdf2doi.pdf2doi = make_stub_pdf2doi(args.latency)
+
+    with tempfile.TemporaryDirectory() as folder:
+        for i in range(args.files):
+            open(os.path.join(folder, f"paper{i:05d}.pdf"), 'wb').close()
+
+        reference = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = pdf2bib.pdf2bib(folder, workers=workers)
+            elapsed = time.perf_counter() - start
+            bibtex = [result['bibtex'] for result in results]
+            if reference is None:
+                reference = bibtex
+            same_order = (bibtex == reference)
+            print(f"workers = {workers:3d}: {elapsed:8.3f} s, {args.files/elapsed:8.1f} files/s, same results as workers = {args.workers[0]}: {same_order}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+'''
+Benchmark of the class writers.BibtexWriter: time and peak memory needed to write a bibliography with N entries (mode 'w'),
+and to merge N/2 new entries into it (mode 'merge').
+
+Usage:
+    python benchmarks/bench_writers.py [--entries 100000]
+'''
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from pdf2bib.writers import BibtexWriter
+
+
+def make_entry(key, title):
+    return ("@article{%s,\n\ttitle = {%s},\n\tvolume = {1},\n\tpublisher = {Stub Publishing},\n\tdoi = {10.1000/%s},\n"
+            "\tjournal = {Journal of Stubs},\n\tyear = {2020},\n\tauthor = {Jane Doe and John Smith}\n}") % (key, title, key)
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming bibtex writer.")
+    parser.add_argument("--entries", type=int, default=100000, help="Number of entries in the bibliography.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        filename = os.path.join(folder, 'references.bib')
+
+        def write():
+            with BibtexWriter(filename, mode='w') as writer:
+                for i in range(args.entries):
+                    writer.write(make_entry(f"doe2020paper{i}", "A stub paper"))
+
+        def merge():
+            with BibtexWriter(filename, mode='merge') as writer:
+                for i in range(0, 2 * args.entries, 4):
+                    writer.write(make_entry(f"doe2020paper{i}", "An updated stub paper"))
+
+        for name, function in [('write', write), ('merge', merge)]:
+            elapsed, peak = measure(function)
+            print(f"{name:6s}: {elapsed:7.3f} s, {args.entries/elapsed:10.0f} entries/s, peak memory {peak/1e6:7.2f} MB, file size {os.path.getsize(filename)/1e6:7.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
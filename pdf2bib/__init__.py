@@ -10,11 +10,26 @@ if not logger.handlers:
     logger.addHandler(ch)
 logger.propagate = False
 
-from .config import config
-config.ReadParamsINIfile()
+from .config import config, Settings #The settings (and the verbosity of the loggers) are loaded from settings.ini the first time they are accessed (see config.load)
 
-config.set('verbose',config.get('verbose')) #This is a quick and dirty way (to improve in the future) to make sure that the verbosity of the pdf2bib and pdf2doi loggers is properly set according
-                                            #to the current value of config.get('verbose') (see config.py file for details)
-from .main import pdf2bib, pdf2bib_singlefile
-from .bibtex_makers import *
+#The functions below are imported only when they are accessed for the first time (e.g. pdf2bib.pdf2bib), since importing them requires importing
+#pdf2doi, bibtexparser, etc., which is slow. In this way "import pdf2bib" (and the command pdf2bib --help) are fast.
+_lazy_attributes = {'pdf2bib': 'main', 'iter_pdf2bib': 'main', 'pdf2bib_singlefile': 'main',
+                    'pdf2bib_pipeline': 'pipeline',
+                    'pdf2bib_async': 'async_main', 'pdf2bib_singlefile_async': 'async_main',
+                    'parse_bib_from_dxdoiorg': 'bibtex_makers', 'parse_bib_from_exportarxivorg': 'bibtex_makers',
+                    'make_bibtex': 'bibtex_makers', 'make_bibtex_many': 'bibtex_makers', 'format_authors': 'bibtex_makers',
+                    'remove_latex_codes': 'bibtex_makers'}
 
+__all__ = ['config', 'Settings'] + list(_lazy_attributes)
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        import importlib
+        value = getattr(importlib.import_module('.' + _lazy_attributes[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))
@@ -0,0 +1,324 @@
+'''
+This module contains the asyncio versions of the functions pdf2bib and pdf2bib_singlefile defined in main.py.
+
+The pdf files are analyzed (in a thread of the default executor of the event loop) with the same finders used by pdf2doi, but the candidate
+identifiers are validated by querying dx.doi.org and export.arxiv.org directly from the event loop, via a single pooled aiohttp session shared
+by all the files (see the class AsyncLookupClient). When config.get('ratelimit_enabled') is True, the queries are paced by the same per-host limiters
+used by the other functions of pdf2bib (see ratelimit.py). The raw data returned by dx.doi.org and export.arxiv.org is the same obtained by pdf2doi, and it is
+parsed by the same functions parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg, so the results are identical to the ones of pdf2bib.
+
+The deadlines of the files (config.get('file_timeout') and config.get('batch_timeout'), see deadlines.py) are applied as in pdf2bib: a file which is not 
+done in time is cancelled, and its result has result['status'] = 'timeout'.
+
+The module requires the library aiohttp, which is imported only when an AsyncLookupClient is created.
+
+    Example:
+    import asyncio
+    import pdf2bib
+    results = asyncio.run(pdf2bib.pdf2bib_async(r"Path\to\folder", concurrency=20))
+'''
+
+import asyncio
+import logging
+import time
+from os import path
+import pdf2bib.cache as cache
+import pdf2bib.compact as compact
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+import pdf2bib.lookups as lookups
+import pdf2bib.observers as observers
+import pdf2bib.offline as offline
+import pdf2bib.ratelimit as ratelimit
+from pdf2bib.main import _find_pdf_files, _add_bibtex_to_result, _get_cached_result, _embed_result_in_file, _store_result_in_cache, _import_pdf2doi
+
+logger = logging.getLogger("pdf2bib")
+
+
+class AsyncLookupClient():
+    '''
+    Asynchronous client used to validate identifiers via dx.doi.org and export.arxiv.org. All queries go through a single aiohttp session, whose
+    connection pool is limited to max_connections connections. Each query which takes more than timeout seconds (by default, the same timeout 
+    used by ratelimit.get) is treated as a failed connection. It must be used as an asynchronous context manager:
+
+        async with AsyncLookupClient() as client:
+            text = await client.validate('10.1063/1.2409490', 'doi')
+    '''
+    def __init__(self, max_connections=None, dxdoiorg_url=None, exportarxivorg_url=None, number_attempts=10, timeout=None):
+        self.max_connections = max_connections or config.get('async_concurrency')
+        self.timeout = timeout or ratelimit.REQUEST_TIMEOUT
+        self.dxdoiorg_url = dxdoiorg_url or lookups.DXDOIORG_URL
+        self.exportarxivorg_url = exportarxivorg_url or lookups.EXPORTARXIVORG_URL
+        self.number_attempts = number_attempts
+        self.session = None
+
+    async def __aenter__(self):
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("The asyncio functions of pdf2bib require the library aiohttp. Install it via 'pip install aiohttp'.")
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    async def get_dxdoiorg(self, doi, method=None):
+        '''
+        Queries dx.doi.org for the DOI doi. It returns the text returned by dx.doi.org (in the format specified by method) if the DOI is valid,
+        False if the DOI is not valid, and None if it was not possible to connect to dx.doi.org.
+        '''
+        import pdf2doi
+        if method is None:
+            method = pdf2doi.config.get('method_dxdoiorg')
+        url = self.dxdoiorg_url + doi
+        headers = {"accept": method}
+        limiter = ratelimit.get_limiter(lookups.DXDOIORG_HOST) if config.get('ratelimit_enabled') else None
+        try:
+            for attempt in range(self.number_attempts):
+                status, text, response_headers, latency = await self._get(url, headers, limiter)
+                # 503 or 504 errors (and 429, if the requests are throttled) are common, in this case we try again
+                if ratelimit.is_throttled(status, text) or (not text):
+                    logger.info(f"Could not reach dx.doi.org. Trying again. Attempts left: {self.number_attempts - attempt - 1}")
+                    if limiter:
+                        retry_after = ratelimit.retry_after_seconds(response_headers)
+                        limiter.on_throttle(retry_after, reason=f"status {status}")
+                        await asyncio.sleep(ratelimit.backoff_delay(attempt, retry_after))
+                    continue
+                if limiter:
+                    limiter.on_success(latency)
+                return lookups.interpret_dxdoiorg_response(status, text)
+        except deadlines.FileTimeoutError:
+            lookups._deadline_expired(lookups.DXDOIORG_HOST)
+        except Exception as e:
+            logger.error(f"Some error occurred during connection to dx.doi.org: {e}")
+        return None
+
+    async def get_exportarxivorg(self, arxiv_id):
+        '''
+        Queries export.arxiv.org for the arXiv ID arxiv_id. It returns the dictionary describing the paper if the arXiv ID is valid,
+        False if it is not valid, and None if it was not possible to connect to export.arxiv.org.
+        '''
+        limiter = ratelimit.get_limiter(lookups.EXPORTARXIVORG_HOST) if config.get('ratelimit_enabled') else None
+        try:
+            for attempt in range(config.get('ratelimit_retries') + 1 if limiter else 1):
+                status, text, response_headers, latency = await self._get(self.exportarxivorg_url + arxiv_id, None, limiter)
+                if not (limiter and ratelimit.is_throttled(status, text)):
+                    break
+                retry_after = ratelimit.retry_after_seconds(response_headers)
+                limiter.on_throttle(retry_after, reason=f"status {status}")
+                await asyncio.sleep(ratelimit.backoff_delay(attempt, retry_after))
+            else:
+                return None
+        except deadlines.FileTimeoutError:
+            lookups._deadline_expired(lookups.EXPORTARXIVORG_HOST)
+            return None
+        except Exception as e:
+            logger.error(f"Some error occurred during connection to export.arxiv.org: {e}")
+            return None
+        if limiter:
+            limiter.on_success(latency)
+        return lookups.interpret_exportarxivorg_response(text)
+
+    async def _get(self, url, headers, limiter):
+        #Sends a GET request (through the limiter of the host, if any), and returns the status code, text, headers and latency of the response
+        if limiter:
+            async with limiter.async_slot():
+                return await self._get(url, headers, None)
+        start = time.perf_counter()
+        async with self.session.get(url, headers=headers) as response:
+            text = await response.text(encoding='utf-8')
+            return response.status, text, response.headers, time.perf_counter() - start
+
+    async def validate(self, identifier, what='doi'):
+        '''
+        Asynchronous version of pdf2doi.finders.validate (with web validation always enabled). The data is first looked for in the offline index and in
+        the identifier cache (if enabled).
+        '''
+        import pdf2doi
+        identifier_cache = cache.get_identifier_cache()
+        key = ('DOI', identifier, pdf2doi.config.get('method_dxdoiorg')) if what == 'doi' else ('arxiv ID', identifier, '')
+        validation_info = offline.lookup(*key)
+        if validation_info is not None:
+            return validation_info
+        if config.get('offline_only'):
+            return False
+        if identifier_cache:
+            validation_info = identifier_cache.get_validation_info(*key)
+            if validation_info is not None:
+                logger.info(f"The data associated to the {key[0]} {identifier} was found in the cache.")
+                return validation_info
+        if what == 'doi':
+            logger.info(f"Validating the possible DOI {identifier} via a query to dx.doi.org...")
+            validation_info = await self.get_dxdoiorg(identifier)
+        else:
+            logger.info(f"Validating the possible arxiv ID {identifier} via a query to export.arxiv.org...")
+            validation_info = await self.get_exportarxivorg(identifier)
+        if identifier_cache and validation_info:
+            identifier_cache.put_validation_info(*key, validation_info)
+        return validation_info
+
+
+async def pdf2bib_async(target, concurrency=None, client=None, timeout=None, batch_timeout=None, settings=None):
+    '''
+    Asynchronous version of the function pdf2bib. It accepts the same target (a pdf file or a folder) and returns the same output (a dictionary or a list of dictionaries).
+
+    Parameters
+    ----------
+    target : string
+        Relative or absolute path of a .pdf file or a directory containing pdf files
+    concurrency : int, optional
+        Maximum number of files processed at the same time (and maximum number of simultaneous connections, if client is not specified).
+        If None (default), the value of config.get('async_concurrency') is used.
+    client : AsyncLookupClient, optional
+        Client used for all queries. If not specified, a new client is created and closed when all files are processed.
+    timeout, batch_timeout : float, optional
+        Maximum time (in seconds) spent on each file and on the whole target (see pdf2bib). If None (default), the values of config.get('file_timeout')
+        and config.get('batch_timeout') are used.
+    settings : dictionary or Settings, optional
+        Values of the settings of pdf2bib (or pdf2doi) used only for this call, instead of the global ones (see config.settings).
+    '''
+    if settings:
+        #The tasks created below inherit the context, and thus the settings, of this coroutine
+        with config.settings(settings):
+            return await pdf2bib_async(target, concurrency=concurrency, client=client, timeout=timeout, batch_timeout=batch_timeout)
+
+    target = str(target)
+    files = _find_pdf_files(target)
+    if files is None:
+        return None
+    if concurrency is None:
+        concurrency = config.get('async_concurrency')
+
+    if client is None:
+        async with AsyncLookupClient(max_connections=concurrency) as client:
+            return await pdf2bib_async(target, concurrency=concurrency, client=client, timeout=timeout, batch_timeout=batch_timeout)
+
+    file_timeout, batch_timeout = deadlines.get_timeouts(timeout, batch_timeout)
+    batch_end = time.monotonic() + batch_timeout if batch_timeout else None
+    if not path.isdir(target):
+        return await _singlefile_with_deadline(files[0], client, file_timeout, batch_end)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async def process(file):
+        async with semaphore:
+            return await _singlefile_with_deadline(file, client, file_timeout, batch_end)
+    return list(await asyncio.gather(*[process(file) for file in files])) #asyncio.gather returns the results in the same order as files
+
+async def _singlefile_with_deadline(filename, client, file_timeout=None, batch_end=None):
+    #Processes the file filename via pdf2bib_singlefile_async, with a deadline file_timeout seconds from now (if not None) and at most batch_end (in the
+    #time.monotonic clock, if not None). If the file is not done in time, it returns a result with status 'timeout' (see deadlines.timeout_result)
+    start = time.monotonic()
+    ends = [end for end in [start + file_timeout if file_timeout else None, batch_end] if end is not None]
+    try:
+        with deadlines.deadline(min(ends) if ends else None):
+            return await pdf2bib_singlefile_async(filename, client=client)
+    except deadlines.FileTimeoutError:
+        logger.error(f"The file {filename} was cancelled, since it was not done in time.")
+        return compact.make_result(deadlines.timeout_result(filename, time.monotonic() - start))
+
+async def pdf2bib_singlefile_async(filename, client=None, settings=None):
+    '''
+    Asynchronous version of the function pdf2bib_singlefile. It returns a dictionary with the same keys as the output of pdf2bib_singlefile.
+    If client (an instance of AsyncLookupClient) is not specified, a new client is created for this file. The optional settings (a dictionary 
+    or a Settings object) are used only for this call (see config.settings). The functions run in the default executor are wrapped by config.bind 
+    and deadlines.bind, since the threads of the executor do not inherit the context of the task.
+    If a deadline is active in the current task (see deadlines.py), the file is cancelled when it expires and deadlines.FileTimeoutError is raised.
+    '''
+    if settings:
+        with config.settings(settings):
+            return await pdf2bib_singlefile_async(filename, client=client)
+    if client is None:
+        async with AsyncLookupClient() as client:
+            return await pdf2bib_singlefile_async(filename, client=client)
+
+    logger.info(f"Trying to extract data to generate the BibTeX entry for the file: {filename}")
+    observers.notify('on_file_start', filename)
+    left = deadlines.remaining()
+    if left is None:
+        return await _singlefile_async(filename, client)
+    try:
+        if left == 0:
+            raise asyncio.TimeoutError()
+        return await asyncio.wait_for(_singlefile_async(filename, client), left)
+    except asyncio.TimeoutError:
+        #The functions running in the executor are not interrupted, but their queries fail immediately (see lookups.py)
+        exception = deadlines.FileTimeoutError(f"The file {filename} was not done in time.")
+        observers.notify('on_error', filename, exception)
+        raise exception from None
+
+async def _singlefile_async(filename, client):
+    #Body of pdf2bib_singlefile_async (the observers were already notified that the file started)
+    pdf2doi = _import_pdf2doi()
+    loop = asyncio.get_running_loop()
+    timer = observers.StageTimer(filename)
+    try:
+        with timer.stage('cache'):
+            result = await loop.run_in_executor(None, _bind(_get_cached_result), filename)
+        if not result:
+            result = await _find_identifier_async(filename, client, timer)
+            if result['identifier'] == None:
+                logger.info(f"Looking for an identifier via a google search...")
+                with timer.stage('extraction'):
+                    result = await loop.run_in_executor(None, _bind(lookups.find_identifier_online), filename)
+            elif pdf2doi.config.get('save_identifier_metadata') and not (result['method'] == "document_infos"):
+                #This is the same as done by pdf2doi.pdf2doi
+                with timer.stage('extraction'):
+                    await loop.run_in_executor(None, _bind(pdf2doi.add_found_identifier_to_metadata), filename, result['identifier'])
+
+            _add_bibtex_to_result(result, timer)
+            if result['bibtex']:
+                with timer.stage('cache'):
+                    await loop.run_in_executor(None, _bind(_embed_result_in_file), filename, result)
+                    await loop.run_in_executor(None, _bind(_store_result_in_cache), filename, result)
+    except Exception as e:
+        observers.notify('on_error', filename, e)
+        raise
+    result['timings'] = timer.stop()
+    result = compact.make_result(result)
+    observers.notify('on_file_end', filename, result)
+    return result
+
+def _bind(function):
+    #The threads of the executor do not inherit the context of the task, so the settings and the deadline of the file are applied explicitly
+    return deadlines.bind(config.bind(function))
+
+async def _find_identifier_async(filename, client, timer):
+    '''
+    Looks for a valid identifier of the file filename with the local methods of pdf2doi (see lookups.LOCAL_METHODS), validating the candidates
+    via client. It returns a dictionary with the same format as the output of pdf2doi.pdf2doi (with result['identifier'] = None if nothing was found).
+    The time spent in the analysis of the file and in the validation is added to timer (an instance of observers.StageTimer).
+    '''
+    import pdf2doi
+    loop = asyncio.get_running_loop()
+    result = {'identifier': None, 'identifier_type': None, 'validation_info': None, 'path': filename, 'method': None}
+    for method in lookups.LOCAL_METHODS:
+        with timer.stage('extraction'):
+            candidates = await loop.run_in_executor(None, _bind(lookups.find_candidates), filename, method)
+        for identifier, what in candidates:
+            with timer.stage('lookup'):
+                info = await client.validate(identifier, what)
+            if info:
+                result.update({'identifier': identifier, 'identifier_type': 'DOI' if what == 'doi' else 'arxiv ID',
+                               'validation_info': info, 'method': method})
+                break
+        if result['identifier']:
+            break
+    else:
+        return result
+
+    #The next block of code replaces an arXiv ID with a DOI (either from a journal publication or with the arXiv DOI), as done in pdf2doi.finders.find_identifier
+    if result['identifier_type'] == 'arxiv ID' and pdf2doi.config.get('replace_arxivID_by_DOI_when_available') == True:
+        info = result['validation_info']
+        if 'arxiv_doi' in info.keys() and info['arxiv_doi']:
+            with timer.stage('lookup'):
+                doi_info = await client.validate(info['arxiv_doi'], 'doi')
+            if doi_info:
+                result.update({'identifier': info['arxiv_doi'], 'identifier_type': 'DOI', 'validation_info': doi_info,
+                               'method': result['method'] + ' + arxiv2doi'})
+        else:
+            result.update({'identifier': f"10.48550/arXiv.{result['identifier']}", 'identifier_type': 'arxiv DOI',
+                           'method': result['method'] + ' + arxiv2doi'})
+    return result
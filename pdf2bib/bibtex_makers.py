@@ -1,12 +1,19 @@
+import functools
 import json
 import re
 import logging
 import urllib.parse
-from unidecode import unidecode
-import bibtexparser
+from itertools import islice
+import pdf2bib.config as config
+from pdf2bib.compact import Authors
+#import bibtexparser, unidecode (Modules that are commented here are imported later only when needed, to improve start up time. bibtexparser is only needed
+#for the bibtex entries which are not supported by _parse_single_bibtex_entry)
 
 logger = logging.getLogger('pdf2bib')
 
+_latex_code_regex = re.compile(r"{\\[^\{]+{([\w]+)}}")
+_id_forbidden_chars = str.maketrans('', '', "-,:'\n") #Hyphens, commas, colons, single quotes and newlines are removed from the ID of a bibtex entry
+
 #The functions parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg take as input a string or other object, which has been obtained by the library pdf2doi by
 #querying the relevant websites. By analyzing this input, they create a dictionary containing valid bibtex infos and return it as output.
 #The output dictionaries returned by parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg must have the same "format", i.e. the same set of required keys
@@ -15,6 +22,12 @@ logger = logging.getLogger('pdf2bib')
 
 #The dictionaries are then fed to the function make_bibtex(data) which creates a string containing the full bibtex entry
 
+#The authors are written in the bibtex entries by the function format_authors, which keeps only the first config.get('max_authors') authors (if it is
+#larger than 0) followed by "and others". This keeps the entries of the papers of large collaborations (thousands of authors) short.
+
+#The function make_bibtex_many(metadata_list) does the same as make_bibtex for many dictionaries at once (e.g. when a large bibliography is regenerated from
+#cached metadata), and it returns exactly the same strings.
+
 #The functions make_bibtex, parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg are called directly from the function pdf2bib_singlefile inside main.py, but they
 #can also called directly by an user is (s)he knows what (s)he is doing.
 
@@ -33,14 +46,11 @@ def parse_bib_from_dxdoiorg(text, method):
     Normally, the format returned by dx.doi.org when using "application/citeproc+json" is author =  [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ... [{'given': 'NameN', 'family': 'LastNameN'}]
     """
 
-    # 
     if method == "application/x-bibtex":
-        data = bibtexparser.loads(text)
-        metadata = data.entries[0]
+        metadata = parse_bibtex_entry(text)
         return metadata
     if method == "text/bibliography; style=bibtex":
-        data = bibtexparser.loads(text)
-        metadata = data.entries[0]
+        metadata = parse_bibtex_entry(text)
         return metadata
     if method == "application/citeproc+json":        
         try:
@@ -75,13 +85,146 @@ def parse_bib_from_dxdoiorg(text, method):
         except:
             metadata['month'] = ''
         try:
-            metadata['author'] = [author for author in json_dict['author']]
+            metadata['author'] = list(json_dict['author'])
         except:
             metadata['author'] = ''
         return metadata
     raise ValueError("The input variable method does not have a valid value")
 
 
+def parse_bibtex_entry(text):
+    """
+    Parses a string containing a single bibtex entry (as returned by dx.doi.org with the methods "application/x-bibtex" and "text/bibliography; style=bibtex")
+    and returns a dictionary with the fields of the entry, plus the keys 'ENTRYTYPE' and 'ID'. The dictionary is identical (including the order of the keys)
+    to bibtexparser.loads(text).entries[0].
+
+    The entry is parsed by _parse_single_bibtex_entry, which avoids importing and running the full bibtexparser (about 10 ms per entry). Anything which
+    is not supported by it (e.g. @string definitions, concatenations via #, undefined macros, non-standard entry types or several entries) is passed
+    to bibtexparser instead.
+    """
+    metadata = _parse_single_bibtex_entry(text)
+    if metadata is None:
+        import bibtexparser
+        metadata = bibtexparser.loads(text).entries[0]
+    return metadata
+
+#Syntax accepted by _parse_single_bibtex_entry, which follows the grammar used by bibtexparser (v1, see bibtexparser.bibtexexpression)
+_bibtex_standard_types = {'article', 'book', 'booklet', 'conference', 'inbook', 'incollection', 'inproceedings', 'manual', 'mastersthesis', 'misc',
+                          'phdthesis', 'proceedings', 'techreport', 'unpublished'}
+_bibtex_common_strings = {'jan': 'January', 'feb': 'February', 'mar': 'March', 'apr': 'April', 'may': 'May', 'jun': 'June', 'jul': 'July',
+                          'aug': 'August', 'sep': 'September', 'oct': 'October', 'nov': 'November', 'dec': 'December'}
+_bibtex_entry_start_regex = re.compile(r"[ \t\n\r]*@[ \t\n\r]*([A-Za-z]+)[ \t\n\r]*([{(])")
+_bibtex_field_name_regex = re.compile(r"[ \t\n\r]*([A-Za-z0-9_\-().+]+)[ \t\n\r]*=[ \t\n\r]*")
+_bibtex_bare_value_regex = re.compile(r"[A-Za-z0-9_\-:]+")
+_bibtex_separator_regex = re.compile(r"[ \t\n\r]*([,})])")
+_bibtex_braces_regex = re.compile(r"[{}]")
+_bibtex_braces_quotes_regex = re.compile(r'[{}"]')
+_bibtex_key_forbidden_chars = set(' \t\n\r{}()"#=@')
+
+def _parse_single_bibtex_entry(text):
+    #Returns the same dictionary as bibtexparser.loads(text).entries[0], or None if text is not made of a single entry in the subset of the bibtex syntax
+    #supported here. In particular, the fields are stored in the dictionary in reverse order (when a field is repeated, the value of its first
+    #occurrence is kept), their values are stripped of the outer braces or quotes and of the leading whitespaces of all lines but the first one,
+    #and the month macros (jan, feb, ...) are expanded. 
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    if '\t' in text:
+        #bibtexparser (via pyparsing) replaces the tabs of the whole text with spaces, up to the next multiple of 8 columns, before parsing it
+        text = text.expandtabs()
+    match = _bibtex_entry_start_regex.match(text)
+    if not match:
+        return None
+    entry_type = match.group(1).lower()
+    if not entry_type in _bibtex_standard_types:
+        return None
+    closer = '}' if match.group(2) == '{' else ')'
+    position = match.end()
+    comma = text.find(',', position)
+    if comma < 0:
+        return None
+    key = text[position:comma].strip()
+    if not key or any(char in _bibtex_key_forbidden_chars or char.isspace() for char in key):
+        return None
+    position = comma + 1
+
+    fields = []
+    while True:
+        match = _bibtex_field_name_regex.match(text, position)
+        if not match:
+            return None
+        value, position = parse_bibtex_value(text, match.end())
+        if value is None:
+            return None
+        fields.append((match.group(1), value))
+        match = _bibtex_separator_regex.match(text, position)
+        if not match:
+            return None
+        position = match.end()
+        if match.group(1) == ',':
+            match = _bibtex_separator_regex.match(text, position) #Trailing comma after the last field
+            if match and match.group(1) == closer:
+                position = match.end()
+                break
+        elif match.group(1) == closer:
+            break
+        else:
+            return None
+    if text[position:].strip(' \t\n\r'):
+        return None
+
+    fields = {name: value for (name, value) in reversed(fields)}
+    metadata = {}
+    for name, value in fields.items():
+        metadata[name.lower()] = value
+    metadata['ENTRYTYPE'] = entry_type
+    metadata['ID'] = key
+    return metadata
+
+def parse_bibtex_value(text, position):
+    """
+    Parses the value of a bibtex field starting at text[position] (i.e. right after the "=" and any whitespace), and returns the value, cleaned as
+    bibtexparser does, and the position right after it. If the value is not supported by the fast parser of single entries (e.g. a macro defined
+    via @string, or a concatenation via #), it returns (None, position).
+    Used by _parse_single_bibtex_entry, and by merge.py to read only a few fields of each entry.
+    """
+    if position >= len(text):
+        return None, position
+    char = text[position]
+    if char == '{' or char == '"':
+        #Only the braces (and the quotes) are inspected, the text in between is skipped via the regular expression
+        depth = 0
+        for delimiter in (_bibtex_braces_regex if char == '{' else _bibtex_braces_quotes_regex).finditer(text, position + 1):
+            if delimiter.group(0) == '{':
+                depth += 1
+            elif depth > 0 and delimiter.group(0) == '}':
+                depth -= 1
+            elif depth == 0 and (delimiter.group(0) == '"' or char == '{'):
+                break
+            else:
+                return None, position
+        else:
+            return None, position
+        end = delimiter.start()
+        value = text[position + 1:end]
+        lines = value.splitlines()
+        if len(lines) > 1:
+            value = '\n'.join([lines[0]] + [line.lstrip() for line in lines[1:]])
+        else:
+            value = '\n'.join(lines)
+        if value == '{}':
+            value = ''
+        return value, end + 1
+    match = _bibtex_bare_value_regex.match(text, position)
+    if not match:
+        return None, position
+    value = match.group(0)
+    if value.isdigit() and value.isascii():
+        return value, match.end()
+    if value.lower() in _bibtex_common_strings:
+        return _bibtex_common_strings[value.lower()], match.end()
+    return None, position
+
+
 def parse_bib_from_exportarxivorg(items):
     """
     Given a certain dictionary contained in the input variable items (which was obtained from pdf2doi by quering export.arxiv.org)
@@ -132,8 +275,12 @@ def parse_bib_from_exportarxivorg(items):
     #The typical format returned by export.arxiv.org for the authors is a list 
     #in the format [{'name': 'Name1 LastName1'}, {'name': 'Name2 LastName2'}, ... [{'name': 'NameN LastNameN'}], 
     #If authors is indeed a list in this format, we reshape it in the format [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ... [{'given': 'NameN', 'family': 'LastNameN'}]
+    #Each name is split only once, at the last space (the result is the same as splitting it at every space and joining all words but the last one)
     if authors and isinstance(authors,list):
-        authorsnames_list = [ {'given' : " ".join(author['name'].split(" ")[0:-1]), 'family': author['name'].split(" ")[-1]} for author in authors]
+        authorsnames_list = []
+        for author in authors:
+            given, _, family = author['name'].rpartition(" ")
+            authorsnames_list.append({'given' : given, 'family': family})
         data_dict['author'] = authorsnames_list
     elif authors and isinstance(authors,str):
         data_dict['author'] = authors
@@ -147,6 +294,7 @@ def make_bibtex(metadata):
     #If the tag url is present, any possible ascii code (e.g. %2f) is decoded
     #Note: the code below assumes that the field for the authors is either a string in the format "Name1 Lastname1 and Name2 Lastname2 and ... "
     #or a list of dictionaries in the format  [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ... [{'given': 'NameN', 'family': 'LastNameN'}]
+    #(or a compact.Authors object, which behaves as such a list)
     
     data = metadata.copy()
 
@@ -155,12 +303,12 @@ def make_bibtex(metadata):
     else:
         authors = ''
 
-    if not(type(authors) in (str, list)):
+    if not(type(authors) in (str, list, Authors)):
         raise TypeError('The value corresponding to the key ''author'' must be either a string or a list of strings')
     
     #Generate the ID by looking for last name of first author, year of publicaton, and first word of title
     try:
-        if authors and isinstance(authors,list):
+        if authors and isinstance(authors,(list,Authors)):
             firstauthor = authors[0]
             lastname_firstauthor = (firstauthor['family'].strip()).split(' ')[0]
         elif authors and isinstance(authors,str): 
@@ -177,6 +325,7 @@ def make_bibtex(metadata):
     id = lastname_firstauthor + str(year) + first_word_title
     id = id.lower()
     id = remove_latex_codes(id)
+    from unidecode import unidecode
     id = unidecode(id) #This makes sure that the id of the bibtex entry is only made out of ascii characters (i.e. no accents, tildes, etc.)
     id = re.sub(
         "-|,|:|'|\\n", "", id
@@ -191,14 +340,9 @@ def make_bibtex(metadata):
     if not 'ENTRYTYPE' in data.keys():
         data['ENTRYTYPE'] = 'article'
 
-    if  isinstance(authors,list):
-        #if authors is defined as a list, it will have the format [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ... [{'given': 'NameN', 'family': 'LastNameN'}]
-        #We convert it into a string Name1 Lastname1 and Name2 Lastname2 and ... "
-        authors_string = " and ".join([ a.get('given', '') +  " " + a.get('family', '')  for a in authors if (('family' in a) or ('given' in a))])
-        data['author'] = authors_string
-    elif isinstance(authors,str):
-        #if instead authors is a string, then it is already in the right format
-        data['author'] = authors
+    #The authors are converted into a string Name1 Lastname1 and Name2 Lastname2 and ... " (see format_authors)
+    if 'author' in data.keys():
+        data['author'] = format_authors(authors)
 
     #Create the bibtex entry as a string 
     metadata_not_to_use = ['ENTRYTYPE','ID'] #These are temporary metadata, not useful for bibtex
@@ -210,11 +354,107 @@ def make_bibtex(metadata):
     return bibtex_entry
 
 
+def make_bibtex_many(metadata_list):
+    """
+    Generator which yields, for each dictionary in the iterable metadata_list, the same bibtex entry (as a string) returned by make_bibtex.
+    
+    Differently from make_bibtex, the input dictionaries are never copied, the regular expressions are precompiled, and the normalization of the IDs
+    (removal of latex codes, conversion to ascii, etc.) is memoized. This makes it faster when a large number of entries needs to be generated, e.g.
+
+        with writers.BibtexWriter('references.bib') as writer:
+            for bibtex in make_bibtex_many(metadata_list):
+                writer.write(bibtex)
+    """
+    unquote = urllib.parse.unquote
+    max_authors = config.get('max_authors')
+    for data in metadata_list:
+        authors = data['author'] if 'author' in data else ''
+        if not(type(authors) in (str, list, Authors)):
+            raise TypeError('The value corresponding to the key ''author'' must be either a string or a list of strings')
+
+        #Generate the ID (see make_bibtex)
+        try:
+            if authors and isinstance(authors,(list,Authors)):
+                lastname_firstauthor = (authors[0]['family'].strip()).split(' ')[0]
+            elif authors and isinstance(authors,str): 
+                lastname_firstauthor = authors.split(" and ")[0].split(" ")[-1]
+            else: 
+                lastname_firstauthor = ''
+        except:
+            lastname_firstauthor =''
+        year = data['year'] if 'year' in data else ''
+        try:
+            first_word_title =  data['title'].split(' ')[0] if 'title' in data  else ''
+        except:
+            first_word_title =''
+        id = _normalize_bibtex_id(lastname_firstauthor + str(year) + first_word_title)
+
+        authors = format_authors(authors, max_authors)
+
+        #The fields are written in the same order as in the input dictionary. Only the url and the authors are changed (see make_bibtex)
+        text = ["@" + (data['ENTRYTYPE'] if 'ENTRYTYPE' in data else 'article') + "{" + id]
+        for key, value in data.items():
+            if key == 'url':
+                value = unquote(value)
+            elif key == 'author':
+                value = authors
+            if value and key != 'ENTRYTYPE' and key != 'ID':
+                text.append("\t%s = {%s}" % (key, value))
+        yield ",\n".join(text) + "\n}"
+
+def format_authors(authors, max_authors=None):
+    """
+    Returns the authors, either as a string in the format "Name1 LastName1 and Name2 LastName2 and ..." or as a list of dictionaries in the format
+    [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ...] (or a compact.Authors object), as a string in the format
+    "Name1 LastName1 and Name2 LastName2 and ...", which is the one used in the bibtex entries.
+
+    If max_authors (default: config.get('max_authors')) is larger than 0 and there are more than max_authors authors, only the first max_authors are kept,
+    followed by "and others" (which bibtex styles print as "et al."). Only the names which are kept are formatted.
+    """
+    if max_authors is None:
+        max_authors = config.get('max_authors')
+    if isinstance(authors, str):
+        if max_authors <= 0:
+            return authors
+        end = -1
+        for _ in range(max_authors):
+            end = authors.find(" and ", end + 1)
+            if end < 0:
+                return authors
+        return authors[:end] + " and others"
+    if isinstance(authors, Authors):
+        names = authors.names()
+    elif max_authors <= 0 or len(authors) <= max_authors:
+        return " and ".join([a.get('given', '') +  " " + a.get('family', '') for a in authors if (('family' in a) or ('given' in a))])
+    else:
+        names = (a.get('given', '') +  " " + a.get('family', '') for a in authors if (('family' in a) or ('given' in a)))
+    if max_authors <= 0:
+        return " and ".join(names)
+    names = list(islice(names, max_authors + 1))
+    if len(names) > max_authors:
+        names[max_authors:] = ["others"]
+    return " and ".join(names)
+
+@functools.lru_cache(maxsize=1 << 16)
+def _normalize_bibtex_id(id):
+    #Same transformations applied to the ID by make_bibtex. Each step is skipped when it would not change the string
+    id = id.lower()
+    if '{' in id:
+        id = remove_latex_codes(id)
+    if not id.isascii():
+        from unidecode import unidecode
+        id = unidecode(id)
+    id = id.translate(_id_forbidden_chars)
+    if id == '':
+        id = 'NoValidID'
+    return id
+
+
 def remove_latex_codes(text):
     #It replaces any latex special code (e.g. {\`{u}}) by the "closest" unicode character (e.g. u). This is useful when
     #certain strings which might contain latex codes need to be used in contexts where only unicode characters are accepted
     
     #This regex looks for any substring that matches the pattern "{\string1{string2}}" where string1 can be anything,
     #and it replaces the whole substring by string2
-    text_sanitized = re.sub(r"{\\[^\{]+{([\w]+)}}", r"\1",text)
+    text_sanitized = _latex_code_regex.sub(r"\1",text)
     return text_sanitized
@@ -0,0 +1,418 @@
+'''
+This module implements the persistent caches used by pdf2bib. Both caches are stored in the same SQLite database, which is kept in a user cache
+directory (or in the folder specified by config.get('cache_directory')).
+
+ResultCache stores the results produced by pdf2bib_singlefile (see main.py).
+Each result is stored with a key given by the SHA-256 hash of the content of the pdf file, so that a file which is moved or renamed
+is still found in the cache. To avoid reading (and hashing) the whole file at every run, the path of each file is also stored together with its
+size, modification time and inode: if these values did not change since the last time the file was hashed, the stored hash is used directly.
+Each result is only reused with the same values of the settings which affect it (see KEY_SETTINGS_PDF2DOI and KEY_SETTINGS).
+Only the results for which a valid BibTeX entry was generated are stored. The total size of the stored results is kept below
+config.get('cache_max_size_mb') megabytes by removing the least recently used results.
+
+IdentifierCache stores, for each identifier (e.g. a DOI or an arXiv ID), the raw data returned by dx.doi.org or export.arxiv.org (i.e. the validation_info
+returned by pdf2doi) and the metadata parsed from it. In this way different pdf files associated to the same identifier (e.g. duplicates, or preprint and 
+published version) trigger a single query. Entries expire after config.get('identifier_cache_ttl_days') days. The most recently used entries are also kept
+in memory, and concurrent requests for the same identifier (e.g. from different threads of the same batch) are coalesced into a single query.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+import pdf2bib.compact as compact
+import pdf2bib.config as config
+
+logger = logging.getLogger("pdf2bib")
+
+CACHE_FORMAT_VERSION = 2 #Increase this number whenever the format of the stored results (or of their keys) changes, so that old results are ignored
+#Settings of pdf2doi and of pdf2bib which affect the result obtained for a pdf file. Their values are part of the key of each result stored in ResultCache,
+#so that a result is only reused with the same settings
+KEY_SETTINGS_PDF2DOI = ['method_dxdoiorg', 'websearch', 'webvalidation', 'replace_arxivID_by_DOI_when_available', 'numb_results_google_search',
+                        'N_characters_in_pdf']
+KEY_SETTINGS = ['max_authors', 'offline_only']
+CACHE_FILENAME = 'pdf2bib_cache.sqlite'
+
+def default_cache_directory():
+    '''
+    Returns the default folder where the cache is stored, following the conventions of the current OS.
+    '''
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base, 'pdf2bib', 'Cache')
+    if sys.platform == 'darwin':
+        return os.path.join(os.path.expanduser('~'), 'Library', 'Caches', 'pdf2bib')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pdf2bib')
+
+def cache_directory():
+    return config.get('cache_directory') or default_cache_directory()
+
+def hash_file(filename, chunk_size=1 << 20):
+    '''
+    Returns the SHA-256 hash (as hexadecimal string) of the content of the file filename.
+    '''
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class SQLiteCache():
+    '''
+    Base class of the caches defined in this module. An instance can be shared by several threads: each thread uses its own
+    connection to the database.
+    '''
+    def __init__(self, path_database):
+        self.path_database = path_database
+        self._local = threading.local()
+        self._create_tables()
+
+    def _create_tables(self):
+        pass
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path_database), exist_ok=True)
+            connection = sqlite3.connect(self.path_database, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL') #WAL allows several processes to read the cache while another one is writing
+            self._local.connection = connection
+        return connection
+
+
+class ResultCache(SQLiteCache):
+    '''
+    Persistent cache of the results of pdf2bib_singlefile.
+    '''
+    def __init__(self, path_database, max_size_mb=100):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        super().__init__(path_database)
+
+    def _create_tables(self):
+        connection = self._connection()
+        connection.execute('''CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, hash TEXT)''')
+        connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                hash TEXT, key TEXT, identifier TEXT, identifier_type TEXT, method TEXT,
+                                validation_info TEXT, metadata TEXT, bibtex TEXT, size INTEGER, last_access REAL,
+                                PRIMARY KEY (hash, key))''')
+        connection.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+
+    @staticmethod
+    def _settings_key():
+        #The results also depend on the settings (of pdf2doi and pdf2bib) listed in KEY_SETTINGS, so their values are part of the key
+        import pdf2doi
+        values = [pdf2doi.config.get(name) for name in KEY_SETTINGS_PDF2DOI] + [config.get(name) for name in KEY_SETTINGS]
+        return '|'.join(str(value) for value in [CACHE_FORMAT_VERSION] + values)
+
+    def file_hash(self, filename):
+        '''
+        Returns the hash of the file filename. The file is only read if its size, modification time or inode changed since the last time it was hashed.
+        '''
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        connection = self._connection()
+        row = connection.execute('SELECT size, mtime_ns, inode, hash FROM files WHERE path = ?', (filename,)).fetchone()
+        if row and tuple(row[0:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return row[3]
+        file_hash = hash_file(filename)
+        connection.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, hash) VALUES (?, ?, ?, ?, ?)',
+                           (filename, stat.st_size, stat.st_mtime_ns, stat.st_ino, file_hash))
+        return file_hash
+
+    def get(self, filename):
+        '''
+        Returns the cached result (a dictionary with the same keys as the output of pdf2bib_singlefile) for the file filename,
+        or None if the file is not in the cache.
+        '''
+        file_hash = self.file_hash(filename)
+        connection = self._connection()
+        key = self._settings_key()
+        row = connection.execute('SELECT identifier, identifier_type, method, validation_info, metadata, bibtex FROM results WHERE hash = ? AND key = ?',
+                                 (file_hash, key)).fetchone()
+        if not row:
+            return None
+        connection.execute('UPDATE results SET last_access = ? WHERE hash = ? AND key = ?', (time.time(), file_hash, key))
+        identifier, identifier_type, method, validation_info, metadata, bibtex = row
+        return {'identifier': identifier, 'identifier_type': identifier_type, 'validation_info': json.loads(validation_info),
+                'path': filename, 'method': method, 'metadata': json.loads(metadata), 'bibtex': bibtex}
+
+    def put(self, filename, result):
+        '''
+        Stores the dictionary result (as returned by pdf2bib_singlefile) for the file filename. The file is hashed again, since
+        pdf2doi might have modified it (e.g. by adding the identifier to its metadata).
+        '''
+        file_hash = self.file_hash(filename)
+        validation_info = json.dumps(result['validation_info'], default=compact.json_default)
+        metadata = json.dumps(result['metadata'], default=compact.json_default)
+        size = len(validation_info) + len(metadata) + len(result['bibtex'])
+        connection = self._connection()
+        connection.execute('''INSERT OR REPLACE INTO results (hash, key, identifier, identifier_type, method, validation_info, metadata, bibtex, size, last_access)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (file_hash, self._settings_key(), result['identifier'], result['identifier_type'], result['method'],
+                            validation_info, metadata, result['bibtex'], size, time.time()))
+        self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used results until the total size of the stored results is below self.max_size.
+        '''
+        connection = self._connection()
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        to_remove = total_size - int(0.9 * self.max_size) #We free a bit more than needed, so that eviction is not performed at every new result
+        rows = connection.execute('SELECT hash, key, size FROM results ORDER BY last_access')
+        keys = []
+        for file_hash, key, size in rows:
+            keys.append((file_hash, key))
+            to_remove -= size
+            if to_remove <= 0:
+                break
+        connection.executemany('DELETE FROM results WHERE hash = ? AND key = ?', keys)
+        logger.info(f"Removed {len(keys)} results from the cache.")
+
+    def invalidate(self, filename):
+        '''
+        Removes from the cache the results associated to the file filename (if any). It returns the number of results removed.
+        '''
+        filename = os.path.abspath(filename)
+        connection = self._connection()
+        row = connection.execute('SELECT hash FROM files WHERE path = ?', (filename,)).fetchone()
+        hashes = {row[0]} if row else set()
+        if os.path.exists(filename):
+            hashes.add(hash_file(filename))
+        removed = 0
+        for file_hash in hashes:
+            removed += connection.execute('DELETE FROM results WHERE hash = ?', (file_hash,)).rowcount
+        connection.execute('DELETE FROM files WHERE path = ?', (filename,))
+        return removed
+
+    def clear(self):
+        '''
+        Removes all the stored results.
+        '''
+        connection = self._connection()
+        connection.execute('DELETE FROM results')
+        connection.execute('DELETE FROM files')
+        connection.execute('VACUUM')
+
+
+class IdentifierCache(SQLiteCache):
+    '''
+    Cache of the data associated to each identifier (see the docstring of this module). Each entry is identified by the tuple 
+    (identifier_type, identifier, method), where method is the method used to query dx.doi.org (or '' for arXiv IDs), and it contains
+    the raw validation_info and/or the parsed metadata.
+    '''
+    MEMORY_SIZE = 1024 #Maximum number of entries kept in memory
+
+    def __init__(self, path_database, ttl_days=30, max_entries=10000):
+        self.ttl = ttl_days * 24 * 3600
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        super().__init__(path_database)
+
+    def _create_tables(self):
+        connection = self._connection()
+        connection.execute('''CREATE TABLE IF NOT EXISTS identifiers (
+                                identifier_type TEXT, identifier TEXT, method TEXT, validation_info TEXT, metadata TEXT, created REAL,
+                                PRIMARY KEY (identifier_type, identifier, method))''')
+        connection.execute('CREATE INDEX IF NOT EXISTS identifiers_created ON identifiers (created)')
+
+    def _get_entry(self, key):
+        #Returns the entry (a dictionary with keys 'validation_info', 'metadata' and 'created') for the key, looking first in memory and then on disk
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+        if entry is None:
+            row = self._connection().execute('''SELECT validation_info, metadata, created FROM identifiers 
+                                                WHERE identifier_type = ? AND identifier = ? AND method = ?''', key).fetchone()
+            if row:
+                entry = {'validation_info': json.loads(row[0]) if row[0] else None, 'metadata': json.loads(row[1]) if row[1] else None, 'created': row[2]}
+                self._remember(key, entry)
+        if entry and time.time() - entry['created'] > self.ttl:
+            return None
+        return entry
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.MEMORY_SIZE:
+                self._memory.popitem(last=False)
+
+    def _put_entry(self, key, validation_info=None, metadata=None):
+        entry = self._get_entry(key) or {'validation_info': None, 'metadata': None}
+        entry = {'validation_info': validation_info if validation_info is not None else entry['validation_info'], 
+                 'metadata': metadata if metadata is not None else entry['metadata'], 'created': time.time()}
+        self._remember(key, entry)
+        connection = self._connection()
+        connection.execute('''INSERT OR REPLACE INTO identifiers (identifier_type, identifier, method, validation_info, metadata, created)
+                              VALUES (?, ?, ?, ?, ?, ?)''', key + (json.dumps(entry['validation_info'], default=compact.json_default) if entry['validation_info'] is not None else None,
+                                                            json.dumps(entry['metadata'], default=compact.json_default) if entry['metadata'] is not None else None, entry['created']))
+        self.evict()
+
+    def get_validation_info(self, identifier_type, identifier, method=''):
+        '''
+        Returns (a copy of) the cached validation_info of the identifier, or None if it is not in the cache.
+        '''
+        entry = self._get_entry((identifier_type, identifier, method))
+        if entry and entry['validation_info'] is not None:
+            return deepcopy(entry['validation_info'])
+        return None
+
+    def put_validation_info(self, identifier_type, identifier, method, validation_info):
+        self._put_entry((identifier_type, identifier, method), validation_info=validation_info)
+
+    def get_metadata(self, identifier_type, identifier, method=''):
+        '''
+        Returns (a copy of) the cached metadata of the identifier, or None if it is not in the cache.
+        '''
+        entry = self._get_entry((identifier_type, identifier, method))
+        if entry and entry['metadata'] is not None:
+            return deepcopy(entry['metadata'])
+        return None
+
+    def put_metadata(self, identifier_type, identifier, method, metadata):
+        self._put_entry((identifier_type, identifier, method), metadata=metadata)
+
+    def get_or_fetch_validation_info(self, identifier_type, identifier, method, fetch):
+        '''
+        Returns the validation_info of the identifier. If it is not in the cache, it is obtained by calling fetch() (without arguments), and
+        stored in the cache if it is a valid string or dictionary. If another thread is already fetching the same identifier, this function waits for
+        it and returns the same value, instead of calling fetch() again.
+        '''
+        key = (identifier_type, identifier, method)
+        validation_info = self.get_validation_info(*key)
+        if validation_info is not None:
+            logger.info(f"The data associated to the {identifier_type} {identifier} was found in the cache.")
+            return validation_info
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            owner = in_flight is None
+            if owner:
+                in_flight = self._in_flight[key] = {'event': threading.Event(), 'value': None}
+        if not owner:
+            in_flight['event'].wait()
+            return deepcopy(in_flight['value'])
+        try:
+            value = fetch()
+            in_flight['value'] = value
+            if isinstance(value, (str, dict)):
+                self.put_validation_info(*key, value)
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight['event'].set()
+
+    def evict(self):
+        '''
+        Removes the expired entries and, if needed, the oldest ones, so that at most self.max_entries entries are stored on disk.
+        '''
+        connection = self._connection()
+        connection.execute('DELETE FROM identifiers WHERE created < ?', (time.time() - self.ttl,))
+        numb_entries = connection.execute('SELECT COUNT(*) FROM identifiers').fetchone()[0]
+        if numb_entries > self.max_entries:
+            connection.execute('''DELETE FROM identifiers WHERE rowid IN 
+                                  (SELECT rowid FROM identifiers ORDER BY created LIMIT ?)''', (numb_entries - int(0.9 * self.max_entries),))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        connection = self._connection()
+        connection.execute('DELETE FROM identifiers')
+
+
+_result_cache = None
+_identifier_cache = None
+_result_cache_lock = threading.Lock()
+
+def _forget_caches():
+    #SQLite connections cannot be used in a child process created by fork (e.g. by the process pool of pdf2bib), so the child opens its own ones
+    global _result_cache, _identifier_cache, _result_cache_lock
+    _result_cache = None
+    _identifier_cache = None
+    _result_cache_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_caches)
+
+def get_result_cache():
+    '''
+    Returns the ResultCache instance shared by all calls of pdf2bib_singlefile, or None if the cache is disabled (i.e. if config.get('cache_enabled') is False)
+    or if it could not be opened.
+    '''
+    global _result_cache
+    if not config.get('cache_enabled'):
+        return None
+    with _result_cache_lock:
+        path_database = os.path.join(cache_directory(), CACHE_FILENAME)
+        if _result_cache is None or _result_cache.path_database != path_database:
+            try:
+                _result_cache = ResultCache(path_database, max_size_mb=config.get('cache_max_size_mb'))
+            except Exception as e:
+                logger.error(f"It was not possible to open the cache in {path_database}: {e}")
+                return None
+        return _result_cache
+
+def get_identifier_cache():
+    '''
+    Returns the IdentifierCache instance shared by all threads, or None if the cache is disabled (i.e. if config.get('identifier_cache_enabled') is False)
+    or if it could not be opened.
+    '''
+    global _identifier_cache
+    if not config.get('identifier_cache_enabled'):
+        return None
+    with _result_cache_lock:
+        path_database = os.path.join(cache_directory(), CACHE_FILENAME)
+        if _identifier_cache is None or _identifier_cache.path_database != path_database:
+            try:
+                _identifier_cache = IdentifierCache(path_database, ttl_days=config.get('identifier_cache_ttl_days'),
+                                                    max_entries=config.get('identifier_cache_max_entries'))
+            except Exception as e:
+                logger.error(f"It was not possible to open the cache in {path_database}: {e}")
+                return None
+        return _identifier_cache
+
+def clear_cache():
+    '''
+    Removes all the results and all the identifiers stored in the cache.
+    '''
+    path_database = os.path.join(cache_directory(), CACHE_FILENAME)
+    if not os.path.exists(path_database):
+        logger.info("The cache is already empty.")
+        return
+    IdentifierCache(path_database).clear()
+    if _identifier_cache:
+        _identifier_cache.clear()
+    ResultCache(path_database, max_size_mb=config.get('cache_max_size_mb')).clear()
+    logger.info(f"The cache in {path_database} was cleared.")
+
+def invalidate(target):
+    '''
+    Removes from the cache the results associated to the pdf file target, or to all the pdf files in the folder target. As clear_cache, it also
+    works when the cache is disabled (i.e. config.get('cache_enabled') is False), since the results stored while it was enabled would be used
+    again when it is enabled. It returns the number of results removed.
+    '''
+    target = str(target)
+    if os.path.isdir(target):
+        files = [os.path.join(target, f) for f in os.listdir(target) if f.lower().endswith('.pdf')]
+    else:
+        files = [target]
+    path_database = os.path.join(cache_directory(), CACHE_FILENAME)
+    if not os.path.exists(path_database):
+        return 0
+    result_cache = ResultCache(path_database, max_size_mb=config.get('cache_max_size_mb'))
+    return sum(result_cache.invalidate(file) for file in files)
@@ -0,0 +1,244 @@
+'''
+This module defines Result, a compact alternative to the dictionaries returned by pdf2bib_singlefile, used when config.get('compact_results') is True.
+
+A Result has the same keys as the dictionary it replaces (see pdf2bib_singlefile), and it can be used in the same way (result['bibtex'], result.get('metadata'),
+result.items(), dict(result), etc.), but it takes much less memory, which matters when the results of many thousands of files are kept until the end:
+    - the fields are stored in slots rather than in a dictionary,
+    - the raw data returned by dx.doi.org or export.arxiv.org (result['validation_info']), which is often the largest part of the result, is either kept
+      as it is, kept compressed (and decompressed only when accessed) or dropped, according to config.get('compact_validation_info') ('keep', 'compress' or 'drop'),
+    - in result['metadata'], the short values which are shared by many papers (e.g. the journal) and the names of the authors are interned, and the list of
+      authors is replaced by an Authors object, which stores the given and family name of each author (which are the only ones used by make_bibtex)
+      in a single tuple, instead of one dictionary per author. This matters for the papers of large collaborations, which list thousands of authors.
+      The other keys of each author (e.g. 'ORCID', 'affiliation' or 'sequence', returned by dx.doi.org) are kept as well, so that no data is lost
+      (e.g. in the CSL-JSON records, see writers.py), and identical ones are stored only once.
+An Authors object can be used as a read-only list of dictionaries (metadata['author'][0]['family'], len(metadata['author']), etc.). It is converted into
+a list by json_default, which is used wherever the metadata is converted into JSON.
+'''
+
+import pickle
+import sys
+import zlib
+from collections.abc import MutableMapping, Sequence
+import pdf2bib.config as config
+
+VALIDATION_INFO_MODES = ['keep', 'compress', 'drop']
+_INTERNED_METADATA = ['journal', 'ejournal', 'publisher', 'ENTRYTYPE', 'year', 'month', 'day', 'volume', 'issue']
+_MAX_INTERNED_LENGTH = 200
+
+
+class _Missing():
+    #Value of the fields which are not set. It is pickled by name, so that it is still recognized after being sent to another process
+    def __reduce__(self):
+        return '_MISSING'
+
+    def __repr__(self):
+        return '<missing>'
+
+_MISSING = _Missing()
+
+
+class _Compressed():
+    '''
+    A validation_info compressed with zlib (strings are encoded in utf-8, any other object is pickled).
+    '''
+    __slots__ = ('data', 'is_string')
+
+    def __init__(self, value):
+        self.is_string = isinstance(value, str)
+        self.data = zlib.compress(value.encode('utf-8') if self.is_string else pickle.dumps(value))
+
+    def decompress(self):
+        data = zlib.decompress(self.data)
+        return data.decode('utf-8') if self.is_string else pickle.loads(data)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) and len(value) <= _MAX_INTERNED_LENGTH else value
+
+
+class Authors(Sequence):
+    '''
+    Compact, read-only version of a list of authors in the format [{'given': 'Name1', 'family': 'LastName1'}, {'given': 'Name2', 'family': 'LastName2'}, ...].
+    The names are stored (interned) in a single tuple (given1, family1, given2, family2, ...), and the dictionary of each author is created only when accessed.
+    The other keys of the authors (if any) are stored in a second tuple, with the tuple of the (key, value) pairs of each author (or None), and the identical
+    tuples are stored only once (e.g. ('sequence', 'additional'), which dx.doi.org returns for all authors but the first). The values are shared by the
+    dictionaries returned for the same author, so they must not be modified.
+    The names of each author, in the format used in the bibtex entries, are returned by names without creating the dictionaries.
+    '''
+    __slots__ = ('_names', '_extras')
+
+    def __init__(self, authors=()):
+        names = []
+        extras = []
+        unique_extras = {}
+        for author in authors:
+            names.append(_intern(author.get('given')))
+            names.append(_intern(author.get('family')))
+            items = tuple((sys.intern(key) if isinstance(key, str) else key, value) for key, value in author.items() if key != 'given' and key != 'family')
+            extras.append(unique_extras.setdefault(repr(items), items) if items else None)
+        self._names = tuple(names)
+        self._extras = tuple(extras) if any(extras) else None
+
+    @classmethod
+    def from_list(cls, authors):
+        '''
+        Returns an Authors object with the same authors as the list authors, or authors itself if it cannot be represented by an Authors object
+        (i.e. if it is not a list of dictionaries, each containing at least one of the keys 'given' and 'family').
+        '''
+        if isinstance(authors, list) and all(isinstance(author, dict) and ('given' in author or 'family' in author) for author in authors):
+            return cls(authors)
+        return authors
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Authors index out of range')
+        given, family = self._names[2 * index], self._names[2 * index + 1]
+        author = {key: value for key, value in (('given', given), ('family', family)) if value is not None}
+        if self._extras and self._extras[index]:
+            author.update(self._extras[index])
+        return author
+
+    def __len__(self):
+        return len(self._names) // 2
+
+    def __eq__(self, other):
+        if isinstance(other, Authors):
+            return self._names == other._names and (self._extras == other._extras or list(self) == list(other))
+        return isinstance(other, Sequence) and not isinstance(other, str) and list(self) == list(other)
+
+    def __reduce__(self):
+        return (_authors_from_names, (self._names, self._extras))
+
+    def __repr__(self):
+        return f"Authors({list(self)!r})"
+
+    def names(self):
+        '''
+        Iterates over the names of the authors in the format "Name1 LastName1" (as in the bibtex entries, see bibtex_makers.format_authors).
+        '''
+        names = self._names
+        return ((names[i] or '') + " " + (names[i + 1] or '') for i in range(0, len(names), 2))
+
+    def to_list(self):
+        return list(self)
+
+def _authors_from_names(names, extras=None):
+    authors = Authors()
+    authors._names = names
+    authors._extras = extras
+    return authors
+
+def json_default(value):
+    '''
+    Function used as argument default of json.dumps, wherever the results or the metadata are converted into JSON: the Authors objects are converted into
+    lists of dictionaries, and any other object which is not supported by json into a string.
+    '''
+    if isinstance(value, Authors):
+        return value.to_list()
+    return str(value)
+
+def compact_metadata(metadata):
+    '''
+    Returns a copy of the dictionary metadata (as generated by bibtex_makers.parse_bib_from_dxdoiorg or parse_bib_from_exportarxivorg) in which
+    all keys and the values of the keys in _INTERNED_METADATA are interned, and the list of authors is replaced by an Authors object.
+    The bibtex entry generated from the copy (see make_bibtex) is the same as the one generated from metadata.
+    '''
+    if not isinstance(metadata, dict):
+        return metadata
+    compact = {}
+    for key, value in metadata.items():
+        key = sys.intern(key) if isinstance(key, str) else key
+        if key == 'author' and isinstance(value, list):
+            value = Authors.from_list(value)
+        elif key in _INTERNED_METADATA:
+            value = _intern(value)
+        compact[key] = value
+    return compact
+
+
+class Result(MutableMapping):
+    '''
+    Compact, dictionary-compatible version of the dictionary returned by pdf2bib_singlefile (see the docstring of this module).
+    Keys other than those in Result.FIELDS can also be set: they are stored in a separate dictionary, created only when needed.
+    '''
+    FIELDS = ('identifier', 'identifier_type', 'validation_info', 'path', 'method', 'metadata', 'bibtex', 'timings')
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, data=(), validation_info=None):
+        '''
+        data is a dictionary (or any iterable of (key, value) pairs) with the content of the result. validation_info is one of the modes in
+        VALIDATION_INFO_MODES (if None, the value of config.get('compact_validation_info') is used).
+        '''
+        for field in self.FIELDS:
+            setattr(self, field, _MISSING)
+        self._extra = None
+        mode = validation_info or config.get('compact_validation_info')
+        if not mode in VALIDATION_INFO_MODES:
+            raise ValueError(f"validation_info must be one of {VALIDATION_INFO_MODES}.")
+        for key, value in (data.items() if isinstance(data, dict) else data):
+            if key == 'validation_info':
+                value = None if mode == 'drop' else (_Compressed(value) if mode == 'compress' and isinstance(value, (str, dict)) else value)
+                self.validation_info = value
+            elif key == 'metadata':
+                self.metadata = compact_metadata(value)
+            elif key in ('identifier_type', 'method'):
+                setattr(self, key, _intern(value))
+            else:
+                self[key] = value
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value.decompress() if key == 'validation_info' and isinstance(value, _Compressed) else value
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS and getattr(self, key) is not _MISSING:
+            setattr(self, key, _MISSING)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for field in self.FIELDS:
+            if getattr(self, field) is not _MISSING:
+                yield field
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(getattr(self, field) is not _MISSING for field in self.FIELDS) + len(self._extra or ())
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key) is not _MISSING
+        return bool(self._extra) and key in self._extra
+
+    def __repr__(self):
+        return f"Result({dict(self.items())!r})"
+
+def make_result(result):
+    '''
+    Returns result (a dictionary in the format returned by pdf2bib_singlefile) converted into a Result if config.get('compact_results') is True,
+    and result itself otherwise.
+    '''
+    if config.get('compact_results') and isinstance(result, dict):
+        return Result(result)
+    return result
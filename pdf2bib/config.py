@@ -1,48 +1,274 @@
 import configparser
+import contextvars
 import os
 import logging
+import sys
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+#The settings which override the global ones in the current thread or asyncio task (see config.settings)
+_overrides = contextvars.ContextVar('pdf2bib_settings', default=None)
+#Names of the settings of pdf2bib which are also settings of pdf2doi: their values override the ones of pdf2doi as well
+SHARED_SETTINGS = ['verbose', 'separator', 'save_identifier_metadata']
+
+
+class Settings(Mapping):
+    '''
+    Immutable collection of values of settings (of pdf2bib or, for the names which are not settings of pdf2bib, of pdf2doi), which can be passed to
+    pdf2bib, pdf2bib_singlefile, etc. (argument settings) or applied via config.settings. It can be used as a read-only dictionary.
+
+        Example:
+        settings = pdf2bib.Settings(save_identifier_metadata=False, verbose=False)
+        results = pdf2bib.pdf2bib(path, settings=settings)
+        results = pdf2bib.pdf2bib(path, settings=settings.replace(websearch=False))
+    '''
+    __slots__ = ('_values',)
+
+    def __init__(self, values=None, **kwargs):
+        values = dict(values or {})
+        values.update(kwargs)
+        for name in values:
+            config.check_name(name)
+        object.__setattr__(self, '_values', values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings objects are immutable, use replace() to obtain a modified copy")
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f"Settings({self._values!r})"
+
+    def replace(self, values=None, **kwargs):
+        '''
+        Returns a new Settings object with the values of self, updated with values (a dictionary) and kwargs.
+        '''
+        new_values = dict(self._values)
+        new_values.update(values or {})
+        new_values.update(kwargs)
+        return Settings(new_values)
+
+
+class _VerbosityFilter(logging.Filter):
+    '''
+    Filter of the pdf2bib and pdf2doi loggers, which discards all records below CRITICAL when config.get('verbose') is False. Since it is evaluated 
+    for each record, the verbosity can be different in each thread (see config.settings).
+    '''
+    def filter(self, record):
+        return record.levelno >= logging.CRITICAL or bool(config.get('verbose'))
+
+_verbosity_filter = _VerbosityFilter()
+
 
 class config():
+    '''
+    Settings of pdf2bib. The values stored in the file settings.ini are read the first time any setting is accessed (and not when pdf2bib is imported).
+
+    The values set via config.set are global (i.e. shared by all threads). Within the context manager config.settings (or a call of pdf2bib with the argument
+    settings) some values can be overridden only for the current thread or asyncio task (and for the threads started by pdf2bib to process the files),
+    so that concurrent calls of pdf2bib in the same process can use different settings.
+    '''
     __params={'verbose'   :   True,
             'separator' : os.path.sep,
-            'save_identifier_metadata' : True
+            'save_identifier_metadata' : True,
+            'workers' : 1,
+            'cache_enabled' : False,
+            'cache_directory' : '',
+            'cache_max_size_mb' : 100,
+            'async_concurrency' : 10,
+            'identifier_cache_enabled' : False,
+            'identifier_cache_ttl_days' : 30,
+            'identifier_cache_max_entries' : 10000,
+            'executor' : 'thread',
+            'process_validation_info' : False,
+            'pipeline_concurrency' : 10,
+            'pipeline_retries' : 3,
+            'use_daemon' : False,
+            'daemon_port' : 0,
+            'watch_debounce' : 2,
+            'watch_poll_interval' : 2,
+            'watch_batch_size' : 100,
+            'compact_results' : False,
+            'compact_validation_info' : 'compress',
+            'merge_index' : 'memory',
+            'merge_duplicates' : 'replace',
+            'ratelimit_enabled' : True,
+            'ratelimit_dxdoiorg_per_minute' : 600,
+            'ratelimit_exportarxivorg_per_minute' : 20,
+            'ratelimit_max_concurrency' : 8,
+            'ratelimit_retries' : 5,
+            'ratelimit_max_backoff' : 60,
+            'offline_index' : '',
+            'offline_only' : False,
+            'file_timeout' : 0,
+            'batch_timeout' : 0,
+            'embed_metadata' : False,
+            'read_embedded_metadata' : True,
+            'max_authors' : 0
             }
     __setters = __params.keys()
+    __loaded = False
+
+    @staticmethod
+    def load():
+        '''
+        Reads the file settings.ini, if it was not read yet, and applies the settings which have side effects (e.g. the verbosity of the loggers).
+        '''
+        if config.__loaded:
+            return
+        config.__loaded = True
+        config.ReadParamsINIfile()
+        config.set('verbose', config.get('verbose'))
 
     @staticmethod
     def update_params(new_params):
+        config.load()
         config.__params.update(new_params)
 
+    @staticmethod
+    def get_params():
+        '''
+        Returns a copy of the dictionary containing all settings (with the values active in the current context, see config.settings)
+        '''
+        config.load()
+        overrides = _overrides.get()
+        params = dict(config.__params)
+        if overrides:
+            params.update((name, value) for name, value in overrides.items() if name in params)
+        return params
+
     @staticmethod
     def get(name):
+        if not config.__loaded:
+            config.load()
+        overrides = _overrides.get()
+        if overrides is not None and name in overrides:
+            return overrides[name]
         return config.__params[name]
 
+    @staticmethod
+    def check_name(name):
+        '''
+        Raises NameError if name is neither a setting of pdf2bib nor a setting of pdf2doi.
+        '''
+        if name in config.__params:
+            return
+        import pdf2doi
+        try:
+            pdf2doi.config.get(name)
+        except KeyError:
+            raise NameError(f"{name} is not a setting of pdf2bib or pdf2doi") from None
+
+    @staticmethod
+    @contextmanager
+    def settings(values=None, **kwargs):
+        '''
+        Context manager which applies the settings values (a dictionary or a Settings object) and kwargs to the current thread or asyncio task, 
+        on top of the settings already active, and restores the previous ones at the end. It yields the Settings object which is active inside the context.
+        The settings of pdf2doi (e.g. websearch), and the settings in SHARED_SETTINGS, are applied to the calls of pdf2doi done inside the context.
+
+            Example:
+            with pdf2bib.config.settings(save_identifier_metadata=False, websearch=False):
+                results = pdf2bib.pdf2bib(path)
+        '''
+        current = _overrides.get()
+        if not values and not kwargs:
+            yield current or Settings()
+            return
+        settings = (current or Settings()).replace(values, **kwargs)
+        token = _overrides.set(settings)
+        try:
+            yield settings
+        finally:
+            _overrides.reset(token)
+
+    @staticmethod
+    def current_settings():
+        '''
+        Returns the Settings object active in the current context (see config.settings), or None if only the global settings are used.
+        '''
+        return _overrides.get()
+
+    @staticmethod
+    def bind(function):
+        '''
+        Returns a function which calls function with the settings active in the current context (see config.settings). It is used to 
+        apply the same settings in the threads started to process the files.
+        '''
+        overrides = _overrides.get()
+        if overrides is None:
+            return function
+        def bound(*args, **kwargs):
+            token = _overrides.set(overrides)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _overrides.reset(token)
+        return bound
+
+    @staticmethod
+    def install_pdf2doi_hook(pdf2doi_config):
+        '''
+        Replaces the method get of the config of pdf2doi (pdf2doi_config), so that the settings of pdf2doi active in the current context (see config.settings) 
+        are used for each call. It can be safely called several times.
+        '''
+        if getattr(pdf2doi_config.get, '_pdf2bib_hook', False):
+            return
+        original = pdf2doi_config.get
+        def get(name):
+            overrides = _overrides.get()
+            if overrides is not None and name in overrides and (name in SHARED_SETTINGS or not name in config.__params):
+                return overrides[name]
+            return original(name)
+        get._pdf2bib_hook = True
+        pdf2doi_config.get = staticmethod(get)
+
     @staticmethod
     def set(name, value):
+        if not config.__loaded:
+            config.load()
         if name in config.__setters:
              config.__params[name] = value
         else:
             raise NameError("Name not accepted in set() method")
         #Here we define additional actions to perform when specific parameters are modified
         if name == 'verbose':
-            # We change the logger verbosity
-            if value: loglevel = logging.INFO
-            else: loglevel = logging.CRITICAL
-            logger = logging.getLogger("pdf2bib")
-            logger.setLevel(level=loglevel)
-            logger = logging.getLogger("pdf2doi")
-            logger.setLevel(level=loglevel)
+            # We change the logger verbosity. The records below CRITICAL are discarded by _verbosity_filter when config.get('verbose') is False 
+            # (the level of the loggers is not changed, since the verbosity can be overridden in each context, see config.settings)
+            for logger in [logging.getLogger("pdf2bib"), logging.getLogger("pdf2doi")]:
+                logger.setLevel(level=logging.INFO)
+                logger.addFilter(_verbosity_filter)
+        if name == 'save_identifier_metadata':
+            # We tell pdf2doi to use the same value. If pdf2doi was not imported yet, this is done when it gets imported (see main._import_pdf2doi)
+            pdf2doi = sys.modules.get('pdf2doi')
+            if pdf2doi and hasattr(pdf2doi, 'config'):
+                pdf2doi.config.set('save_identifier_metadata', value)
+        if name.startswith('ratelimit_'):
+            # The limiters of the hosts are created again with the new settings
+            ratelimit = sys.modules.get('pdf2bib.ratelimit')
+            if ratelimit:
+                ratelimit.reset()
 
     @staticmethod
     def ReadParamsINIfile():
         '''
         Reads the parameters stored in the file settings.ini, and stores them in the dict self.params
-        If the .ini file does not exist, it creates it with the default values.
+        If the .ini file does not exist, it creates it with the default values (if the folder of pdf2bib is not writable, the default values are used).
         '''
         path_current_directory = os.path.dirname(__file__)
         path_config_file = os.path.join(path_current_directory, 'settings.ini')
         if not(os.path.exists(path_config_file)):
-            config.WriteParamsINIfile()
+            try:
+                config.WriteParamsINIfile()
+            except OSError:
+                pass
         else:
             config_object = configparser.ConfigParser()
             config_object.optionxform = str
@@ -70,6 +296,7 @@ class config():
         '''
         Prints all settings
         '''
+        config.load()
         for key,val in config.__params.items():
             print(key + " : " + str(val) + ' ('+type(val).__name__+')')
 
@@ -78,6 +305,7 @@ class config():
         '''
         Writes the parameters currently stored in in the dict self.params into the file settings.ini
         '''
+        config.load()
         path_current_directory = os.path.dirname(__file__)
         path_config_file = os.path.join(path_current_directory, 'settings.ini')
         config_object = configparser.ConfigParser()
@@ -0,0 +1,410 @@
+'''
+This module implements the daemon mode of pdf2bib (command line: pdf2bib --serve), and the client used by the command line to talk to it.
+
+The daemon is a long-running process which keeps pdf2doi and the other modules loaded, and the caches (see cache.py) open and warm, so that each
+request only pays for the lookup itself, and not for the start-up of python and of pdf2bib. It listens on a localhost port (config.get('daemon_port'),
+a free port is chosen if it is 0) and accepts requests of the form
+    POST /pdf2bib   {"target": absolute path of a pdf file or folder, "workers": ..., "ordered": ..., "pipeline": ..., "settings": {...}}
+The results are sent back as they are ready, one JSON dictionary per line (same keys as the output of pdf2bib.pdf2bib, without 'validation_info' unless
+"validation_info": true is specified in the request). The log messages of the request are sent back as well (as lines {"log": ..., "level": ..., "logger": ...}),
+and the client emits them via its own loggers.
+
+Each request contains the values of all the settings of pdf2bib and pdf2doi active in the client (see effective_settings), which are applied only to the request
+(see config.settings), so that the files are processed exactly as they would be by the client itself. The settings in PROCESS_SETTINGS are used when the caches
+and the rate limiters of the daemon are created, and they cannot be changed for a single request: a request with different values is refused (status 409),
+and the client processes the files itself. Requests are processed concurrently, and the files of each request can be processed concurrently as well (see "workers").
+
+When the daemon starts, it writes its port, its pid and a random token in the file daemon.json in the cache directory (readable only by the current user).
+Each request must contain the token in the header X-pdf2bib-token, so that only the user who started the daemon can use it.
+When config.get('use_daemon') is True (or the option -daemon is used), the command line (including the right-click menu, see utils_registry.py) looks for this
+file and, if a daemon is running, sends the request to it instead of processing the files itself (unless -nodaemon is used). The command line option -clearcache
+also clears the caches of the running daemon (see clear_cache).
+
+    Example:
+    import pdf2bib.daemon as daemon
+    results = daemon.request(r"C:\\Path\\to\\folder")
+    if results is None:
+        print("No daemon is running")
+    else:
+        for result in results:
+            print(result['bibtex'])
+'''
+
+import hmac
+import http.client
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pdf2bib.cache as cache
+import pdf2bib.compact as compact
+import pdf2bib.config as config
+import pdf2bib.observers as observers
+
+logger = logging.getLogger("pdf2bib")
+
+DAEMON_FILENAME = 'daemon.json'
+#Settings which are used when the caches and the rate limiters of the daemon are created, and cannot be changed for a single request
+PROCESS_SETTINGS = ['cache_max_size_mb', 'identifier_cache_ttl_days', 'identifier_cache_max_entries', 'ratelimit_dxdoiorg_per_minute',
+                    'ratelimit_exportarxivorg_per_minute', 'ratelimit_max_concurrency']
+#Settings which only concern the client, and are not applied to the requests
+CLIENT_SETTINGS = ['use_daemon', 'daemon_port', 'watch_debounce', 'watch_poll_interval', 'watch_batch_size']
+CONNECT_TIMEOUT = 1.0 #Seconds to wait for the daemon to accept a request, before processing the files locally
+TOKEN_HEADER = 'X-pdf2bib-token'
+
+def daemon_file():
+    '''
+    Returns the path of the file where the running daemon stores its port, pid and token.
+    '''
+    return os.path.join(cache.cache_directory(), DAEMON_FILENAME)
+
+
+def _read_pdf2doi_settings_file():
+    #Returns the global settings of pdf2doi, as read by pdf2doi from its file settings.ini when it is imported, or None if the file does not exist
+    import configparser
+    import importlib.util
+    spec = importlib.util.find_spec('pdf2doi')
+    path_config_file = os.path.join(list(spec.submodule_search_locations)[0], 'settings.ini') if spec and spec.submodule_search_locations else ''
+    if not os.path.exists(path_config_file):
+        return None
+    config_object = configparser.ConfigParser()
+    config_object.optionxform = str
+    config_object.read(path_config_file)
+    settings = {}
+    for name, value in config_object['DEFAULT'].items(): #Same conversions done by pdf2doi.config
+        if value.lower() in ('true', 'false'):
+            value = value.lower() == 'true'
+        elif value.isdigit():
+            value = int(value)
+        settings[name] = value
+    return settings
+
+def effective_settings():
+    '''
+    Returns a dictionary with the values of all the settings of pdf2bib and pdf2doi active in the current context (see config.settings), which are sent
+    with each request. If pdf2doi was not imported yet (e.g. in the command line), it is not imported: its global settings are read from its settings.ini file
+    (as done by pdf2doi when it is imported), so that sending a request stays fast.
+    '''
+    pdf2doi = sys.modules.get('pdf2doi')
+    settings = _read_pdf2doi_settings_file() if not (pdf2doi and hasattr(pdf2doi, 'config')) else None
+    params = config.get_params()
+    if settings is None:
+        from pdf2bib.main import _get_pdf2doi_settings
+        settings = _get_pdf2doi_settings()
+    else:
+        #The settings of pdf2doi overridden in the current context (those shared with pdf2bib are already in params)
+        settings.update((name, value) for name, value in (config.current_settings() or {}).items() if not name in params)
+    settings.update(params)
+    return settings
+
+
+class RequestRefused(Exception):
+    '''
+    Raised when a request cannot be processed by the daemon with the settings it specifies.
+    '''
+
+
+class _RequestLogHandler(logging.Handler):
+    '''
+    Handler of the pdf2bib and pdf2doi loggers of the daemon, which sends each record emitted while processing a request back to the client of the request.
+    The request of each record is identified by the Settings object active when the record is emitted (see config.settings and config.bind).
+    '''
+    def __init__(self):
+        super().__init__()
+        self._senders = {}
+
+    def register(self, settings, send):
+        self._senders[id(settings)] = send
+
+    def unregister(self, settings):
+        self._senders.pop(id(settings), None)
+
+    def emit(self, record):
+        send = self._senders.get(id(config.current_settings()))
+        if send is None:
+            return
+        try:
+            send({'log': record.getMessage(), 'level': record.levelno, 'logger': record.name})
+        except Exception: #The client went away. The results are not sent either, and the request ends
+            pass
+
+
+class _Daemon():
+    '''
+    Processes the requests received by the daemon. The settings of each request are applied via config.settings, which affects only the thread
+    which serves the request (and the threads started to process its files), so that several requests can be processed at the same time.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.log_handler = _RequestLogHandler()
+
+    def request_settings(self, request):
+        '''
+        Returns the settings of the request which are applied to it. It raises RequestRefused if a setting in PROCESS_SETTINGS has a different value
+        than the one used by the daemon.
+        '''
+        settings = {}
+        for name, value in (request.get('settings') or {}).items():
+            if name in CLIENT_SETTINGS:
+                continue
+            if name in PROCESS_SETTINGS:
+                if value != config.get(name):
+                    raise RequestRefused(f"The setting {name} of the request ({value}) is different from the one of the daemon ({config.get(name)}).")
+                continue
+            try:
+                config.check_name(name)
+            except NameError: #e.g. a setting of a different version of pdf2doi
+                logger.warning(f"The setting {name} of the request is not known, and it is ignored.")
+                continue
+            settings[name] = value
+        return settings
+
+    def process(self, request, settings=None, send_log=None):
+        '''
+        Generator which yields the results of the request, processed with the settings settings (by default, those returned by request_settings).
+        If send_log is specified, it is called with a dictionary for each log record emitted while processing the request.
+        '''
+        from pdf2bib.main import iter_pdf2bib
+        settings = self.request_settings(request) if settings is None else settings
+        with self._lock:
+            self.requests += 1
+        with config.settings(settings) as active:
+            if send_log:
+                self.log_handler.register(active, send_log)
+            try:
+                if request.get('pipeline'):
+                    import pdf2bib.pipeline as pipeline
+                    results = pipeline.pdf2bib_pipeline(request['target'], workers=request.get('workers'))
+                    yield from (results if isinstance(results, list) else ([results] if results else []))
+                else:
+                    yield from iter_pdf2bib(request['target'], workers=request.get('workers'), ordered=request.get('ordered', True))
+            finally:
+                self.log_handler.unregister(active)
+
+    def clear_cache(self, target=None):
+        '''
+        Removes from the caches of the daemon (including the entries kept in memory) the results of the pdf files in target, or all results and
+        identifiers if target is None (see cache.invalidate and cache.clear_cache).
+        '''
+        if target:
+            cache.invalidate(target)
+        else:
+            cache.clear_cache()
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'pdf2bib'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _authorized(self):
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), self.server.token):
+            return True
+        self._send_json(403, {'error': 'Invalid token.'})
+        return False
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self._send_json(404, {'error': f'Unknown path {self.path}.'})
+        if self._authorized():
+            self._send_json(200, {'pid': os.getpid(), 'requests': self.server.daemon.requests})
+
+    def do_POST(self):
+        if not self.path in ('/pdf2bib', '/clearcache'):
+            return self._send_json(404, {'error': f'Unknown path {self.path}.'})
+        if not self._authorized():
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            target = request.get('target')
+            if not ((isinstance(target, str) and os.path.isabs(target)) or (self.path == '/clearcache' and target is None)):
+                raise ValueError("The target must be an absolute path.")
+            if self.path == '/pdf2bib':
+                settings = self.server.daemon.request_settings(request)
+        except RequestRefused as e:
+            return self._send_json(409, {'error': str(e)})
+        except Exception as e:
+            return self._send_json(400, {'error': f'Invalid request: {e}'})
+        if self.path == '/clearcache':
+            self.server.daemon.clear_cache(target)
+            return self._send_json(200, {})
+
+        #The response is streamed (one JSON dictionary per line), and the connection is closed at the end. The log records are sent from the threads
+        #which process the files, so the lines are written under a lock
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        lock = threading.Lock()
+        def send(data):
+            line = (json.dumps(data, default=compact.json_default) + '\n').encode('utf-8')
+            with lock:
+                self.wfile.write(line)
+                self.wfile.flush()
+        try:
+            for result in self.server.daemon.process(request, settings, send_log=send):
+                result = dict(result)
+                if not request.get('validation_info'):
+                    result['validation_info'] = None
+                send(result)
+        except Exception as e:
+            logger.error(f"Some error occurred while processing the request for {request['target']}: {e}")
+            send({'error': str(e)})
+
+
+def serve(port=None):
+    '''
+    Starts the daemon on the localhost port (if port is None, the value of config.get('daemon_port') is used; 0 means any free port), and processes
+    requests until the process is interrupted (e.g. via Ctrl+C).
+    '''
+    from pdf2bib.main import _import_pdf2doi
+    import pdf2bib.lookups as lookups
+    port = config.get('daemon_port') if port is None else port
+
+    #Everything which is loaded lazily by pdf2bib is loaded now, so that the first request is as fast as the following ones
+    _import_pdf2doi()
+    lookups.install_pdf2doi_hooks()
+    import bibtexparser, unidecode
+    cache.get_result_cache()
+    cache.get_identifier_cache()
+
+    server = start_server(port)
+    logger.info(f"The pdf2bib daemon (pid {os.getpid()}) is listening on 127.0.0.1:{server.server_address[1]}. Press Ctrl+C to stop it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_server(server)
+        logger.info("The pdf2bib daemon was stopped.")
+
+def start_server(port=0):
+    '''
+    Creates the server of the daemon on the localhost port (0 means any free port), and writes its port and token in the file daemon_file(). The requests
+    are processed once server.serve_forever() is called (see serve), and stop_server(server) must be called at the end.
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), _RequestHandler)
+    server.daemon_threads = True
+    server.daemon = _Daemon()
+    for name in ("pdf2bib", "pdf2doi"):
+        logging.getLogger(name).addHandler(server.daemon.log_handler)
+    server.token = secrets.token_hex(16)
+    filename = daemon_file()
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with os.fdopen(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+        json.dump({'pid': os.getpid(), 'port': server.server_address[1], 'token': server.token}, file)
+    os.replace(temporary, filename)
+    server.daemon_filename = filename
+    return server
+
+def stop_server(server):
+    '''
+    Closes the server created by start_server, and removes the file daemon_file() if it still refers to it.
+    '''
+    server.server_close()
+    for name in ("pdf2bib", "pdf2doi"):
+        logging.getLogger(name).removeHandler(server.daemon.log_handler)
+    try:
+        with open(server.daemon_filename) as file:
+            if json.load(file).get('port') == server.server_address[1]:
+                os.remove(server.daemon_filename)
+    except (OSError, ValueError):
+        pass
+
+def _read_daemon_file():
+    try:
+        with open(daemon_file()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _post(path, data):
+    #Sends the POST request data to the path of the running daemon, and returns the connection and the response, or None if no daemon is running
+    #or if the request was refused
+    info = _read_daemon_file()
+    if not info.get('port'):
+        return None
+    connection = http.client.HTTPConnection('127.0.0.1', info['port'], timeout=CONNECT_TIMEOUT)
+    try:
+        connection.connect()
+        connection.sock.settimeout(None) #Once the daemon accepted the connection, there is no timeout (processing a folder might take a long time)
+        connection.request('POST', path, body=json.dumps(data), headers={'Content-Type': 'application/json', TOKEN_HEADER: info.get('token', '')})
+        response = connection.getresponse()
+        if response.status == 409:
+            logger.info(f"The files are not processed by the pdf2bib daemon: {json.loads(response.read()).get('error')}")
+            connection.close()
+            return None
+        if response.status != 200:
+            logger.error(f"The pdf2bib daemon refused the request: {response.read().decode('utf-8', 'replace')}")
+            connection.close()
+            return None
+    except OSError:
+        connection.close()
+        return None
+    return connection, response
+
+def request(target, workers=None, ordered=True, pipeline=False, settings=None, validation_info=False):
+    '''
+    Sends the request of processing the pdf file or folder target to the running daemon. It returns a generator which yields the result of each
+    pdf file as soon as it is received (the observers of this process are notified via on_file_end, and the log messages of the daemon are emitted
+    via the loggers of this process), or None if no daemon is running or if it cannot process the request with the current settings (see the docstring
+    of this module). All the settings active in the current context (see effective_settings) are sent with the request.
+
+    Parameters
+    ----------
+    target : string
+        Path of a .pdf file or of a directory containing pdf files
+    workers, ordered :
+        See pdf2bib.iter_pdf2bib
+    pipeline : boolean, optional
+        If True, the files are processed via pdf2bib.pipeline.pdf2bib_pipeline.
+    settings : dictionary, optional
+        Values of settings to be used for this request, in addition to those active in the current context.
+    validation_info : boolean, optional
+        If True, result['validation_info'] is also returned (converted to JSON).
+    '''
+    settings = dict(effective_settings(), **(settings or {}))
+    posted = _post('/pdf2bib', {'target': os.path.abspath(str(target)), 'workers': workers, 'ordered': ordered, 'pipeline': pipeline,
+                                'settings': settings, 'validation_info': validation_info})
+    if posted is None:
+        return None
+    logger.info(f"The files are processed by the pdf2bib daemon (pid {_read_daemon_file().get('pid')}).")
+    return _read_results(*posted)
+
+def _read_results(connection, response):
+    try:
+        for line in response:
+            result = json.loads(line)
+            if 'error' in result:
+                raise RuntimeError(f"The pdf2bib daemon failed: {result['error']}")
+            if 'log' in result:
+                logging.getLogger(result.get('logger') or "pdf2bib").log(result.get('level', logging.INFO), result['log'])
+                continue
+            observers.notify('on_file_end', result.get('path'), result)
+            yield result
+    finally:
+        connection.close()
+
+def clear_cache(target=None):
+    '''
+    Asks the running daemon (if any) to remove from its caches the results of the pdf files in target, or all results and identifiers if target is None
+    (see _Daemon.clear_cache). It returns True if a daemon is running and its caches were cleared.
+    '''
+    posted = _post('/clearcache', {'target': os.path.abspath(str(target)) if target else None})
+    if posted is None:
+        return False
+    posted[0].close()
+    return True
@@ -0,0 +1,107 @@
+'''
+This module implements the deadlines of the files processed by pdf2bib (config.get('file_timeout') and config.get('batch_timeout'), in seconds,
+0 meaning no deadline).
+
+A file whose deadline expires is cancelled: the functions which process a folder (see main._iter_concurrent, and also async_main.pdf2bib_async and 
+pipeline.pdf2bib_pipeline) stop waiting for it and return, in its place,
+a result with result['status'] = 'timeout' (see timeout_result), while the other files keep being processed. When the deadline of the whole batch expires,
+the files which are not done yet get the same result, so that the results of the files completed in time are returned without further delay.
+
+Python threads cannot be interrupted, so the thread which is processing a cancelled file is also told to stop: the deadline of the file is stored in a
+context variable (see deadline), and the queries to dx.doi.org and export.arxiv.org sent after it expired fail immediately as if the archive could not be reached
+(see lookups.py and ratelimit.py), so that pdf2doi gives up quickly. The analysis of the pdf file itself cannot be interrupted: a worker thread which
+is stuck in it stays busy until the analysis ends, while the worker processes of a pool of processes (executor='process') are terminated at the end of the batch.
+
+    Example:
+    import pdf2bib
+    results = pdf2bib.pdf2bib(r"Path\\to\\folder", workers=8, timeout=20, batch_timeout=120)
+    timed_out = [result['path'] for result in results if result.get('status') == pdf2bib.deadlines.TIMEOUT_STATUS]
+'''
+
+import contextvars
+import time
+from contextlib import contextmanager
+import pdf2bib.config as config
+
+TIMEOUT_STATUS = 'timeout'
+
+#Deadline (in the time.monotonic clock) of the file processed in the current thread or asyncio task
+_deadline = contextvars.ContextVar('pdf2bib_deadline', default=None)
+
+
+class FileTimeoutError(TimeoutError):
+    '''
+    Exception passed to the observers (see observers.py, method on_error) when a file is cancelled because its deadline expired.
+    '''
+    pass
+
+
+def get_timeouts(timeout=None, batch_timeout=None):
+    '''
+    Returns the timeout of each file and of the whole batch (in seconds), with the values of config.get('file_timeout') and config.get('batch_timeout')
+    used for the arguments which are None. A timeout which is 0 (or negative) is returned as None, meaning no deadline.
+    '''
+    if timeout is None:
+        timeout = config.get('file_timeout')
+    if batch_timeout is None:
+        batch_timeout = config.get('batch_timeout')
+    return (float(timeout) if timeout and float(timeout) > 0 else None,
+            float(batch_timeout) if batch_timeout and float(batch_timeout) > 0 else None)
+
+@contextmanager
+def deadline(at):
+    '''
+    Context manager which sets the deadline of the current thread or asyncio task to the time at (in the time.monotonic clock, or None for no deadline).
+    A deadline which is already active is never extended.
+    '''
+    current = _deadline.get()
+    if at is None or (current is not None and current <= at):
+        yield
+        return
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining():
+    '''
+    Returns the number of seconds until the deadline of the current thread or asyncio task (0 if it expired), or None if there is no deadline.
+    '''
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - time.monotonic())
+
+def expired():
+    return remaining() == 0.0
+
+def clamp(timeout):
+    '''
+    Returns timeout (a number of seconds, or None for no limit) reduced to the time remaining until the deadline of the current thread or asyncio task.
+    '''
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+def bind(function):
+    '''
+    Returns a function which calls function with the deadline active in the current context (see deadline). As config.bind, it is used to apply
+    the same deadline in the threads started to process the files.
+    '''
+    at = _deadline.get()
+    if at is None:
+        return function
+    def bound(*args, **kwargs):
+        with deadline(at):
+            return function(*args, **kwargs)
+    return bound
+
+def timeout_result(filename, elapsed=0.0):
+    '''
+    Returns the result of the file filename cancelled after elapsed seconds, with the same keys as the output of pdf2bib_singlefile,
+    plus result['status'] = TIMEOUT_STATUS.
+    '''
+    return {'identifier': None, 'identifier_type': None, 'validation_info': None, 'path': filename, 'method': None,
+            'metadata': None, 'bibtex': None, 'timings': {'total': elapsed}, 'status': TIMEOUT_STATUS}
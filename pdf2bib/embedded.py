@@ -0,0 +1,115 @@
+'''
+This module stores the bibtex data found for a pdf file in the metadata of the file itself, and reads it back, so that the file can be processed
+again (also on another computer) without any online lookup.
+
+When config.get('embed_metadata') is True, the identifier, the metadata (see bibtex_makers.py) and the bibtex entry of each file are written as a JSON
+string in the entry METADATA_KEY of the metadata (document info) of the pdf file, together with FORMAT_VERSION. When config.get('read_embedded_metadata')
+is True (default), the data embedded in a file is used before looking for its identifier (see main._get_cached_result), unless it was written with a different
+format version or it refers to a different identifier than the one stored by pdf2doi in the same file (e.g. because the identifier was later corrected manually
+via pdf2doi.add_found_identifier_to_metadata). If the bibtex entry was written with a different value of config.get('max_authors'), it is generated again
+from the embedded metadata.
+
+    Example:
+    import pdf2bib
+    import pdf2bib.embedded as embedded
+    pdf2bib.config.set('embed_metadata', True)
+    result = pdf2bib.pdf2bib_singlefile(r"Path\\to\\file.pdf")      # The data is found online, and stored in the file
+    print(embedded.read_result(r"Path\\to\\file.pdf")['bibtex'])   # The same bibtex entry, read from the file
+'''
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import pdf2bib.config as config
+from pdf2bib.compact import json_default
+
+logger = logging.getLogger("pdf2bib")
+
+METADATA_KEY = '/pdf2bib_metadata'
+IDENTIFIER_KEY = '/pdf2doi_identifier' #Entry where pdf2doi stores the identifier of the file (see pdf2doi.add_found_identifier_to_metadata)
+FORMAT_VERSION = 1
+METHOD = 'embedded_metadata' #Value of result['method'] for the results read from the file
+
+
+def read_result(filename):
+    '''
+    Returns the result (a dictionary with the same keys as the output of pdf2bib_singlefile, except 'timings') embedded in the metadata of the pdf file filename,
+    or None if config.get('read_embedded_metadata') is False or no valid data is embedded in the file. result['validation_info'] is None, since the raw data
+    returned by the online archives is not stored.
+    '''
+    if not config.get('read_embedded_metadata'):
+        return None
+    import pdf2doi.finders as finders
+    try:
+        with open(filename, 'rb') as file:
+            info = finders.get_pdf_info(file)
+            value = info.get(METADATA_KEY) if info else None
+            identifier = info.get(IDENTIFIER_KEY) if value else None
+    except Exception as e:
+        logger.error(f"Some error occurred when reading the metadata of the file {filename}: {e}")
+        return None
+    if not value:
+        return None
+    try:
+        data = json.loads(str(value))
+    except ValueError:
+        logger.error(f"The data embedded in the metadata of the file {filename} is not valid.")
+        return None
+    if not isinstance(data, dict) or data.get('format_version') != FORMAT_VERSION:
+        logger.info(f"The data embedded in the metadata of the file {filename} was written by a different version of pdf2bib, and it is ignored.")
+        return None
+    if not (isinstance(data.get('metadata'), dict) and isinstance(data.get('bibtex'), str) and data.get('identifier')):
+        logger.error(f"The data embedded in the metadata of the file {filename} is not valid.")
+        return None
+    if identifier and str(identifier) != data['identifier']:
+        logger.info(f"The data embedded in the metadata of the file {filename} refers to a different identifier than the one stored by pdf2doi, and it is ignored.")
+        return None
+    if data.get('max_authors', 0) != config.get('max_authors'): #The authors in the bibtex entry were truncated differently (see bibtex_makers.format_authors)
+        from pdf2bib.bibtex_makers import make_bibtex
+        data['bibtex'] = make_bibtex(data['metadata'])
+    logger.info(f"A valid BibTeX entry for this file was found in the metadata of the file.")
+    return {'identifier': data['identifier'], 'identifier_type': data.get('identifier_type'), 'validation_info': None, 'path': filename,
+            'method': METHOD, 'metadata': data['metadata'], 'bibtex': data['bibtex']}
+
+def write_result(filename, result):
+    '''
+    Writes the identifier, the metadata and the bibtex entry contained in result (a dictionary in the format returned by pdf2bib_singlefile) in the metadata
+    of the pdf file filename, if config.get('embed_metadata') is True and result contains a valid bibtex entry which was not read from the file itself.
+    It returns True if the data was written.
+    '''
+    if not (config.get('embed_metadata') and result.get('bibtex') and result.get('metadata') and result.get('method') != METHOD):
+        return False
+    value = json.dumps({'format_version': FORMAT_VERSION, 'identifier': result['identifier'], 'identifier_type': result['identifier_type'],
+                        'metadata': result['metadata'], 'bibtex': result['bibtex'], 'max_authors': config.get('max_authors')},
+                       ensure_ascii=False, default=json_default)
+    logger.info(f"Storing the BibTeX entry in the metadata of the file...")
+    try:
+        _write_metadata(filename, METADATA_KEY, value)
+    except Exception as e:
+        logger.error(f"It was not possible to store the BibTeX entry in the metadata of the file {filename}: {e}")
+        return False
+    return True
+
+def _write_metadata(filename, key, value):
+    '''
+    Adds the entry key, with the string value, to the metadata of the pdf file filename, keeping the other entries. The file is written to a temporary file 
+    in the same folder, which replaces filename only after the entry was read back from it, so that filename is never left truncated or corrupted.
+    It raises an exception if the entry could not be written.
+    '''
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter(clone_from=PdfReader(filename, strict=False))
+    writer.add_metadata({key: value})
+    descriptor, temporary = tempfile.mkstemp(suffix='.pdf', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            writer.write(file)
+        info = PdfReader(temporary, strict=False).metadata
+        if not info or str(info.get(key)) != value:
+            raise ValueError("the entry could not be read back from the written file")
+        shutil.copymode(filename, temporary) #mkstemp creates the file readable only by the current user
+        os.replace(temporary, filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
@@ -0,0 +1,158 @@
+'''
+This module implements the incremental update of a .bib file generated from a folder of pdf files.
+
+Next to the .bib file (e.g. refs.bib) a manifest (e.g. refs.bib.pdf2bib-manifest.json) is stored, which contains, for each pdf file that was processed
+successfully, its size, modification time, hash and the key of its bibtex entry. When the .bib file is updated (see update_bibtex_file)
+    - only the pdf files which are new, or whose content changed, are processed,
+    - the entries of the pdf files which were deleted from the folder are removed from the .bib file,
+    - the new entries are merged into the existing .bib file (see writers.BibtexWriter), leaving all other entries unchanged. Their keys are resolved
+      via merge.MergeEngine, so that the entry of a work already in the .bib file replaces it, while a new work whose key is already used by a
+      different work (e.g. same first author, year and first word of the title) gets a suffix (a, b, ...) instead of overwriting it. The old entry
+      of a modified file is not counted as a different work, so the new entry of the file keeps the same key when it is generated again.
+Files for which no valid bibtex entry could be generated are not stored in the manifest, so they are processed again at the next update.
+'''
+
+import json
+import logging
+import os
+import tempfile
+import pdf2bib.cache as cache
+import pdf2bib.config as config
+import pdf2bib.merge as merge
+import pdf2bib.writers as writers
+
+logger = logging.getLogger("pdf2bib")
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.pdf2bib-manifest.json'
+
+
+class Manifest():
+    '''
+    Manifest of the pdf files already processed for a given .bib file. The paths of the pdf files are stored relative to the folder of the .bib file.
+    '''
+    def __init__(self, filename_bibtex):
+        self.filename = os.path.abspath(filename_bibtex) + MANIFEST_SUFFIX
+        self.folder = os.path.dirname(self.filename)
+        self.files = {}
+        if os.path.exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.files = data['files']
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"The manifest {self.filename} could not be read ({e}). All pdf files will be processed again.")
+
+    def relative_path(self, filename):
+        return os.path.relpath(os.path.abspath(filename), self.folder)
+
+    def is_unchanged(self, filename):
+        '''
+        Returns True if the pdf file filename is in the manifest and its content did not change since it was processed. The file is hashed only
+        if its size or modification time changed.
+        '''
+        record = self.files.get(self.relative_path(filename))
+        if not record:
+            return False
+        stat = os.stat(filename)
+        if (record['size'], record['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return True
+        if record['size'] == stat.st_size and record['hash'] == cache.hash_file(filename):
+            record['mtime_ns'] = stat.st_mtime_ns #The file was only touched
+            return True
+        return False
+
+    def add(self, filename, key):
+        stat = os.stat(filename)
+        self.files[self.relative_path(filename)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                                    'hash': cache.hash_file(filename), 'key': key}
+
+    def remove(self, relative_path):
+        return self.files.pop(relative_path, None)
+
+    def keys(self):
+        return {record['key'] for record in self.files.values()}
+
+    def save(self):
+        '''
+        Writes the manifest on file (via a temporary file and an atomic rename).
+        '''
+        handle, temp_filename = tempfile.mkstemp(prefix='.' + os.path.basename(self.filename) + '.', suffix='.tmp', dir=self.folder)
+        with open(handle, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.files}, f, indent=1)
+        os.replace(temp_filename, self.filename)
+
+
+def update_bibtex_file(target, filename_bibtex, workers=None):
+    '''
+    Updates the file filename_bibtex (created inside the folder target) with the bibtex entries of the pdf files in the folder target,
+    processing only the files which are new or changed since the last update (see the docstring of this module).
+
+    Parameters
+    ----------
+    target : string
+        Relative or absolute path of a folder containing pdf files
+    filename_bibtex : string
+        Name of the .bib file, which is created (or updated) inside the folder target
+    workers : int, optional
+        Number of files processed concurrently (see pdf2bib.pdf2bib)
+
+    Returns
+    -------
+    results, list of dictionaries (or None if an error occured)
+        The dictionaries (in the format returned by pdf2bib_singlefile) describing the pdf files which were processed.
+    '''
+    from pdf2bib.main import _find_pdf_files
+
+    target = str(target)
+    if not os.path.isdir(target):
+        logger.error(f"{target} is not a valid path to a directory.")
+        return None
+    if not(target.endswith(config.get('separator'))):
+        target = target + config.get('separator')
+    path_filename_bibtex = target + filename_bibtex
+
+    manifest = Manifest(path_filename_bibtex)
+    if not os.path.exists(path_filename_bibtex):
+        manifest.files = {} #If the .bib file was deleted, all files need to be processed again
+    files = _find_pdf_files(target) or []
+    files_to_process = [file for file in files if not manifest.is_unchanged(file)]
+    current_files = {manifest.relative_path(file) for file in files}
+    deleted_files = [relative_path for relative_path in manifest.files if not relative_path in current_files]
+    logger.info(f"{len(files_to_process)} new or modified pdf files, {len(deleted_files)} deleted pdf files, "
+                f"{len(files) - len(files_to_process)} unchanged pdf files.")
+    return apply_changes(manifest, path_filename_bibtex, files_to_process, deleted_files, workers)
+
+def apply_changes(manifest, path_filename_bibtex, files_to_process, deleted_files, workers=None):
+    '''
+    Processes the pdf files in the list files_to_process, merges their bibtex entries into the file path_filename_bibtex, removes from it the entries
+    of the deleted files (whose paths, relative to the folder of the manifest, are in the list deleted_files), and updates and saves the manifest.
+    It returns the list of the dictionaries describing the processed files.
+    '''
+    from pdf2bib.main import _iter_files
+
+    #The keys of the deleted or modified files are removed from the .bib file, unless they are still used by another file
+    old_keys = [manifest.remove(relative_path)['key'] for relative_path in deleted_files if relative_path in manifest.files]
+    old_keys += [manifest.remove(manifest.relative_path(file))['key'] for file in files_to_process if manifest.relative_path(file) in manifest.files]
+
+    results = []
+    #The engine reads the .bib file before the writer changes it, and it is closed after the writer (see merge.MergeEngine)
+    with merge.MergeEngine(path_filename_bibtex, duplicates='replace') as engine, writers.BibtexWriter(path_filename_bibtex, mode='merge') as writer:
+        #The old entries of the deleted or modified files are dropped from the index, so that the new entry of a modified file keeps its key without suffix
+        engine.release(set(old_keys) - manifest.keys())
+        try:
+            if files_to_process:
+                for result in _iter_files(files_to_process, workers):
+                    results.append(result)
+                    if isinstance(result['bibtex'], str):
+                        bibtex = engine.resolve(result['bibtex'])
+                        writer.write(bibtex)
+                        manifest.add(result['path'], writers.get_bibtex_key(bibtex))
+        finally:
+            keys_in_use = manifest.keys()
+            for key in set(old_keys):
+                if not key in keys_in_use:
+                    writer.remove(key)
+            manifest.save()
+    return results
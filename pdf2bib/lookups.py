@@ -0,0 +1,234 @@
+'''
+This module contains the low-level functions used by pdf2bib to find candidate identifiers in a pdf file and to validate them by querying
+dx.doi.org and export.arxiv.org, without going through the function pdf2doi.pdf2doi.
+
+The function pdf2doi.pdf2doi looks for an identifier in the pdf file and validates each candidate online as soon as it is found, which makes
+the (CPU-bound) analysis of the pdf file and the (network-bound) validation impossible to separate. The function find_candidates below uses the same
+finders of pdf2doi, but instead of validating the identifiers it collects all of them (in the same order in which pdf2doi would have validated them).
+The candidates can then be validated separately, e.g. asynchronously (see async_main.py).
+
+The module also defines the functions validate_doi_web and validate_arxivID_web, which replace the homonymous functions of pdf2doi.finders 
+(see install_pdf2doi_hooks) so that every query performed by pdf2doi goes through the identifier cache of pdf2bib (see cache.IdentifierCache).
+The time spent in these functions is accumulated for each thread (see reset_lookup_time and get_lookup_time), so that it can be told apart from the 
+time spent by pdf2doi analyzing the pdf file.
+Before any query, the identifiers are looked for in the offline index (see offline.py), if it exists.
+When config.get('ratelimit_enabled') is True, the queries are also sent through the per-host limiters of ratelimit.py (instead of the functions of
+pdf2doi, which retry the failed queries immediately), so that large batches are paced and throttled queries are retried with a jittered backoff.
+Once the deadline of the file being processed has expired (see deadlines.py), no query is sent and the archives are treated as unreachable, so that pdf2doi
+gives up quickly.
+'''
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+import pdf2bib.cache as cache
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+import pdf2bib.offline as offline
+import pdf2bib.ratelimit as ratelimit
+
+logger = logging.getLogger("pdf2bib")
+
+DXDOIORG_URL = "https://dx.doi.org/"
+EXPORTARXIVORG_URL = "http://export.arxiv.org/api/query?search_query=id:"
+DXDOIORG_HOST = "dx.doi.org"
+EXPORTARXIVORG_HOST = "export.arxiv.org"
+DXDOIORG_ATTEMPTS = 10 #Same number of attempts of pdf2doi, when dx.doi.org returns an empty response
+
+#Methods of pdf2doi which only analyze the pdf file, without any online search (the candidates found are validated separately)
+LOCAL_METHODS = ['document_infos', 'filename', 'document_text']
+#Methods of pdf2doi which perform a google search. They are used only if no valid identifier is found with the local methods
+ONLINE_METHODS = ['title_google', 'first_N_characters_google']
+
+_original_validate_doi_web = None
+_original_validate_arxivID_web = None
+_hooks_lock = threading.Lock()
+_thread_data = threading.local()
+
+def install_pdf2doi_hooks():
+    '''
+    Replaces the functions validate_doi_web and validate_arxivID_web of pdf2doi.finders, which are used by pdf2doi to query dx.doi.org and export.arxiv.org,
+    with the functions validate_doi_web and validate_arxivID_web defined in this module. It can be safely called several times.
+    '''
+    global _original_validate_doi_web, _original_validate_arxivID_web
+    import pdf2doi.finders as finders
+    with _hooks_lock:
+        if _original_validate_doi_web is None:
+            _original_validate_doi_web = finders.validate_doi_web
+            _original_validate_arxivID_web = finders.validate_arxivID_web
+            finders.validate_doi_web = validate_doi_web
+            finders.validate_arxivID_web = validate_arxivID_web
+
+def reset_lookup_time():
+    _thread_data.lookup_time = 0.0
+
+def get_lookup_time():
+    '''
+    Returns the time (in seconds) spent by the current thread in the functions validate_doi_web and validate_arxivID_web since the last call of reset_lookup_time.
+    '''
+    return getattr(_thread_data, 'lookup_time', 0.0)
+
+@contextmanager
+def _timed_lookup():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _thread_data.lookup_time = get_lookup_time() + time.perf_counter() - start
+
+def validate_doi_web(doi, method=None):
+    '''
+    Same as pdf2doi.finders.validate_doi_web, but the data is first looked for in the offline index and in the identifier cache (if enabled). 
+    '''
+    import pdf2doi
+    if method is None:
+        method = pdf2doi.config.get('method_dxdoiorg')
+    fetch = lambda: _fetch_dxdoiorg(doi, method) if config.get('ratelimit_enabled') else _original_validate_doi_web(doi, method)
+    if deadlines.expired():
+        fetch = lambda: _deadline_expired(DXDOIORG_HOST)
+    with _timed_lookup():
+        validation_info = offline.lookup('DOI', doi, method)
+        if validation_info is not None or config.get('offline_only'):
+            return validation_info
+        identifier_cache = cache.get_identifier_cache()
+        if identifier_cache is None:
+            return fetch()
+        return identifier_cache.get_or_fetch_validation_info('DOI', doi, method, fetch)
+
+def validate_arxivID_web(arxivID):
+    '''
+    Same as pdf2doi.finders.validate_arxivID_web, but the data is first looked for in the offline index and in the identifier cache (if enabled). 
+    '''
+    fetch = lambda: _fetch_exportarxivorg(arxivID) if config.get('ratelimit_enabled') else _original_validate_arxivID_web(arxivID)
+    if deadlines.expired():
+        fetch = lambda: _deadline_expired(EXPORTARXIVORG_HOST)
+    with _timed_lookup():
+        validation_info = offline.lookup('arxiv ID', arxivID)
+        if validation_info is not None or config.get('offline_only'):
+            return validation_info
+        identifier_cache = cache.get_identifier_cache()
+        if identifier_cache is None:
+            return fetch()
+        return identifier_cache.get_or_fetch_validation_info('arxiv ID', arxivID, '', fetch)
+
+def _deadline_expired(host):
+    #Used instead of the queries once the deadline of the file has expired. It returns -1 (i.e. it was not possible to connect), so the result is not cached
+    logger.error(f"The deadline of this file expired, {host} is not queried.")
+    return -1
+
+def _fetch_dxdoiorg(doi, method):
+    #Same as pdf2doi.finders.validate_doi_web (it returns the text, None if the DOI does not exist, or -1 if it was not possible to connect), but the query
+    #is sent via ratelimit.get. As in pdf2doi, the query is sent again (at most DXDOIORG_ATTEMPTS times) when the response is empty. The attempts are paced
+    #by the limiter of dx.doi.org
+    for attempt in range(DXDOIORG_ATTEMPTS):
+        try:
+            response = ratelimit.get(DXDOIORG_URL + doi, headers={"accept": method})
+        except deadlines.FileTimeoutError:
+            return _deadline_expired(DXDOIORG_HOST)
+        except Exception as e:
+            logger.error(f"Some error occurred during connection to dx.doi.org: {e}")
+            return -1
+        text = response.text
+        if ratelimit.is_throttled(response.status_code, text):
+            logger.error(f"Could not reach dx.doi.org (status {response.status_code}).")
+            return -1
+        if text:
+            break
+        logger.info(f"Could not reach dx.doi.org. Trying again. Attempts left: {DXDOIORG_ATTEMPTS - attempt - 1}")
+    else:
+        return -1
+    if response.status_code == 404 or text.lower().find("DOI cannot be found".lower()) != -1:
+        return None
+    return text
+
+def _fetch_exportarxivorg(arxivID):
+    #Same as pdf2doi.finders.validate_arxivID_web (it returns the data of the paper, None if the arXiv ID does not exist, or -1 if it was not possible to connect),
+    #but the query is sent via ratelimit.get
+    import feedparser
+    try:
+        response = ratelimit.get(EXPORTARXIVORG_URL + arxivID)
+    except deadlines.FileTimeoutError:
+        return _deadline_expired(EXPORTARXIVORG_HOST)
+    except Exception as e:
+        logger.error(f"Some error occurred during connection to export.arxiv.org: {e}")
+        return -1
+    if ratelimit.is_throttled(response.status_code, response.text):
+        logger.error(f"Could not reach export.arxiv.org (status {response.status_code}).")
+        return -1
+    entries = feedparser.parse(response.text).entries
+    if not entries:
+        return -1
+    return entries[0] if len(entries[0]) > 0 else None
+
+def find_candidates(filename, method):
+    '''
+    Looks for all the possible identifiers in the pdf file filename, by using the finder of pdf2doi specified by method (one of the elements of LOCAL_METHODS).
+    No identifier is validated online: the DOIs are only standardised, and the arXiv IDs are checked against the regular expression used by pdf2doi.
+
+    Returns
+    -------
+    candidates : list of tuples (identifier, what)
+        Each tuple contains a possible identifier and its type ('doi' or 'arxiv'), in the order in which pdf2doi would validate them. Duplicates are removed.
+    '''
+    import pdf2doi.finders as finders
+    from pdf2doi.patterns import arxiv2007_pattern, standardise_doi
+
+    candidates = []
+    def collect(identifier, what='doi'):
+        if what == 'doi':
+            identifier = standardise_doi(identifier)
+        elif not re.match(arxiv2007_pattern, identifier, re.I):
+            identifier = None
+        if identifier and not (identifier, what) in candidates:
+            candidates.append((identifier, what))
+        return False #By returning False, the finder keeps looking for other identifiers
+
+    kwargs = {'keysToCheckFirst': ['/doi', '/pdf2doi_identifier']} if method == 'document_infos' else {}
+    try:
+        with open(filename, 'rb') as file:
+            finders.finder_methods[method](file, collect, **kwargs)
+    except Exception as e:
+        logger.error(f"Some error occurred when looking for identifiers with the method {method}: {e}")
+    return candidates
+
+def find_identifier_online(filename):
+    '''
+    Looks for a valid identifier of the pdf file filename by using the methods of pdf2doi which perform a google search (ONLINE_METHODS).
+    The identifiers found are validated by pdf2doi (synchronously). It returns a dictionary with the same format as the output of pdf2doi.pdf2doi.
+    '''
+    import pdf2doi.finders as finders
+    result = {'identifier': None, 'identifier_type': None, 'validation_info': None, 'path': filename, 'method': None}
+    with open(filename, 'rb') as file:
+        for method in ONLINE_METHODS:
+            result = finders.find_identifier(file, method=method)
+            if result['identifier']:
+                break
+    result['path'] = filename
+    return result
+
+def interpret_dxdoiorg_response(status, text):
+    '''
+    Interprets the response of dx.doi.org (status code and text) in the same way as the function pdf2doi.finders.validate.
+    It returns the text if the DOI is valid, or False otherwise.
+    '''
+    if status == 404 or not text:
+        return False
+    if text.lower().find("DOI cannot be found".lower()) != -1:
+        return False
+    if text.strip()[0:5] == '@misc':
+        #This might be the DOI of the journal and not the article itself (see pdf2doi.finders.validate)
+        return False
+    return text
+
+def interpret_exportarxivorg_response(text):
+    '''
+    Parses the Atom feed returned by export.arxiv.org in the same way as the function pdf2doi.finders.validate_arxivID_web.
+    It returns the dictionary describing the paper if the arXiv ID is valid, or False otherwise.
+    '''
+    import feedparser
+    entries = feedparser.parse(text).entries
+    if not entries or len(entries[0]) == 0:
+        return False
+    return entries[0]
@@ -1,16 +1,42 @@
 import argparse
 import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 from os import path, listdir
 import pdf2bib.bibtex_makers as bibtex_makers
+import pdf2bib.cache as cache
+import pdf2bib.compact as compact
 import pdf2bib.config as config
-import pdf2doi as pdf2doi
-#import pyperclip (Modules that are commented here are imported later only when needed, to improve start up time)
+import pdf2bib.deadlines as deadlines
+import pdf2bib.embedded as embedded
+import pdf2bib.lookups as lookups
+import pdf2bib.merge as merge
+import pdf2bib.observers as observers
+import pdf2bib.writers as writers
+#import pdf2doi, pyperclip (Modules that are commented here are imported later only when needed, to improve start up time)
 
-#We tell pdf2doi to use the same value of save_identifier_metadata specified in the settings of pdf2bib. When pdf2bib is called via command line, 
-#the value of save_identifier_metadata (for both pdf2doi and pdf2bib) might get changed
-pdf2doi.config.set('save_identifier_metadata',config.get('save_identifier_metadata')) 
+_pdf2doi_configured = False
 
-def pdf2bib(target):
+def _import_pdf2doi():
+    '''
+    Imports and returns the module pdf2doi. The first time, it also tells pdf2doi to use the same value of save_identifier_metadata specified in the settings of pdf2bib
+    (when pdf2bib is called via command line, the value of save_identifier_metadata might get changed, see config.set), it sets the verbosity of its logger,
+    and it makes pdf2doi use the settings active in each context (see config.settings).
+    '''
+    global _pdf2doi_configured
+    import pdf2doi
+    if not _pdf2doi_configured:
+        _pdf2doi_configured = True
+        config.install_pdf2doi_hook(pdf2doi.config)
+        pdf2doi.config.set('save_identifier_metadata',config.get('save_identifier_metadata')) 
+        config.set('verbose',config.get('verbose'))
+    return pdf2doi
+
+def pdf2bib(target, workers=None, executor=None, timeout=None, batch_timeout=None, settings=None):
     ''' 
     This is the main routine of the library. When the library is used as a command-line tool (via the entry-point "pdf2bib") the input arguments
     are collected, validated and sent to this function (see the function main() below). Alternatively, the function can be called from a Python
@@ -24,10 +50,29 @@ def pdf2bib(target):
         print(result[0]['metadata']             # Dictionary containing bibtex data
         print(result[0]['bibtex']               # A string containing a valid bibtex entry
 
+    When target is a folder containing many files, the function iter_pdf2bib can be used instead, to obtain each result as soon as it is ready.
+
     Parameters
     ----------
     target : string
         Relative or absolute path of a .pdf file or a directory containing pdf files
+    workers : int, optional
+        Number of files processed concurrently when target is a directory. Almost all the time spent on each file is spent waiting
+        for the network queries performed by pdf2doi, so several files can be processed in parallel by a pool of threads.
+        The results are returned in the same order as in the sequential case. If None (default), the value of config.get('workers') is used.
+    executor : string, optional
+        Either 'thread' (the files are processed by a pool of threads) or 'process' (the files are processed by a pool of processes, which is faster
+        when most of the time is spent by pdf2doi analyzing large or scanned pdf files, i.e. when the work is CPU-bound). In the 'process' mode, 
+        result['validation_info'] is None unless config.get('process_validation_info') is True. If None (default), the value of config.get('executor') is used.
+    timeout : float, optional
+        Maximum time (in seconds) spent on each file. A file which is not done in time is cancelled, and its result has result['status'] = 'timeout'
+        and no bibtex entry, while the other files keep being processed (see deadlines.py). If None (default), the value of config.get('file_timeout') is used (0 means no limit).
+    batch_timeout : float, optional
+        Maximum time (in seconds) spent on the whole target. When it expires, the files which are not done yet are cancelled (as done by timeout), and the results
+        of the files completed in time are returned. If None (default), the value of config.get('batch_timeout') is used (0 means no limit).
+    settings : dictionary or Settings, optional
+        Values of the settings of pdf2bib (or pdf2doi) used only for this call, instead of the global ones (see config.settings). Other calls 
+        running at the same time in other threads are not affected.
 
     Returns
     -------
@@ -43,23 +88,110 @@ def pdf2bib(target):
         result['method']            = Method used to find the identifier
         result['metadata']          = Dictionary containing bibtex info
         result['bibtex']            = A string containing a valid bibtex entry
+        result['status']            = Only present, and equal to 'timeout', if the file was cancelled because it was not done in time (see timeout)
 
     ''' 
+    with config.settings(settings):
+        # Make sure the path is a string in case a Pathlib object is provided
+        target = str(target)
 
-    # Setup logging
-    logger = logging.getLogger("pdf2bib")
+        files = _find_pdf_files(target)
+        if files is None:
+            return None
+
+        #If target is a directory, we return a list with one dictionary for each .pdf file inside it
+        if path.isdir(target):
+            papers = list(_iter_files(files, workers, executor=executor, timeout=timeout, batch_timeout=batch_timeout))
+            logging.getLogger("pdf2bib").info("................") 
+            return papers
+
+        if any(deadlines.get_timeouts(timeout, batch_timeout)):
+            return next(_iter_files(files, 1, executor=executor, timeout=timeout, batch_timeout=batch_timeout))
+        return pdf2bib_singlefile(files[0])
+
+def iter_pdf2bib(target, workers=None, ordered=True, executor=None, timeout=None, batch_timeout=None, settings=None):
+    ''' 
+    Generator version of the function pdf2bib. Instead of returning all the results at the end, it yields the dictionary describing each pdf file
+    (with the same keys as the output of pdf2bib) as soon as the file has been processed. Only a limited number of results is kept in memory at any time.
+    If target is a single pdf file, a single dictionary is yielded. If target is not valid, or no pdf file is found, nothing is yielded.
+
+        Example:
+        import pdf2bib
+        for result in pdf2bib.iter_pdf2bib(r"Path\to\folder", workers=8, ordered=False):
+            print(result['bibtex'])
+
+    Parameters
+    ----------
+    target : string
+        Relative or absolute path of a .pdf file or a directory containing pdf files
+    workers : int, optional
+        Number of files processed concurrently when target is a directory (see pdf2bib). If None (default), the value of config.get('workers') is used.
+    ordered : boolean, optional
+        If True (default), the results are yielded in the same order as in the sequential case. If False, and the files are processed concurrently, 
+        each result is yielded as soon as it is ready (i.e. in order of completion).
+    executor : string, optional
+        Either 'thread' or 'process' (see pdf2bib). If None (default), the value of config.get('executor') is used.
+    timeout, batch_timeout : float, optional
+        Maximum time (in seconds) spent on each file and on the whole target (see pdf2bib). If None (default), the values of config.get('file_timeout')
+        and config.get('batch_timeout') are used.
+    settings : dictionary or Settings, optional
+        Values of the settings of pdf2bib (or pdf2doi) used only for this call, instead of the global ones (see config.settings). They are applied (on top of 
+        the settings active when iter_pdf2bib is called) whenever the generator is running, also in the threads and processes which process the files, 
+        while the code which consumes the results keeps its own settings.
+    ''' 
+    iterator = _iter_pdf2bib(target, workers, ordered, executor, timeout, batch_timeout)
+    if not settings:
+        return iterator
+    with config.settings(settings): #The generator is advanced (and closed) with the settings active now, updated with settings
+        return _iter_bound(iterator, config.bind(next), config.bind(iterator.close))
+
+def _iter_bound(iterator, advance, close):
+    '''
+    Generator which yields the items of iterator obtained via advance (the function next, wrapped by config.bind), and closes iterator via close 
+    (iterator.close, wrapped by config.bind) at the end. Unlike a generator which yields from within config.settings, the settings of the iterator are 
+    not seen by the code which consumes the items, and the items are produced with the same settings even if they are consumed in another context.
+    '''
+    try:
+        while True:
+            try:
+                item = advance(iterator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        close()
 
-    # Make sure the path is a string in case a Pathlib object is provided
+def _iter_pdf2bib(target, workers, ordered, executor, timeout, batch_timeout):
+    #Body of iter_pdf2bib
     target = str(target)
 
+    files = _find_pdf_files(target)
+    if files is None:
+        return
+
+    if path.isdir(target):
+        yield from _iter_files(files, workers, ordered, executor, timeout, batch_timeout)
+        logging.getLogger("pdf2bib").info("................") 
+    elif any(deadlines.get_timeouts(timeout, batch_timeout)):
+        yield from _iter_files(files, 1, executor=executor, timeout=timeout, batch_timeout=batch_timeout)
+    else:
+        yield pdf2bib_singlefile(files[0])
+
+def _find_pdf_files(target):
+    '''
+    Returns the list of pdf files to process for the input target (either a single pdf file or a folder), or None (after logging the problem)
+    if target is not valid or if no pdf file was found.
+    '''
+    # Setup logging
+    logger = logging.getLogger("pdf2bib")
+
     #Check if path is valid
     if not(path.exists(target)):
         logger.error(f"{target} is not a valid path to a file or a directory.")
         return None
       
     #Check if target is a directory
-    #If yes, we look for all the .pdf files inside it, and for each of them
-    #we call again this function
+    #If yes, we look for all the .pdf files inside it
     if  path.isdir(target):
         logger.info(f"Looking for pdf files in the folder {target}...")
         pdf_files = [f for f in listdir(target) if (f.lower()).endswith('.pdf')]
@@ -72,19 +204,7 @@ def pdf2bib(target):
         logger.info(f"Found {numb_files} pdf files.")
         if not(target.endswith(config.get('separator'))): #Make sure the path ends with "\" or "/" (according to the OS)
             target = target + config.get('separator')
-            
-        papers = [] #For each pdf file in the target folder we will store a dictionary inside this list
-        for f in pdf_files:
-            logger.info("................") 
-            file = target + f
-            #For each file we call again this function, but now the input argument target is set to the path of the file
-            result = pdf2bib(target=file)
-            #logger.info(result['identifier'])
-            papers.append(result)
-
-        logger.info("................") 
-
-        return papers
+        return [target + f for f in pdf_files]
     
     #If target is not a directory, we check that if it is an existing file and that it ends with .pdf
     else:
@@ -95,19 +215,284 @@ def pdf2bib(target):
         if not (filename.lower()).endswith('.pdf'):
             logger.error("The file must have .pdf extension.")
             return None
+        return [filename]
 
-        result = pdf2bib_singlefile(filename)
+def _iter_files(files, workers=None, ordered=True, executor=None, timeout=None, batch_timeout=None):
+    '''
+    Process the pdf files listed in files (either sequentially or concurrently, depending on workers and executor) and yield the result of each of them.
+    If a timeout (see pdf2bib) is set, the files are always processed by a pool, so that the files which are not done in time can be cancelled.
+    '''
+    logger = logging.getLogger("pdf2bib")
+    if workers is None:
+        workers = config.get('workers')
+    if executor is None:
+        executor = config.get('executor')
+    if not executor in ['thread', 'process']:
+        raise ValueError("The input variable executor must be either 'thread' or 'process'")
+    file_timeout, batch_timeout = deadlines.get_timeouts(timeout, batch_timeout)
+    batch_end = time.monotonic() + batch_timeout if batch_timeout else None
+    if workers and workers > 1 and len(files) > 1:
+        logger.info(f"Processing the files with {min(workers, len(files))} concurrent workers ({executor} pool)...")
+        yield from _iter_concurrent(files, workers, ordered, executor, file_timeout, batch_end)
+    elif file_timeout or batch_end:
+        yield from _iter_concurrent(files, 1, ordered, executor, file_timeout, batch_end)
+    else:
+        for file in files:
+            logger.info("................") 
+            yield pdf2bib_singlefile(file)
 
-        return result 
+class _PerFileLogBuffer(logging.Filter):
+    '''
+    Logging filter used when several files are processed concurrently (see _iter_concurrent). Every record emitted by a worker thread 
+    (by either the pdf2bib or the pdf2doi logger) is held back, and all the records of a file are released together when the file is done.
+    In this way the output of different files is not interleaved. Records emitted by threads which are not processing a file pass through unchanged.
+    '''
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+        self._lock = threading.Lock()
 
-def pdf2bib_singlefile(filename):
+    def filter(self, record):
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    def start(self):
+        self._local.records = []
+
+    def flush(self):
+        records, self._local.records = self._local.records, None
+        self.release(records)
+
+    def collect(self):
+        '''
+        Same as flush, but the records are returned instead of being released. The records are made picklable, so that they can be 
+        sent from a worker process to the main process (see _process_file_in_worker).
+        '''
+        records, self._local.records = self._local.records, None
+        for record in records:
+            record.msg, record.args = record.getMessage(), None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+        return records
+
+    def release(self, records):
+        with self._lock:
+            for record in records:
+                logging.getLogger(record.name).callHandlers(record) #callHandlers bypasses the filters of the logger, including this one
+
+def _iter_concurrent(files, workers, ordered=True, executor='thread', file_timeout=None, batch_end=None):
+    '''
+    Process the pdf files listed in files with a pool of (at most) workers threads or processes (depending on executor), and yield the result of each file. 
+    If ordered is True the results follow the same order as files, otherwise they are yielded in order of completion. At most 2*workers files are submitted
+    to the pool at any time, so that the number of results waiting to be consumed stays bounded.
+    If file_timeout (in seconds) is not None, each file which is not done within file_timeout seconds from its start is cancelled, and if batch_end (in the
+    time.monotonic clock) is not None, all the files which are not done at that time are cancelled (see deadlines.py). A result with status 'timeout' is yielded
+    for each cancelled file. The pool is then replaced by a new one (with the files not started yet), so that a file which is stuck does not hold up the others.
+    '''
+    log_buffer = _PerFileLogBuffer()
+    loggers = [logging.getLogger("pdf2bib"), logging.getLogger("pdf2doi")]
+    started = {} #Start time of each file (for the process pool, the time when it was submitted)
+
+    def file_deadline(file):
+        #Returns the deadline of the file (in the time.monotonic clock), or None
+        start = started.get(file)
+        ends = [end for end in [start + file_timeout if (file_timeout and start is not None) else None, batch_end] if end is not None]
+        return min(ends) if ends else None
+
+    @config.bind #The worker threads use the settings active in the current context
+    def process(file):
+        started[file] = time.monotonic()
+        log_buffer.start()
+        try:
+            logging.getLogger("pdf2bib").info("................")
+            with deadlines.deadline(file_deadline(file)):
+                return pdf2bib_singlefile(file)
+        finally:
+            log_buffer.flush()
+
+    def get_result(future):
+        file = submitted.pop(future)
+        if executor == 'thread':
+            try:
+                return future.result()
+            except deadlines.FileTimeoutError: #The file noticed that its deadline expired (the observers were already notified by pdf2bib_singlefile)
+                return timeout_result(file, notify=False)
+        #The result of a worker process also contains the log records of the file (which are released here), and the observers 
+        #of the main process are notified only now (see _process_file_in_worker)
+        result, records, exception = future.result()
+        log_buffer.release(records)
+        observers.notify('on_file_start', file)
+        if isinstance(exception, deadlines.FileTimeoutError):
+            return timeout_result(file, exception=exception)
+        if exception:
+            observers.notify('on_error', file, exception)
+            raise exception
+        for stage, elapsed in result['timings'].items():
+            if stage != 'total':
+                observers.notify('on_stage_end', file, stage, elapsed)
+        observers.notify('on_file_end', file, result)
+        return result
+
+    def timeout_result(file, notify=True, exception=None):
+        elapsed = time.monotonic() - started[file] if file in started else 0.0
+        logging.getLogger("pdf2bib").error(f"The file {file} was cancelled, since it was not done in time.")
+        #In the thread pool the observers are notified by the worker thread, unless the file was cancelled before starting
+        if notify and (executor == 'process' or not file in started):
+            observers.notify('on_file_start', file)
+            observers.notify('on_error', file, exception or deadlines.FileTimeoutError(f"The file {file} was not done in time."))
+        return compact.make_result(deadlines.timeout_result(file, elapsed))
+
+    submitted = {}
+    def submit(file):
+        if executor == 'thread':
+            future = pool.submit(process, file)
+        else:
+            started[file] = time.monotonic()
+            timeout = file_deadline(file)
+            future = pool.submit(_process_file_in_worker, file, None if timeout is None else max(0.0, timeout - started[file]))
+        submitted[future] = file
+        return future
+
+    def new_pool():
+        if executor == 'process':
+            return ProcessPoolExecutor(max_workers=min(workers, len(files)), initializer=_init_process_worker,
+                                       initargs=(config.get_params(), _get_pdf2doi_settings()))
+        return ThreadPoolExecutor(max_workers=min(workers, len(files)))
+
+    def replace_pool():
+        #The files which were not started yet are moved to a new pool, while the cancelled files which are still running are left in the old one
+        nonlocal pool
+        old_pools.append(pool)
+        pool = new_pool()
+        for index, future in enumerate(pending):
+            if future.cancel():
+                pending[index] = submit(submitted.pop(future))
+        if executor == 'thread': #A process pool is shut down only at the end, when its worker processes are terminated (see below)
+            old_pools[-1].shutdown(wait=False)
+
+    if executor == 'thread':
+        for logger in loggers:
+            logger.addFilter(log_buffer)
+    #With a timeout, the worker processes get only the files which can start right away, since the deadline of each file starts when it is submitted
+    ahead = workers if (executor == 'process' and file_timeout) else 2 * workers
+    old_pools = []
+    pool = new_pool()
+    abandoned = False
+    try:
+        files_to_submit = iter(files)
+        pending = deque(submit(file) for file in islice(files_to_submit, ahead))
+        while pending:
+            waiting = [pending[0]] if ordered else list(pending)
+            ends = [end for end in map(file_deadline, (submitted[future] for future in waiting)) if end is not None]
+            timeout = max(0.0, min(ends) - time.monotonic()) if ends else None
+            done, _ = wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED) #for ordered, wait for the oldest file
+            expired = []
+            if not done:
+                now = time.monotonic()
+                expired = [future for future in waiting if (file_deadline(submitted[future]) or now + 1) <= now]
+            for future in list(done) + expired:
+                pending.remove(future)
+            if any(not future.cancel() for future in expired):
+                abandoned = True
+                replace_pool()
+            for future in list(done) + expired:
+                if batch_end is None or time.monotonic() < batch_end:
+                    for file in islice(files_to_submit, 1):
+                        pending.append(submit(file))
+                yield get_result(future) if future in done else timeout_result(submitted.pop(future))
+        #When the batch deadline expires, the files which were never submitted are cancelled as well
+        for file in files_to_submit:
+            yield timeout_result(file)
+    finally:
+        #If the generator is closed before the end, the files which were not started yet are cancelled. The pools containing cancelled files which
+        #are still running are not waited for (their worker processes are terminated)
+        for old_pool in old_pools + [pool]:
+            wait_pool = (old_pool is pool and not abandoned)
+            if executor == 'process' and not wait_pool:
+                _terminate_process_pool(old_pool)
+            else:
+                old_pool.shutdown(wait=wait_pool, cancel_futures=True)
+        for logger in loggers:
+            logger.removeFilter(log_buffer)
+
+def _terminate_process_pool(pool):
+    '''
+    Cancels the files which were not started yet by the process pool pool, and terminates its worker processes.
+    '''
+    if hasattr(pool, 'terminate_workers'): #Available from python 3.14
+        pool.terminate_workers()
+        return
+    processes = list((getattr(pool, '_processes', None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+#Names of the settings of pdf2doi which are passed to the worker processes (see _init_process_worker)
+_PDF2DOI_SETTINGS = ['verbose', 'separator', 'method_dxdoiorg', 'webvalidation', 'websearch', 'numb_results_google_search', 
+                     'N_characters_in_pdf', 'save_identifier_metadata', 'replace_arxivID_by_DOI_when_available']
+
+def _get_pdf2doi_settings():
+    pdf2doi = _import_pdf2doi()
+    settings = {}
+    for name in _PDF2DOI_SETTINGS:
+        try:
+            settings[name] = pdf2doi.config.get(name)
+        except KeyError: #This setting is not available in the installed version of pdf2doi
+            pass
+    return settings
+
+_process_log_buffer = None
+
+def _init_process_worker(pdf2bib_settings, pdf2doi_settings):
+    '''
+    Initializer of each worker process (see _iter_concurrent). It applies the settings of pdf2bib and pdf2doi of the main process (which are not 
+    inherited when the worker processes are spawned rather than forked), and it starts collecting the log records of each file.
+    '''
+    global _process_log_buffer
+    config.update_params(pdf2bib_settings)
+    pdf2doi = _import_pdf2doi()
+    for name, value in pdf2doi_settings.items():
+        pdf2doi.config.set(name, value)
+    config.set('verbose', config.get('verbose')) #This must be done last, since it also sets the verbosity of the pdf2doi logger
+    observers.remove_all_observers() #The observers are notified by the main process
+    _process_log_buffer = _PerFileLogBuffer()
+    for logger in [logging.getLogger("pdf2bib"), logging.getLogger("pdf2doi")]:
+        logger.addFilter(_process_log_buffer)
+
+def _process_file_in_worker(file, timeout=None):
+    '''
+    Processes the pdf file file in a worker process, within timeout seconds (if not None, see deadlines.py). It returns a tuple (result, records, exception), 
+    where records are the log records emitted while processing the file and exception is the exception raised (if any). result['validation_info'] is removed 
+    (unless config.get('process_validation_info') is True), to reduce the amount of data sent back to the main process.
+    '''
+    _process_log_buffer.start()
+    try:
+        logging.getLogger("pdf2bib").info("................")
+        with deadlines.deadline(None if timeout is None else time.monotonic() + timeout):
+            result = pdf2bib_singlefile(file)
+        if not config.get('process_validation_info'):
+            result['validation_info'] = None
+        return result, _process_log_buffer.collect(), None
+    except Exception as e:
+        return None, _process_log_buffer.collect(), e
+
+def pdf2bib_singlefile(filename, settings=None):
     '''
     Extract bibtex data from the pdf file specified by filename. This function does not check wheter filename is a valid path to a pdf file.
+    If config.get('cache_enabled') is True, the result is first looked for in the persistent cache (see cache.py), and then in the metadata of the file
+    itself (see embedded.py): pdf2doi is called only if this file was not processed before. If a deadline is active in the current thread (see deadlines.py) and it expires before pdf2doi is done,
+    deadlines.FileTimeoutError is raised.
 
     Parameters
     ----------
     filename : string
         absolute path of a single .pdf file
+    settings : dictionary or Settings, optional
+        Values of the settings of pdf2bib (or pdf2doi) used only for this call, instead of the global ones (see config.settings).
 
     Returns
     -------
@@ -122,12 +507,59 @@ def pdf2bib_singlefile(filename):
         result['method']            = Method used by pdf2doi to find the identifier
         result['metadata']          = Dictionary containing bibtex info
         result['bibtex']            = A string containing a valid bibtex entry
+        result['timings']           = Dictionary containing the time (in seconds) spent in each stage of the processing (see observers.py)
     ''' 
-    # Setup logging
+    with config.settings(settings):
+        # Setup logging
+        pdf2doi = _import_pdf2doi()
+        logger = logging.getLogger("pdf2bib")
+        logger.info(f"Trying to extract data to generate the BibTeX entry for the file: {filename}")  
+
+        timer = observers.StageTimer(filename)
+        observers.notify('on_file_start', filename)
+        try:
+            with timer.stage('cache'):
+                result = _get_cached_result(filename)
+            if not result:
+                _check_deadline(filename)
+                logger.info(f"Calling pdf2doi...") 
+                lookups.install_pdf2doi_hooks() #This makes sure that the queries done by pdf2doi go through the identifier cache of pdf2bib
+                lookups.reset_lookup_time()
+                start = time.perf_counter()
+                result = pdf2doi.pdf2doi(filename)
+                _check_deadline(filename) #If the deadline expired, pdf2doi might have given up before validating the right identifier
+                lookup_time = lookups.get_lookup_time()
+                timer.add('extraction', time.perf_counter() - start - lookup_time)
+                timer.add('lookup', lookup_time)
+                _add_bibtex_to_result(result, timer)
+                if result['bibtex']:
+                    with timer.stage('cache'):
+                        _embed_result_in_file(filename, result)
+                        _store_result_in_cache(filename, result)
+        except Exception as e:
+            observers.notify('on_error', filename, e)
+            raise
+        result['timings'] = timer.stop()
+        result = compact.make_result(result)
+        observers.notify('on_file_end', filename, result)
+        return result
+
+def _check_deadline(filename):
+    '''
+    Raises deadlines.FileTimeoutError if the deadline of the current thread (see deadlines.py) has expired.
+    '''
+    if deadlines.expired():
+        raise deadlines.FileTimeoutError(f"The file {filename} was not done in time.")
+
+def _add_bibtex_to_result(result, timer=None):
+    '''
+    Given a dictionary result in the format returned by pdf2doi, it parses result['validation_info'] and adds the keys 'metadata' and 'bibtex' to result.
+    If it is not possible to generate a valid bibtex entry, both result['metadata'] and result['bibtex'] are set to None.
+    If timer (an instance of observers.StageTimer) is specified, the time spent parsing the data and generating the bibtex entry is added to it.
+    '''
+    timer = timer or observers.StageTimer(result.get('path'))
+    pdf2doi = _import_pdf2doi()
     logger = logging.getLogger("pdf2bib")
-    logger.info(f"Trying to extract data to generate the BibTeX entry for the file: {filename}")  
-    logger.info(f"Calling pdf2doi...") 
-    result = pdf2doi.pdf2doi(filename)
     if result['identifier'] == None:
         logger.error("It was not possible to find a valid identifier for this file.")
         result['metadata'] = None
@@ -140,49 +572,108 @@ def pdf2bib_singlefile(filename):
         return result
 
     logger.info(f"pdf2doi found a valid identifier for this paper.") 
-  
-    if result["identifier_type"] == "arxiv ID":
-        logger.info(f"Parsing the info returned by export.arxiv.org...")
-        metadata = bibtex_makers.parse_bib_from_exportarxivorg(
-            result["validation_info"]
-        )
-    elif result["identifier_type"] == "arxiv DOI":
-        if "arxiv_doi" not in result["validation_info"]:
-            result["validation_info"]["arxiv_doi"] = result["identifier"]
-        logger.info(f"Parsing the info returned by export.arxiv.org...")
-        metadata = bibtex_makers.parse_bib_from_exportarxivorg(
-            result["validation_info"]
-        )
-    elif result['identifier_type'] == 'DOI':
-        logger.info(f"Parsing the info returned by dx.doi.org...")
-        metadata = bibtex_makers.parse_bib_from_dxdoiorg(result['validation_info'], method=pdf2doi.config.get('method_dxdoiorg'))
+
+    #The metadata associated to this identifier might have been already parsed for another file (or in a previous run)
+    with timer.stage('parse'):
+        identifier_cache = cache.get_identifier_cache()
+        cache_key = (result['identifier_type'], result['identifier'], 
+                     pdf2doi.config.get('method_dxdoiorg') if result['identifier_type'] == 'DOI' else '')
+        metadata = identifier_cache.get_metadata(*cache_key) if identifier_cache else None
+    
+        if metadata:
+            logger.info(f"The metadata associated to this identifier was found in the cache.")
+        elif result["identifier_type"] == "arxiv ID":
+            logger.info(f"Parsing the info returned by export.arxiv.org...")
+            metadata = bibtex_makers.parse_bib_from_exportarxivorg(
+                result["validation_info"]
+            )
+        elif result["identifier_type"] == "arxiv DOI":
+            if "arxiv_doi" not in result["validation_info"]:
+                result["validation_info"]["arxiv_doi"] = result["identifier"]
+            logger.info(f"Parsing the info returned by export.arxiv.org...")
+            metadata = bibtex_makers.parse_bib_from_exportarxivorg(
+                result["validation_info"]
+            )
+        elif result['identifier_type'] == 'DOI':
+            logger.info(f"Parsing the info returned by dx.doi.org...")
+            metadata = bibtex_makers.parse_bib_from_dxdoiorg(result['validation_info'], method=pdf2doi.config.get('method_dxdoiorg'))
 
     if metadata: #if retrieval of bibtex data was succesful, we add the fields to the result dictionary
         result['metadata'] = metadata
-        result['bibtex'] = bibtex_makers.make_bibtex(metadata)
+        with timer.stage('render'):
+            result['bibtex'] = bibtex_makers.make_bibtex(metadata)
         logger.info(f"A valid BibTeX entry was generated.") 
+        if identifier_cache:
+            try:
+                identifier_cache.put_metadata(*cache_key, metadata)
+            except Exception as e:
+                logger.error(f"Some error occurred when storing the metadata in the cache: {e}")
     else:
         result['metadata'] = None
         result['bibtex'] = None
         logger.error("Some error occurred when parsing the raw BibTeX data.")
     
     return result
-    
 
+def _get_cached_result(filename):
+    '''
+    Returns the result stored in the persistent cache for the file filename or, if the cache is disabled or the file is not in the cache, the result 
+    embedded in the metadata of the file (see embedded.py). It returns None if neither is available.
+    '''
+    logger = logging.getLogger("pdf2bib")
+    result_cache = cache.get_result_cache()
+    result = None
+    if result_cache:
+        try:
+            result = result_cache.get(filename)
+        except Exception as e:
+            logger.error(f"Some error occurred when reading the cache: {e}")
+    if result:
+        logger.info(f"A valid BibTeX entry for this file was found in the cache.") 
+        return result
+    return embedded.read_result(filename)
+
+def _embed_result_in_file(filename, result):
+    '''
+    Stores the bibtex entry of result in the metadata of the file filename, if config.get('embed_metadata') is True (see embedded.py). 
+    This must be done before storing the result in the persistent cache, since the file is modified.
+    '''
+    try:
+        embedded.write_result(filename, result)
+    except Exception as e:
+        logging.getLogger("pdf2bib").error(f"Some error occurred when storing the BibTeX entry in the metadata of the file: {e}")
+
+def _store_result_in_cache(filename, result):
+    logger = logging.getLogger("pdf2bib")
+    result_cache = cache.get_result_cache()
+    if not result_cache:
+        return
+    try:
+        result_cache.put(filename, result)
+    except Exception as e:
+        logger.error(f"Some error occurred when storing the result in the cache: {e}")
+    
 
-def save_bibtex_entries(filename_bibtex, results, clipboard = False):
+def save_bibtex_entries(filename_bibtex, results, clipboard = False, mode = 'w', dedupe = False):
     ''' Write all bibtex entries contained in the input list 'results' into a text file with a path specified by filename_bibtex 
         (if filename_bibtex is a valid string) and/or into the clipboard (if clipboard = True).
         the input variable results is a list of dictionaries, and the element results[i]['bibtex'] contains the bibtex entry.
+        The entries are written on file one at a time via a writers.BibtexWriter, so results can also be any iterable (e.g. the generator returned by iter_pdf2bib).
     
     Parameters
     ----------
     filename_bibtex : string
-        Absolute path of the target file. If equal to '' or False, nothing is stored on file.
-    results : list of dictionaries
+        Name of the target file, which is created in the same folder of the first pdf file. If equal to '' or False, nothing is stored on file.
+    results : list (or iterable) of dictionaries
         Each element of the list 'results' describes a .pdf file, and contains the pdf identifier, bibtex entry and other infos.
     clipboard : boolean, optional
         If set to True, the bibtex entries are stored in the clipboard. Default is False.
+    mode : string, optional
+        Either 'w' (default, the file is overwritten), 'a' (the entries are appended to the file) or 'merge' (the entries replace the ones with the
+        same key in the file, and the others are added). See writers.py for details.
+    dedupe : boolean, optional
+        If set to True, the entries are merged into the file (as with mode = 'merge'), but the duplicates of existing entries (same DOI, arXiv ID or title)
+        are detected and the keys already used by different works are disambiguated with a suffix (a, b, ...). See merge.py for details.
 
     Returns
     -------
@@ -190,38 +681,92 @@ def save_bibtex_entries(filename_bibtex, results, clipboard = False):
     '''
     logger = logging.getLogger("pdf2bib")
 
-    if isinstance(filename_bibtex,str) or clipboard:
-        text = ''
+    clipboard_entries = []
+    writer = None
+    engine = None
+    try:
         for result in results:
-            if isinstance(result['bibtex'],str):
-                text = text + result['bibtex'] + "\n\n"
+            #If filename_bibtex is a valid string, we create the full path of the file where bibtex entries will be saved (in the folder of the first
+            #pdf file, also when it has no bibtex entry, so that the file is created even if no entry is found)
+            if isinstance(filename_bibtex,str) and writer is None:
+                path_filename_bibtex = path.dirname(result['path']) + config.get('separator') + filename_bibtex
+                if dedupe:
+                    engine = merge.MergeEngine(path_filename_bibtex) #The engine reads the file before the writer changes it
+                writer = writers.BibtexWriter(path_filename_bibtex, mode='merge' if dedupe else mode)
+            if not isinstance(result['bibtex'],str):
+                continue
+            if writer:
+                bibtex = engine.resolve(result['bibtex']) if engine else result['bibtex']
+                if bibtex:
+                    writer.write(bibtex)
+            if clipboard:
+                clipboard_entries.append(result['bibtex'] + "\n\n")
+        if writer:
+            writer.close()
+            print(f'All available bibtex entries have been stored in the file {filename_bibtex}')
+        if engine:
+            engine.close()
+            print(f'{engine.numb_duplicates} duplicate entries were found, and {engine.numb_renamed} keys were disambiguated')
+    except Exception as e:
+        if writer:
+            writer.abort() #The target file is left as it was
+        if engine:
+            engine.abort()
+        print(e)
+        print(f'A problem occurred when trying to write into the file {filename_bibtex}')
 
-    #If filename_bibtex is a valid string, we create the full path of the file where bibtex entries will be saved
-    if isinstance(filename_bibtex,str):
-        path_filename_bibtex = path.dirname(results[0]['path']) + config.get('separator') + filename_bibtex
-        try:
-            with open(path_filename_bibtex, "w", encoding="utf-8") as text_file:
-                text_file.write(text) 
-                print(f'All available bibtex entries have been stored in the file {filename_bibtex}')
-        except Exception as e:
-            print(e)
-            print(f'A problem occurred when trying to write into the file {filename_bibtex}')
     if clipboard:
         import pyperclip
         try:
-            pyperclip.copy(text)
+            pyperclip.copy(''.join(clipboard_entries))
             print(f'All available bibtex entries have been stored in the system clipboard')
         except Exception as e:
             print(e)
             print(f'A problem occurred when trying to write into the system clipboard')
 
-    
+
+def save_records(output_format, filename, results, mode='w', folder=None):
+    '''
+    Writes a machine-readable record for each element of results (see writers.RecordWriter), as soon as it is produced.
+
+    Parameters
+    ----------
+    output_format : string
+        Either 'jsonl' or 'csl-json'
+    filename : string
+        Name of the target file, which is created in the same folder of the first pdf file. If equal to '' or None, the records are printed on the standard output.
+    results : list (or iterable) of dictionaries
+        Each element of the list 'results' describes a .pdf file, as returned by pdf2bib_singlefile
+    mode : string, optional
+        Either 'w' (default, the file is overwritten) or 'a' (the records are appended to the file, only for the format 'jsonl').
+    folder : string, optional
+        Folder where the target file is created if results is empty (e.g. the folder processed by pdf2bib). If None (default), no file is created in this case.
+    '''
+    writer = None if filename else writers.get_record_writer(output_format)
+    try:
+        for result in results:
+            if writer is None:
+                path_filename = path.dirname(result['path']) + config.get('separator') + filename
+                writer = writers.get_record_writer(output_format, path_filename, mode=mode)
+            writer.write(result)
+        if writer is None and folder:
+            #As for the bibtex entries, the (empty) file is created also when no record is written
+            writer = writers.get_record_writer(output_format, path.join(folder, filename), mode=mode)
+    except BaseException:
+        if writer:
+            writer.abort() #The target file is left as it was
+        raise
+    if writer:
+        writer.close()
+    if filename and writer:
+        print(f'All records have been stored in the file {filename}', file=sys.stderr)
+
 def main():
     '''
     This is the main function which is called when pdf2dbib is called from the command line. It parses all the input parameters and then 
-    (1) Calls the function pdf2bib, obtaining a list of dictionaries as output
-    (2) Prints a summary of papers analyzed (if verbose is set to True), and then a list of the bibtex entries generated
-    (3) Calls the function save_bibtex_entries to (optionally) save the bibtex entries on file and/or copy them into the clipboard
+    (1) Calls the function iter_pdf2bib, obtaining a dictionary for each pdf file as soon as it is processed
+    (2) Prints each bibtex entry generated or (optionally) writes it on file, without waiting for the other files
+    (3) Calls the function save_bibtex_entries to (optionally) copy all the bibtex entries into the clipboard
     '''
     parser = argparse.ArgumentParser( 
             description = "Generate BibTeX entries of scientific publications starting from the pdf files. It requires an internet connection.",
@@ -244,10 +789,133 @@ def main():
                         dest="filename_bibtex",
                         help="Create a text file inside the target directory, with name given by FILENAME_BIBTEX, containing the bibtex entry of each pdf file in the target folder (if any is found).",
                         action="store")
+    parser.add_argument("-o",
+                        "--format",
+                        choices=['bibtex', 'jsonl', 'csl-json'],
+                        default='bibtex',
+                        help="Output format. With 'jsonl' one JSON dictionary (with path, identifier, identifier type, method, metadata, bibtex entry and timings) is written\
+                                for each pdf file, one per line. With 'csl-json' a CSL-JSON array is written (the format read by pandoc, Zotero and other citation processors).\
+                                The records are printed (or stored in FILENAME_BIBTEX, if -s is used) as soon as each file is processed.",
+                        action="store")
+    parser.add_argument("-append",
+                        "--append_bibtex_file",
+                        help="Used together with -s. Append the bibtex entries at the end of FILENAME_BIBTEX, instead of overwriting it.",
+                        action="store_true")
+    parser.add_argument("-merge",
+                        "--merge_bibtex_file",
+                        help="Used together with -s. Update FILENAME_BIBTEX: each entry already present in the file (i.e. with the same key) is replaced by the new one,\
+                                the other entries are left unchanged, and the new entries are added at the end of the file.",
+                        action="store_true")
+    parser.add_argument("-dedupe",
+                        "--dedupe_bibtex_file",
+                        help="Used together with -s. Update FILENAME_BIBTEX as done by -merge, but each new entry which describes the same work as an existing entry\
+                                (same DOI, arXiv ID or title) replaces it, while a new entry whose key is already used by a different work gets a suffix (a, b, ...) added to its key.",
+                        action="store_true")
+    parser.add_argument("-incremental",
+                        "--incremental_bibtex_file",
+                        help="Used together with -s, when the target is a folder. Only the pdf files which were added or modified since the last time FILENAME_BIBTEX was generated\
+                                are processed, the entries of deleted pdf files are removed, and FILENAME_BIBTEX is updated accordingly. A manifest of the processed files is\
+                                stored next to FILENAME_BIBTEX.",
+                        action="store_true")
+    parser.add_argument("--watch",
+                        help="Used together with -s, when the target is a folder. After updating FILENAME_BIBTEX (as done by -incremental), keep monitoring the folder\
+                                and update FILENAME_BIBTEX whenever pdf files are added, modified or deleted, until pdf2bib is stopped with Ctrl+C.",
+                        action="store_true")
+    parser.add_argument("-embed",
+                        "--embed_metadata",
+                        help="Store the bibtex entry of each pdf file (together with its identifier and metadata) in the metadata of the file itself. The following runs\
+                                (also on other computers, if the file is copied) read it from the file, without any online lookup.",
+                        action="store_true")
+    parser.add_argument("-maxauthors",
+                        "--max_authors",
+                        type=int,
+                        help="Maximum number of authors written in each bibtex entry. The papers with more authors (e.g. those of large collaborations) get only\
+                                the first MAX_AUTHORS authors, followed by 'and others'. The default value 0 means that all authors are written.",
+                        action="store")
     parser.add_argument("-clip",
                         "--save_bibtex_clipboard",
                         action="store_true",
                         help="Store all found bibtex entries into the clipboard.")
+    parser.add_argument("-w",
+                        "--workers",
+                        type=int,
+                        help="Number of pdf files processed concurrently when the target is a folder. Since most of the time is spent waiting for online\
+                                archives, using several workers (e.g. 8) can strongly reduce the total time. By default files are processed one at a time.",
+                        action="store")
+    parser.add_argument("--executor",
+                        choices=['thread', 'process'],
+                        help="Used together with -w. With 'thread' (default) the files are processed by a pool of threads, which is ideal when most of the time is spent\
+                                waiting for online archives. With 'process' the files are processed by a pool of processes, which is faster when most of the time is spent\
+                                analyzing large or scanned pdf files.",
+                        action="store")
+    parser.add_argument("--unordered",
+                        help="When several workers are used (see -w), print (or store) each bibtex entry as soon as it is ready, instead of following the order of the files in the folder.",
+                        action="store_true")
+    parser.add_argument("-timeout",
+                        "--timeout",
+                        type=float,
+                        help="Maximum time (in seconds) spent on each pdf file. A file which is not done in time is skipped (without a bibtex entry), and the\
+                                other files keep being processed.",
+                        action="store")
+    parser.add_argument("-batchtimeout",
+                        "--batch_timeout",
+                        type=float,
+                        help="Maximum time (in seconds) spent on the whole folder. When it expires, the files which are not done yet are skipped, and the bibtex\
+                                entries of the files completed in time are printed (or stored).",
+                        action="store")
+    parser.add_argument("-pipeline",
+                        "--pipeline",
+                        help="Process the pdf files in two phases: first the identifiers of all files are looked for, then they are validated online all together, querying\
+                                each identifier only once and retrying the failed queries. Useful for large folders, or folders containing several copies of the same paper.\
+                                The bibtex entries are printed (or stored) only at the end.",
+                        action="store_true")
+    parser.add_argument("-cache",
+                        "--cache",
+                        dest="use_cache",
+                        help="Store the result obtained for each pdf file in a persistent cache, so that the same file is not analyzed again in the following runs (with the same settings)\
+                                unless its content changes. This is the default if the setting cache_enabled is True.",
+                        action="store_true")
+    parser.add_argument("-nocache",
+                        "--no_cache",
+                        help="Do not use the results stored in the cache by previous runs (and do not store new ones), nor the cached data of each identifier.",
+                        action="store_true")
+    parser.add_argument("-clearcache",
+                        "--clear_cache",
+                        help="Remove all results stored in the cache. If a path is also specified, only the results of the pdf files in the path are removed.",
+                        action="store_true")
+    parser.add_argument("-importindex",
+                        "--import_offline_index",
+                        help="Import the bulk metadata snapshots specified as path (Crossref works in citeproc JSON Lines or JSON format, or the arXiv metadata snapshot,\
+                                optionally compressed with gzip) into the offline index, which is checked before querying dx.doi.org and export.arxiv.org.",
+                        action="store_true")
+    parser.add_argument("-offline",
+                        "--offline",
+                        help="Do not send any query to online archives: the identifiers found in the pdf files are validated only via the offline index (see -importindex).",
+                        action="store_true")
+    parser.add_argument("-stats",
+                        "--stats",
+                        help="At the end, print a summary of the processed files: number of files and of failures for each type of identifier, and total time\
+                                and percentiles of the time spent in each stage (cache, pdf analysis, online lookup, parsing, bibtex generation).",
+                        action="store_true")
+    parser.add_argument("--serve",
+                        help="Start the pdf2bib daemon: a background process which keeps pdf2bib loaded and its caches warm, and processes the requests of the following\
+                                pdf2bib commands (including the right-click menu) until it is stopped with Ctrl+C. This strongly reduces the time needed to process a single file.",
+                        action="store_true")
+    parser.add_argument("--port",
+                        type=int,
+                        help="Used together with --serve. Localhost port used by the daemon. By default, any free port is used.",
+                        action="store")
+    parser.add_argument("-daemon",
+                        "--daemon",
+                        dest="use_daemon",
+                        help="If a pdf2bib daemon (see --serve) is running, send the request to it instead of processing the files in this process. The daemon\
+                                processes the files with the same settings as this command. This is the default if the setting use_daemon is True.",
+                        action="store_true")
+    parser.add_argument("-nodaemon",
+                        "--no-daemon",
+                        dest="no_daemon",
+                        help="Process the files in this process, even if a pdf2bib daemon (see --serve) is running and the setting use_daemon is True.",
+                        action="store_true")
     parser.add_argument("-install--right--click",
                         dest="install_right_click",
                         action="store_true",
@@ -277,8 +945,14 @@ def main():
         utils_registry.uninstall_right_click()
         return
 
+    if args.serve:
+        config.set('verbose',True)
+        import pdf2bib.daemon as daemon
+        daemon.serve(port=args.port)
+        return
+
     ## The following block of code (until ##END) is required to make sure that 'path' is a required parameter, except for the case when
-    ## -install--right--click or -uninstall--right--click are used
+    ## -install--right--click, -uninstall--right--click, --serve, -clearcache or -importindex are used
     if isinstance(args.path,list):
         if len(args.path)>0:
             target = args.path[0]
@@ -287,41 +961,139 @@ def main():
     else:
         target = args.path
 
+    if args.clear_cache:
+        config.set('verbose',True)
+        if target:
+            removed = cache.invalidate(target)
+            if removed:
+                logger.info(f"The results of the pdf files in {target} were removed from the cache.")
+            else:
+                logger.info(f"No result of the pdf files in {target} was found in the cache.")
+        else:
+            cache.clear_cache()
+        import pdf2bib.daemon as daemon
+        if daemon.clear_cache(target): #A running daemon also keeps some entries in memory
+            logger.info(f"The caches of the running pdf2bib daemon were cleared as well.")
+        return
+
+    if args.import_offline_index:
+        config.set('verbose',True)
+        import pdf2bib.offline as offline
+        if not args.path:
+            print("pdf2bib: error: the option -importindex requires the paths of the snapshots to import.")
+            return
+        counts = offline.import_snapshots(args.path)
+        logger.info(f"The offline index {offline.offline_index_path()} contains {counts.get('DOI', 0)} DOIs and {counts.get('arxiv ID', 0)} arXiv IDs.")
+        return
+
     if target == "":
         print("pdf2bib: error: the following arguments are required: path. Type \'pdf2bib --h\' for a list of commands.")
         return
     ## END
     
-    config.set('save_identifier_metadata', not (args.no_store_identifier_metadata))
-    pdf2doi.config.set('save_identifier_metadata',config.get('save_identifier_metadata')) 
+    #The settings specified by the arguments are applied via config.settings, so that the global settings (and those of pdf2doi) are left unchanged
+    settings = {'save_identifier_metadata': not (args.no_store_identifier_metadata)}
+    if args.no_cache:
+        settings.update(cache_enabled=False, identifier_cache_enabled=False)
+    elif args.use_cache:
+        settings['cache_enabled'] = True
+    if args.executor:
+        settings['executor'] = args.executor
+    if args.offline:
+        settings.update(offline_only=True, websearch=False)
+    if args.embed_metadata:
+        settings['embed_metadata'] = True
+    if args.max_authors is not None:
+        settings['max_authors'] = args.max_authors
+    if args.timeout is not None:
+        settings['file_timeout'] = args.timeout
+    if args.batch_timeout is not None:
+        settings['batch_timeout'] = args.batch_timeout
+
+    if args.format != 'bibtex' and (args.merge_bibtex_file or args.dedupe_bibtex_file or args.save_bibtex_clipboard or args.incremental_bibtex_file or args.watch):
+        print("pdf2bib: error: the options -merge, -dedupe, -clip, -incremental and --watch can only be used with the bibtex format.")
+        return
+    if args.format == 'csl-json' and args.append_bibtex_file:
+        print("pdf2bib: error: the option -append cannot be used with the csl-json format.")
+        return
 
-    str_savebibtex = f"All bibtex entries found in {target} will be stored in the file {args.filename_bibtex }.\n" if args.filename_bibtex else ''
+    messages = sys.stdout if args.format == 'bibtex' else sys.stderr #With the machine-readable formats, only the records are printed on the standard output
+    str_entries = "bibtex entries" if args.format == 'bibtex' else f"{args.format} records"
+    str_savebibtex = f"All {str_entries} found in {target} will be stored in the file {args.filename_bibtex }.\n" if args.filename_bibtex else ''
     str_copybibtex = f"All bibtex entries found in will be copied into the system clipboard.\n" if  args.save_bibtex_clipboard else ''
     if str_savebibtex or str_copybibtex:
-        print(f"{str_savebibtex} {str_copybibtex}")
+        print(f"{str_savebibtex} {str_copybibtex}", file=messages)
     if(args.verbose==False):
-        print(f"(All intermediate output will be suppressed. To see additional output, use the command -v)")
-    results = pdf2bib(target=target)
-    
+        print(f"(All intermediate output will be suppressed. To see additional output, use the command -v)", file=messages)
+
+    with config.settings(settings):
+        if args.stats:
+            stats = observers.StatsObserver()
+            observers.add_observer(stats)
+            try:
+                _run(args, target)
+            finally:
+                observers.remove_observer(stats)
+                print(stats.summary(), file=messages)
+        else:
+            _run(args, target)
 
-    if not results:
+def _run(args, target):
+    '''
+    Processes the target (a pdf file or a folder) according to the command-line arguments args (see main).
+    '''
+    if args.watch:
+        if not (args.filename_bibtex and path.isdir(target)):
+            print("pdf2bib: error: the option --watch requires a folder as target and the option -s.")
+            return
+        import pdf2bib.watch as watch
+        print(f'Watching the folder {target} for changes. Press Ctrl+C to stop.', flush=True)
+        watch.watch(target, args.filename_bibtex, workers=args.workers)
+        return
+    if args.incremental_bibtex_file:
+        if not (args.filename_bibtex and path.isdir(target)):
+            print("pdf2bib: error: the option -incremental requires a folder as target and the option -s.")
+            return
+        import pdf2bib.incremental as incremental
+        incremental.update_bibtex_file(target, args.filename_bibtex, workers=args.workers)
+        print(f'The file {args.filename_bibtex} has been updated.')
+        return
+
+    # The bibtex entries are printed (or written into the file args.filename_bibtex) as soon as each pdf file is processed, 
+    # instead of waiting for the whole folder to be done
+    # If a pdf2bib daemon is running (see daemon.py) and its use was requested, the files are processed by it, with the same settings
+    results = None
+    if not args.no_daemon and (args.use_daemon or config.get('use_daemon')) and path.exists(target):
+        import pdf2bib.daemon as daemon
+        results = daemon.request(target, workers=args.workers, ordered=not(args.unordered), pipeline=args.pipeline,
+                                 validation_info=(args.format == 'csl-json')) #None if no daemon is running
+    if results is None and args.pipeline:
+        import pdf2bib.pipeline as pipeline
+        results = pipeline.pdf2bib_pipeline(target, workers=args.workers)
+        results = results if isinstance(results, list) else ([results] if results else [])
+    elif results is None:
+        results = iter_pdf2bib(target=target, workers=args.workers, ordered=not(args.unordered))
+
+    if args.format != 'bibtex':
+        save_records(args.format, args.filename_bibtex, results, mode='a' if args.append_bibtex_file else 'w',
+                     folder=target if path.isdir(target) else path.dirname(target))
         return
-    if not isinstance(results,list):
-        results = [results]
-    #logger.info('The following files were analyzed:')
-    #for result in results:
-    #    if result['identifier']:
-    #        logger.info('{:<15s} {:<40s} {:<10s}\n'.format(result['identifier_type'], result['identifier'],result['path']) ) 
-    #    else:
-    #        logger.info('{:<15s} {:<40s} {:<10s}\n'.format('n.a.', 'n.a.',result['path']) ) 
+
     if not(args.filename_bibtex or args.save_bibtex_clipboard): #If the user wants to save the bibtex entries on file or on the clipboard, we dont show them in the command prompt
         for result in results:
-            if result['identifier']:
-                print(result['bibtex']) 
+            if isinstance(result['bibtex'],str):
+                print(result['bibtex'], flush=True) 
+        return
 
-    # We call the function save_bibtex_entries. If args.filename_bibtex is a valid string, it will save all found identifiers in a text file with that name.
-    # If args.save_doi_clipboard is true, it will copy all identifiers into the clipboard
-    save_bibtex_entries(args.filename_bibtex, results, args.save_bibtex_clipboard)  
+    # We call the function save_bibtex_entries. If args.filename_bibtex is a valid string, it will write each bibtex entry in a text file with that name
+    # as soon as it is generated. If args.save_bibtex_clipboard is true, it will copy all bibtex entries into the clipboard
+    if args.merge_bibtex_file:
+        mode = 'merge'
+    elif args.append_bibtex_file:
+        mode = 'a'
+    else:
+        mode = 'w'
+    save_bibtex_entries(args.filename_bibtex, results, args.save_bibtex_clipboard, mode=mode, dedupe=args.dedupe_bibtex_file)  
 
     return
 
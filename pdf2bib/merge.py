@@ -0,0 +1,418 @@
+'''
+This module implements the deduplication of the bibtex entries merged into an existing .bib file (command line: pdf2bib folder -s refs.bib -dedupe),
+and the disambiguation of their keys.
+
+The keys generated by make_bibtex (lastname + year + first word of the title) often collide in large bibliographies, and the same work can arrive
+from different pdf files (e.g. two copies, or the preprint and the published version). Before each new entry is written (via writers.BibtexWriter
+in the 'merge' mode), MergeEngine.resolve looks it up in an index of the entries already in the .bib file (and of those already merged), by
+    - DOI (lower case, without prefixes such as https://doi.org/),
+    - arXiv ID (without version, taken from the fields eprint, url or doi),
+    - normalized title (only letters and digits, lower case, without accents and latex commands), stored as a hash. Titles shorter than
+      MIN_TITLE_LENGTH characters are not used, and two entries with different DOIs are never considered duplicates because of their titles,
+and by key. Then
+    - if the entry matches an existing entry (i.e. it describes the same work), it takes the key of the existing entry, which it replaces (or, if
+      duplicates = 'keep', it is discarded and the existing entry is kept),
+    - otherwise, if its key is already used by a different work, a suffix (a, b, ..., z, aa, ab, ...) is added to the key. The suffixes already
+      used for each key are counted, so each new entry is resolved with a constant number of lookups, also in bibliographies with 100k+ entries.
+Keys of existing entries are never changed, so the key assigned to each work is stable across runs.
+
+The index is built by reading the .bib file once, and it is kept either in memory (index = 'memory') or in a SQLite database next to the .bib
+file (index = 'sqlite', e.g. refs.bib.pdf2bib-index.sqlite). The SQLite index is reused as long as the .bib file is only modified via pdf2bib
+(its size and modification time are stored), so that merging a few entries into a very large bibliography does not require to read it again.
+The default index and policy for duplicates are set by config.get('merge_index') and config.get('merge_duplicates').
+
+    Example:
+    import pdf2bib
+    import pdf2bib.merge as merge
+    results = pdf2bib.pdf2bib(r"Path\\to\\folder")
+    merge.merge_bibtex_entries(r"Path\\to\\refs.bib", [result['bibtex'] for result in results if result['bibtex']], index='sqlite')
+'''
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import unicodedata
+import pdf2bib.config as config
+import pdf2bib.writers as writers
+from pdf2bib.bibtex_makers import parse_bibtex_value
+
+logger = logging.getLogger("pdf2bib")
+
+INDEX_FORMAT_VERSION = 1 #Increase this number whenever the format of the index (or the normalization of the identities) changes
+INDEX_SUFFIX = '.pdf2bib-index.sqlite'
+INDEXES = ['memory', 'sqlite']
+DUPLICATES = ['replace', 'keep']
+MIN_TITLE_LENGTH = 16
+IDENTITY_FIELDS = {'doi', 'eprint', 'url', 'title'}
+
+_entry_type_regex = re.compile(r"\s*@\s*(\w+)")
+_field_regex = re.compile(r"[ \t\n\r]*,?[ \t\n\r]*([A-Za-z0-9_\-().+]+)[ \t\n\r]*=[ \t\n\r]*")
+_doi_prefix_regex = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.I)
+_arxiv_id_regex = re.compile(r"(?:arxiv[:./]|arxiv\.org/(?:abs|pdf)/)\s*(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?", re.I)
+_macro_regex = re.compile(r"[A-Za-z0-9_\-:]+")
+_latex_command_regex = re.compile(r"\\[A-Za-z]+\s*")
+
+
+def normalize_doi(doi):
+    '''
+    Returns the DOI doi in lower case and without prefixes (e.g. https://doi.org/), or None if doi is not a valid DOI.
+    '''
+    doi = _doi_prefix_regex.sub('', doi.strip()).lower()
+    return doi if doi.startswith('10.') else None
+
+def normalize_arxiv_id(text):
+    '''
+    Returns the arXiv ID (in lower case and without version) contained in the string text (e.g. arXiv:2103.00001v2, http://arxiv.org/abs/2103.00001v1,
+    10.48550/arXiv.2103.00001), or None if no arXiv ID is found.
+    '''
+    match = _arxiv_id_regex.search(text)
+    return match.group(1).lower() if match else None
+
+def normalize_title(title):
+    '''
+    Returns the title title reduced to its letters and digits, in lower case, without accents and latex commands (e.g. \\textit), so that the
+    titles of the same work written in different ways are equal.
+    '''
+    title = unicodedata.normalize('NFKD', _latex_command_regex.sub('', title))
+    return ''.join(char for char in title if char.isalnum() and not unicodedata.combining(char)).lower()
+
+def entry_identities(bibtex):
+    '''
+    Returns the identities of the bibtex entry contained in the string bibtex, as a dictionary with (some of) the keys 'doi', 'arxiv' and 'title'
+    (the hash of the normalized title). Only the fields doi, eprint, url and title are considered. The fields are read in sequence (so that
+    text inside the value of another field is never mistaken for a field), until the end of the entry or the first value which cannot be parsed
+    (e.g. a concatenation via #).
+    '''
+    fields = {}
+    match = writers._bibtex_key_regex.match(bibtex)
+    position = bibtex.find(',', match.end()) + 1 if match else 0
+    while position > 0:
+        match = _field_regex.match(bibtex, position)
+        if not match:
+            break
+        value, position = parse_bibtex_value(bibtex, match.end())
+        if value is None:
+            macro = _macro_regex.match(bibtex, position) #Macros defined via @string are skipped
+            if not macro:
+                break
+            value, position = '', macro.end()
+        name = match.group(1).lower()
+        if name in IDENTITY_FIELDS and not name in fields:
+            fields[name] = value
+
+    identities = {}
+    doi = normalize_doi(fields['doi']) if fields.get('doi') else None
+    if doi:
+        identities['doi'] = doi
+    for name in ('eprint', 'url', 'doi'):
+        arxiv_id = normalize_arxiv_id(fields[name]) if fields.get(name) else None
+        if arxiv_id:
+            identities['arxiv'] = arxiv_id
+            break
+    title = normalize_title(fields['title']) if fields.get('title') else ''
+    if len(title) >= MIN_TITLE_LENGTH:
+        identities['title'] = hashlib.blake2b(title.encode('utf-8'), digest_size=16).hexdigest()
+    return identities
+
+def key_suffix(number):
+    '''
+    Returns the suffix number (starting from 0) added to the keys already in use: a, b, ..., z, aa, ab, ...
+    '''
+    suffix = ''
+    number += 1
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        suffix = chr(ord('a') + remainder) + suffix
+    return suffix
+
+
+class MemoryIndex():
+    '''
+    Index of the entries of a bibliography, kept in memory. For each identity (see entry_identities) it stores the key of the first entry with that
+    identity, for each key the DOI of the entry (or None), and for each key to which suffixes were added, the number of suffixes already tried.
+    '''
+    def __init__(self):
+        self.identities = {}
+        self.keys = {}
+        self.suffixes = {}
+
+    def is_current(self, signature):
+        return False
+
+    def clear(self):
+        self.identities.clear()
+        self.keys.clear()
+        self.suffixes.clear()
+
+    def find(self, kind, value):
+        return self.identities.get((kind, value))
+
+    def add_identity(self, kind, value, key):
+        self.identities.setdefault((kind, value), key)
+
+    def has_key(self, key):
+        return key in self.keys
+
+    def key_doi(self, key):
+        return self.keys.get(key)
+
+    def add_key(self, key, doi):
+        if self.keys.get(key) is None:
+            self.keys[key] = doi
+
+    def get_suffix(self, key):
+        return self.suffixes.get(key, 0)
+
+    def set_suffix(self, key, number):
+        self.suffixes[key] = number
+
+    def remove_keys(self, keys):
+        self.identities = {identity: key for identity, key in self.identities.items() if not key in keys}
+        for key in keys:
+            self.keys.pop(key, None)
+
+    def commit(self, signature=None):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteIndex(MemoryIndex):
+    '''
+    Same as MemoryIndex, but stored in the SQLite database path_database, together with the signature (size and modification time) of the
+    bibliography it describes.
+    '''
+    def __init__(self, path_database):
+        self.path_database = path_database
+        self.connection = sqlite3.connect(path_database, timeout=30)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS identities (kind TEXT, value TEXT, key TEXT, PRIMARY KEY (kind, value)) WITHOUT ROWID')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, doi TEXT) WITHOUT ROWID')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS suffixes (key TEXT PRIMARY KEY, number INTEGER) WITHOUT ROWID')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS identities_key ON identities (key)') #Used by remove_keys
+        self.connection.commit()
+
+    def is_current(self, signature):
+        row = self.connection.execute("SELECT value FROM info WHERE name = 'signature'").fetchone()
+        return bool(row) and json.loads(row[0]) == [INDEX_FORMAT_VERSION] + list(signature)
+
+    def clear(self):
+        for table in ('info', 'identities', 'keys', 'suffixes'):
+            self.connection.execute(f'DELETE FROM {table}')
+
+    def find(self, kind, value):
+        row = self.connection.execute('SELECT key FROM identities WHERE kind = ? AND value = ?', (kind, value)).fetchone()
+        return row[0] if row else None
+
+    def add_identity(self, kind, value, key):
+        self.connection.execute('INSERT OR IGNORE INTO identities (kind, value, key) VALUES (?, ?, ?)', (kind, value, key))
+
+    def has_key(self, key):
+        return self.connection.execute('SELECT 1 FROM keys WHERE key = ?', (key,)).fetchone() is not None
+
+    def key_doi(self, key):
+        row = self.connection.execute('SELECT doi FROM keys WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def add_key(self, key, doi):
+        self.connection.execute('INSERT OR IGNORE INTO keys (key, doi) VALUES (?, NULL)', (key,))
+        if doi:
+            self.connection.execute('UPDATE keys SET doi = ? WHERE key = ? AND doi IS NULL', (doi, key))
+
+    def get_suffix(self, key):
+        row = self.connection.execute('SELECT number FROM suffixes WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else 0
+
+    def set_suffix(self, key, number):
+        self.connection.execute('INSERT OR REPLACE INTO suffixes (key, number) VALUES (?, ?)', (key, number))
+
+    def remove_keys(self, keys):
+        self.connection.executemany('DELETE FROM keys WHERE key = ?', [(key,) for key in keys])
+        self.connection.executemany('DELETE FROM identities WHERE key = ?', [(key,) for key in keys])
+
+    def commit(self, signature=None):
+        if signature is not None:
+            self.connection.execute("INSERT OR REPLACE INTO info (name, value) VALUES ('signature', ?)", (json.dumps([INDEX_FORMAT_VERSION] + list(signature)),))
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.connection.close()
+
+
+def _signature(filename):
+    #Size and modification time of the file, or None if the file does not exist
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class MergeEngine():
+    '''
+    Resolves the keys of the entries merged into the bibliography filename_bibtex (see the docstring of this module). The engine must be used
+    together with a writers.BibtexWriter in the 'merge' mode, and closed after the writer:
+
+        with MergeEngine('refs.bib') as engine, writers.BibtexWriter('refs.bib', mode='merge') as writer:
+            for bibtex in entries:
+                bibtex = engine.resolve(bibtex)
+                if bibtex:
+                    writer.write(bibtex)
+    '''
+    def __init__(self, filename_bibtex, index=None, duplicates=None):
+        index = index or config.get('merge_index')
+        self.duplicates = duplicates or config.get('merge_duplicates')
+        if not index in INDEXES:
+            raise ValueError(f"The input variable index must be one of {INDEXES}")
+        if not self.duplicates in DUPLICATES:
+            raise ValueError(f"The input variable duplicates must be one of {DUPLICATES}")
+        self.filename = os.path.abspath(filename_bibtex)
+        self.numb_duplicates = 0
+        self.numb_renamed = 0
+        self.index = SQLiteIndex(self.filename + INDEX_SUFFIX) if index == 'sqlite' else MemoryIndex()
+        try:
+            self._load()
+        except Exception:
+            self.index.close()
+            raise
+
+    def _load(self):
+        signature = _signature(self.filename)
+        if signature is None:
+            self.index.clear()
+            return
+        if self.index.is_current(signature):
+            logger.info(f"The index of {self.filename} is up to date.")
+            return
+        self.index.clear()
+        numb_entries = 0
+        with open(self.filename, 'r', encoding='utf-8') as file:
+            for key, text in writers.iter_bibtex_entries(file):
+                if not key or _entry_type_regex.match(text).group(1).lower() in ('string', 'comment', 'preamble'):
+                    continue
+                identities = entry_identities(text)
+                self.index.add_key(key, identities.get('doi'))
+                for kind, value in identities.items():
+                    self.index.add_identity(kind, value, key)
+                numb_entries += 1
+        self.index.commit(signature)
+        logger.info(f"Indexed {numb_entries} entries of {self.filename}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def find_duplicate(self, identities):
+        '''
+        Returns the key of the entry which describes the same work as an entry with the identities identities (see entry_identities), or None.
+        '''
+        for kind in ('doi', 'arxiv'):
+            if kind in identities:
+                key = self.index.find(kind, identities[kind])
+                if key is not None:
+                    return key
+        if 'title' in identities:
+            key = self.index.find('title', identities['title'])
+            if key is not None:
+                doi = self.index.key_doi(key)
+                if not (doi and identities.get('doi') and doi != identities['doi']):
+                    return key
+        return None
+
+    def resolve(self, bibtex):
+        '''
+        Returns the bibtex entry contained in the string bibtex with its key changed (if needed) so that it is not used by a different work, or
+        None if the entry is a duplicate of an existing entry and it must be discarded (when duplicates = 'keep'). The index is updated accordingly.
+        '''
+        key = writers.get_bibtex_key(bibtex)
+        if not key:
+            return bibtex
+        identities = entry_identities(bibtex)
+        new_key = self.find_duplicate(identities)
+        if new_key is not None:
+            self.numb_duplicates += 1
+            if self.duplicates == 'keep':
+                return None
+        else:
+            new_key = key
+            if self.index.has_key(key):
+                number = self.index.get_suffix(key)
+                while self.index.has_key(key + key_suffix(number)):
+                    number += 1
+                new_key = key + key_suffix(number)
+                self.index.set_suffix(key, number + 1)
+                self.numb_renamed += 1
+        self.index.add_key(new_key, identities.get('doi'))
+        for kind, value in identities.items():
+            self.index.add_identity(kind, value, new_key)
+        return bibtex if new_key == key else writers.set_bibtex_key(bibtex, new_key)
+
+    def release(self, keys):
+        '''
+        Removes the entries with the keys in the set keys from the index, because they are going to be removed from the bibliography (via
+        BibtexWriter.remove) or replaced. Their keys are then free: a new entry with one of these keys keeps it, without suffix.
+        '''
+        if keys:
+            self.index.remove_keys(keys)
+
+    def close(self):
+        '''
+        Stores the index (if it is stored on disk), together with the signature of the bibliography. It must be called after the bibliography
+        was written (i.e. after the writer was closed).
+        '''
+        if self.index is None:
+            return
+        self.index.commit(_signature(self.filename))
+        self.index.close()
+        self.index = None
+
+    def abort(self):
+        '''
+        Discards the changes made to the index since it was loaded.
+        '''
+        if self.index is None:
+            return
+        self.index.rollback()
+        self.index.close()
+        self.index = None
+
+
+def merge_bibtex_entries(filename_bibtex, entries, index=None, duplicates=None):
+    '''
+    Merges the bibtex entries in the iterable entries (strings) into the file filename_bibtex, which is created if it does not exist,
+    removing the duplicates and disambiguating the keys (see the docstring of this module). It returns the engine used, whose attributes
+    numb_duplicates and numb_renamed contain the number of duplicates found and of keys changed.
+    '''
+    writer = writers.BibtexWriter(filename_bibtex, mode='merge')
+    try:
+        engine = MergeEngine(filename_bibtex, index=index, duplicates=duplicates)
+    except Exception:
+        writer.abort()
+        raise
+    try:
+        for bibtex in entries:
+            bibtex = engine.resolve(bibtex)
+            if bibtex:
+                writer.write(bibtex)
+    except Exception:
+        writer.abort()
+        engine.abort()
+        raise
+    writer.close()
+    engine.close()
+    return engine
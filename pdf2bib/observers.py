@@ -0,0 +1,168 @@
+'''
+This module defines the interface used to monitor the processing of each pdf file (e.g. to feed an external metrics system).
+
+An observer is any object with the methods of the class Observer below. After being registered via add_observer, it is notified
+    on_file_start(filename)                 when pdf2bib starts processing the pdf file filename,
+    on_stage_end(filename, stage, elapsed)  when a stage of the processing of filename is completed (elapsed is its duration in seconds),
+    on_file_end(filename, result)           when the file is done (result is the dictionary returned by pdf2bib_singlefile),
+    on_error(filename, exception)           when an exception is raised while processing the file (the exception is then propagated as usual).
+The stages are
+    'cache'      : look-up (and storage) of the result in the persistent cache (see cache.py) and in the metadata of the pdf file (see embedded.py),
+    'extraction' : analysis of the pdf file by pdf2doi (including any google search), excluding the time spent in the 'lookup' stage,
+    'lookup'     : queries to dx.doi.org and export.arxiv.org (or to the identifier cache) to validate the identifiers,
+    'parse'      : parsing of the data returned by dx.doi.org or export.arxiv.org (see bibtex_makers.py),
+    'render'     : generation of the bibtex entry (see bibtex_makers.make_bibtex).
+A stage might be notified more than once for the same file (e.g. 'lookup' in the asyncio functions, one for each validated identifier). The total time spent in each
+stage (plus the key 'total') is also stored in result['timings'].
+
+When the files are processed concurrently, the observers are called from the worker threads, so they must be thread-safe. When the files are processed by 
+a pool of processes (see pdf2bib.pdf2bib), the observers are notified by the main process, once each file is done.
+
+    Example:
+    import pdf2bib
+    import pdf2bib.observers as observers
+    stats = observers.StatsObserver()
+    observers.add_observer(stats)
+    pdf2bib.pdf2bib(r"Path\\to\\folder", workers=8)
+    print(stats.summary())
+'''
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger("pdf2bib")
+
+STAGES = ['cache', 'extraction', 'lookup', 'parse', 'render']
+
+_observers = []
+_observers_lock = threading.Lock()
+
+
+class Observer():
+    '''
+    Base class of the observers. It does nothing, so subclasses only need to override the methods they are interested in.
+    '''
+    def on_file_start(self, filename):
+        pass
+
+    def on_stage_end(self, filename, stage, elapsed):
+        pass
+
+    def on_file_end(self, filename, result):
+        pass
+
+    def on_error(self, filename, exception):
+        pass
+
+
+def add_observer(observer):
+    with _observers_lock:
+        if not observer in _observers:
+            _observers.append(observer)
+
+def remove_observer(observer):
+    with _observers_lock:
+        if observer in _observers:
+            _observers.remove(observer)
+
+def remove_all_observers():
+    with _observers_lock:
+        del _observers[:]
+
+def notify(event, *args):
+    '''
+    Calls the method event (e.g. 'on_file_end') of all registered observers with the arguments args. Any exception raised by an observer is logged and ignored.
+    '''
+    if not _observers:
+        return
+    with _observers_lock:
+        observers = list(_observers)
+    for observer in observers:
+        try:
+            getattr(observer, event)(*args)
+        except Exception as e:
+            logger.error(f"Some error occurred in the observer {observer} ({event}): {e}")
+
+
+class StageTimer():
+    '''
+    Measures the time spent in each stage of the processing of the file filename. The total time of each stage is kept in the dictionary self.timings,
+    and the observers are notified at the end of each stage.
+
+        timer = StageTimer(filename)
+        with timer.stage('parse'):
+            metadata = ...
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.timings = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, elapsed):
+        self.timings[name] = self.timings.get(name, 0.0) + elapsed
+        notify('on_stage_end', self.filename, name, elapsed)
+
+    def stop(self):
+        '''
+        Stores in self.timings['total'] the time elapsed since the timer was created, and returns self.timings.
+        '''
+        self.timings['total'] = time.perf_counter() - self._start
+        return self.timings
+
+
+def _percentile(sorted_values, q):
+    #Nearest-rank percentile of a sorted (non-empty) list
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))]
+
+class StatsObserver(Observer):
+    '''
+    Observer which collects the timings of all files, and the number of files (and of failures, i.e. files for which no bibtex entry was generated)
+    for each identifier type. The collected data is summarized by the method summary (used by the command-line option --stats).
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings = defaultdict(list) #For each stage (and 'total'), list of the times spent by each file
+        self.files = Counter() #Number of files for each identifier type
+        self.failures = Counter() #Number of failures for each identifier type
+        self.errors = 0 #Number of files for which an exception was raised
+
+    def on_file_end(self, filename, result):
+        identifier_type = str(result.get('identifier_type'))
+        with self._lock:
+            self.files[identifier_type] += 1
+            if not result.get('bibtex'):
+                self.failures[identifier_type] += 1
+            for stage, elapsed in (result.get('timings') or {}).items():
+                self.timings[stage].append(elapsed)
+
+    def on_error(self, filename, exception):
+        with self._lock:
+            self.errors += 1
+
+    def summary(self):
+        '''
+        Returns a string with the summary of the collected data.
+        '''
+        with self._lock:
+            lines = [f"Processed files: {sum(self.files.values())} ({sum(self.failures.values())} without a valid bibtex entry, {self.errors} errors)"]
+            for identifier_type in sorted(self.files):
+                lines.append(f"    identifier type {identifier_type:10s}: {self.files[identifier_type]:6d} files, {self.failures[identifier_type]:6d} failures")
+            lines.append(f"{'stage':12s} {'total [s]':>10s} {'p50 [ms]':>10s} {'p90 [ms]':>10s} {'p99 [ms]':>10s} {'max [ms]':>10s}")
+            for stage in STAGES + ['total']:
+                values = sorted(self.timings.get(stage, []))
+                if not values:
+                    continue
+                lines.append(f"{stage:12s} {sum(values):10.3f} " + " ".join(f"{1000 * _percentile(values, q):10.1f}" for q in (50, 90, 99))
+                             + f" {1000 * values[-1]:10.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,280 @@
+'''
+This module implements the offline index of pdf2bib: a SQLite database containing the metadata of many DOIs and arXiv IDs, imported from bulk
+metadata snapshots, which is checked before querying dx.doi.org and export.arxiv.org. In this way pdf2bib can process large batches of files
+without any query for the papers contained in the snapshot, and it can be used on machines without internet access.
+
+The following snapshots can be imported (see import_snapshots), also compressed with gzip (.gz):
+    - Crossref metadata, as JSON Lines with one work per line (in the citeproc format returned by dx.doi.org with the method application/citeproc+json,
+      or in the format of the Crossref REST API), or as JSON files containing a list of works or a dictionary {"items": [...]} (as in the Crossref public data files),
+    - arXiv metadata, as JSON Lines with one paper per line in the format of the arXiv metadata snapshot (with the keys 'id', 'title', 'authors_parsed', 'versions', ...).
+Only the fields used by pdf2bib are stored (the affiliations of the authors and the abstracts are dropped), compressed with zlib, and each identifier
+is the primary key of a table without rowid, so that each lookup takes a few microseconds even with tens of millions of records.
+
+The data of each identifier is returned in the same format returned by dx.doi.org (the citeproc JSON string) or by export.arxiv.org (the dictionary
+obtained by pdf2doi via feedparser), so that it is passed to parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg exactly as the data obtained online.
+The DOIs are found in the index only when pdf2doi.config.get('method_dxdoiorg') is 'application/citeproc+json' (default).
+
+The index is stored in the file specified by config.get('offline_index') or, if this setting is empty, in the file pdf2bib_offline_index.sqlite in the cache directory
+of pdf2bib (see cache.py). It is used whenever this file exists. When config.get('offline_only') is True, the identifiers which are not in the index are
+considered not valid, and no query is sent to dx.doi.org and export.arxiv.org.
+
+    Example:
+    pdf2bib path/to/crossref-works.jsonl.gz path/to/arxiv-metadata-oai-snapshot.json -importindex
+    pdf2bib path/to/folder -s refs.bib -offline
+'''
+
+import email.utils
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+import pdf2bib.cache as cache
+import pdf2bib.config as config
+
+logger = logging.getLogger("pdf2bib")
+
+INDEX_FORMAT_VERSION = 1 #Increase this number whenever the format of the stored records changes
+INDEX_FILENAME = 'pdf2bib_offline_index.sqlite'
+CITEPROC_METHOD = 'application/citeproc+json'
+#Fields of the citeproc records which are stored (those used by bibtex_makers.parse_bib_from_dxdoiorg, and the type of the work)
+CITEPROC_FIELDS = ['type', 'title', 'container-title', 'volume', 'issue', 'page', 'publisher', 'URL', 'DOI', 'issued', 'author']
+#Fields which are lists of strings in the format of the Crossref REST API, and single strings in the format returned by dx.doi.org
+CROSSREF_LIST_FIELDS = ['title', 'container-title', 'publisher']
+BATCH_SIZE = 10000 #Number of records inserted in each transaction
+
+_arxiv_id_regex = re.compile(r"^(?:arxiv:)?(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(v\d+)?$", re.I)
+
+
+class OfflineIndex(cache.SQLiteCache):
+    '''
+    Offline index of the metadata of DOIs and arXiv IDs (see the docstring of this module). An instance can be shared by several threads.
+    '''
+    def _create_tables(self):
+        connection = self._connection()
+        connection.execute('''CREATE TABLE IF NOT EXISTS records (
+                                identifier_type TEXT, identifier TEXT, data BLOB, PRIMARY KEY (identifier_type, identifier)) WITHOUT ROWID''')
+        connection.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        row = connection.execute("SELECT value FROM info WHERE key = 'format_version'").fetchone()
+        if row is None:
+            connection.execute('INSERT INTO info (key, value) VALUES (?, ?)', ('format_version', str(INDEX_FORMAT_VERSION)))
+        elif row[0] != str(INDEX_FORMAT_VERSION):
+            raise ValueError(f"The offline index {self.path_database} was created by a different version of pdf2bib. Import the snapshots again in a new file.")
+
+    def get_validation_info(self, identifier_type, identifier, method=''):
+        '''
+        Returns the data of the identifier (of type 'DOI' or 'arxiv ID') in the same format returned by dx.doi.org (with the method method)
+        or export.arxiv.org, or None if it is not in the index.
+        '''
+        if identifier_type == 'DOI':
+            if method != CITEPROC_METHOD:
+                return None
+            key, version = identifier.strip().lower(), None
+        else:
+            match = _arxiv_id_regex.match(identifier.strip())
+            if not match:
+                return None
+            key, version = match.group(1).lower(), match.group(2)
+        row = self._connection().execute('SELECT data FROM records WHERE identifier_type = ? AND identifier = ?', (identifier_type, key)).fetchone()
+        if row is None:
+            return None
+        text = zlib.decompress(row[0]).decode('utf-8')
+        if identifier_type == 'DOI':
+            return text
+        entry = json.loads(text)
+        if version:
+            #export.arxiv.org returns the links of the version which was asked for
+            entry['id'] = entry['link'] = f"http://arxiv.org/abs/{key}{version}"
+        return entry
+
+    def import_records(self, records):
+        '''
+        Stores the records (an iterable of tuples (identifier_type, identifier, data), where data is a citeproc dictionary for DOIs and a dictionary in the
+        format of feedparser for arXiv IDs), replacing the existing records of the same identifiers. It returns the number of records stored.
+        '''
+        connection = self._connection()
+        count = 0
+        batch = []
+        def flush():
+            connection.execute('BEGIN')
+            try:
+                connection.executemany('INSERT OR REPLACE INTO records (identifier_type, identifier, data) VALUES (?, ?, ?)', batch)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            batch.clear()
+        for identifier_type, identifier, data in records:
+            batch.append((identifier_type, identifier, zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))))
+            count += 1
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        return count
+
+    def count(self):
+        '''
+        Returns a dictionary with the number of records of each type of identifier.
+        '''
+        rows = self._connection().execute('SELECT identifier_type, COUNT(*) FROM records GROUP BY identifier_type').fetchall()
+        return dict(rows)
+
+
+def citeproc_record(item):
+    '''
+    Converts a work of a Crossref snapshot (in the citeproc format returned by dx.doi.org, or in the format of the Crossref REST API) into the tuple
+    ('DOI', doi, data) stored in the index, where data is the citeproc dictionary returned by dx.doi.org (restricted to CITEPROC_FIELDS).
+    '''
+    data = {}
+    for field in CITEPROC_FIELDS:
+        if not field in item:
+            continue
+        value = item[field]
+        if field in CROSSREF_LIST_FIELDS and isinstance(value, list):
+            value = value[0] if value else ''
+        elif field == 'author' and isinstance(value, list):
+            value = [{key: author_value for key, author_value in author.items() if key != 'affiliation'} for author in value]
+        data[field] = value
+    return ('DOI', item['DOI'].strip().lower(), data)
+
+def _arxiv_date(text):
+    #The arXiv metadata snapshot contains the dates in the format "Mon, 2 Apr 2007 19:18:42 GMT", while export.arxiv.org returns "2007-04-02T19:18:42Z"
+    return email.utils.parsedate_to_datetime(text).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def arxiv_record(item):
+    '''
+    Converts a paper of the arXiv metadata snapshot into the tuple ('arxiv ID', arxiv_id, data) stored in the index, where data is the dictionary obtained by
+    pdf2doi by parsing the response of export.arxiv.org.
+    '''
+    arxiv_id = item['id'].strip().lower()
+    versions = item.get('versions') or [{'version': 'v1', 'created': None}]
+    names = []
+    for parts in item.get('authors_parsed') or []:
+        family, given, suffix = (list(parts) + ['', ''])[:3]
+        names.append(" ".join(part for part in (given, family, suffix) if part))
+    if not names:
+        names = [name.strip() for name in re.split(r",|\band\b", item.get('authors', '')) if name.strip()]
+    link = f"http://arxiv.org/abs/{arxiv_id}{versions[-1]['version']}"
+    data = {'id': link, 'link': link, 'title': item.get('title', ''),
+            'published': _arxiv_date(versions[0]['created']) if versions[0]['created'] else '',
+            'updated': _arxiv_date(versions[-1]['created']) if versions[-1]['created'] else ''}
+    if names:
+        data['authors'] = [{'name': name} for name in names]
+        data['author'] = names[-1]
+    if item.get('doi'):
+        data['arxiv_doi'] = item['doi'].split()[0] #A few papers have several DOIs, separated by spaces
+    if item.get('journal-ref'):
+        data['arxiv_journal_ref'] = item['journal-ref']
+    return ('arxiv ID', arxiv_id, data)
+
+def _unwrap(data):
+    #Yields the works contained in data: a single work, a list of works, a dictionary {"items": [...]}, or a response of the Crossref REST API {"message": ...}
+    if isinstance(data, list):
+        for item in data:
+            yield from _unwrap(item)
+    elif isinstance(data, dict):
+        if 'message' in data and isinstance(data['message'], dict):
+            yield from _unwrap(data['message'])
+        elif 'items' in data and isinstance(data['items'], list):
+            yield from _unwrap(data['items'])
+        else:
+            yield data
+
+def iter_snapshot(filename):
+    '''
+    Yields the records (see citeproc_record and arxiv_record) contained in the snapshot filename (see the docstring of this module).
+    The works which are neither Crossref works nor arXiv papers, and the lines which are not valid JSON, are skipped (and logged).
+    '''
+    opener = gzip.open if filename.lower().endswith('.gz') else open
+    with opener(filename, 'rt', encoding='utf-8') as file:
+        first_line = file.readline()
+        try:
+            json.loads(first_line)
+            lines = True #JSON Lines
+        except ValueError:
+            lines = False
+        file.seek(0)
+        documents = (line for line in file if line.strip()) if lines else [file.read()]
+        for number, document in enumerate(documents, 1):
+            try:
+                items = _unwrap(json.loads(document))
+            except ValueError as e:
+                logger.error(f"The line {number} of {filename} is not valid JSON ({e}), it will be skipped.")
+                continue
+            for item in items:
+                try:
+                    if 'DOI' in item:
+                        yield citeproc_record(item)
+                    elif 'id' in item and ('versions' in item or 'authors_parsed' in item):
+                        yield arxiv_record(item)
+                    else:
+                        logger.info(f"A record in {filename} is neither a Crossref work nor an arXiv paper, it will be skipped.")
+                except Exception as e:
+                    logger.error(f"A record in {filename} could not be imported ({e}), it will be skipped.")
+
+
+_offline_index = None
+_offline_index_lock = threading.Lock()
+
+def _forget_index():
+    #SQLite connections cannot be used in a child process created by fork, so the child opens its own ones
+    global _offline_index, _offline_index_lock
+    _offline_index = None
+    _offline_index_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_index)
+
+def offline_index_path():
+    return os.path.abspath(config.get('offline_index') or os.path.join(cache.cache_directory(), INDEX_FILENAME))
+
+def get_offline_index():
+    '''
+    Returns the OfflineIndex instance shared by all threads, or None if the file of the index does not exist or could not be opened.
+    '''
+    global _offline_index
+    path_database = offline_index_path()
+    with _offline_index_lock:
+        if _offline_index is None or _offline_index.path_database != path_database:
+            if not os.path.exists(path_database):
+                return None
+            try:
+                _offline_index = OfflineIndex(path_database)
+            except Exception as e:
+                logger.error(f"It was not possible to open the offline index {path_database}: {e}")
+                return None
+        return _offline_index
+
+def lookup(identifier_type, identifier, method=''):
+    '''
+    Returns the data of the identifier (of type 'DOI' or 'arxiv ID') contained in the offline index, in the same format returned by dx.doi.org (with the method method)
+    or export.arxiv.org, or None if the index does not exist or does not contain the identifier.
+    '''
+    offline_index = get_offline_index()
+    if offline_index is None:
+        return None
+    try:
+        validation_info = offline_index.get_validation_info(identifier_type, identifier, method)
+    except Exception as e:
+        logger.error(f"Some error occurred when looking for the {identifier_type} {identifier} in the offline index: {e}")
+        return None
+    if validation_info is not None:
+        logger.info(f"The data associated to the {identifier_type} {identifier} was found in the offline index.")
+    return validation_info
+
+def import_snapshots(filenames, path_database=None):
+    '''
+    Imports the records contained in the snapshots filenames (a list of paths, see the docstring of this module) into the offline index stored in
+    path_database (by default, the one returned by offline_index_path), which is created if it does not exist. It returns a dictionary with the number of records
+    of each type of identifier contained in the index.
+    '''
+    path_database = os.path.abspath(path_database or offline_index_path())
+    offline_index = OfflineIndex(path_database)
+    for filename in filenames:
+        logger.info(f"Importing the records contained in {filename} into the offline index {path_database}...")
+        count = offline_index.import_records(iter_snapshot(filename))
+        logger.info(f"{count} records were imported from {filename}.")
+    return offline_index.count()
@@ -0,0 +1,259 @@
+'''
+This module implements the two-phase pipeline of pdf2bib (see the function pdf2bib_pipeline), which is an alternative to processing each pdf file
+from start to end (as done by pdf2bib.pdf2bib).
+
+In the first phase the identifiers of all the pdf files are looked for, without any online query (see lookups.find_candidates). In the second phase
+the candidate identifiers are validated online, all together: each identifier is queried only once (even when it was found in several files), the
+queries are performed concurrently, and the queries which fail (e.g. because dx.doi.org could not be reached) are retried, without analyzing the pdf files again.
+As done by pdf2doi, the candidates of each file are validated in the same order in which they were found, and only until a valid one is found. Therefore the
+two phases are repeated in rounds: in each round, the next candidate of each file which is not resolved yet is validated.
+The files for which no valid identifier is found are then looked for via a google search (if enabled in pdf2doi), and finally the bibtex entries are generated.
+
+Since all the files are processed together, the deadline of each file (config.get('file_timeout'), see deadlines.py) starts with the pipeline, as the deadline 
+of the whole batch (config.get('batch_timeout')). When it expires, no more queries are sent, and the files which are not resolved yet get a result with 
+result['status'] = 'timeout'. A file whose bibtex entry cannot be generated (e.g. because of an unexpected error) gets a result with result['status'] = 'error' 
+(and the error message in result['error']), while the results of the other files are returned as usual.
+
+    Example:
+    import pdf2bib.pipeline as pipeline
+    results = pipeline.pdf2bib_pipeline(r"Path\\to\\folder", workers=4, concurrency=20)
+'''
+
+import logging
+import time
+from os import path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pdf2bib.compact as compact
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+import pdf2bib.lookups as lookups
+import pdf2bib.observers as observers
+from pdf2bib.main import _find_pdf_files, _add_bibtex_to_result, _get_cached_result, _embed_result_in_file, _store_result_in_cache, _import_pdf2doi
+
+logger = logging.getLogger("pdf2bib")
+
+ERROR_STATUS = 'error'
+
+
+class _PipelineFile():
+    '''
+    State of a pdf file inside the pipeline: the candidate identifiers which were not validated yet, the timings and the result.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.timer = observers.StageTimer(filename)
+        self.methods = iter(lookups.LOCAL_METHODS)
+        self.method = None
+        self.candidates = deque()
+        self.candidate = None
+        self.result = None
+
+    def next_candidate(self):
+        '''
+        Returns the next candidate identifier (a tuple (identifier, what)) of this file, or None if there are no more candidates.
+        The file is analyzed with the next method of pdf2doi only when the candidates found with the previous methods are exhausted.
+        '''
+        while not self.candidates:
+            self.method = next(self.methods, None)
+            if self.method is None:
+                return None
+            with self.timer.stage('extraction'):
+                self.candidates.extend(lookups.find_candidates(self.filename, self.method))
+        return self.candidates.popleft()
+
+    def set_result(self, identifier, identifier_type, validation_info, method):
+        self.result = {'identifier': identifier, 'identifier_type': identifier_type, 'validation_info': validation_info,
+                       'path': self.filename, 'method': method}
+
+
+def pdf2bib_pipeline(target, workers=None, concurrency=None, retries=None, timeout=None, batch_timeout=None, settings=None):
+    '''
+    Same as pdf2bib.pdf2bib, but the pdf files are processed with the two-phase pipeline described in the docstring of this module.
+    The output has the same format as the output of pdf2bib.pdf2bib (i.e. a list of dictionaries if target is a folder, in the same order).
+
+    Parameters
+    ----------
+    target : string
+        Relative or absolute path of a .pdf file or a directory containing pdf files
+    workers : int, optional
+        Number of pdf files analyzed concurrently in the first phase. If None (default), the value of config.get('workers') is used.
+    concurrency : int, optional
+        Maximum number of identifiers validated at the same time in the second phase. If None (default), the value of config.get('pipeline_concurrency') is used.
+    retries : int, optional
+        Number of times the validation of an identifier is repeated (with increasing waiting times) when the online archive could not be reached.
+        If None (default), the value of config.get('pipeline_retries') is used.
+    timeout, batch_timeout : float, optional
+        Maximum time (in seconds) spent on each file and on the whole target (see pdf2bib). Since all the files are processed together, the shortest of the 
+        two is applied to all files. If None (default), the values of config.get('file_timeout') and config.get('batch_timeout') are used.
+    settings : dictionary or Settings, optional
+        Values of the settings of pdf2bib (or pdf2doi) used only for this call, instead of the global ones (see config.settings).
+    '''
+    with config.settings(settings):
+        target = str(target)
+        files = _find_pdf_files(target)
+        if files is None:
+            return None
+        start = time.monotonic()
+        timeouts = [timeout for timeout in deadlines.get_timeouts(timeout, batch_timeout) if timeout is not None]
+        with deadlines.deadline(start + min(timeouts) if timeouts else None):
+            results = _run_pipeline(files, workers, concurrency, retries, start)
+        if not path.isdir(target):
+            return results[0]
+        return results
+
+def _run_pipeline(files, workers, concurrency, retries, start):
+    '''
+    Processes the pdf files listed in files with the two-phase pipeline (see pdf2bib_pipeline), within the deadline active in the current thread (if any), 
+    and returns the list of their results. start is the time (in the time.monotonic clock) when the pipeline started.
+    '''
+    workers = max(1, workers or config.get('workers'))
+    concurrency = max(1, concurrency or config.get('pipeline_concurrency'))
+    retries = config.get('pipeline_retries') if retries is None else retries
+
+    pdf2doi = _import_pdf2doi()
+    lookups.install_pdf2doi_hooks() #The validations go through the identifier cache of pdf2bib (see lookups.py)
+    states = [_PipelineFile(file) for file in files]
+    for state in states:
+        observers.notify('on_file_start', state.filename)
+
+    #The functions run by the pools are wrapped by config.bind and deadlines.bind, so that the worker threads use the settings and the deadline of this call
+    bind = lambda function: deadlines.bind(config.bind(function))
+    timed_out = set()
+    with ThreadPoolExecutor(max_workers=workers) as extraction_pool, ThreadPoolExecutor(max_workers=concurrency) as lookup_pool:
+        #Files which were already processed in previous runs
+        def get_cached_result(state):
+            with state.timer.stage('cache'):
+                return _get_cached_result(state.filename)
+        cached = list(extraction_pool.map(bind(get_cached_result), states))
+        done = {id(state): result for state, result in zip(states, cached) if result}
+        pending = [state for state in states if not id(state) in done]
+        logger.info(f"{len(done)} pdf files were found in the cache. Looking for the identifiers of the other {len(pending)} files...")
+
+        #First and second phase, repeated until each file has either a valid identifier or no more candidates
+        validated = {}
+        exhausted = []
+        while pending:
+            if deadlines.expired():
+                timed_out.update(id(state) for state in pending)
+                break
+            candidates = list(extraction_pool.map(bind(_PipelineFile.next_candidate), pending))
+            waiting = []
+            for state, candidate in zip(pending, candidates):
+                if candidate is None:
+                    exhausted.append(state)
+                else:
+                    state.candidate = candidate
+                    waiting.append(state)
+            elapsed = _validate_all({state.candidate for state in waiting}, validated, lookup_pool, retries)
+            pending = []
+            for state in waiting:
+                state.timer.add('lookup', elapsed.get(state.candidate, 0.0))
+                identifier, what = state.candidate
+                if validated[state.candidate]:
+                    state.set_result(identifier, 'DOI' if what == 'doi' else 'arxiv ID', validated[state.candidate], state.method)
+                else:
+                    pending.append(state)
+
+        #The arXiv IDs are replaced by DOIs (either from a journal publication or with the arXiv DOI), as done in pdf2doi.finders.find_identifier
+        if pdf2doi.config.get('replace_arxivID_by_DOI_when_available') == True and not deadlines.expired():
+            arxiv_states = [state for state in states if state.result and state.result['identifier_type'] == 'arxiv ID' and isinstance(state.result['validation_info'], dict)]
+            dois = {state.result['validation_info'].get('arxiv_doi') for state in arxiv_states}
+            elapsed = _validate_all({(doi, 'doi') for doi in dois if doi}, validated, lookup_pool, retries)
+            for state in arxiv_states:
+                arxiv_doi = state.result['validation_info'].get('arxiv_doi')
+                if arxiv_doi:
+                    state.timer.add('lookup', elapsed.get((arxiv_doi, 'doi'), 0.0))
+                    if validated[(arxiv_doi, 'doi')]:
+                        state.set_result(arxiv_doi, 'DOI', validated[(arxiv_doi, 'doi')], state.method + ' + arxiv2doi')
+                else:
+                    state.set_result(f"10.48550/arXiv.{state.result['identifier']}", 'arxiv DOI', state.result['validation_info'], state.method + ' + arxiv2doi')
+
+        #The files without a valid identifier are looked for via a google search
+        if exhausted and pdf2doi.config.get('websearch'):
+            if deadlines.expired():
+                timed_out.update(id(state) for state in exhausted)
+            else:
+                logger.info(f"Looking for the identifiers of {len(exhausted)} pdf files via a google search...")
+                def find_online(state):
+                    with state.timer.stage('extraction'):
+                        state.result = lookups.find_identifier_online(state.filename)
+                list(extraction_pool.map(bind(find_online), exhausted))
+                if deadlines.expired(): #The search might have given up before finding the identifier
+                    timed_out.update(id(state) for state in exhausted if not state.result['identifier'])
+        for state in exhausted:
+            if state.result is None:
+                state.set_result(None, None, None, None)
+
+        #The identifiers found are stored in the metadata of the pdf files (as done by pdf2doi.pdf2doi)
+        if pdf2doi.config.get('save_identifier_metadata'):
+            to_save = [state for state in states if state.result and state.result['identifier'] and not state.result['method'] == 'document_infos'
+                       and not id(state) in timed_out]
+            list(extraction_pool.map(bind(lambda state: pdf2doi.add_found_identifier_to_metadata(state.filename, state.result['identifier'])), to_save))
+
+    #Generation of the bibtex entries
+    results = []
+    for state in states:
+        if id(state) in timed_out:
+            logger.error(f"The file {state.filename} was cancelled, since it was not done in time.")
+            observers.notify('on_error', state.filename, deadlines.FileTimeoutError(f"The file {state.filename} was not done in time."))
+            results.append(compact.make_result(deadlines.timeout_result(state.filename, time.monotonic() - start)))
+            continue
+        if id(state) in done:
+            result = done[id(state)]
+        else:
+            try:
+                result = state.result
+                _add_bibtex_to_result(result, state.timer)
+                if result['bibtex']:
+                    with state.timer.stage('cache'):
+                        _embed_result_in_file(state.filename, result)
+                        _store_result_in_cache(state.filename, result)
+            except Exception as e:
+                logger.error(f"Some error occurred when generating the bibtex entry of the file {state.filename}: {e}")
+                observers.notify('on_error', state.filename, e)
+                result = dict(state.result, metadata=None, bibtex=None, timings=state.timer.stop(), status=ERROR_STATUS, error=str(e))
+                results.append(compact.make_result(result))
+                continue
+        result['timings'] = state.timer.stop()
+        result = compact.make_result(result)
+        observers.notify('on_file_end', state.filename, result)
+        results.append(result)
+    logger.info("................")
+    return results
+
+def _validate_all(candidates, validated, pool, retries):
+    '''
+    Validates online (concurrently, via pool) all the candidate identifiers (tuples (identifier, what)) in the set candidates which are not in the
+    dictionary validated yet, and stores the validation_info of each of them in validated. It returns a dictionary with the time spent validating each identifier.
+    '''
+    to_validate = [candidate for candidate in candidates if not candidate in validated]
+    if not to_validate:
+        return {}
+    logger.info(f"Validating {len(to_validate)} identifiers...")
+    def validate(candidate):
+        start = time.perf_counter()
+        return _validate_with_retries(*candidate, retries), time.perf_counter() - start
+    elapsed = {}
+    for candidate, (validation_info, duration) in zip(to_validate, pool.map(deadlines.bind(config.bind(validate)), to_validate)):
+        validated[candidate] = validation_info
+        elapsed[candidate] = duration
+    return elapsed
+
+def _validate_with_retries(identifier, what, retries):
+    '''
+    Validates the identifier via pdf2doi.finders.validate. If the online archive could not be reached (i.e. validate returned None), the validation
+    is repeated up to retries times, waiting 0.5, 1, 2... seconds (at most 30) between consecutive attempts. No attempt is made after the deadline of the
+    current thread (see deadlines.py) expired.
+    '''
+    import pdf2doi.finders as finders
+    for attempt in range(retries + 1):
+        validation_info = finders.validate(identifier, what)
+        if validation_info is not None:
+            return validation_info
+        if attempt < retries and not deadlines.expired():
+            logger.info(f"It was not possible to validate the identifier {identifier}. Trying again (attempts left: {retries - attempt}).")
+            time.sleep(deadlines.clamp(min(30, 0.5 * 2 ** attempt)))
+        if deadlines.expired():
+            break
+    return None
@@ -0,0 +1,335 @@
+'''
+This module paces the queries sent by pdf2bib to each host (dx.doi.org, export.arxiv.org), so that large batches of files get the highest throughput
+which the host can sustain, without being throttled or temporarily banned.
+
+Each host has its own HostLimiter, which combines
+    - a token bucket, which limits the rate of the requests to at most config.get('ratelimit_dxdoiorg_per_minute') (or
+      config.get('ratelimit_exportarxivorg_per_minute'), whose default follows the terms of use of the arXiv API) requests per minute,
+    - an adaptive limit on the number of concurrent requests (at most config.get('ratelimit_max_concurrency')). The limit is increased additively
+      after each fast successful response, and decreased multiplicatively when the recent latency (an exponential moving average over about
+      the last 1/LATENCY_SMOOTHING responses) grows well above the baseline latency (a much slower moving average, over about the last
+      BASELINE_WINDOW responses), i.e. the requests are queueing up on the host, or when the host throttles the requests (status 429 or 5xx,
+      or connection errors), at most once every DECREASE_INTERVAL seconds.
+      When the host throttles the requests, the rate of the token bucket is also halved (and then slowly increased again), and all requests to the
+      host are paused for the time specified by the header Retry-After (if any).
+The function get performs a GET request through the limiter of the host, and retries the throttled requests (at most config.get('ratelimit_retries')
+times) after a random delay with exponential growth (full jitter, at most config.get('ratelimit_max_backoff') seconds). The timeout of each request,
+the waits for a free slot and for a token, and the retries, are limited by the deadline of the file being processed, if any (see deadlines.py).
+
+When config.get('ratelimit_enabled') is True (default), all the queries performed by pdf2doi via the hooks installed by lookups.install_pdf2doi_hooks,
+and the queries performed by async_main.AsyncLookupClient, go through this module. The limits of other hosts (e.g. a local mirror) can be set via
+set_host_limit.
+
+    Example:
+    import pdf2bib.ratelimit as ratelimit
+    response = ratelimit.get("https://dx.doi.org/10.1063/1.2409490", headers={"accept": "application/citeproc+json"})
+    print(ratelimit.get_limiter("dx.doi.org").stats())
+'''
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from urllib.parse import urlsplit
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+
+logger = logging.getLogger("pdf2bib")
+
+#For each host, the setting which contains its maximum number of requests per minute. The requests to other hosts are not paced, unless a limit is set via set_host_limit
+HOST_LIMITS = {'dx.doi.org': 'ratelimit_dxdoiorg_per_minute', 'export.arxiv.org': 'ratelimit_exportarxivorg_per_minute'}
+REQUEST_TIMEOUT = 30 #Seconds
+BASE_BACKOFF = 0.5 #Seconds, maximum delay before the first retry
+CONGESTION_FACTOR = 3 #A recent latency larger than CONGESTION_FACTOR times the baseline latency means that the requests are queueing up on the host
+#The latency of single responses varies a lot (e.g. dx.doi.org redirects to many different registrars), so both latencies are moving averages.
+#The baseline follows the slow changes of the latency of the host, so that it is not stuck to the fastest response ever observed
+LATENCY_SMOOTHING = 0.2 #Weight of each response in the recent latency
+BASELINE_WINDOW = 200 #Number of responses (approximately) averaged in the baseline latency
+POLL_INTERVAL = 0.01 #Seconds, used by the coroutines waiting for a free slot
+DECREASE_INTERVAL = 1.0 #Seconds. The limits are decreased at most once in this interval, since the responses to the requests already in flight do not carry new information
+
+_limiters = {}
+_host_limits = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket():
+    '''
+    Thread-safe token bucket, which allows at most rate requests per second, with bursts of at most burst requests.
+    '''
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        '''
+        Takes a token, and returns the time (in seconds) to wait before using it (0 if a token is available immediately). The token is reserved,
+        so the following calls return increasingly longer times: the requests are spread evenly.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def set_rate(self, rate):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.rate = rate
+
+
+class HostLimiter():
+    '''
+    Limits the rate (via a TokenBucket) and the concurrency (adaptively, see the docstring of this module) of the requests sent to the host host.
+    If per_minute is None, the rate is not limited.
+    '''
+    def __init__(self, host, per_minute=None, max_concurrency=8):
+        self.host = host
+        self.max_rate = per_minute / 60 if per_minute else None
+        self.min_rate = self.max_rate / 64 if per_minute else None
+        self.bucket = TokenBucket(self.max_rate, burst=max(1, min(max_concurrency, int(self.max_rate) // 10))) if per_minute else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = max(1, self.max_concurrency // 2)
+        self.in_flight = 0
+        self.latency = None #Recent and baseline latency, in seconds (see on_success)
+        self.baseline_latency = None
+        self.responses = 0
+        self.paused_until = 0.0
+        self.last_decrease = -DECREASE_INTERVAL
+        self.requests = 0
+        self.throttled = 0
+        self._condition = threading.Condition()
+
+    def _can_enter(self):
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.paused_until
+
+    def try_enter(self):
+        '''
+        Takes a slot for a new request and returns True, if the number of requests in flight is below the current limit (and the host is not paused).
+        '''
+        with self._condition:
+            if not self._can_enter():
+                return False
+            self.in_flight += 1
+            return True
+
+    def enter(self, timeout=None):
+        '''
+        Waits until a slot for a new request is available (at most timeout seconds, if timeout is not None), and takes it.
+        It returns True if the slot was taken, and False if the timeout expired first.
+        '''
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._can_enter():
+                wait = max(POLL_INTERVAL, self.paused_until - time.monotonic())
+                if end is not None:
+                    if time.monotonic() >= end:
+                        return False
+                    wait = min(wait, end - time.monotonic())
+                self._condition.wait(wait)
+            self.in_flight += 1
+            return True
+
+    def exit(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def wait_time(self):
+        '''
+        Reserves a token of the bucket, and returns the time (in seconds) to wait before sending the request.
+        '''
+        return self.bucket.reserve() if self.bucket else 0.0
+
+    @contextmanager
+    def slot(self):
+        '''
+        Context manager which waits for a free slot and for a token, and releases the slot at the end. The waits are limited by the deadline
+        of the current thread (see deadlines.py): if it expires first, deadlines.FileTimeoutError is raised.
+        '''
+        if not self.enter(deadlines.remaining()):
+            raise deadlines.FileTimeoutError(f"The deadline expired while waiting to send a request to {self.host}.")
+        try:
+            delay = self.wait_time()
+            if delay:
+                time.sleep(deadlines.clamp(delay))
+            if deadlines.expired():
+                raise deadlines.FileTimeoutError(f"The deadline expired while waiting to send a request to {self.host}.")
+            yield
+        finally:
+            self.exit()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        '''
+        Same as slot, for coroutines (the event loop is never blocked).
+        '''
+        while not self.try_enter():
+            if deadlines.expired():
+                raise deadlines.FileTimeoutError(f"The deadline expired while waiting to send a request to {self.host}.")
+            await asyncio.sleep(POLL_INTERVAL)
+        try:
+            delay = self.wait_time()
+            if delay:
+                await asyncio.sleep(deadlines.clamp(delay))
+            if deadlines.expired():
+                raise deadlines.FileTimeoutError(f"The deadline expired while waiting to send a request to {self.host}.")
+            yield
+        finally:
+            self.exit()
+
+    def on_success(self, latency):
+        '''
+        Updates the limits after a successful response received in latency seconds.
+        '''
+        with self._condition:
+            self.requests += 1
+            self.responses += 1
+            if self.latency is None:
+                self.latency = self.baseline_latency = latency
+            else:
+                self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+                #Until BASELINE_WINDOW responses are received, the baseline is the average of all the latencies
+                self.baseline_latency += max(1 / BASELINE_WINDOW, 1 / self.responses) * (latency - self.baseline_latency)
+            if self.latency > CONGESTION_FACTOR * self.baseline_latency and self.latency > POLL_INTERVAL:
+                if self._can_decrease():
+                    self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+        if self.bucket and self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate / 16))
+
+    def on_throttle(self, retry_after=None, reason=''):
+        '''
+        Updates the limits after a request was throttled by the host (or failed). If retry_after is specified, all requests are paused for retry_after seconds.
+        '''
+        with self._condition:
+            self.requests += 1
+            self.throttled += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            if not self._can_decrease():
+                return
+            self.limit = max(1.0, self.limit / 2)
+        if self.bucket:
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+        logger.info(f"The requests to {self.host} were throttled ({reason}). Concurrency reduced to {int(self.limit)}"
+                    + (f", rate reduced to {60 * self.bucket.rate:.1f} requests per minute." if self.bucket else "."))
+
+    def _can_decrease(self):
+        #Must be called while holding self._condition
+        now = time.monotonic()
+        if now - self.last_decrease < DECREASE_INTERVAL:
+            return False
+        self.last_decrease = now
+        return True
+
+    def stats(self):
+        '''
+        Returns a dictionary with the current limits and the number of requests (and of throttled requests) sent to the host.
+        '''
+        return {'host': self.host, 'concurrency': int(self.limit), 'per_minute': 60 * self.bucket.rate if self.bucket else None,
+                'requests': self.requests, 'throttled': self.throttled}
+
+
+def set_host_limit(host, per_minute=None, max_concurrency=None):
+    '''
+    Sets the maximum number of requests per minute (None means no limit) and of concurrent requests (default config.get('ratelimit_max_concurrency'))
+    of the host host, replacing its current limiter.
+    '''
+    with _limiters_lock:
+        _host_limits[host] = (per_minute, max_concurrency)
+        _limiters.pop(host, None)
+
+def reset():
+    '''
+    Removes all the limiters, so that the following requests use the current values of the settings.
+    '''
+    with _limiters_lock:
+        _limiters.clear()
+
+def get_limiter(host):
+    '''
+    Returns the HostLimiter of the host host (which is created the first time).
+    '''
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            per_minute, max_concurrency = _host_limits.get(host, (None, None))
+            if host in HOST_LIMITS and not host in _host_limits:
+                per_minute = config.get(HOST_LIMITS[host]) or None
+            limiter = _limiters[host] = HostLimiter(host, per_minute, max_concurrency or config.get('ratelimit_max_concurrency'))
+        return limiter
+
+def backoff_delay(attempt, retry_after=None):
+    '''
+    Returns the time (in seconds) to wait before the retry number attempt (starting from 0): a random time between 0 and BASE_BACKOFF * 2**attempt
+    (full jitter, so that the retries of different requests are spread out), at most config.get('ratelimit_max_backoff'), and at least retry_after.
+    '''
+    delay = random.uniform(0, min(config.get('ratelimit_max_backoff'), BASE_BACKOFF * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+def is_throttled(status, text=''):
+    '''
+    Returns True if a response with status code status and text text means that the host is throttling the requests (or is temporarily unavailable).
+    '''
+    return status == 429 or status >= 500 or "503 service unavailable" in text[:1000].lower()
+
+def retry_after_seconds(headers):
+    '''
+    Returns the number of seconds specified by the header Retry-After in headers (a dictionary-like object), or None.
+    '''
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return min(float(value), config.get('ratelimit_max_backoff')) if value else None
+    except ValueError:
+        return None #Dates are not supported
+
+def get(url, headers=None, timeout=REQUEST_TIMEOUT):
+    '''
+    Sends a GET request (via the library requests) to url through the limiter of its host, and retries it if the host throttles it
+    (see the docstring of this module). It returns the last response received, or raises the last exception if no response was received.
+    It raises deadlines.FileTimeoutError if the deadline of the current thread (see deadlines.py) expires before a response is received.
+    '''
+    import requests
+    limiter = get_limiter(urlsplit(url).hostname)
+    retries = config.get('ratelimit_retries')
+    for attempt in range(retries + 1):
+        if deadlines.expired():
+            raise deadlines.FileTimeoutError(f"The deadline expired before a response was received from {url}.")
+        response, error, retry_after = None, None, None
+        with limiter.slot():
+            request_timeout = deadlines.clamp(timeout)
+            if request_timeout is not None and request_timeout <= 0: #requests does not accept a timeout of 0
+                raise deadlines.FileTimeoutError(f"The deadline expired before a response was received from {url}.")
+            start = time.perf_counter()
+            try:
+                response = requests.get(url, headers=headers, timeout=request_timeout)
+                response.encoding = 'utf-8'
+            except requests.RequestException as e:
+                error = e
+            latency = time.perf_counter() - start
+        if response is not None and not is_throttled(response.status_code, response.text):
+            limiter.on_success(latency)
+            return response
+        if response is not None:
+            retry_after = retry_after_seconds(response.headers)
+            limiter.on_throttle(retry_after, reason=f"status {response.status_code}")
+        elif deadlines.expired(): #The request was interrupted by the deadline, not by the host
+            raise deadlines.FileTimeoutError(f"The deadline expired before a response was received from {url}.")
+        else:
+            limiter.on_throttle(reason=str(error))
+        if attempt < retries:
+            time.sleep(deadlines.clamp(backoff_delay(attempt, retry_after)))
+    if response is None:
+        raise error
+    return response
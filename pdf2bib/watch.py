@@ -0,0 +1,211 @@
+'''
+This module implements the watch mode of pdf2bib (command line: pdf2bib folder -s refs.bib --watch), which keeps a .bib file in sync with a folder of pdf files.
+
+The .bib file is first updated as done by the option -incremental (see incremental.py). Then the folder is monitored (via inotify on Linux, or by
+scanning it every config.get('watch_poll_interval') seconds on the other systems) and, whenever pdf files are added, modified or deleted, the .bib file
+and its manifest are updated accordingly (see incremental.apply_changes).
+    - A pdf file is processed only after it did not change for config.get('watch_debounce') seconds (and its size and modification time are stable),
+      so that files which are still being copied are not processed.
+    - The files ready to be processed are processed in batches of at most config.get('watch_batch_size') files, and the .bib file is updated after
+      each batch. The pending files are stored only once each (by name), so a bulk copy of thousands of files does not accumulate work in memory.
+    - If the events are lost (e.g. the inotify queue overflows), the whole folder is compared with the manifest again.
+
+    Example:
+    import pdf2bib.watch as watch
+    watch.watch(r"Path\\to\\folder", "refs.bib", workers=4) #Runs until it is interrupted (e.g. via Ctrl+C)
+'''
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+import pdf2bib.config as config
+import pdf2bib.incremental as incremental
+
+logger = logging.getLogger("pdf2bib")
+
+#Constants of the inotify API (see man inotify)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_pdf(name):
+    return name.lower().endswith('.pdf')
+
+
+class _InotifyWatcher():
+    '''
+    Reports the names of the pdf files which were created, modified, moved or deleted in the folder, via the inotify API of Linux (called through ctypes).
+    '''
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout):
+        '''
+        Waits at most timeout seconds for events, and returns the set of the names of the pdf files involved, or None if some events were lost.
+        '''
+        names = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return names
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return names
+            position = 0
+            while position < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, position)
+                position += _EVENT_HEADER.size
+                name = os.fsdecode(data[position:position + length].rstrip(b'\0'))
+                position += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    raise OSError("The watched folder was deleted or moved.")
+                if _is_pdf(name):
+                    names.add(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _PollingWatcher():
+    '''
+    Reports the names of the pdf files which were created, modified or deleted in the folder, by comparing the sizes and modification times of
+    the files with those found in the previous scan. The folder is scanned every interval seconds.
+    '''
+    def __init__(self, folder, interval):
+        self.folder = folder
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if _is_pdf(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        time.sleep(max(timeout, self.interval))
+        snapshot = self._scan()
+        names = {name for name in snapshot.keys() | self.snapshot.keys() if snapshot.get(name) != self.snapshot.get(name)}
+        self.snapshot = snapshot
+        return names
+
+    def close(self):
+        pass
+
+
+def _signature(filename):
+    #Size and modification time of the file, or None if the file does not exist
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def watch(target, filename_bibtex, workers=None, stop_event=None):
+    '''
+    Keeps the file filename_bibtex (inside the folder target) in sync with the pdf files in the folder target (see the docstring of this module).
+    It runs until the process is interrupted (e.g. via Ctrl+C), or until stop_event (a threading.Event) is set.
+
+    Parameters
+    ----------
+    target : string
+        Relative or absolute path of a folder containing pdf files
+    filename_bibtex : string
+        Name of the .bib file, which is created (or updated) inside the folder target
+    workers : int, optional
+        Number of files processed concurrently (see pdf2bib.pdf2bib)
+    stop_event : threading.Event, optional
+        If specified, the function returns as soon as it is set (after the current batch of files is done).
+    '''
+    target = str(target)
+    if not os.path.isdir(target):
+        logger.error(f"{target} is not a valid path to a directory.")
+        return
+    if not(target.endswith(config.get('separator'))):
+        target = target + config.get('separator')
+    path_filename_bibtex = target + filename_bibtex
+    debounce = config.get('watch_debounce')
+    batch_size = max(1, config.get('watch_batch_size'))
+
+    #The watcher is started before the first update, so that no change is missed
+    try:
+        watcher = _InotifyWatcher(target)
+    except (OSError, AttributeError) as e:
+        logger.info(f"It was not possible to use inotify ({e}). The folder will be scanned every {config.get('watch_poll_interval')} seconds.")
+        watcher = _PollingWatcher(target, config.get('watch_poll_interval'))
+
+    pending = {} #For each pdf file waiting to be processed, the time of its last change and its signature (size and modification time)
+    try:
+        incremental.update_bibtex_file(target, filename_bibtex, workers=workers)
+        manifest = incremental.Manifest(path_filename_bibtex)
+        logger.info(f"Watching the folder {target} for changes...")
+        while not (stop_event and stop_event.is_set()):
+            now = time.monotonic()
+            timeout = min([debounce - (now - changed) for changed, _ in pending.values()] + [1.0])
+            names = watcher.read(max(0.0, timeout))
+            now = time.monotonic()
+            if names is None:
+                logger.info("Some changes in the folder were missed. The whole folder will be compared with the manifest again.")
+                names = {name for name in os.listdir(target) if _is_pdf(name)}
+                names |= {os.path.basename(relative_path) for relative_path in manifest.files}
+            for name in names:
+                pending[name] = (now, _signature(target + name))
+
+            #The files which did not change for debounce seconds are processed, unless their size or modification time changed in the meantime
+            ready = []
+            for name, (changed, signature) in list(pending.items()):
+                if len(ready) >= batch_size or now - changed < debounce:
+                    continue
+                current_signature = _signature(target + name)
+                if current_signature != signature:
+                    pending[name] = (now, current_signature)
+                    continue
+                del pending[name]
+                ready.append(name)
+            if not ready:
+                continue
+
+            files_to_process = [target + name for name in ready if _signature(target + name) and not manifest.is_unchanged(target + name)]
+            deleted_files = [manifest.relative_path(target + name) for name in ready if not _signature(target + name)]
+            deleted_files = [relative_path for relative_path in deleted_files if relative_path in manifest.files]
+            if not (files_to_process or deleted_files):
+                continue
+            logger.info(f"Updating {path_filename_bibtex}: {len(files_to_process)} new or modified pdf files, {len(deleted_files)} deleted pdf files "
+                        f"({len(pending)} more files waiting).")
+            incremental.apply_changes(manifest, path_filename_bibtex, files_to_process, deleted_files, workers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    logger.info(f"Stopped watching the folder {target}.")
@@ -0,0 +1,472 @@
+'''
+This module contains the classes used to write bibtex entries on file while they are produced, without keeping all of them in memory.
+
+The class BibtexWriter supports three modes
+    'w'     : the entries are written into a temporary file in the same folder of the target file, which is renamed into the target file
+              (atomically) when the writer is closed. A previous version of the target file is therefore never left half-written.
+    'a'     : the entries are appended directly to the end of the target file (which is created if it does not exist). Each entry is flushed
+              to disk as soon as it is written.
+    'merge' : the target file is updated. Each new entry whose key is already present in the target file replaces the old entry (in the same position),
+              all other entries are left unchanged, and the entries with new keys are added at the end. The new entries are spooled in a temporary file while
+              they are produced, and the target file is rewritten (again via a temporary file and an atomic rename) when the writer is closed.
+              Only the keys of the new entries are kept in memory, so that very large bibliographies can be merged with constant memory.
+              Entries can also be removed from the target file (see BibtexWriter.remove).
+
+The classes JSONLinesWriter and CSLJSONWriter write machine-readable records instead, one for each result returned by pdf2bib (see RecordWriter).
+    JSONLinesWriter : one JSON dictionary per line and per pdf file, with the keys in RECORD_KEYS (see make_record).
+    CSLJSONWriter   : a CSL-JSON array (the format used by citation processors, e.g. pandoc or Zotero), with one item for each pdf file for which
+                      bibliographic data was found (see make_csl_item). When dx.doi.org returned citeproc+json data (the default method of pdf2doi),
+                      the item is taken directly from it, without going through the bibtex entry.
+Both can write either into a file (with the modes 'w' and 'a', as BibtexWriter; only 'w' for CSLJSONWriter) or into a stream (e.g. sys.stdout).
+'''
+
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+from collections.abc import Sequence
+from pdf2bib.compact import json_default
+
+logger = logging.getLogger("pdf2bib")
+
+_bibtex_key_regex = re.compile(r"\s*@\s*\w+\s*[{(]\s*([^,\s]*)")
+_bibtex_parenthesis_regex = re.compile(r"\s*@\s*\w+\s*\(") #Start of an entry delimited by parentheses, e.g. @article(key, ...)
+
+def get_bibtex_key(bibtex):
+    '''
+    Returns the key (i.e. the ID) of the bibtex entry contained in the string bibtex, or None if no key is found.
+    '''
+    match = _bibtex_key_regex.match(bibtex)
+    return match.group(1) if match else None
+
+def set_bibtex_key(bibtex, key):
+    '''
+    Returns the bibtex entry contained in the string bibtex, with its key replaced by key.
+    '''
+    match = _bibtex_key_regex.match(bibtex)
+    if not match:
+        raise ValueError("No valid bibtex entry was found.")
+    return bibtex[:match.start(1)] + key + bibtex[match.end(1):]
+
+def _brace_balance(line):
+    #Number of opening braces minus number of closing braces in line, ignoring escaped braces
+    balance = line.count('{') - line.count('}')
+    if '\\' in line:
+        balance += line.count('\\}') - line.count('\\{')
+    return balance
+
+def _scan_parenthesis_entry(line, position, state):
+    #Scans line from position, as part of an entry delimited by parentheses. state is the list [brace depth, inside a quoted value], which is updated.
+    #Returns True if the closing parenthesis of the entry (i.e. outside braces and quotes) is found. Escaped characters (e.g. \{) are skipped
+    depth, quoted = state
+    length = len(line)
+    while position < length:
+        char = line[position]
+        if char == '\\':
+            position += 1
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        elif depth <= 0:
+            if char == '"':
+                quoted = not quoted
+            elif char == ')' and not quoted:
+                return True
+        position += 1
+    state[:] = depth, quoted
+    return False
+
+def iter_bibtex_entries(file):
+    '''
+    Reads the bibtex file file (an object file opened in text mode) one line at a time, and yields tuples (key, text),
+    where text is the full text of an entry and key is its key. Any text found between entries (e.g. comments) is yielded with key = None.
+    Both the entries delimited by braces (@article{key, ...}) and those delimited by parentheses (@article(key, ...)) are supported.
+    Only one entry at a time is kept in memory.
+    '''
+    chunk = []
+    depth = 0
+    parenthesis_state = None #[brace depth, inside a quoted value] while reading an entry delimited by parentheses
+    for line in file:
+        position = 0
+        if depth == 0 and parenthesis_state is None and line.lstrip().startswith('@'):
+            if chunk:
+                yield None, ''.join(chunk)
+            chunk = []
+            key = get_bibtex_key(line)
+            match = _bibtex_parenthesis_regex.match(line)
+            if match:
+                parenthesis_state, position = [0, False], match.end()
+        elif depth == 0 and parenthesis_state is None:
+            chunk.append(line)
+            continue
+        chunk.append(line)
+        if parenthesis_state is not None:
+            if _scan_parenthesis_entry(line, position, parenthesis_state):
+                parenthesis_state = None
+                yield key, ''.join(chunk)
+                chunk = []
+            continue
+        depth += _brace_balance(line)
+        if depth <= 0:
+            depth = 0
+            yield key, ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield (key if depth > 0 or parenthesis_state is not None else None), ''.join(chunk)
+
+def _create_temp_file(filename, encoding='utf-8', binary=False):
+    #Creates a temporary file in the same folder of filename, and returns the opened file and its name
+    folder, name = os.path.split(filename)
+    handle, temp_filename = tempfile.mkstemp(prefix='.' + name + '.', suffix='.tmp', dir=folder)
+    if binary:
+        return open(handle, 'w+b'), temp_filename
+    return open(handle, 'w', encoding=encoding, newline=''), temp_filename
+
+def _commit_temp_file(file, temp_filename, filename):
+    #Closes the temporary file and renames it (atomically) into filename
+    file.flush()
+    os.fsync(file.fileno())
+    file.close()
+    if os.path.exists(filename):
+        try:
+            os.chmod(temp_filename, os.stat(filename).st_mode) #mkstemp creates files readable only by the owner
+        except OSError:
+            pass
+    os.replace(temp_filename, filename)
+
+
+class BibtexWriter():
+    '''
+    Writes bibtex entries into the file filename, one entry at a time (see the docstring of this module for the possible values of mode).
+    The writer can be used as a context manager:
+
+        with BibtexWriter('references.bib', mode='merge') as writer:
+            for result in pdf2bib.iter_pdf2bib(folder):
+                if result['bibtex']:
+                    writer.write(result['bibtex'])
+
+    If an exception occurs while the entries are produced, the entries written so far are still saved. Use abort() to discard them instead.
+    '''
+    def __init__(self, filename, mode='w', encoding='utf-8'):
+        if not mode in ['w', 'a', 'merge']:
+            raise ValueError("The input variable mode must be either 'w', 'a' or 'merge'")
+        self.filename = os.path.abspath(filename)
+        self.mode = mode
+        self.encoding = encoding
+        self.numb_entries = 0
+        self._spool_index = {} #Only used in the merge mode. For each key, it contains the position and length of the corresponding entry in the spool file
+        self._removed_keys = set() #Only used in the merge mode. Keys of the entries to be removed from the target file
+        if mode == 'a':
+            self._file = open(self.filename, 'a', encoding=encoding, newline='')
+            self._temp_filename = None
+        else:
+            self._file, self._temp_filename = self._create_temp_file(binary=(mode == 'merge'))
+
+    def _create_temp_file(self, binary=False):
+        return _create_temp_file(self.filename, self.encoding, binary)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, bibtex):
+        '''
+        Writes the bibtex entry contained in the string bibtex.
+        '''
+        text = bibtex.strip() + "\n\n"
+        if self.mode == 'merge':
+            key = get_bibtex_key(text)
+            data = text.encode(self.encoding)
+            self._spool_index.pop(key, None) #If the same key is written twice, the last entry wins (and keeps the position of the last one)
+            self._removed_keys.discard(key)
+            self._spool_index[key] = (self._file.tell(), len(data))
+            self._file.write(data)
+        else:
+            self._file.write(text)
+            self._file.flush()
+        self.numb_entries += 1
+
+    def remove(self, key):
+        '''
+        Removes the entry with the key key from the target file (only available in the merge mode). If an entry with the same key is written
+        after calling this method, the new entry is kept.
+        '''
+        if self.mode != 'merge':
+            raise ValueError("Entries can be removed only when the writer is in the 'merge' mode")
+        self._spool_index.pop(key, None)
+        self._removed_keys.add(key)
+
+    def close(self):
+        '''
+        Finalizes the target file (see the docstring of this module) and closes the writer.
+        '''
+        if self._file is None:
+            return
+        if self.mode == 'a':
+            self._file.close()
+        elif self.mode == 'w':
+            self._commit(self._file, self._temp_filename)
+        else:
+            self._merge()
+        self._file = None
+
+    def abort(self):
+        '''
+        Closes the writer without modifying the target file (in the modes 'w' and 'merge').
+        '''
+        if self._file is None:
+            return
+        self._file.close()
+        if self._temp_filename:
+            os.remove(self._temp_filename)
+        self._file = None
+
+    def _commit(self, file, temp_filename):
+        _commit_temp_file(file, temp_filename, self.filename)
+
+    def _read_spooled_entry(self, key):
+        position, length = self._spool_index[key]
+        self._file.seek(position)
+        return self._file.read(length).decode(self.encoding)
+
+    def _merge(self):
+        output, output_filename = self._create_temp_file()
+        try:
+            written = set()
+            if os.path.exists(self.filename):
+                with open(self.filename, 'r', encoding=self.encoding) as existing:
+                    for key, text in iter_bibtex_entries(existing):
+                        if key is None:
+                            if text.strip():
+                                output.write(text.strip() + "\n\n")
+                        elif key in self._removed_keys:
+                            continue
+                        elif key in self._spool_index:
+                            if not key in written:
+                                output.write(self._read_spooled_entry(key))
+                                written.add(key)
+                        else:
+                            output.write(text.strip() + "\n\n")
+            for key in self._spool_index:
+                if not key in written:
+                    output.write(self._read_spooled_entry(key))
+        except Exception:
+            output.close()
+            os.remove(output_filename)
+            self.abort()
+            raise
+        self._commit(output, output_filename)
+        self._file.close()
+        os.remove(self._temp_filename)
+
+
+RECORD_KEYS = ['path', 'identifier', 'identifier_type', 'method', 'metadata', 'bibtex', 'timings']
+
+#Variables of the CSL-JSON schema. The other keys returned by dx.doi.org (e.g. the list of references) are not included in the CSL-JSON items
+CSL_VARIABLES = {'type', 'id', 'title', 'title-short', 'author', 'editor', 'translator', 'container-title', 'container-title-short', 'collection-title',
+                 'volume', 'issue', 'page', 'page-first', 'number', 'edition', 'publisher', 'publisher-place', 'event', 'event-place', 'DOI', 'ISBN', 'ISSN',
+                 'URL', 'issued', 'published-print', 'published-online', 'accessed', 'abstract', 'language', 'note', 'keyword', 'genre', 'medium', 'source'}
+_CSL_TYPES = {'article': 'article-journal', 'book': 'book', 'inbook': 'chapter', 'incollection': 'chapter', 'inproceedings': 'paper-conference',
+              'conference': 'paper-conference', 'phdthesis': 'thesis', 'mastersthesis': 'thesis', 'techreport': 'report', 'misc': 'document'}
+_CSL_FIELDS = {'title': 'title', 'journal': 'container-title', 'ejournal': 'container-title', 'volume': 'volume', 'issue': 'issue', 'number': 'issue',
+               'page': 'page', 'pages': 'page', 'publisher': 'publisher', 'doi': 'DOI', 'url': 'URL', 'issn': 'ISSN', 'isbn': 'ISBN'}
+_MONTHS = {name: i + 1 for i, name in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+
+def make_record(result):
+    '''
+    Returns the dictionary written by JSONLinesWriter for the result result (in the format returned by pdf2bib_singlefile), i.e. the values of the keys in RECORD_KEYS.
+    '''
+    return {key: result.get(key) for key in RECORD_KEYS}
+
+def _csl_names(authors):
+    #Converts the authors in the format of the metadata generated by pdf2bib (see bibtex_makers.make_bibtex) into a list of CSL names
+    if isinstance(authors, Sequence) and not isinstance(authors, str): #A list or a compact.Authors object
+        #The other keys of the authors returned by dx.doi.org (e.g. 'ORCID', 'affiliation', 'sequence') are kept, as in the citeproc data
+        return [{key: value for key, value in author.items() if value} for author in authors if isinstance(author, dict)]
+    names = []
+    for name in authors.split(' and '):
+        name = name.strip()
+        if ',' in name:
+            family, given = name.split(',', 1)
+        else:
+            given, _, family = name.rpartition(' ')
+        names.append({key: value.strip() for key, value in (('family', family), ('given', given)) if value.strip()})
+    return names
+
+def _csl_date_part(value):
+    value = str(value).strip().lower()
+    if value.isdigit():
+        return int(value)
+    return _MONTHS.get(value[:3])
+
+def _csl_from_metadata(metadata):
+    #Converts the metadata generated by pdf2bib (see bibtex_makers.parse_bib_from_dxdoiorg and parse_bib_from_exportarxivorg) into a CSL-JSON item
+    if metadata.get('ejournal') == 'arXiv' or metadata.get('journal') == 'arXiv':
+        item = {'type': 'article'}
+    else:
+        item = {'type': _CSL_TYPES.get(str(metadata.get('ENTRYTYPE', 'article')).lower(), 'article-journal')}
+    for key, value in metadata.items():
+        if value and key in _CSL_FIELDS and not _CSL_FIELDS[key] in item:
+            item[_CSL_FIELDS[key]] = value
+    if metadata.get('author'):
+        item['author'] = _csl_names(metadata['author'])
+    date_parts = []
+    for key in ('year', 'month', 'day'):
+        part = _csl_date_part(metadata.get(key, ''))
+        if not part:
+            break
+        date_parts.append(part)
+    if date_parts:
+        item['issued'] = {'date-parts': [date_parts]}
+    return item
+
+def make_csl_item(result):
+    '''
+    Returns the CSL-JSON item written by CSLJSONWriter for the result result (in the format returned by pdf2bib_singlefile), or None if no bibliographic
+    data was found for it. If result['validation_info'] contains citeproc+json data (as returned by dx.doi.org), the item contains the CSL variables of
+    that data; otherwise the item is generated from result['metadata']. The id of the item is the key of the bibtex entry (or the identifier).
+    '''
+    metadata = result.get('metadata')
+    if not metadata:
+        return None
+    item = None
+    validation_info = result.get('validation_info')
+    if isinstance(validation_info, str) and validation_info.lstrip().startswith('{'):
+        try:
+            item = {key: value for key, value in json.loads(validation_info).items() if key in CSL_VARIABLES}
+        except ValueError:
+            item = None
+    if not item:
+        item = _csl_from_metadata(metadata)
+    item.pop('id', None)
+    key = get_bibtex_key(result['bibtex']) if isinstance(result.get('bibtex'), str) else None
+    return dict({'id': key or result.get('identifier')}, **item)
+
+
+class RecordWriter():
+    '''
+    Base class of the writers of machine-readable records. Each call of write(result), where result is a dictionary returned by pdf2bib_singlefile,
+    writes a record immediately, so only one record at a time is kept in memory. If filename is None, the records are written into stream (sys.stdout
+    by default), otherwise into the file filename, with the mode 'w' (via a temporary file, as for BibtexWriter) or 'a' (if supported by the format).
+
+        with JSONLinesWriter('records.jsonl') as writer:
+            for result in pdf2bib.iter_pdf2bib(folder):
+                writer.write(result)
+    '''
+    modes = ['w', 'a']
+
+    def __init__(self, filename=None, mode='w', encoding='utf-8', stream=None):
+        if not mode in self.modes:
+            raise ValueError(f"The input variable mode must be one of {self.modes}")
+        self.filename = os.path.abspath(filename) if filename else None
+        self.mode = mode
+        self.numb_entries = 0
+        self._temp_filename = None
+        if self.filename is None:
+            self._file = stream or sys.stdout
+        elif mode == 'a':
+            self._file = open(self.filename, 'a', encoding=encoding, newline='')
+        else:
+            self._file, self._temp_filename = _create_temp_file(self.filename, encoding)
+        self._begin()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, result):
+        '''
+        Writes the record of result (if there is any record to write).
+        '''
+        record = self.make(result)
+        if record is None:
+            return
+        self._write(json.dumps(record, ensure_ascii=False, default=json_default))
+        self._file.flush()
+        self.numb_entries += 1
+
+    def close(self):
+        if self._file is None:
+            return
+        self._end()
+        if self._temp_filename:
+            _commit_temp_file(self._file, self._temp_filename, self.filename)
+        elif self.filename:
+            self._file.close()
+        else:
+            self._file.flush()
+        self._file = None
+
+    def abort(self):
+        '''
+        Closes the writer without modifying the target file (in the mode 'w').
+        '''
+        if self._file is None:
+            return
+        if self._temp_filename:
+            self._file.close()
+            os.remove(self._temp_filename)
+        elif self.filename:
+            self._file.close()
+        self._file = None
+
+    def make(self, result):
+        raise NotImplementedError
+
+    def _begin(self):
+        pass
+
+    def _write(self, text):
+        raise NotImplementedError
+
+    def _end(self):
+        pass
+
+
+class JSONLinesWriter(RecordWriter):
+    '''
+    Writes one JSON dictionary per line (JSON Lines) for each result (see make_record).
+    '''
+    def make(self, result):
+        return make_record(result)
+
+    def _write(self, text):
+        self._file.write(text + "\n")
+
+
+class CSLJSONWriter(RecordWriter):
+    '''
+    Writes a CSL-JSON array, with one item per line for each result for which bibliographic data was found (see make_csl_item).
+    Since the output is a single JSON array, it cannot be appended to an existing file.
+    '''
+    modes = ['w']
+
+    def make(self, result):
+        return make_csl_item(result)
+
+    def _begin(self):
+        self._file.write("[")
+
+    def _write(self, text):
+        self._file.write(("," if self.numb_entries else "") + "\n" + text)
+
+    def _end(self):
+        self._file.write("\n]\n" if self.numb_entries else "]\n")
+
+
+FORMATS = {'jsonl': JSONLinesWriter, 'csl-json': CSLJSONWriter}
+
+def get_record_writer(output_format, filename=None, mode='w', stream=None):
+    '''
+    Returns the writer of the records in the format output_format (either 'jsonl' or 'csl-json'), see RecordWriter.
+    '''
+    if not output_format in FORMATS:
+        raise ValueError(f"The output format must be one of {list(FORMATS)}")
+    return FORMATS[output_format](filename, mode=mode, stream=stream)
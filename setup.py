@@ -22,4 +22,5 @@ setuptools.setup(name='pdf2bib',
       },
       packages=['pdf2bib'],
       install_requires= required_packages,
+      extras_require={'async': ['aiohttp']},
       zip_safe=False)
\ No newline at end of file
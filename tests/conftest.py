@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+import pdf2bib.config as config
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings():
+    '''
+    Applies, to each test, settings which keep it from writing into the pdf files, using the persistent caches of the user, or going through a running daemon.
+    '''
+    with config.settings(separator=os.path.sep, verbose=False, save_identifier_metadata=False, cache_enabled=False, identifier_cache_enabled=False,
+                         use_daemon=False, ratelimit_enabled=False, websearch=False) as settings:
+        yield settings
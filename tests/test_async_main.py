@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web
+pypdf = pytest.importorskip('pypdf')
+
+import pdf2bib.async_main as async_main
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+import pdf2bib.lookups as lookups
+import pdf2bib.main as main
+
+DOI = '10.1000/stub.2020'
+CITEPROC = {'type': 'article-journal', 'title': 'A stub paper', 'DOI': DOI, 'container-title': 'Journal of Stubs', 'volume': '12', 'page': '1-10',
+            'issued': {'date-parts': [[2020, 5]]}, 'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}]}
+
+
+class StubArchive():
+    '''
+    Local http server which answers the queries to dx.doi.org: DOI is valid, the DOIs starting with 10.1000/flaky are valid but the first 
+    answers are 503 errors, the DOIs starting with 10.1000/slow are answered after one second, and all other DOIs are not found.
+    '''
+    def __init__(self):
+        self.requests = []
+        self.failures = {}
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/{doi:.*}', self.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/"
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def handle(self, request):
+        doi = request.match_info['doi']
+        self.requests.append(doi)
+        if doi.startswith('10.1000/flaky') and self.failures.get(doi, 0) < 2:
+            self.failures[doi] = self.failures.get(doi, 0) + 1
+            return web.Response(status=503, text='503 Service Unavailable')
+        if doi.startswith('10.1000/slow'):
+            await asyncio.sleep(1)
+        if doi == DOI or doi.startswith('10.1000/flaky') or doi.startswith('10.1000/slow'):
+            return web.Response(text=json.dumps(dict(CITEPROC, DOI=doi)), content_type='application/json')
+        return web.Response(status=404, text='DOI Not Found')
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+@pytest.fixture
+def archive(monkeypatch):
+    archive = StubArchive()
+    monkeypatch.setattr(lookups, 'DXDOIORG_URL', archive.url) #Used by the queries of both the synchronous and the asynchronous functions
+    try:
+        yield archive
+    finally:
+        archive.close()
+
+def make_pdf(filename, doi):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    writer.add_metadata({'/doi': doi})
+    with open(filename, 'wb') as file:
+        writer.write(file)
+    return str(filename)
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'papers'
+    folder.mkdir()
+    make_pdf(folder / 'a.pdf', DOI)
+    make_pdf(folder / 'b.pdf', '10.1000/missing')
+    return folder
+
+
+def test_client_validates_doi(archive):
+    async def validate():
+        async with async_main.AsyncLookupClient() as client:
+            return await client.validate(DOI, 'doi')
+    assert json.loads(asyncio.run(validate()))['title'] == 'A stub paper'
+    assert archive.requests == [DOI]
+
+def test_client_returns_false_for_missing_doi(archive):
+    async def validate():
+        async with async_main.AsyncLookupClient() as client:
+            return await client.get_dxdoiorg('10.1000/missing')
+    assert asyncio.run(validate()) is False
+    assert archive.requests == ['10.1000/missing']
+
+@pytest.mark.parametrize('ratelimit_enabled', [False, True])
+def test_client_retries_unavailable_host(archive, ratelimit_enabled):
+    async def validate():
+        async with async_main.AsyncLookupClient() as client:
+            return await client.get_dxdoiorg('10.1000/flaky')
+    with config.settings(ratelimit_enabled=ratelimit_enabled, ratelimit_max_backoff=0):
+        text = asyncio.run(validate())
+    assert json.loads(text)['DOI'] == '10.1000/flaky'
+    assert archive.requests == ['10.1000/flaky'] * 3
+
+def test_client_gives_up_after_timeout(archive):
+    async def validate():
+        async with async_main.AsyncLookupClient(timeout=0.2) as client:
+            return await client.get_dxdoiorg('10.1000/slow')
+    start = time.perf_counter()
+    assert asyncio.run(validate()) is None
+    assert time.perf_counter() - start < 1
+
+def test_pdf2bib_singlefile_async(archive, folder):
+    result = asyncio.run(async_main.pdf2bib_singlefile_async(str(folder / 'a.pdf')))
+    assert result['identifier'] == DOI and result['method'] == 'document_infos'
+    assert result['metadata']['title'] == 'A stub paper'
+    assert 'Jane Doe and John Roe' in result['bibtex']
+
+def test_pdf2bib_async_folder(archive, folder):
+    results = asyncio.run(async_main.pdf2bib_async(str(folder), concurrency=2))
+    assert [result['path'] for result in results] == [str(folder / 'a.pdf'), str(folder / 'b.pdf')]
+    assert results[0]['identifier'] == DOI
+    assert results[1]['identifier'] is None and not results[1]['bibtex']
+
+def test_async_results_match_sync_results(archive, folder):
+    #The synchronous functions send the queries through ratelimit.get (instead of the functions of pdf2doi) only when the rate limits are enabled
+    with config.settings(ratelimit_enabled=True):
+        sync_results = main.pdf2bib(str(folder))
+        async_results = asyncio.run(async_main.pdf2bib_async(str(folder)))
+    for sync_result, async_result in zip(sync_results, async_results, strict=True):
+        for key in ('path', 'identifier', 'identifier_type', 'method', 'validation_info', 'metadata', 'bibtex'):
+            assert sync_result[key] == async_result[key], key
+
+@pytest.mark.parametrize('timeouts', [{'timeout': 0.3}, {'batch_timeout': 0.3}])
+def test_pdf2bib_async_deadline(archive, folder, timeouts):
+    make_pdf(folder / 'c.pdf', '10.1000/slow')
+    start = time.perf_counter()
+    results = asyncio.run(async_main.pdf2bib_async(str(folder), **timeouts))
+    assert time.perf_counter() - start < 1
+    statuses = {result['path']: result.get('status') for result in results}
+    assert statuses == {str(folder / 'a.pdf'): None, str(folder / 'b.pdf'): None, str(folder / 'c.pdf'): deadlines.TIMEOUT_STATUS}
+
+def test_pdf2bib_async_deadline_from_settings(archive, folder):
+    make_pdf(folder / 'c.pdf', '10.1000/slow')
+    results = asyncio.run(async_main.pdf2bib_async(str(folder), settings={'file_timeout': 0.3}))
+    assert [result['path'] for result in results if result.get('status') == deadlines.TIMEOUT_STATUS] == [str(folder / 'c.pdf')]
@@ -0,0 +1,160 @@
+import logging
+import random
+
+import pytest
+
+bibtexparser = pytest.importorskip('bibtexparser')
+
+import pdf2bib.bibtex_makers as bibtex_makers
+import pdf2bib.config as config
+from pdf2bib.compact import Authors
+
+XBIBTEX = (" @article{Doe_2020, title={Light-matter {I}nteraction in {{nested {deep}}} cavities}, volume={12}, ISSN={1234-5678}, "
+           "url={http://dx.doi.org/10.1000/stub.1}, DOI={10.1000/stub.1}, number={2}, journal={Journal of Stubs}, publisher={Stub Publishing}, "
+           "author={Doe, Jane and Roe, John}, year={2020}, month=may, pages={1-13} }\n")
+
+#Entries in the subset of the bibtex syntax supported by the fast parser (bibtex_makers._parse_single_bibtex_entry)
+SUPPORTED = [XBIBTEX,
+             '@article{a, title={\t x}}', '@article{a,\ttitle =\t{x\ty},\n\tyear = 2020}', '@article{a, title={l1\n\t  l2\tz}}', '@article{a, title="q\tq"}',
+             '﻿\t@article{a, title={\tx}}', '@article{a, title={a\r\n\tb}}', '@article{a, title={a\n\n  b}}', '@article{a, title={\n a}}',
+             '@article{a, title={{nested {deep}}}, note={{}}}', '@article{a, title={}, note=""}',
+             '@article(a, title={x (y) z})', '@ARTICLE ( a , TITLE = "t" , )', '@misc{a, month = jan, Month = {5}, year = 2019}',
+             '@article{a, title={first}, Title={second}}', '@book{a, x-field.(1)+ = {odd name},\n}', '@article{a, title = {x} }\n']
+#Entries which must be passed to bibtexparser
+UNSUPPORTED = ['@string{j = "Journal"}\n@article{k, journal = j}', '@article{k, title = {a} # " b"}', '@article{k, title = {a\tb} # {\tc}}',
+               '@article{k, month = foo}', '@weird{k, title = {t}}', '@article{k, title = {t}}\n@misc{k2, title = {u}}', '@article{k title = {t}}',
+               '@article{k,}', '@article{k, title = {t} junk}', '@article{k, title = {unbalanced}', 'no entry at all', '@comment{a comment}',
+               '@article{k, title = "a}b"}', '@article{k, year = 2019a}', 'junk @article{k, title = {t}}', '@article{a, title="{"}"}',
+               '@article{a, title="He said {"}hi{"}"}']
+
+VALUES = ['Light-matter {I}nteraction', 'Caf{\\\'e} {\\"u}ber {{nested {deep}}} braces', '100\\% sure \\& more', 'He said {"}hi{"}', '',
+          '{}', 'line1\n    line2\n\n\tline3  ', ' padded ', 'a\r\nb', 'Zoë and José', 'x   y', 'tab\there', '\tleading\ttabs\t', 'a\n\t\tb\tc']
+
+
+@pytest.fixture(autouse=True)
+def quiet_bibtexparser():
+    logging.disable(logging.WARNING) #bibtexparser logs a warning for each non-standard entry
+    yield
+    logging.disable(logging.NOTSET)
+
+def parse_with(function, text):
+    #Returns the fields of the entry as a list (so that the order of the keys is compared as well), or the type of the exception raised
+    try:
+        return list(function(text).items())
+    except Exception as e:
+        return type(e)
+
+def expected(text):
+    return parse_with(lambda text: bibtexparser.loads(text).entries[0], text)
+
+def make_variant(rng):
+    #Returns a random entry in the subset of the bibtex syntax supported by the fast parser
+    fields = [('title', rng.choice(VALUES)), ('volume', str(rng.randint(1, 200))), ('DOI', f"10.1000/stub.{rng.randint(1, 1000)}"),
+              ('author', 'Doe, Jane and Roe, John'), ('note', rng.choice(VALUES)), ('abstract', rng.choice(VALUES))]
+    rng.shuffle(fields)
+    fields = [(name.upper() if rng.random() < 0.2 else name,
+               f'"{value}"' if rng.random() < 0.3 and not any(char in value for char in '"{}') else '{' + value + '}') for name, value in fields]
+    fields.append(('year', rng.choice(['2020', '{2020}'])))
+    fields.append(('Month', rng.choice(['jan', 'Feb', 'MAR', '{5}', '7'])))
+    if rng.random() < 0.3:
+        fields.append((rng.choice(['title', 'Title', 'note']), '{repeated}'))
+    separator = rng.choice([', ', ',\n\t', ' ,\n  ', ',', ',\t'])
+    space = lambda: rng.choice(['', ' ', '\t'])
+    opener, closer = rng.choice([('{', '}'), ('(', ')')])
+    text = (f"@{space()}{rng.choice(['article', 'ARTICLE', 'Misc', 'inproceedings', 'book'])}{space()}{opener}{space()}key2020{space()}, "
+            + separator.join(f"{name}{space()}={space()}{value}" for name, value in fields) + rng.choice(['', ',', ' ,\n']) + closer)
+    return rng.choice(['', ' ', '\n', '\t', '﻿']) + text + rng.choice(['', '\n', ' \n\n'])
+
+
+@pytest.mark.parametrize('text', SUPPORTED)
+def test_supported_entries_match_bibtexparser(text):
+    assert bibtex_makers._parse_single_bibtex_entry(text) is not None
+    assert parse_with(bibtex_makers.parse_bibtex_entry, text) == expected(text)
+
+@pytest.mark.parametrize('text', UNSUPPORTED)
+def test_unsupported_entries_are_passed_to_bibtexparser(text):
+    assert bibtex_makers._parse_single_bibtex_entry(text) is None
+    assert parse_with(bibtex_makers.parse_bibtex_entry, text) == expected(text)
+
+def test_tabs_are_expanded_as_in_bibtexparser():
+    assert bibtex_makers.parse_bibtex_entry('@article{a, title={\t x}}')['title'] == '      x'
+
+def test_random_entries_match_bibtexparser():
+    rng = random.Random(0)
+    for _ in range(500):
+        text = make_variant(rng)
+        assert bibtex_makers._parse_single_bibtex_entry(text) is not None, text
+        assert parse_with(bibtex_makers.parse_bibtex_entry, text) == expected(text), text
+
+
+AUTHORS = [[{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}, {'given': 'Ann', 'family': 'Poe'}],
+           [{'given': 'Zoë', 'family': 'Müller-Lüdenscheidt'}, {'family': 'Ångström'}, {'given': 'Only given'}],
+           [{'given': 'Jos{\\\'e}', 'family': '{\\v{C}}apek Jr'}], [{'given': 'No', 'family': 'Family key'}, {'name': 'A collaboration'}],
+           'Jane Doe and John Roe and Ann Poe', 'Single Author', '', []]
+
+def make_metadata(rng):
+    #Returns random metadata in the format generated by pdf2bib (see bibtex_makers.parse_bib_from_dxdoiorg)
+    data = {}
+    fields = [('title', rng.choice(['Light-matter {I}nteraction', "Caf{\\'e} {\\\"u}ber", 'Zoë and José: a story', '', 'Title, with: colons\nand lines',
+                                    "O'Brien's - hyphenated"])),
+              ('year', rng.choice([2020, '2021', ''])), ('journal', rng.choice(['Journal of Stubs', 'Physical Review {B}', None])),
+              ('url', rng.choice(['http://dx.doi.org/10.1000%2Fstub', 'https://arxiv.org/abs/2101.00001v2'])), ('doi', '10.1000/stub'),
+              ('ENTRYTYPE', rng.choice(['article', 'misc', 'inproceedings'])), ('author', rng.choice(AUTHORS))]
+    rng.shuffle(fields)
+    for name, value in fields:
+        if rng.random() < 0.8: #Some fields are missing
+            data[name] = value
+    if isinstance(data.get('author'), list) and data['author'] and rng.random() < 0.5:
+        data['author'] = Authors.from_list(data['author'])
+    return data
+
+@pytest.mark.parametrize('max_authors', [0, 1, 2, 5])
+def test_make_bibtex_many_matches_make_bibtex(max_authors):
+    rng = random.Random(max_authors)
+    metadata_list = [make_metadata(rng) for _ in range(300)]
+    metadata_list += [dict(metadata_list[0]), dict(metadata_list[0])] #Entries with the same ID
+    with config.settings(max_authors=max_authors):
+        entries = list(bibtex_makers.make_bibtex_many(metadata_list))
+        assert entries == [bibtex_makers.make_bibtex(data) for data in metadata_list]
+    assert any(' and others}' in entry for entry in entries) == (max_authors in (1, 2))
+
+def test_make_bibtex_many_rejects_invalid_authors():
+    with pytest.raises(TypeError):
+        list(bibtex_makers.make_bibtex_many([{'title': 'x', 'author': 42}]))
+
+@pytest.mark.parametrize('text, value, rest', [('{a {b} c}, x', 'a {b} c', ', x'), ('"q {x} q", x', 'q {x} q', ', x'), ('2020}', '2020', '}'),
+                                               ('jan}', 'January', '}'), ('{l1\n    l2}', 'l1\nl2', ''), ('{}', '', ''),
+                                               ('macro, x', None, 'macro, x'), ('{unbalanced', None, '{unbalanced')])
+def test_parse_bibtex_value(text, value, rest):
+    parsed, position = bibtex_makers.parse_bibtex_value('title = ' + text, len('title = '))
+    assert parsed == value
+    assert ('title = ' + text)[position:] == rest
+
+NAMES = ['Jane Doe', 'John Roe', 'Ann Poe', 'Mary Ann Loe']
+NAMES_LIST = [{'given': name.rpartition(' ')[0], 'family': name.rpartition(' ')[2]} for name in NAMES]
+
+@pytest.mark.parametrize('authors', [' and '.join(NAMES), NAMES_LIST, Authors.from_list(NAMES_LIST)], ids=['string', 'list', 'Authors'])
+@pytest.mark.parametrize('max_authors', [0, 1, 3, 4, 5])
+def test_format_authors_keeps_the_first_authors(authors, max_authors):
+    expected = NAMES if max_authors == 0 or max_authors >= len(NAMES) else NAMES[:max_authors] + ['others']
+    assert bibtex_makers.format_authors(authors, max_authors) == ' and '.join(expected)
+    with config.settings(max_authors=max_authors): #By default, max_authors is read from the settings
+        assert bibtex_makers.format_authors(authors) == ' and '.join(expected)
+
+def test_format_authors_skips_authors_without_names():
+    authors = NAMES_LIST[:1] + [{'name': 'Not a name'}] + NAMES_LIST[1:]
+    assert bibtex_makers.format_authors(authors, 0) == ' and '.join(NAMES)
+    assert bibtex_makers.format_authors(authors, 2) == 'Jane Doe and John Roe and others'
+
+def test_authors_of_large_collaborations_are_truncated():
+    items = {'title': 'A stub preprint', 'link': 'http://arxiv.org/abs/2101.00001v1', 'published': '2021-01-01T10:00:00Z',
+             'authors': [{'name': f'Given{index} Middle{index} Family{index}'} for index in range(3000)]}
+    metadata = bibtex_makers.parse_bib_from_exportarxivorg(items)
+    assert len(metadata['author']) == 3000
+    assert metadata['author'][1] == {'given': 'Given1 Middle1', 'family': 'Family1'} #Each name is split at the last space
+    with config.settings(max_authors=2):
+        bibtex = bibtex_makers.make_bibtex(metadata)
+    assert '\tauthor = {Given0 Middle0 Family0 and Given1 Middle1 Family1 and others}' in bibtex
+    assert bibtex.startswith('@article{family02021a,')
+    with config.settings(max_authors=0):
+        assert bibtex_makers.make_bibtex(metadata).count(' and ') == 2999
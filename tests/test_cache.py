@@ -0,0 +1,59 @@
+import pytest
+
+import pdf2bib.cache as cache
+import pdf2bib.config as config
+import pdf2bib.main as main
+
+RESULT = {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'method': 'stub', 'validation_info': {'title': 'A stub paper'},
+          'metadata': {'title': 'A stub paper'}, 'bibtex': '@article{stub2020,\n\ttitle = {A stub paper}\n}'}
+
+
+@pytest.fixture
+def result_cache(tmp_path):
+    main._import_pdf2doi() #So that the settings of pdf2doi applied via config.settings are seen by the cache
+    return cache.ResultCache(str(tmp_path / 'cache.sqlite'))
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    filename = tmp_path / 'paper.pdf'
+    filename.write_bytes(b'%PDF-1.4 stub')
+    return str(filename)
+
+
+def test_result_cache_is_opt_in():
+    assert config.get_params()['cache_enabled'] is False
+
+def test_result_is_reused_with_the_same_settings(result_cache, pdf_file):
+    with config.settings(websearch=False, max_authors=0):
+        result_cache.put(pdf_file, RESULT)
+    with config.settings(websearch=False, max_authors=0):
+        assert result_cache.get(pdf_file)['bibtex'] == RESULT['bibtex']
+
+@pytest.mark.parametrize('name, value', [('websearch', True), ('webvalidation', False), ('replace_arxivID_by_DOI_when_available', False),
+                                         ('numb_results_google_search', 1), ('N_characters_in_pdf', 10), ('method_dxdoiorg', 'text/bibliography; style=bibtex'),
+                                         ('max_authors', 3), ('offline_only', True)])
+def test_result_is_not_reused_with_different_settings(result_cache, pdf_file, name, value):
+    base = {'websearch': False, 'webvalidation': True, 'replace_arxivID_by_DOI_when_available': True, 'numb_results_google_search': 6,
+            'N_characters_in_pdf': 1000, 'method_dxdoiorg': 'application/citeproc+json', 'max_authors': 0, 'offline_only': False}
+    with config.settings(base):
+        result_cache.put(pdf_file, RESULT)
+    with config.settings(base, **{name: value}):
+        assert result_cache.get(pdf_file) is None
+    with config.settings(base):
+        assert result_cache.get(pdf_file) is not None
+
+def test_invalidate_works_with_the_cache_disabled(tmp_path, pdf_file):
+    main._import_pdf2doi()
+    with config.settings(cache_enabled=True, cache_directory=str(tmp_path / 'cache')):
+        cache.get_result_cache().put(pdf_file, RESULT)
+        assert cache.get_result_cache().get(pdf_file) is not None
+    with config.settings(cache_enabled=False, cache_directory=str(tmp_path / 'cache')):
+        assert cache.invalidate(pdf_file) == 1
+        assert cache.invalidate(pdf_file) == 0
+    with config.settings(cache_enabled=True, cache_directory=str(tmp_path / 'cache')):
+        assert cache.get_result_cache().get(pdf_file) is None
+
+def test_invalidate_without_a_cache(tmp_path, pdf_file):
+    with config.settings(cache_directory=str(tmp_path / 'cache')):
+        assert cache.invalidate(pdf_file) == 0
+    assert not (tmp_path / 'cache').exists()
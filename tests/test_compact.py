@@ -0,0 +1,100 @@
+import json
+import pickle
+
+import pytest
+
+import pdf2bib.compact as compact
+import pdf2bib.config as config
+import pdf2bib.writers as writers
+from pdf2bib.bibtex_makers import make_bibtex
+
+AUTHORS = [{'ORCID': 'http://orcid.org/0000-0002-1825-0097', 'given': 'Jane', 'family': 'Doe', 'sequence': 'first', 'affiliation': [{'name': 'Stub University'}]},
+           {'given': 'John', 'family': 'Roe', 'sequence': 'additional', 'affiliation': []},
+           {'given': 'Ann', 'family': 'Poe', 'sequence': 'additional', 'affiliation': []},
+           {'family': 'Collaboration'}]
+CITEPROC = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]}, 'author': AUTHORS}
+METADATA = {'title': 'A stub paper', 'volume': '12', 'issue': '', 'page': '1-13', 'publisher': 'Stub Publishing', 'url': 'http://dx.doi.org/10.1000/stub',
+            'doi': '10.1000/stub', 'journal': 'Journal of Stubs', 'year': 2020, 'month': 5, 'author': AUTHORS}
+
+
+def make_dict_result():
+    return {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(CITEPROC), 'path': '/papers/stub.pdf',
+            'method': 'stub', 'metadata': METADATA, 'bibtex': make_bibtex(METADATA), 'timings': {'total': 0.5}}
+
+
+def test_authors_behave_as_a_list():
+    authors = compact.Authors.from_list(AUTHORS)
+    assert isinstance(authors, compact.Authors)
+    assert len(authors) == 4
+    assert authors == AUTHORS and list(authors) == AUTHORS #The keys other than given and family are kept
+    assert authors[0]['ORCID'] == AUTHORS[0]['ORCID'] and authors[-1] == {'family': 'Collaboration'}
+    assert authors[1:3] == AUTHORS[1:3]
+    assert list(authors.names()) == ['Jane Doe', 'John Roe', 'Ann Poe', ' Collaboration']
+    with pytest.raises(IndexError):
+        authors[4]
+
+def test_authors_store_identical_extra_keys_once():
+    authors = compact.Authors.from_list(AUTHORS)
+    assert authors._extras[1] is authors._extras[2]
+    assert authors._extras[3] is None
+    assert compact.Authors.from_list([{'given': 'Jane', 'family': 'Doe'}])._extras is None
+
+def test_authors_which_cannot_be_compacted_are_kept():
+    for authors in ('Jane Doe and John Roe', [{'name': 'Jane Doe'}], ['Jane Doe']):
+        assert compact.Authors.from_list(authors) is authors
+
+def test_authors_are_pickled_and_converted_to_json():
+    authors = compact.Authors.from_list(AUTHORS)
+    assert pickle.loads(pickle.dumps(authors)) == authors
+    assert json.loads(json.dumps({'author': authors}, default=compact.json_default)) == {'author': AUTHORS}
+
+def test_compact_metadata_gives_the_same_bibtex():
+    metadata = compact.compact_metadata(METADATA)
+    assert isinstance(metadata['author'], compact.Authors)
+    assert metadata == METADATA
+    for max_authors in (0, 2):
+        with config.settings(max_authors=max_authors):
+            assert make_bibtex(metadata) == make_bibtex(METADATA)
+
+@pytest.mark.parametrize('mode', compact.VALIDATION_INFO_MODES)
+def test_result_behaves_as_a_dictionary(mode):
+    original = make_dict_result()
+    result = compact.Result(original, validation_info=mode)
+    expected = dict(original, validation_info=None if mode == 'drop' else original['validation_info'])
+    assert dict(result) == expected
+    assert list(result) == list(expected) and len(result) == len(expected)
+    assert result['bibtex'] == original['bibtex'] and result.get('status') is None and 'path' in result
+    assert json.loads(json.dumps(dict(result), default=compact.json_default))['metadata'] == json.loads(json.dumps(METADATA))
+    result['status'] = 'timeout' #Keys which are not fields are stored separately
+    assert result['status'] == 'timeout' and len(result) == len(expected) + 1
+    del result['status'], result['timings']
+    assert not 'timings' in result and not 'status' in result
+    with pytest.raises(KeyError):
+        result['timings']
+    with pytest.raises(KeyError):
+        del result['timings']
+    assert dict(pickle.loads(pickle.dumps(result))) == dict(result)
+
+def test_result_compresses_validation_info():
+    result = compact.Result(make_dict_result(), validation_info='compress')
+    assert isinstance(result.validation_info, compact._Compressed)
+    assert result['validation_info'] == json.dumps(CITEPROC)
+
+def test_result_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        compact.Result(make_dict_result(), validation_info='unknown')
+
+def test_make_result_is_opt_in():
+    original = make_dict_result()
+    assert compact.make_result(original) is original
+    with config.settings(compact_results=True):
+        assert isinstance(compact.make_result(original), compact.Result)
+
+@pytest.mark.parametrize('mode', compact.VALIDATION_INFO_MODES)
+def test_records_of_compact_results_are_the_same(mode):
+    result = compact.Result(make_dict_result(), validation_info=mode)
+    item = writers.make_csl_item(result)
+    assert item['author'][0]['ORCID'] == AUTHORS[0]['ORCID'] #Also when the item is made from the metadata (mode 'drop')
+    if mode != 'drop':
+        assert item == writers.make_csl_item(make_dict_result())
+    assert json.dumps(writers.make_record(result), default=compact.json_default) == json.dumps(writers.make_record(dict(result)), default=compact.json_default)
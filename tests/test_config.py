@@ -0,0 +1,29 @@
+import configparser
+import json
+import os
+import subprocess
+import sys
+
+import pdf2bib
+
+PATH_SETTINGS_FILE = os.path.join(os.path.dirname(pdf2bib.__file__), 'settings.ini')
+
+
+def default_params():
+    #The defaults in the code, without the values read from settings.ini
+    code = ("import json\n"
+            "import pdf2bib.config as config\n"
+            "config.ReadParamsINIfile = staticmethod(lambda: None)\n"
+            "print(json.dumps(config.get_params()))")
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+def test_defaults_match_settings_file():
+    config_object = configparser.ConfigParser()
+    config_object.optionxform = str
+    config_object.read(PATH_SETTINGS_FILE)
+    values = dict(config_object['DEFAULT'])
+    defaults = default_params()
+    assert set(values) == set(defaults)
+    values.pop('separator'), defaults.pop('separator') #It depends on the OS
+    assert values == {name: str(value) for name, value in defaults.items()}
@@ -0,0 +1,88 @@
+import json
+import logging
+import threading
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.daemon as daemon
+import pdf2bib.main as main
+
+CITEPROC = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]},
+            'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}]}
+
+
+@pytest.fixture
+def running_daemon(tmp_path, monkeypatch, isolated_settings):
+    '''
+    Starts a daemon in this process (with pdf2doi.pdf2doi replaced by a stand-in), and yields the list where the stand-in stores the settings of pdf2doi
+    seen by each call.
+    '''
+    pdf2doi = main._import_pdf2doi()
+    seen = []
+    def stub_pdf2doi(filename):
+        seen.append({name: pdf2doi.config.get(name) for name in ('websearch', 'webvalidation', 'method_dxdoiorg', 'replace_arxivID_by_DOI_when_available')})
+        logging.getLogger("pdf2doi").info(f"Stand-in analysis of {filename}")
+        return {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(CITEPROC), 'path': filename, 'method': 'stub'}
+    monkeypatch.setattr(pdf2doi, 'pdf2doi', stub_pdf2doi)
+    with config.settings(cache_directory=str(tmp_path / 'cache')):
+        server = daemon.start_server(0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield seen
+        finally:
+            server.shutdown()
+            daemon.stop_server(server)
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    filename = tmp_path / 'paper.pdf'
+    filename.write_bytes(b'%PDF-1.4 stub')
+    return str(filename)
+
+
+def test_daemon_is_opt_in():
+    assert config.get_params()['use_daemon'] is False
+
+def test_effective_settings_include_pdf2doi():
+    with config.settings(websearch=False, max_authors=3):
+        settings = daemon.effective_settings()
+    assert settings['websearch'] is False and settings['max_authors'] == 3
+    for name in ('webvalidation', 'method_dxdoiorg', 'replace_arxivID_by_DOI_when_available', 'verbose', 'cache_enabled'):
+        assert name in settings
+
+def test_request_uses_the_settings_of_the_client(running_daemon, pdf_file):
+    with config.settings(websearch=False, webvalidation=False, replace_arxivID_by_DOI_when_available=False, max_authors=1):
+        results = list(daemon.request(pdf_file))
+    assert len(results) == 1
+    assert 'Jane Doe and others' in results[0]['bibtex']
+    assert len(running_daemon) == 1
+    assert running_daemon[0]['websearch'] is False and running_daemon[0]['webvalidation'] is False
+    assert running_daemon[0]['replace_arxivID_by_DOI_when_available'] is False
+
+    with config.settings(websearch=True, webvalidation=True):
+        list(daemon.request(pdf_file))
+    assert running_daemon[1]['websearch'] is True and running_daemon[1]['webvalidation'] is True
+
+def test_request_sends_back_log_messages(running_daemon, pdf_file):
+    with config.settings(verbose=True):
+        connection, response = daemon._post('/pdf2bib', {'target': pdf_file, 'settings': daemon.effective_settings()})
+        lines = [json.loads(line) for line in response]
+        connection.close()
+    assert any(line.get('log') == f"Stand-in analysis of {pdf_file}" and line.get('logger') == 'pdf2doi' for line in lines)
+    assert [line['path'] for line in lines if 'path' in line] == [pdf_file]
+
+    with config.settings(verbose=False):
+        connection, response = daemon._post('/pdf2bib', {'target': pdf_file, 'settings': daemon.effective_settings()})
+        lines = [json.loads(line) for line in response]
+        connection.close()
+    assert not any('log' in line for line in lines)
+
+def test_request_with_different_process_settings_is_refused(running_daemon, pdf_file):
+    with config.settings(cache_max_size_mb=config.get('cache_max_size_mb') + 1):
+        assert daemon.request(pdf_file) is None
+    assert running_daemon == []
+
+def test_clear_cache_reaches_the_daemon(running_daemon):
+    assert daemon.clear_cache() is True
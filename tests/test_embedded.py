@@ -0,0 +1,60 @@
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.embedded as embedded
+from pdf2bib.bibtex_makers import make_bibtex
+
+pypdf = pytest.importorskip('pypdf')
+
+DOI = '10.1000/stub.2020'
+METADATA = {'title': 'A stub paper', 'year': '2020', 'ENTRYTYPE': 'article',
+            'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}, {'given': 'Ann', 'family': 'Poe'}]}
+
+
+def make_result(filename):
+    return {'identifier': DOI, 'identifier_type': 'DOI', 'validation_info': None, 'path': filename, 'method': 'stub',
+            'metadata': METADATA, 'bibtex': make_bibtex(METADATA)}
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    writer.add_metadata({'/Title': 'A stub paper', embedded.IDENTIFIER_KEY: DOI})
+    filename = str(tmp_path / 'paper.pdf')
+    with open(filename, 'wb') as file:
+        writer.write(file)
+    return filename
+
+
+def test_written_result_is_read_back(pdf_file):
+    with config.settings(embed_metadata=True, max_authors=0):
+        assert embedded.write_result(pdf_file, make_result(pdf_file))
+        result = embedded.read_result(pdf_file)
+    assert result['identifier'] == DOI
+    assert result['method'] == embedded.METHOD
+    assert result['metadata'] == METADATA
+    assert result['bibtex'] == make_result(pdf_file)['bibtex']
+    reader = pypdf.PdfReader(pdf_file)
+    assert len(reader.pages) == 1
+    assert reader.metadata['/Title'] == 'A stub paper' #The other entries of the metadata are kept
+
+def test_bibtex_is_made_again_with_a_different_max_authors(pdf_file):
+    with config.settings(embed_metadata=True, max_authors=0):
+        assert embedded.write_result(pdf_file, make_result(pdf_file))
+    with config.settings(max_authors=1):
+        bibtex = embedded.read_result(pdf_file)['bibtex']
+        assert bibtex == make_bibtex(METADATA)
+    assert 'author = {Jane Doe and others}' in bibtex
+
+def test_result_read_from_the_file_is_not_written_again(pdf_file):
+    with config.settings(embed_metadata=True):
+        assert not embedded.write_result(pdf_file, dict(make_result(pdf_file), method=embedded.METHOD))
+    assert embedded.read_result(pdf_file) is None
+
+def test_invalid_file_is_left_unchanged(tmp_path):
+    filename = tmp_path / 'paper.pdf'
+    filename.write_bytes(b'not a pdf file')
+    with config.settings(embed_metadata=True):
+        assert not embedded.write_result(str(filename), make_result(str(filename)))
+    assert filename.read_bytes() == b'not a pdf file'
+    assert [path.name for path in tmp_path.iterdir()] == ['paper.pdf'] #No temporary file is left behind
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.incremental as incremental
+import pdf2bib.main as main
+import pdf2bib.writers as writers
+
+
+def make_bibtex(key, doi, title):
+    return f"@article{{{key},\n\ttitle = {{{title}}},\n\tdoi = {{{doi}}},\n\tyear = {{2020}}\n}}"
+
+def stub_iter_files(entries):
+    #Replaces main._iter_files, returning for each pdf file the bibtex entry in entries (indexed by file name)
+    def iter_files(files, workers=None):
+        for file in files:
+            yield {'path': file, 'identifier': None, 'identifier_type': None, 'validation_info': None, 'method': None, 'metadata': None,
+                   'bibtex': entries[os.path.basename(file)]}
+    return iter_files
+
+def read_entries(filename):
+    with open(filename, 'r', encoding='utf-8') as file:
+        return {key: text for key, text in writers.iter_bibtex_entries(file) if key}
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def merge_index(request):
+    with config.settings(merge_index=request.param):
+        yield request.param
+
+
+def test_colliding_keys_are_disambiguated(tmp_path, monkeypatch):
+    for name in ('first.pdf', 'second.pdf'):
+        (tmp_path / name).write_bytes(b'%PDF-1.4 ' + name.encode())
+    entries = {'first.pdf': make_bibtex('smith2020quantum', '10.1000/first', 'Quantum dots in the first paper'),
+               'second.pdf': make_bibtex('smith2020quantum', '10.1000/second', 'Quantum wires in the second paper')}
+    monkeypatch.setattr(main, '_iter_files', stub_iter_files(entries))
+
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+    bib = read_entries(tmp_path / 'refs.bib')
+    assert sorted(bib) == ['smith2020quantum', 'smith2020quantuma']
+    assert {'10.1000/first', '10.1000/second'} == {text.split('doi = {')[1].split('}')[0] for text in bib.values()}
+    manifest = incremental.Manifest(tmp_path / 'refs.bib')
+    assert manifest.keys() == set(bib)
+
+    #Deleting one of the two files removes only its own entry
+    deleted_key = manifest.files['first.pdf']['key']
+    os.remove(tmp_path / 'first.pdf')
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+    assert set(read_entries(tmp_path / 'refs.bib')) == set(bib) - {deleted_key}
+
+def test_modified_file_replaces_its_entry(tmp_path, monkeypatch):
+    (tmp_path / 'paper.pdf').write_bytes(b'%PDF-1.4 version 1')
+    entries = {'paper.pdf': make_bibtex('doe2020light', '10.1000/light', 'Light-matter interaction, preprint')}
+    monkeypatch.setattr(main, '_iter_files', stub_iter_files(entries))
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+
+    (tmp_path / 'paper.pdf').write_bytes(b'%PDF-1.4 version 2, published')
+    entries['paper.pdf'] = make_bibtex('doe2020light', '10.1000/light', 'Light-matter interaction, published')
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+    bib = read_entries(tmp_path / 'refs.bib')
+    assert list(bib) == ['doe2020light']
+    assert 'published' in bib['doe2020light']
+
+def test_modified_file_keeps_its_key(tmp_path, monkeypatch, merge_index):
+    (tmp_path / 'paper.pdf').write_bytes(b'%PDF-1.4 version 1')
+    (tmp_path / 'other.pdf').write_bytes(b'%PDF-1.4 other')
+    entries = {'paper.pdf': make_bibtex('doe2020light', '10.1000/wrong', 'Light-matter interaction, found with a wrong DOI'),
+               'other.pdf': make_bibtex('roe2019dark', '10.1000/dark', 'Dark-matter interaction in another paper')}
+    monkeypatch.setattr(main, '_iter_files', stub_iter_files(entries))
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+
+    #The new entry of the file is a different work with the same key: it takes the key of the old entry of the same file, without suffix
+    (tmp_path / 'paper.pdf').write_bytes(b'%PDF-1.4 version 2')
+    entries['paper.pdf'] = make_bibtex('doe2020light', '10.1000/light', 'Light-matter interaction, the right paper')
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+    bib = read_entries(tmp_path / 'refs.bib')
+    assert sorted(bib) == ['doe2020light', 'roe2019dark']
+    assert '10.1000/light' in bib['doe2020light']
+    assert incremental.Manifest(tmp_path / 'refs.bib').files['paper.pdf']['key'] == 'doe2020light'
+
+    #The DOI of the old entry is no longer in the index, so a new file with that DOI gets its own entry
+    (tmp_path / 'wrong.pdf').write_bytes(b'%PDF-1.4 wrong')
+    entries['wrong.pdf'] = make_bibtex('poe2020wrong', '10.1000/wrong', 'The paper with the wrong DOI')
+    incremental.update_bibtex_file(str(tmp_path), 'refs.bib')
+    assert sorted(read_entries(tmp_path / 'refs.bib')) == ['doe2020light', 'poe2020wrong', 'roe2019dark']
@@ -0,0 +1,184 @@
+import contextvars
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.main as main
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    '''
+    Folder with three pdf files. pdf2bib_singlefile is replaced by a stand-in which returns, for each file, the settings seen while processing it.
+    '''
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF-1.4 stub')
+    def singlefile(filename, settings=None):
+        return {'path': filename, 'bibtex': None, 'timings': {}, 'max_authors': config.get('max_authors'), 'thread': threading.current_thread().name}
+    monkeypatch.setattr(main, 'pdf2bib_singlefile', singlefile)
+    return tmp_path
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_iter_pdf2bib_applies_settings(folder, workers):
+    results = main.iter_pdf2bib(str(folder), workers=workers, settings={'max_authors': 2})
+    assert config.get('max_authors') == 0 #Nothing is applied until the generator runs
+    seen = []
+    for result in results:
+        seen.append((result['max_authors'], config.get('max_authors'))) #The consumer keeps its own settings between the results
+    assert seen == [(2, 0)] * 3
+
+def test_iter_pdf2bib_settings_in_worker_threads(folder):
+    results = list(main.iter_pdf2bib(str(folder), workers=3, ordered=False, settings={'max_authors': 4}))
+    assert {result['max_authors'] for result in results} == {4}
+    assert all(result['thread'] != threading.current_thread().name for result in results)
+
+def test_iter_pdf2bib_settings_are_bound_at_call(folder):
+    with config.settings(max_authors=5, verbose=False):
+        results = main.iter_pdf2bib(str(folder), settings={'merge_duplicates': 'keep'})
+    with config.settings(max_authors=7):
+        assert [result['max_authors'] for result in results] == [5] * 3
+
+def test_iter_pdf2bib_consumed_in_another_thread(folder):
+    results = main.iter_pdf2bib(str(folder), settings={'max_authors': 3})
+    first = next(results)
+    rest = []
+    thread = threading.Thread(target=lambda: rest.extend(results))
+    thread.start()
+    thread.join()
+    assert [first['max_authors']] + [result['max_authors'] for result in rest] == [3] * 3
+
+def test_iter_pdf2bib_closed_early(folder):
+    results = main.iter_pdf2bib(str(folder), workers=2, settings={'max_authors': 3})
+    assert next(results)['max_authors'] == 3
+    results.close()
+    assert config.get('max_authors') == 0
+
+def test_iter_pdf2bib_settings_in_worker_processes(folder):
+    results = list(main.iter_pdf2bib(str(folder), workers=2, executor='process', settings={'max_authors': 4}))
+    assert [result['max_authors'] for result in results] == [4] * 3
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+@pytest.fixture
+def log_messages():
+    handler = RecordingHandler()
+    logger = logging.getLogger("pdf2bib")
+    logger.addHandler(handler)
+    with config.settings(verbose=True):
+        yield handler.messages
+    logger.removeHandler(handler)
+
+@pytest.fixture
+def slow_folder(tmp_path, monkeypatch):
+    '''
+    Folder with six pdf files. pdf2bib_singlefile is replaced by a stand-in which takes longer for the files which come first, logs a message when it starts
+    and when it ends each file, and records the number of files processed at the same time.
+    '''
+    for index in range(6):
+        (tmp_path / f'{index}.pdf').write_bytes(b'%PDF-1.4 stub')
+    state = {'running': 0, 'max_running': 0, 'started': []}
+    lock = threading.Lock()
+    def singlefile(filename, settings=None):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            state['started'].append(filename)
+        logging.getLogger("pdf2bib").info(f"start {filename}")
+        time.sleep(0.05 * (6 - int(os.path.basename(filename)[0])))
+        logging.getLogger("pdf2bib").info(f"end {filename}")
+        with lock:
+            state['running'] -= 1
+        return {'path': filename, 'bibtex': f"@misc{{file{os.path.basename(filename)[0]},\n}}", 'timings': {}}
+    monkeypatch.setattr(main, 'pdf2bib_singlefile', singlefile)
+    state['files'] = main._find_pdf_files(str(tmp_path))
+    return state
+
+
+def test_pdf2bib_workers_keep_the_order_of_the_files(tmp_path, slow_folder):
+    start = time.monotonic()
+    results = main.pdf2bib(str(tmp_path), workers=3)
+    elapsed = time.monotonic() - start
+    assert [result['path'] for result in results] == slow_folder['files']
+    assert slow_folder['max_running'] == 3 #The pool is bounded by workers
+    assert elapsed < 0.05 * sum(range(1, 7)) #Faster than the sequential processing
+
+def test_pdf2bib_single_worker_is_sequential(tmp_path, slow_folder):
+    results = main.pdf2bib(str(tmp_path), workers=1)
+    assert [result['path'] for result in results] == slow_folder['files']
+    assert slow_folder['max_running'] == 1
+
+def test_pdf2bib_workers_log_each_file_separately(tmp_path, slow_folder, log_messages):
+    main.pdf2bib(str(tmp_path), workers=3)
+    messages = [message for message in log_messages if message.startswith(('start', 'end'))]
+    assert len(messages) == 12
+    for index in range(0, 12, 2): #The two messages of each file are consecutive
+        assert messages[index].replace('start', 'end', 1) == messages[index + 1]
+
+
+def test_iter_pdf2bib_yields_in_order_of_completion(tmp_path, slow_folder):
+    results = main.iter_pdf2bib(str(tmp_path), workers=6, ordered=False)
+    assert [result['path'] for result in results] == sorted(slow_folder['files'], reverse=True) #The last files are the fastest
+
+def test_iter_pdf2bib_yields_in_order_of_files(tmp_path, slow_folder):
+    results = main.iter_pdf2bib(str(tmp_path), workers=3, ordered=True)
+    assert [result['path'] for result in results] == slow_folder['files']
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_iter_pdf2bib_yields_before_the_end(tmp_path, slow_folder, workers):
+    results = main.iter_pdf2bib(str(tmp_path), workers=workers, ordered=False)
+    assert slow_folder['started'] == [] #Nothing is done until the first result is requested
+    next(results)
+    assert 1 <= len(slow_folder['started']) <= 2 * workers + 1 #At most 2*workers files are submitted ahead
+    results.close()
+
+def test_command_line_prints_each_entry_when_ready(tmp_path, slow_folder, monkeypatch):
+    output = io.StringIO()
+    printed_before_last = []
+    singlefile = main.pdf2bib_singlefile
+    def last_file_checks_output(filename, settings=None):
+        if filename == slow_folder['files'][-1]:
+            printed_before_last.append(output.getvalue())
+        return singlefile(filename, settings)
+    monkeypatch.setattr(main, 'pdf2bib_singlefile', last_file_checks_output)
+    monkeypatch.setattr(sys, 'stdout', output)
+    monkeypatch.setattr(sys, 'argv', ['pdf2bib', str(tmp_path), '-nostore'])
+    verbose = contextvars.Context().run(config.get, 'verbose') #The global value, which main changes
+    try:
+        main.main()
+    finally:
+        config.set('verbose', verbose)
+    assert printed_before_last[0].count('@misc') == 5
+    assert output.getvalue().count('@misc') == 6
+
+def test_command_line_max_authors(tmp_path, monkeypatch):
+    pdf2doi = main._import_pdf2doi()
+    citeproc = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]},
+                'author': [{'given': f'Given{index}', 'family': f'Family{index}'} for index in range(500)]}
+    monkeypatch.setattr(pdf2doi, 'pdf2doi', lambda filename: {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'path': filename,
+                                                              'validation_info': json.dumps(citeproc), 'method': 'stub'})
+    (tmp_path / 'a.pdf').write_bytes(b'%PDF-1.4 stub')
+    output = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', output)
+    monkeypatch.setattr(sys, 'argv', ['pdf2bib', str(tmp_path), '-nostore', '-maxauthors', '2'])
+    verbose = contextvars.Context().run(config.get, 'verbose') #The global value, which main changes
+    try:
+        main.main()
+    finally:
+        config.set('verbose', verbose)
+    assert 'author = {Given0 Family0 and Given1 Family1 and others}' in output.getvalue()
+    assert config.get('max_authors') == 0 #The value of the command line is applied only to this run
@@ -0,0 +1,137 @@
+import contextvars
+import io
+import json
+import sys
+import threading
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.main as main
+import pdf2bib.observers as observers
+
+CITEPROC = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]},
+            'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}]}
+
+
+class RecordingObserver(observers.Observer):
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def on_file_start(self, filename):
+        with self._lock:
+            self.events.append(('start', filename))
+
+    def on_stage_end(self, filename, stage, elapsed):
+        with self._lock:
+            self.events.append(('stage', filename, stage, elapsed))
+
+    def on_file_end(self, filename, result):
+        with self._lock:
+            self.events.append(('end', filename, result))
+
+    def on_error(self, filename, exception):
+        with self._lock:
+            self.events.append(('error', filename, exception))
+
+@pytest.fixture
+def observer():
+    observer = RecordingObserver()
+    observers.add_observer(observer)
+    yield observer
+    observers.remove_observer(observer)
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    '''
+    Folder with three pdf files, processed by a stand-in of pdf2doi.pdf2doi: the file a.pdf has a DOI, b.pdf has no identifier, and c.pdf raises an exception.
+    '''
+    pdf2doi = main._import_pdf2doi()
+    def stub_pdf2doi(filename):
+        if filename.endswith('c.pdf'):
+            raise RuntimeError("The stand-in failed")
+        if filename.endswith('b.pdf'):
+            return {'identifier': None, 'identifier_type': None, 'validation_info': None, 'path': filename, 'method': None}
+        return {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(CITEPROC), 'path': filename, 'method': 'stub'}
+    monkeypatch.setattr(pdf2doi, 'pdf2doi', stub_pdf2doi)
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF-1.4 stub')
+    return tmp_path
+
+
+def test_observer_is_notified_of_each_stage(folder, observer):
+    filename = str(folder / 'a.pdf')
+    result = main.pdf2bib_singlefile(filename)
+    assert observer.events[0] == ('start', filename)
+    assert observer.events[-1] == ('end', filename, result)
+    stages = [event[2] for event in observer.events if event[0] == 'stage']
+    assert set(stages) == {'cache', 'extraction', 'lookup', 'parse', 'render'}
+    assert set(result['timings']) == set(stages) | {'total'}
+    assert all(elapsed >= 0 for elapsed in result['timings'].values())
+    assert result['timings']['total'] >= sum(result['timings'][stage] for stage in ('extraction', 'parse', 'render'))
+
+def test_observer_is_notified_of_errors(folder, observer):
+    filename = str(folder / 'c.pdf')
+    with pytest.raises(RuntimeError):
+        main.pdf2bib_singlefile(filename)
+    assert observer.events[0] == ('start', filename)
+    assert observer.events[-1][:2] == ('error', filename)
+    assert isinstance(observer.events[-1][2], RuntimeError)
+    assert not any(event[0] == 'end' for event in observer.events)
+
+def test_failing_observer_is_ignored(folder):
+    class FailingObserver(observers.Observer):
+        def on_file_start(self, filename):
+            raise ValueError("The observer failed")
+    failing = FailingObserver()
+    observers.add_observer(failing)
+    try:
+        assert main.pdf2bib_singlefile(str(folder / 'a.pdf'))['bibtex']
+    finally:
+        observers.remove_observer(failing)
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_stats_observer_counts_files_and_failures(folder, workers):
+    stats = observers.StatsObserver()
+    observers.add_observer(stats)
+    try:
+        (folder / 'c.pdf').unlink()
+        main.pdf2bib(str(folder), workers=workers)
+    finally:
+        observers.remove_observer(stats)
+    assert stats.files == {'DOI': 1, 'None': 1}
+    assert stats.failures == {'None': 1}
+    assert len(stats.timings['total']) == 2
+    summary = stats.summary()
+    assert summary.startswith("Processed files: 2 (1 without a valid bibtex entry, 0 errors)")
+    for stage in ('extraction', 'lookup', 'parse', 'render', 'total'):
+        assert any(line.startswith(stage) for line in summary.splitlines())
+
+def test_stats_observer_counts_errors(folder):
+    stats = observers.StatsObserver()
+    observers.add_observer(stats)
+    try:
+        with pytest.raises(RuntimeError):
+            main.pdf2bib_singlefile(str(folder / 'c.pdf'))
+    finally:
+        observers.remove_observer(stats)
+    assert stats.errors == 1 and sum(stats.files.values()) == 0
+
+def test_percentiles():
+    values = list(range(1, 101))
+    assert [observers._percentile(values, q) for q in (50, 90, 99, 100)] == [50, 90, 99, 100]
+    assert observers._percentile([7], 50) == 7
+
+def test_command_line_stats(folder, monkeypatch):
+    (folder / 'c.pdf').unlink()
+    output = io.StringIO()
+    monkeypatch.setattr(sys, 'stdout', output)
+    monkeypatch.setattr(sys, 'argv', ['pdf2bib', str(folder), '-nostore', '--stats'])
+    verbose = contextvars.Context().run(config.get, 'verbose') #The global value, which main changes
+    try:
+        main.main()
+    finally:
+        config.set('verbose', verbose)
+    assert "Processed files: 2 (1 without a valid bibtex entry, 0 errors)" in output.getvalue()
+    assert observers._observers == [] #The observer of --stats is removed at the end
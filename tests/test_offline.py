@@ -0,0 +1,119 @@
+import gzip
+import json
+import sqlite3
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.lookups as lookups
+import pdf2bib.offline as offline
+from pdf2bib.bibtex_makers import parse_bib_from_dxdoiorg, parse_bib_from_exportarxivorg
+
+#A work in the format of the Crossref REST API (as in the Crossref public data files)
+CROSSREF_WORK = {'DOI': '10.1000/Stub.Paper', 'type': 'journal-article', 'title': ['A stub paper'], 'container-title': ['Journal of Stubs'],
+                 'publisher': 'Stub Publishing', 'volume': '12', 'page': '1-13', 'issued': {'date-parts': [[2020, 5]]}, 'abstract': 'Not stored.',
+                 'author': [{'given': 'Jane', 'family': 'Doe', 'sequence': 'first', 'affiliation': [{'name': 'Stub University'}]}]}
+#A work in the citeproc format returned by dx.doi.org
+CITEPROC_WORK = {'DOI': '10.1000/other', 'type': 'article-journal', 'title': 'Another stub paper', 'container-title': 'Stub Letters',
+                 'issued': {'date-parts': [[2019]]}, 'author': [{'given': 'John', 'family': 'Roe'}]}
+#Papers in the format of the arXiv metadata snapshot
+ARXIV_PAPER = {'id': '2101.00001', 'title': 'A stub preprint', 'authors': 'Jane Doe and John Roe', 'doi': '10.1000/stub.paper 10.1000/duplicate',
+               'authors_parsed': [['Doe', 'Jane', ''], ['Roe', 'John', 'Jr']],
+               'versions': [{'version': 'v1', 'created': 'Fri, 1 Jan 2021 10:00:00 GMT'}, {'version': 'v2', 'created': 'Mon, 1 Feb 2021 10:00:00 GMT'}]}
+OLD_ARXIV_PAPER = {'id': 'hep-th/9901001', 'title': 'An old stub preprint', 'authors': 'Ann Poe, Bob Loe', 'authors_parsed': [],
+                   'versions': [{'version': 'v1', 'created': 'Fri, 1 Jan 1999 10:00:00 GMT'}]}
+
+
+@pytest.fixture
+def snapshots(tmp_path):
+    '''
+    A Crossref snapshot (JSON Lines compressed with gzip, also containing a line which is not valid JSON and a work without identifier),
+    an arXiv snapshot (JSON Lines) and a Crossref public data file (a JSON dictionary {"items": [...]}).
+    '''
+    crossref = tmp_path / 'crossref-works.jsonl.gz'
+    with gzip.open(crossref, 'wt', encoding='utf-8') as file:
+        file.write(json.dumps(CROSSREF_WORK) + '\n{"DOI": \n' + json.dumps({'title': 'No identifier'}) + '\n\n')
+    arxiv = tmp_path / 'arxiv-metadata-oai-snapshot.json'
+    arxiv.write_text(json.dumps(ARXIV_PAPER) + '\n' + json.dumps(OLD_ARXIV_PAPER) + '\n', encoding='utf-8')
+    items = tmp_path / '0.json'
+    items.write_text(json.dumps({'items': [CITEPROC_WORK]}, indent=2), encoding='utf-8')
+    return [str(crossref), str(arxiv), str(items)]
+
+@pytest.fixture
+def index_path(tmp_path, snapshots):
+    path = str(tmp_path / 'index.sqlite')
+    offline.import_snapshots(snapshots, path)
+    with config.settings(offline_index=path):
+        yield path
+
+
+def test_iter_snapshot_converts_the_records(snapshots):
+    crossref, arxiv, items = (list(offline.iter_snapshot(filename)) for filename in snapshots)
+    assert crossref == [('DOI', '10.1000/stub.paper', {'type': 'journal-article', 'title': 'A stub paper', 'container-title': 'Journal of Stubs',
+                                                       'volume': '12', 'page': '1-13', 'publisher': 'Stub Publishing', 'DOI': '10.1000/Stub.Paper',
+                                                       'issued': {'date-parts': [[2020, 5]]}, 'author': [{'given': 'Jane', 'family': 'Doe', 'sequence': 'first'}]})]
+    assert items == [('DOI', '10.1000/other', CITEPROC_WORK)]
+    assert [record[:2] for record in arxiv] == [('arxiv ID', '2101.00001'), ('arxiv ID', 'hep-th/9901001')]
+    data = arxiv[0][2]
+    assert data['id'] == data['link'] == 'http://arxiv.org/abs/2101.00001v2'
+    assert (data['published'], data['updated']) == ('2021-01-01T10:00:00Z', '2021-02-01T10:00:00Z')
+    assert data['authors'] == [{'name': 'Jane Doe'}, {'name': 'John Roe Jr'}] and data['arxiv_doi'] == '10.1000/stub.paper'
+    assert arxiv[1][2]['authors'] == [{'name': 'Ann Poe'}, {'name': 'Bob Loe'}] #Without authors_parsed, the names are split at the commas
+
+def test_import_snapshots_counts_the_records(tmp_path, snapshots):
+    path = str(tmp_path / 'index.sqlite')
+    assert offline.import_snapshots(snapshots, path) == {'DOI': 2, 'arxiv ID': 2}
+    assert offline.import_snapshots(snapshots[:1], path) == {'DOI': 2, 'arxiv ID': 2} #The records imported again replace the existing ones
+
+def test_dois_are_found_in_the_index(index_path):
+    index = offline.get_offline_index()
+    for doi in ('10.1000/stub.paper', ' 10.1000/STUB.Paper '):
+        validation_info = index.get_validation_info('DOI', doi, offline.CITEPROC_METHOD)
+        assert json.loads(validation_info)['title'] == 'A stub paper'
+    assert index.get_validation_info('DOI', '10.1000/stub.paper', 'text/bibliography; style=bibtex') is None #Only the citeproc format is stored
+    assert index.get_validation_info('DOI', '10.1000/missing', offline.CITEPROC_METHOD) is None
+    metadata = parse_bib_from_dxdoiorg(index.get_validation_info('DOI', '10.1000/other', offline.CITEPROC_METHOD), offline.CITEPROC_METHOD)
+    assert (metadata['title'], metadata['journal'], metadata['year']) == ('Another stub paper', 'Stub Letters', 2019)
+
+@pytest.mark.parametrize('arxiv_id, link', [('2101.00001', 'http://arxiv.org/abs/2101.00001v2'),
+                                            ('arXiv:2101.00001', 'http://arxiv.org/abs/2101.00001v2'),
+                                            ('2101.00001v1', 'http://arxiv.org/abs/2101.00001v1'),
+                                            ('2101.00001v2', 'http://arxiv.org/abs/2101.00001v2'),
+                                            ('HEP-TH/9901001v1', 'http://arxiv.org/abs/hep-th/9901001v1')])
+def test_arxiv_ids_are_found_with_the_links_of_their_version(index_path, arxiv_id, link):
+    entry = offline.get_offline_index().get_validation_info('arxiv ID', arxiv_id)
+    assert entry['id'] == entry['link'] == link
+    assert parse_bib_from_exportarxivorg(entry)['url'] == link
+
+def test_arxiv_entries_give_the_metadata_of_export_arxiv_org(index_path):
+    metadata = parse_bib_from_exportarxivorg(offline.get_offline_index().get_validation_info('arxiv ID', '2101.00001'))
+    assert (metadata['title'], metadata['year'], metadata['month'], metadata['day']) == ('A stub preprint', '2021', '01', '01')
+    assert metadata['author'] == [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John Roe', 'family': 'Jr'}]
+    assert (metadata['doi'], metadata['eprint']) == ('10.1000/stub.paper', 'arXiv:10.1000/stub.paper')
+    assert offline.get_offline_index().get_validation_info('arxiv ID', 'not an arxiv id') is None
+
+def test_lookups_use_the_index(index_path, monkeypatch):
+    def no_queries(*args):
+        raise AssertionError("No query should be sent")
+    monkeypatch.setattr(lookups, '_original_validate_doi_web', no_queries)
+    monkeypatch.setattr(lookups, '_original_validate_arxivID_web', no_queries)
+    assert json.loads(lookups.validate_doi_web('10.1000/stub.paper', offline.CITEPROC_METHOD))['DOI'] == '10.1000/Stub.Paper'
+    assert lookups.validate_arxivID_web('2101.00001v1')['link'] == 'http://arxiv.org/abs/2101.00001v1'
+    with config.settings(offline_only=True): #The identifiers which are not in the index are not valid
+        assert lookups.validate_doi_web('10.1000/missing', offline.CITEPROC_METHOD) is None
+        assert lookups.validate_arxivID_web('2101.99999') is None
+
+def test_missing_index_is_not_used(tmp_path):
+    with config.settings(offline_index=str(tmp_path / 'missing.sqlite')):
+        assert offline.get_offline_index() is None
+        assert offline.lookup('DOI', '10.1000/stub.paper', offline.CITEPROC_METHOD) is None
+
+def test_index_of_another_format_version_is_rejected(index_path):
+    offline._forget_index()
+    connection = sqlite3.connect(index_path)
+    with connection:
+        connection.execute("UPDATE info SET value = '0' WHERE key = 'format_version'")
+    connection.close()
+    with pytest.raises(ValueError):
+        offline.OfflineIndex(index_path)
+    assert offline.get_offline_index() is None
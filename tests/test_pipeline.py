@@ -0,0 +1,63 @@
+import json
+import time
+
+import pytest
+
+import pdf2bib.deadlines as deadlines
+import pdf2bib.lookups as lookups
+import pdf2bib.main as main
+import pdf2bib.pipeline as pipeline
+
+
+def citeproc(doi):
+    return json.dumps({'type': 'article-journal', 'title': f'Paper {doi}', 'DOI': doi, 'container-title': 'Journal of Stubs',
+                       'issued': {'date-parts': [[2020, 5]]}, 'author': [{'given': 'Jane', 'family': 'Doe'}]})
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    '''
+    Folder with the pdf files a.pdf, b.pdf and slow.pdf. The candidate identifier of each file is the DOI 10.1000/<name of the file>; the validation of all 
+    DOIs succeeds, except the one of slow.pdf, for which the archive cannot be reached (after 0.3 seconds).
+    '''
+    pdf2doi = main._import_pdf2doi()
+    for name in ('a', 'b', 'slow'):
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF-1.4 stub')
+    monkeypatch.setattr(lookups, 'find_candidates',
+                        lambda filename, method: [(f"10.1000/{filename.split('/')[-1][:-4]}", 'doi')] if method == lookups.LOCAL_METHODS[0] else [])
+    def validate(identifier, what):
+        if identifier.endswith('slow'):
+            time.sleep(0.3)
+            return None
+        return citeproc(identifier)
+    monkeypatch.setattr(pdf2doi.finders, 'validate', validate)
+    return tmp_path
+
+
+def by_name(results):
+    return {result['path'].split('/')[-1][:-4]: result for result in results}
+
+def test_pipeline_results(folder):
+    results = by_name(pipeline.pdf2bib_pipeline(str(folder), retries=0))
+    assert {name: result['identifier'] for name, result in results.items()} == {'a': '10.1000/a', 'b': '10.1000/b', 'slow': None}
+    assert 'Paper 10.1000/b' in results['b']['bibtex']
+    assert not any('status' in result for result in results.values())
+
+def test_error_in_bibtex_generation_is_recorded_per_file(folder, monkeypatch):
+    add_bibtex = pipeline._add_bibtex_to_result
+    def failing_add_bibtex(result, timer=None):
+        if result['identifier'] == '10.1000/a':
+            raise ValueError("broken record")
+        return add_bibtex(result, timer)
+    monkeypatch.setattr(pipeline, '_add_bibtex_to_result', failing_add_bibtex)
+    results = by_name(pipeline.pdf2bib_pipeline(str(folder), retries=0))
+    assert results['a']['status'] == pipeline.ERROR_STATUS and results['a']['error'] == "broken record"
+    assert results['a']['bibtex'] is None and results['a']['identifier'] == '10.1000/a'
+    assert 'Paper 10.1000/b' in results['b']['bibtex']
+
+@pytest.mark.parametrize('timeouts', [{'timeout': 0.2}, {'batch_timeout': 0.2}])
+def test_pipeline_deadline(folder, timeouts):
+    start = time.monotonic()
+    results = by_name(pipeline.pdf2bib_pipeline(str(folder), retries=5, **timeouts))
+    assert time.monotonic() - start < 2 #Without the deadline, the retries of slow.pdf take several seconds
+    assert {name: result.get('status') for name, result in results.items()} == {'a': None, 'b': None, 'slow': deadlines.TIMEOUT_STATUS}
+    assert 'Paper 10.1000/a' in results['a']['bibtex']
@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.main as main
+import pdf2bib.observers as observers
+
+CITEPROC = {'title': 'A stub paper', 'DOI': '10.1000/stub', 'container-title': 'Journal of Stubs', 'issued': {'date-parts': [[2020, 5]]},
+            'author': [{'given': 'Jane', 'family': 'Doe'}, {'given': 'John', 'family': 'Roe'}]}
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+class RecordingObserver(observers.Observer):
+    def __init__(self):
+        self.events = []
+        self.threads = set()
+
+    def on_file_end(self, filename, result):
+        self.events.append(('end', filename))
+        self.threads.add(threading.current_thread().name)
+
+    def on_error(self, filename, exception):
+        self.events.append(('error', filename))
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    '''
+    Folder with four pdf files, processed by a stand-in of pdf2doi.pdf2doi which logs two messages and returns the id of the process in result['method'].
+    The stand-in is inherited by the worker processes (which are forked).
+    '''
+    pdf2doi = main._import_pdf2doi()
+    def stub_pdf2doi(filename):
+        logging.getLogger("pdf2doi").info(f"first message of {os.path.basename(filename)}")
+        logging.getLogger("pdf2doi").info(f"second message of {os.path.basename(filename)}")
+        if filename.endswith('fail.pdf'):
+            raise RuntimeError("The stand-in failed")
+        return {'identifier': '10.1000/stub', 'identifier_type': 'DOI', 'validation_info': json.dumps(CITEPROC), 'path': filename,
+                'method': str(os.getpid())}
+    monkeypatch.setattr(pdf2doi, 'pdf2doi', stub_pdf2doi)
+    for name in ('a', 'b', 'c', 'd'):
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF-1.4 stub')
+    return tmp_path
+
+@pytest.fixture
+def log_records():
+    handler = RecordingHandler()
+    logger = logging.getLogger("pdf2doi")
+    logger.addHandler(handler)
+    with config.settings(verbose=True):
+        yield handler.records
+    logger.removeHandler(handler)
+
+
+def test_files_are_processed_by_worker_processes(folder):
+    results = main.pdf2bib(str(folder), workers=2, executor='process')
+    assert [result['path'] for result in results] == main._find_pdf_files(str(folder))
+    assert all(result['bibtex'] and result['identifier'] == '10.1000/stub' for result in results)
+    pids = {result['method'] for result in results}
+    assert not str(os.getpid()) in pids and 1 <= len(pids) <= 2
+
+def test_validation_info_is_dropped_unless_requested(folder):
+    results = main.pdf2bib(str(folder), workers=2, executor='process')
+    assert all(result['validation_info'] is None and result['metadata']['title'] == 'A stub paper' for result in results)
+    with config.settings(process_validation_info=True):
+        results = main.pdf2bib(str(folder), workers=2, executor='process')
+    assert all(json.loads(result['validation_info']) == CITEPROC for result in results)
+
+def test_worker_processes_use_the_settings_of_the_caller(folder):
+    with config.settings(max_authors=1, executor='process'):
+        results = main.pdf2bib(str(folder), workers=2)
+    assert all('Jane Doe and others' in result['bibtex'] for result in results)
+    assert all(result['method'] != str(os.getpid()) for result in results)
+
+def test_log_records_of_each_file_are_released_together(folder, log_records):
+    main.pdf2bib(str(folder), workers=2, executor='process')
+    messages = [record.getMessage() for record in log_records if 'message of' in record.getMessage()]
+    assert len(messages) == 8
+    for index in range(0, 8, 2): #The records of each file are not interleaved with those of other files
+        assert messages[index].replace('first', 'second') == messages[index + 1]
+
+def test_observers_are_notified_by_the_main_process(folder):
+    (folder / 'fail.pdf').write_bytes(b'%PDF-1.4 stub')
+    observer = RecordingObserver()
+    observers.add_observer(observer)
+    try:
+        with pytest.raises(RuntimeError):
+            list(main.iter_pdf2bib(str(folder), workers=2, executor='process', ordered=False))
+    finally:
+        observers.remove_observer(observer)
+    assert ('error', str(folder / 'fail.pdf')) in observer.events
+    assert observer.threads <= {threading.current_thread().name}
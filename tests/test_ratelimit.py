@@ -0,0 +1,263 @@
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.deadlines as deadlines
+import pdf2bib.lookups as lookups
+import pdf2bib.ratelimit as ratelimit
+
+
+class FakeClock():
+    '''
+    Replaces the clock used by ratelimit.py, so that the tests do not depend on the actual timing.
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', SimpleNamespace(monotonic=clock.monotonic, perf_counter=clock.monotonic, sleep=clock.advance))
+    return clock
+
+
+def test_token_bucket_spreads_requests(clock):
+    bucket = ratelimit.TokenBucket(rate=10, burst=2)
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0] #The burst
+    assert [round(bucket.reserve(), 6) for _ in range(3)] == [0.1, 0.2, 0.3]
+
+def test_token_bucket_refills_up_to_burst(clock):
+    bucket = ratelimit.TokenBucket(rate=10, burst=2)
+    bucket.reserve(), bucket.reserve()
+    clock.advance(60)
+    assert [round(bucket.reserve(), 6) for _ in range(3)] == [0.0, 0.0, 0.1]
+
+def test_token_bucket_set_rate(clock):
+    bucket = ratelimit.TokenBucket(rate=10, burst=1)
+    bucket.reserve()
+    bucket.set_rate(2)
+    assert round(bucket.reserve(), 6) == 0.5
+
+def test_limit_grows_additively_after_fast_responses(clock):
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=8)
+    assert limiter.limit == 4
+    limiter.on_success(0.1)
+    assert limiter.limit == pytest.approx(4.25)
+    for _ in range(100):
+        limiter.on_success(0.1)
+    assert limiter.limit == 8 #Never above max_concurrency
+
+def slow_responses_until_decrease(limiter, latency):
+    #Returns the limit before the first decrease caused by the responses received in latency seconds
+    for _ in range(20):
+        limit = limiter.limit
+        limiter.on_success(latency)
+        if limiter.limit < limit:
+            return limit
+    raise AssertionError("The limit was not decreased")
+
+def test_limit_shrinks_after_slow_responses_once_per_interval(clock):
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=8)
+    for _ in range(50):
+        limiter.on_success(0.1)
+    limiter.on_success(2 * ratelimit.CONGESTION_FACTOR * 0.1) #A single slow response is not a sign of congestion
+    assert limiter.limit == 8
+    limit = slow_responses_until_decrease(limiter, 10 * ratelimit.CONGESTION_FACTOR * 0.1)
+    assert limiter.limit == pytest.approx(0.9 * limit)
+    for _ in range(5):
+        limiter.on_success(10 * ratelimit.CONGESTION_FACTOR * 0.1) #Within DECREASE_INTERVAL: no new decrease
+    assert limiter.limit == pytest.approx(0.9 * limit)
+    clock.advance(ratelimit.DECREASE_INTERVAL)
+    limiter.on_success(10 * ratelimit.CONGESTION_FACTOR * 0.1)
+    assert limiter.limit == pytest.approx(0.81 * limit)
+
+def test_limit_is_kept_with_variable_latency(clock):
+    #The latency of a host which is not congested varies a lot from one response to the next (e.g. the registrars behind dx.doi.org)
+    rng = random.Random(0)
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=8)
+    limits = []
+    for _ in range(3000):
+        latency = 0.3 * math.exp(rng.gauss(0, 0.8))
+        clock.advance(latency / 8)
+        limiter.on_success(latency)
+        limits.append(limiter.limit)
+    assert min(limits[100:]) >= 7
+    assert limiter.limit == 8
+
+def test_baseline_latency_follows_lasting_changes(clock):
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=8)
+    for _ in range(50):
+        limiter.on_success(0.1)
+    slow_responses_until_decrease(limiter, 1.0)
+    for _ in range(10 * ratelimit.BASELINE_WINDOW): #The host became slower, but it is not congested
+        clock.advance(0.1)
+        limiter.on_success(1.0)
+    assert limiter.baseline_latency == pytest.approx(1.0, rel=0.01)
+    assert limiter.limit == 8
+
+def test_throttle_halves_limit_and_rate(clock):
+    limiter = ratelimit.HostLimiter('example.org', per_minute=600, max_concurrency=8)
+    limiter.on_throttle(reason='status 429')
+    assert limiter.limit == 2 and limiter.bucket.rate == 5
+    limiter.on_throttle(reason='status 429') #Within DECREASE_INTERVAL: the responses to the requests in flight carry no new information
+    assert limiter.limit == 2 and limiter.bucket.rate == 5
+    clock.advance(ratelimit.DECREASE_INTERVAL)
+    limiter.on_throttle(reason='status 429')
+    assert limiter.limit == 1 and limiter.bucket.rate == 2.5
+    limiter.on_success(0.1)
+    assert limiter.bucket.rate == 2.5 + 10 / 16 #The rate grows again slowly
+    assert limiter.stats()['throttled'] == 3
+
+def test_retry_after_pauses_host(clock):
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=8)
+    limiter.on_throttle(retry_after=5)
+    assert not limiter.try_enter()
+    clock.advance(5)
+    assert limiter.try_enter()
+
+def test_limit_caps_requests_in_flight(clock):
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=4)
+    assert [limiter.try_enter() for _ in range(3)] == [True, True, False]
+    limiter.exit()
+    assert limiter.try_enter()
+
+
+def test_enter_gives_up_after_timeout():
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=1)
+    assert limiter.enter()
+    start = time.monotonic()
+    assert limiter.enter(timeout=0.1) is False
+    assert 0.1 <= time.monotonic() - start < 1
+    limiter.exit()
+    assert limiter.enter(timeout=0.1) is True
+
+def test_slot_wait_is_limited_by_deadline():
+    limiter = ratelimit.HostLimiter('example.org', max_concurrency=1)
+    limiter.enter()
+    start = time.monotonic()
+    with deadlines.deadline(start + 0.1), pytest.raises(deadlines.FileTimeoutError):
+        with limiter.slot():
+            pass
+    assert time.monotonic() - start < 1
+    assert limiter.in_flight == 1
+
+def test_get_does_not_send_request_after_deadline(monkeypatch):
+    import requests
+    def fail(*args, **kwargs):
+        raise AssertionError("No request should be sent")
+    monkeypatch.setattr(requests, 'get', fail)
+    monkeypatch.setattr(ratelimit, '_limiters', {})
+    monkeypatch.setattr(ratelimit, '_host_limits', {})
+    ratelimit.set_host_limit('example.org', per_minute=None, max_concurrency=1)
+    limiter = ratelimit.get_limiter('example.org')
+    with deadlines.deadline(time.monotonic() + 0.05):
+        limiter.enter() #The only slot is busy until the deadline expires
+        try:
+            with pytest.raises(deadlines.FileTimeoutError):
+                ratelimit.get('http://example.org/')
+        finally:
+            limiter.exit()
+        time.sleep(0.1)
+        with pytest.raises(deadlines.FileTimeoutError):
+            ratelimit.get('http://example.org/')
+
+
+def test_fetch_dxdoiorg_retries_empty_responses(monkeypatch):
+    responses = [SimpleNamespace(status_code=200, text=''), SimpleNamespace(status_code=200, text=''), SimpleNamespace(status_code=200, text='{"title": "t"}')]
+    calls = []
+    monkeypatch.setattr(ratelimit, 'get', lambda url, headers=None: calls.append(url) or responses[len(calls) - 1])
+    assert lookups._fetch_dxdoiorg('10.1000/stub', 'application/citeproc+json') == '{"title": "t"}'
+    assert len(calls) == 3
+
+def test_fetch_dxdoiorg_gives_up_after_empty_responses(monkeypatch):
+    calls = []
+    monkeypatch.setattr(ratelimit, 'get', lambda url, headers=None: calls.append(url) or SimpleNamespace(status_code=200, text=''))
+    assert lookups._fetch_dxdoiorg('10.1000/stub', 'application/citeproc+json') == -1
+    assert len(calls) == lookups.DXDOIORG_ATTEMPTS
+
+def test_fetch_dxdoiorg_after_deadline(monkeypatch):
+    def get(url, headers=None):
+        raise deadlines.FileTimeoutError("expired")
+    monkeypatch.setattr(ratelimit, 'get', get)
+    assert lookups._fetch_dxdoiorg('10.1000/stub', 'application/citeproc+json') == -1
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    '''
+    Local stand-in of a host which throttles the clients: the first requests are answered with the status 429 and the header Retry-After.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.received.append(time.monotonic())
+            throttled = len(server.received) <= server.throttled_requests
+        body = b'Too Many Requests' if throttled else b'{"title": "A stand-in paper"}'
+        self.send_response(429 if throttled else 200)
+        if throttled:
+            self.send_header('Retry-After', str(server.retry_after))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def throttling_server(monkeypatch):
+    pytest.importorskip('requests')
+    monkeypatch.setattr(ratelimit, '_limiters', {})
+    monkeypatch.setattr(ratelimit, '_host_limits', {})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    server.lock = threading.Lock()
+    server.received = []
+    server.throttled_requests = 0
+    server.retry_after = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_get_paces_requests(throttling_server):
+    ratelimit.set_host_limit('127.0.0.1', per_minute=600, max_concurrency=4)
+    for _ in range(6):
+        assert ratelimit.get(throttling_server.url).status_code == 200
+    received = throttling_server.received
+    burst = ratelimit.get_limiter('127.0.0.1').bucket.burst
+    assert received[-1] - received[burst - 1] >= (len(received) - burst) * 0.1 * 0.9 #At most 10 requests per second after the burst
+
+def test_get_backs_off_when_throttled(throttling_server):
+    throttling_server.throttled_requests = 2
+    throttling_server.retry_after = 0.3
+    ratelimit.set_host_limit('127.0.0.1', per_minute=600, max_concurrency=4)
+    limiter = ratelimit.get_limiter('127.0.0.1')
+    with config.settings(ratelimit_retries=5):
+        response = ratelimit.get(throttling_server.url)
+    assert response.status_code == 200
+    received = throttling_server.received
+    assert len(received) == 3
+    assert received[1] - received[0] >= 0.3 and received[2] - received[1] >= 0.3 #Retry-After is respected
+    assert limiter.stats()['throttled'] == 2
+    assert limiter.bucket.rate < 10 #The rate was halved after the first 429, and grows again slowly
+
+def test_get_gives_up_after_retries(throttling_server):
+    throttling_server.throttled_requests = 100
+    ratelimit.set_host_limit('127.0.0.1', per_minute=None, max_concurrency=4)
+    with config.settings(ratelimit_retries=2, ratelimit_max_backoff=0.05):
+        assert ratelimit.get(throttling_server.url).status_code == 429
+    assert len(throttling_server.received) == 3
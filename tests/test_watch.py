@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import pytest
+
+import pdf2bib.config as config
+import pdf2bib.incremental as incremental
+import pdf2bib.main as main
+import pdf2bib.watch as watch
+import pdf2bib.writers as writers
+
+
+def make_bibtex(name):
+    return f"@article{{{name},\n\ttitle = {{The paper in {name}.pdf}},\n\tdoi = {{10.1000/{name}}}\n}}"
+
+def stub_iter_files(processed):
+    #Replaces main._iter_files: the bibtex entry of each pdf file is made from its name, and the names of the files of each batch are stored in processed
+    def iter_files(files, workers=None):
+        processed.append(sorted(os.path.basename(file) for file in files))
+        for file in files:
+            name = os.path.basename(file)[:-4]
+            yield {'path': file, 'identifier': None, 'identifier_type': None, 'validation_info': None, 'method': None, 'metadata': None,
+                   'bibtex': make_bibtex(name)}
+    return iter_files
+
+def read_keys(filename):
+    if not os.path.exists(filename):
+        return set()
+    with open(filename, 'r', encoding='utf-8') as file:
+        return {key for key, _ in writers.iter_bibtex_entries(file) if key}
+
+def wait_until(condition, timeout=10):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+@pytest.fixture
+def processed(monkeypatch):
+    processed = []
+    monkeypatch.setattr(main, '_iter_files', stub_iter_files(processed))
+    return processed
+
+@pytest.fixture
+def watching(tmp_path, processed, monkeypatch):
+    '''
+    Runs watch.watch on tmp_path in a thread, with the polling watcher (as on the systems without inotify), and stops it at the end.
+    '''
+    def no_inotify(folder):
+        raise OSError("inotify is not available")
+    monkeypatch.setattr(watch, '_InotifyWatcher', no_inotify)
+    stop_event = threading.Event()
+    def start(**settings):
+        settings = dict({'watch_poll_interval': 0.05, 'watch_debounce': 0.2, 'watch_batch_size': 100}, **settings)
+        def run():
+            with config.settings(settings):
+                watch.watch(str(tmp_path), 'refs.bib', stop_event=stop_event)
+        thread = threading.Thread(target=config.bind(run))
+        thread.start()
+        threads.append(thread)
+    threads = []
+    yield start
+    stop_event.set()
+    for thread in threads:
+        thread.join(10)
+
+
+def test_polling_watcher_reports_changes(tmp_path):
+    (tmp_path / 'a.pdf').write_bytes(b'%PDF-1.4 a')
+    (tmp_path / 'b.pdf').write_bytes(b'%PDF-1.4 b')
+    watcher = watch._PollingWatcher(str(tmp_path), 0)
+    assert watcher.read(0) == set()
+    (tmp_path / 'c.pdf').write_bytes(b'%PDF-1.4 c')
+    (tmp_path / 'a.pdf').write_bytes(b'%PDF-1.4 a, modified')
+    (tmp_path / 'b.pdf').unlink()
+    (tmp_path / 'notes.txt').write_text('not a pdf file')
+    assert watcher.read(0) == {'a.pdf', 'b.pdf', 'c.pdf'}
+    assert watcher.read(0) == set()
+
+def test_inotify_watcher_reports_changes(tmp_path):
+    try:
+        watcher = watch._InotifyWatcher(str(tmp_path))
+    except (OSError, AttributeError):
+        pytest.skip("inotify is not available")
+    try:
+        (tmp_path / 'a.pdf').write_bytes(b'%PDF-1.4 a')
+        (tmp_path / 'notes.txt').write_text('not a pdf file')
+        assert watcher.read(1) == {'a.pdf'}
+        (tmp_path / 'a.pdf').unlink()
+        assert watcher.read(1) == {'a.pdf'}
+    finally:
+        watcher.close()
+
+def test_watch_adds_and_removes_entries(tmp_path, processed, watching):
+    (tmp_path / 'first.pdf').write_bytes(b'%PDF-1.4 first')
+    watching()
+    assert wait_until(lambda: read_keys(tmp_path / 'refs.bib') == {'first'})
+    (tmp_path / 'second.pdf').write_bytes(b'%PDF-1.4 second')
+    assert wait_until(lambda: read_keys(tmp_path / 'refs.bib') == {'first', 'second'})
+    (tmp_path / 'first.pdf').unlink()
+    assert wait_until(lambda: read_keys(tmp_path / 'refs.bib') == {'second'})
+    assert processed == [['first.pdf'], ['second.pdf']] #The files which did not change are not processed again
+
+def test_watch_waits_for_files_being_written(tmp_path, processed, watching):
+    watching(watch_debounce=0.3)
+    assert wait_until(lambda: os.path.exists(tmp_path / 'refs.bib'))
+    with open(tmp_path / 'copied.pdf', 'wb') as file: #A file which is still being copied
+        for _ in range(8):
+            file.write(b'%PDF-1.4 chunk ')
+            file.flush()
+            time.sleep(0.1)
+            assert processed == []
+    assert wait_until(lambda: read_keys(tmp_path / 'refs.bib') == {'copied'})
+    assert processed == [['copied.pdf']]
+
+def test_watch_processes_bulk_copies_in_batches(tmp_path, processed, watching):
+    watching(watch_batch_size=3)
+    assert wait_until(lambda: os.path.exists(tmp_path / 'refs.bib'))
+    processed.clear()
+    names = [f'paper{index}' for index in range(8)]
+    for name in names:
+        (tmp_path / f'{name}.pdf').write_bytes(b'%PDF-1.4 ' + name.encode())
+    assert wait_until(lambda: read_keys(tmp_path / 'refs.bib') == set(names))
+    assert all(len(batch) <= 3 for batch in processed)
+    assert sorted(name for batch in processed for name in batch) == sorted(f'{name}.pdf' for name in names)
+    assert set(incremental.Manifest(tmp_path / 'refs.bib').keys()) == set(names)
@@ -0,0 +1,93 @@
+import io
+import json
+import os
+
+import pytest
+
+import pdf2bib.main as main
+import pdf2bib.writers as writers
+
+EXISTING = '''% A comment
+@article(paren2019,
+  title = {Resonances (and anti-resonances) in cavities},
+  note = "a quoted ) parenthesis",
+  year = 2019
+)
+
+@article{brace2018,
+  title = {Braces {and} more},
+  year = {2018}
+}
+'''
+
+
+def entry(key, title):
+    return f"@article{{{key},\n\ttitle = {{{title}}}\n}}"
+
+def result(path, bibtex):
+    return {'path': str(path), 'bibtex': bibtex}
+
+
+def test_iter_bibtex_entries_with_parentheses():
+    entries = list(writers.iter_bibtex_entries(io.StringIO(EXISTING)))
+    assert [key for key, _ in entries] == [None, 'paren2019', None, 'brace2018']
+    assert entries[1][1].rstrip().endswith(')')
+    assert 'year = 2019' in entries[1][1]
+    assert entries[3][1].startswith('@article{brace2018')
+
+def test_iter_bibtex_entries_parentheses_on_one_line():
+    text = "@misc(one, title = {x)y}, note = \"(z\")\n@misc{two, title = {w}}\n"
+    assert [key for key, _ in writers.iter_bibtex_entries(io.StringIO(text))] == ['one', 'two']
+
+def test_merge_replaces_entry_delimited_by_parentheses(tmp_path):
+    filename = tmp_path / 'refs.bib'
+    filename.write_text(EXISTING, encoding='utf-8')
+    with writers.BibtexWriter(filename, mode='merge') as writer:
+        writer.write(entry('paren2019', 'Replaced'))
+    with open(filename, encoding='utf-8') as file:
+        entries = dict(item for item in writers.iter_bibtex_entries(file) if item[0])
+    assert list(entries) == ['paren2019', 'brace2018']
+    assert 'Replaced' in entries['paren2019']
+    assert not 'quoted' in filename.read_text(encoding='utf-8') #No field of the replaced entry is left in the file
+    assert 'Braces {and} more' in entries['brace2018']
+
+def test_save_bibtex_entries_creates_empty_file(tmp_path):
+    main.save_bibtex_entries('refs.bib', [result(tmp_path / 'a.pdf', None), result(tmp_path / 'b.pdf', None)])
+    assert (tmp_path / 'refs.bib').read_text(encoding='utf-8') == ''
+
+def test_save_bibtex_entries_leaves_file_unchanged_on_error(tmp_path):
+    filename = tmp_path / 'refs.bib'
+    filename.write_text(EXISTING, encoding='utf-8')
+    def results():
+        yield result(tmp_path / 'a.pdf', entry('first2020a', 'First'))
+        raise RuntimeError("The processing failed")
+    main.save_bibtex_entries('refs.bib', results())
+    assert filename.read_text(encoding='utf-8') == EXISTING
+    assert os.listdir(tmp_path) == ['refs.bib'] #No temporary file is left behind
+
+@pytest.mark.parametrize('mode', ['w', 'merge'])
+def test_save_bibtex_entries_writes_entries(tmp_path, mode):
+    main.save_bibtex_entries('refs.bib', [result(tmp_path / 'a.pdf', entry('first2020a', 'First')), result(tmp_path / 'b.pdf', None)], mode=mode)
+    with open(tmp_path / 'refs.bib', encoding='utf-8') as file:
+        assert [key for key, _ in writers.iter_bibtex_entries(file) if key] == ['first2020a']
+
+def test_save_records_leaves_file_unchanged_on_error(tmp_path):
+    filename = tmp_path / 'records.jsonl'
+    filename.write_text('{"path": "old.pdf"}\n', encoding='utf-8')
+    def results():
+        yield result(tmp_path / 'a.pdf', entry('first2020a', 'First'))
+        raise RuntimeError("The processing failed")
+    with pytest.raises(RuntimeError):
+        main.save_records('jsonl', 'records.jsonl', results())
+    assert filename.read_text(encoding='utf-8') == '{"path": "old.pdf"}\n'
+    assert os.listdir(tmp_path) == ['records.jsonl'] #No temporary file is left behind
+
+def test_save_records_writes_records(tmp_path):
+    main.save_records('jsonl', 'records.jsonl', [result(tmp_path / 'a.pdf', entry('first2020a', 'First')), result(tmp_path / 'b.pdf', None)])
+    lines = (tmp_path / 'records.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['path'] for line in lines] == [str(tmp_path / 'a.pdf'), str(tmp_path / 'b.pdf')]
+
+@pytest.mark.parametrize('output_format, content', [('jsonl', ''), ('csl-json', '[]\n')])
+def test_save_records_creates_empty_file(tmp_path, output_format, content):
+    main.save_records(output_format, 'records.json', [], folder=str(tmp_path))
+    assert (tmp_path / 'records.json').read_text(encoding='utf-8') == content